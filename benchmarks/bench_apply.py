@@ -0,0 +1,354 @@
+'''
+bench_apply.py - End-to-end Apply benchmark for tg_splatter_craters.
+Runs the Apply pipeline against the mock Terragen RPC server for every
+combination of crater count, insertion mode and option given, and
+reports wall time, round-trips and peak memory per crater. Results are
+saved as JSON and can be compared with an earlier run to spot
+regressions.
+
+Run from the repository folder:
+    python -m benchmarks.bench_apply --counts 10 100 1000 10000 --latency 0.001
+    python -m benchmarks.bench_apply --compare benchmarks/results/<earlier run>.json
+'''
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import terragen_rpc.impl as tg_impl
+import terragen_rpc.jsonrpc as tg_jsonrpc
+from crater_engine.pipeline import run_apply
+from crater_engine.project_cache import reset_project_caches
+from crater_engine.rpc_batch import reset_batch_support
+from crater_engine.settings import DEFAULT_VALUES, ApplySettings
+
+RESULTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+INSERT_MODES = ["Don't", "Output > Main input", "Merge shader", "Merge tree"]
+
+# Case settings identifying a result, in table column order
+CASE_KEYS = ["count", "insert_into_flow", "batch", "workers", "window", "placement", "extras"]
+
+# Case settings of results saved before the setting was benchmarked
+CASE_DEFAULTS = {"window": 1}
+
+# Per crater metrics compared between runs
+COMPARED_METRICS = ["wall_ms_per_crater", "round_trips_per_crater", "peak_kib_per_crater"]
+
+class MockServerProcess:
+    '''
+    Runs crater_engine.mock_server in a child process, so that its memory
+    and CPU time are not counted as the benchmark's, and points
+    terragen_rpc at it.
+    '''
+    def __init__(self, latency, call_latency, batch, serial=False):
+        command = [
+            sys.executable, "-m", "crater_engine.mock_server", "--port", "0",
+            "--latency", str(latency), "--call-latency", str(call_latency),
+            ]
+        if not batch:
+            command.append("--no-batch")
+        if serial:
+            command.append("--serial")
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+        self.port = int(self.process.stdout.readline())
+        tg_impl.TCP_IP, tg_impl.TCP_PORT = "localhost", self.port
+        reset_batch_support()
+        reset_project_caches()
+
+    def stats(self):
+        '''
+        Gets the server's request counters.
+
+        Returns:
+            stats (dict): See MockTerragenServer.stats()
+        '''
+        return tg_jsonrpc.call("mock_stats", []).value
+
+    def stop(self):
+        '''
+        Stops the child process.
+        '''
+        self.process.terminate()
+        self.process.wait()
+        self.process.stdout.close()
+
+def case_values(case):
+    '''
+    Builds the UI values of one benchmark case.
+
+    Args:
+        case (dict): Case settings, see CASE_KEYS
+
+    Returns:
+        values (dict): UI values for run_apply()
+    '''
+    values = dict(DEFAULT_VALUES)
+    values.update({
+        "quantity": str(case["count"]),
+        "insert_into_flow": case["insert_into_flow"],
+        "rpc_workers": str(case["workers"]),
+        "rpc_window": str(case["window"]),
+        "placement": case["placement"],
+        })
+    if case["extras"]:
+        values.update({
+            "group": True,
+            "on_mountain_or_valley": True,
+            "rim_shader_check": True,
+            "append_warp": True,
+            })
+    return values
+
+def run_case(case, latency, call_latency, measure_memory, serial=False):
+    '''
+    Runs Apply once against a fresh mock server.
+
+    Args:
+        case (dict): Case settings, see CASE_KEYS
+        latency (float): Seconds added to every round-trip
+        call_latency (float): Seconds added to every call
+        measure_memory (bool): Trace allocations, which slows the run down
+        serial (bool): The mock server works through calls one at a time
+
+    Returns:
+        measurement (dict): Wall time, peak memory, Apply result and server stats
+    '''
+    server = MockServerProcess(latency, call_latency, case["batch"], serial)
+    try:
+        if measure_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        apply_result = run_apply(ApplySettings.from_values(case_values(case)))
+        wall_time = time.perf_counter() - start
+        peak_bytes = 0
+        if measure_memory:
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        stats = server.stats()
+    finally:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        server.stop()
+    return {
+        "wall_s": wall_time,
+        "peak_bytes": peak_bytes,
+        "apply_result": apply_result,
+        "server_stats": stats,
+        }
+
+def benchmark_case(case, latency, call_latency, repeat, serial=False):
+    '''
+    Times a case as the best of several runs, then measures its peak
+    memory in one more traced run.
+
+    Args:
+        case (dict): Case settings, see CASE_KEYS
+        latency (float): Seconds added to every round-trip
+        call_latency (float): Seconds added to every call
+        repeat (int): Number of timed runs
+        serial (bool): The mock server works through calls one at a time
+
+    Returns:
+        result (dict): Case settings and metrics
+    '''
+    timed = min(
+        (run_case(case, latency, call_latency, False, serial) for _ in range(max(repeat, 1))),
+        key=lambda measurement: measurement["wall_s"])
+    traced = run_case(case, latency, call_latency, True, serial)
+    craters = max(timed["apply_result"]["craters_added"], 1)
+    stats = timed["server_stats"]
+    result = dict(case)
+    result.update({
+        "craters_added": timed["apply_result"]["craters_added"],
+        "wall_s": round(timed["wall_s"], 4),
+        "round_trips": stats["round_trips"],
+        "calls": stats["calls"],
+        "peak_bytes": traced["peak_bytes"],
+        "network_depth": timed["apply_result"]["network_depth"],
+        "rpc_busy_s": timed["apply_result"]["report"]["rpc_busy_seconds"],
+        "python_s": timed["apply_result"]["report"]["python_seconds"],
+        "wall_ms_per_crater": round(timed["wall_s"] * 1000 / craters, 4),
+        "round_trips_per_crater": round(stats["round_trips"] / craters, 4),
+        "calls_per_crater": round(stats["calls"] / craters, 4),
+        "peak_kib_per_crater": round(traced["peak_bytes"] / 1024 / craters, 4),
+        })
+    return result
+
+def make_cases(args):
+    '''
+    Builds every combination of the requested settings.
+
+    Args:
+        args <obj>: Parsed command line arguments
+
+    Returns:
+        cases [dicts]: Case settings, see CASE_KEYS
+    '''
+    combinations = itertools.product(
+        args.counts, args.modes, args.batch, args.workers, args.window, args.placement,
+        args.extras)
+    return [
+        dict(zip(CASE_KEYS, (
+            count, mode, batch == "on", workers, window, placement, extras == "on")))
+        for count, mode, batch, workers, window, placement, extras in combinations
+        ]
+
+def case_key(result):
+    '''
+    Key identifying the case of a result, to match results between runs.
+
+    Args:
+        result (dict): Benchmark result
+
+    Returns:
+        key (tuple): Case settings in CASE_KEYS order
+    '''
+    return tuple(result.get(key, CASE_DEFAULTS.get(key)) for key in CASE_KEYS)
+
+def print_result(result):
+    '''
+    Prints one result row.
+
+    Args:
+        result (dict): Benchmark result
+    '''
+    print(
+        f"{result['count']:>6} {result['insert_into_flow']:<20} "
+        f"batch={'on ' if result['batch'] else 'off'} workers={result['workers']:<2} "
+        f"window={result['window']:<2} "
+        f"{result['placement']:<8} extras={'on ' if result['extras'] else 'off'} | "
+        f"{result['wall_s']:>8.3f} s {result['wall_ms_per_crater']:>8.3f} ms/crater "
+        f"{result['round_trips_per_crater']:>7.3f} trips/crater "
+        f"{result['peak_kib_per_crater']:>8.3f} KiB/crater",
+        flush=True)
+
+def git_commit():
+    '''
+    Gets the commit being benchmarked.
+
+    Returns:
+        commit (str): Commit hash, or empty string outside a git checkout
+    '''
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def save_results(report, output):
+    '''
+    Writes a benchmark report as JSON.
+
+    Args:
+        report (dict): Options, environment and results
+        output (str): File path, or empty to use a timestamped file in RESULTS_FOLDER
+
+    Returns:
+        output (str): Path written
+    '''
+    if not output:
+        os.makedirs(RESULTS_FOLDER, exist_ok=True)
+        output = os.path.join(
+            RESULTS_FOLDER, time.strftime("bench_apply-%Y%m%d-%H%M%S.json"))
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    return output
+
+def compare_results(baseline, results, threshold):
+    '''
+    Compares per crater metrics with an earlier run and prints the
+    cases that got slower or bigger by more than the threshold.
+
+    Args:
+        baseline (dict): Earlier benchmark report
+        results [dicts]: Benchmark results of this run
+        threshold (float): Allowed relative increase, i.e. 0.1 for 10%
+
+    Returns:
+        regressions (int): Number of regressed metrics
+    '''
+    baseline_results = {case_key(result): result for result in baseline["results"]}
+    regressions = 0
+    for result in results:
+        previous = baseline_results.get(case_key(result))
+        if previous is None:
+            continue
+        for metric in COMPARED_METRICS:
+            before, after = previous[metric], result[metric]
+            if before <= 0:
+                continue
+            change = after / before - 1.0
+            if change > threshold:
+                regressions += 1
+                print(f"REGRESSION {case_key(result)} {metric}: {before} -> {after} "
+                      f"(+{change:.0%})")
+    print(f"Compared with {baseline.get('commit') or 'baseline'}: {regressions} regression(s)")
+    return regressions
+
+def main():
+    '''
+    Parses the command line, runs the benchmark cases and saves the results.
+    '''
+    parser = argparse.ArgumentParser(description="Benchmark Apply against a mock Terragen.")
+    parser.add_argument("--counts", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--modes", nargs="+", default=INSERT_MODES, choices=INSERT_MODES)
+    parser.add_argument("--batch", nargs="+", default=["on", "off"], choices=["on", "off"],
+                        help="whether the mock server accepts batch requests")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--window", type=int, nargs="+", default=[1],
+                        help="RPC requests in flight at once")
+    parser.add_argument("--placement", nargs="+", default=["Uniform"],
+                        choices=["Uniform", "Spaced"])
+    parser.add_argument("--extras", nargs="+", default=["off"], choices=["on", "off"],
+                        help="also add a group, mountain, rim shader and fractal warp")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds the mock server adds to every round-trip")
+    parser.add_argument("--call-latency", type=float, default=0.0,
+                        help="seconds the mock server adds to every call")
+    parser.add_argument("--serial", action="store_true",
+                        help="the mock server works through calls one at a time")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="timed runs per case, the fastest is kept")
+    parser.add_argument("--output", default="", help="results file, default is timestamped")
+    parser.add_argument("--compare", default="", help="earlier results file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative increase reported as a regression")
+    args = parser.parse_args()
+
+    results = []
+    for case in make_cases(args):
+        result = benchmark_case(case, args.latency, args.call_latency, args.repeat, args.serial)
+        print_result(result)
+        results.append(result)
+
+    report = {
+        "benchmark": "bench_apply",
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {
+            "latency": args.latency,
+            "call_latency": args.call_latency,
+            "serial": args.serial,
+            "repeat": args.repeat,
+            },
+        "results": results,
+        }
+    print(f"Saved {save_results(report, args.output)}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if compare_results(baseline, results, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
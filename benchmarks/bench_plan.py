@@ -0,0 +1,198 @@
+'''
+bench_plan.py - Crater plan sampling benchmark for tg_splatter_craters.
+Samples crater plans with 1 to N plan worker processes, checks that every
+worker count gives the same plan, and reports craters sampled per second
+and the speedup over one worker. No Terragen or mock server is needed.
+
+Run from the repository folder:
+    python -m benchmarks.bench_plan --counts 1000000 4000000 --workers 1 2 4 8
+    python -m benchmarks.bench_plan --compare benchmarks/results/<earlier run>.json
+'''
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+import numpy as np
+from benchmarks.bench_apply import RESULTS_FOLDER, git_commit, save_results
+from crater_engine.plan import make_crater_plan
+from crater_engine.settings import DEFAULT_VALUES, ApplySettings
+
+# Case settings identifying a result, in table column order
+CASE_KEYS = ["count", "workers", "placement"]
+
+# Metrics compared between runs, lower is better
+COMPARED_METRICS = ["wall_s"]
+
+SEED = 1234
+
+def case_settings(case):
+    '''
+    Builds the settings of one benchmark case. The area grows with the
+    crater count, so spaced placement keeps finding room.
+
+    Args:
+        case (dict): Case settings, see CASE_KEYS
+
+    Returns:
+        settings <obj>: ApplySettings
+    '''
+    side = str(round(max(case["count"], 1) ** 0.5 * 20.0, 1))
+    values = dict(DEFAULT_VALUES)
+    values.update({
+        "quantity": str(case["count"]),
+        "plan_workers": str(case["workers"]),
+        "placement": case["placement"],
+        "x_area": side,
+        "z_area": side,
+        "dia_min": "1.0",
+        "dia_max": "5.0",
+        })
+    return ApplySettings.from_values(values)
+
+def benchmark_case(case, repeat):
+    '''
+    Times sampling a plan as the best of several runs.
+
+    Args:
+        case (dict): Case settings, see CASE_KEYS
+        repeat (int): Number of timed runs
+
+    Returns:
+        result (dict): Case settings and metrics
+        crater_plan (ndarray): Plan of the last run
+    '''
+    settings = case_settings(case)
+    times = []
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        crater_plan = make_crater_plan(settings, case["count"], SEED, case["workers"])
+        times.append(time.perf_counter() - start)
+    result = dict(case)
+    result.update({
+        "craters_planned": len(crater_plan),
+        "wall_s": round(min(times), 4),
+        "craters_per_s": round(case["count"] / max(min(times), 1e-9)),
+        })
+    return result, crater_plan
+
+def case_key(result):
+    '''
+    Key identifying the case of a result, to match results between runs.
+
+    Args:
+        result (dict): Benchmark result
+
+    Returns:
+        key (tuple): Case settings in CASE_KEYS order
+    '''
+    return tuple(result[key] for key in CASE_KEYS)
+
+def print_result(result):
+    '''
+    Prints one result row.
+
+    Args:
+        result (dict): Benchmark result
+    '''
+    print(
+        f"{result['count']:>9} workers={result['workers']:<2} {result['placement']:<8} | "
+        f"{result['wall_s']:>8.3f} s {result['craters_per_s']:>11,} craters/s "
+        f"speedup {result['speedup']:>5.2f}x same={'yes' if result['same_plan'] else 'NO'}",
+        flush=True)
+
+def compare_results(baseline, results, threshold):
+    '''
+    Compares times with an earlier run and prints the cases that got
+    slower by more than the threshold.
+
+    Args:
+        baseline (dict): Earlier benchmark report
+        results [dicts]: Benchmark results of this run
+        threshold (float): Allowed relative increase, i.e. 0.1 for 10%
+
+    Returns:
+        regressions (int): Number of regressed metrics
+    '''
+    baseline_results = {case_key(result): result for result in baseline["results"]}
+    regressions = 0
+    for result in results:
+        previous = baseline_results.get(case_key(result))
+        if previous is None:
+            continue
+        for metric in COMPARED_METRICS:
+            before, after = previous[metric], result[metric]
+            if before <= 0:
+                continue
+            change = after / before - 1.0
+            if change > threshold:
+                regressions += 1
+                print(f"REGRESSION {case_key(result)} {metric}: {before} -> {after} "
+                      f"(+{change:.0%})")
+    print(f"Compared with {baseline.get('commit') or 'baseline'}: {regressions} regression(s)")
+    return regressions
+
+def main():
+    '''
+    Parses the command line, runs the benchmark cases and saves the results.
+    '''
+    parser = argparse.ArgumentParser(description="Benchmark crater plan sampling.")
+    parser.add_argument("--counts", type=int, nargs="+", default=[1000000])
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--placement", nargs="+", default=["Uniform"],
+                        choices=["Uniform", "Spaced"])
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="timed runs per case, the fastest is kept")
+    parser.add_argument("--output", default="", help="results file, default is timestamped")
+    parser.add_argument("--compare", default="", help="earlier results file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative increase reported as a regression")
+    args = parser.parse_args()
+
+    results = []
+    different = 0
+    workers = sorted(set(args.workers))
+    for count, placement in itertools.product(args.counts, args.placement):
+        first_time = first_plan = None
+        for worker_count in workers:
+            case = dict(zip(CASE_KEYS, (count, worker_count, placement)))
+            result, crater_plan = benchmark_case(case, args.repeat)
+            if first_plan is None:
+                first_time, first_plan = result["wall_s"], crater_plan
+            result["speedup"] = round(first_time / max(result["wall_s"], 1e-9), 3)
+            result["same_plan"] = bool(np.array_equal(first_plan, crater_plan))
+            different += not result["same_plan"]
+            print_result(result)
+            results.append(result)
+
+    report = {
+        "benchmark": "bench_plan",
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "options": {"repeat": args.repeat, "seed": SEED},
+        "results": results,
+        }
+    output = args.output or os.path.join(
+        RESULTS_FOLDER, time.strftime("bench_plan-%Y%m%d-%H%M%S.json"))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    print(f"Saved {save_results(report, output)}")
+
+    if different:
+        print(f"{different} case(s) sampled a different plan than {workers[0]} worker(s)")
+    regressions = 0
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare_results(baseline, results, args.threshold)
+    if different or regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
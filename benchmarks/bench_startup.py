@@ -0,0 +1,158 @@
+'''
+bench_startup.py - Startup benchmark for tg_splatter_craters.
+Launches the script in fresh Python processes, as a controller button
+does, and reports how long the interpreter, the script's imports and
+the first paint of the window take. First paint is the time from process
+start until the window has been drawn and can take input; it needs a
+display and is skipped without one.
+
+Run from the repository folder:
+    python -m benchmarks.bench_startup --repeat 20
+    python -m benchmarks.bench_startup --compare benchmarks/results/<earlier run>.json
+'''
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from benchmarks.bench_apply import git_commit, save_results
+
+ROOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT_FOLDER, "tg_splatter_craters.py")
+
+# Prints seconds from the child's start to the end of `import tg_splatter_craters`
+IMPORT_PROBE = '''
+import time
+start = time.perf_counter()
+import tg_splatter_craters
+print(time.perf_counter() - start)
+'''
+
+# Runs the script as __main__ with mainloop() replaced by one update(),
+# then prints seconds from the child's start to the drawn window
+PAINT_PROBE = '''
+import runpy, sys, time, tkinter
+start = time.perf_counter()
+def first_paint(self, n=0):
+    self.update()
+    print(time.perf_counter() - start, flush=True)
+    self.destroy()
+tkinter.Tk.mainloop = first_paint
+sys.argv = [{script!r}]
+runpy.run_path({script!r}, run_name="__main__")
+'''
+
+# Per launch metrics compared between runs
+COMPARED_METRICS = ["process_ms", "import_ms", "first_paint_ms"]
+
+def time_process(code):
+    '''
+    Runs Python code in a fresh interpreter.
+
+    Args:
+        code (str): Code to run, printing one number of seconds as its last line
+
+    Returns:
+        process_s (float): Wall time of the whole process
+        probe_s (float): Seconds printed by the code, None if it failed
+    '''
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT_FOLDER, capture_output=True, text=True,
+        check=False)
+    process_s = time.perf_counter() - start
+    lines = completed.stdout.split()
+    if completed.returncode or not lines:
+        return process_s, None
+    return process_s, float(lines[-1])
+
+def median_ms(seconds):
+    '''
+    Median of measurements in milliseconds.
+
+    Args:
+        seconds [float]: Measurements, None where they failed
+
+    Returns:
+        milliseconds (float): Median, None if every measurement failed
+    '''
+    measured = [value for value in seconds if value is not None]
+    if not measured:
+        return None
+    return round(statistics.median(measured) * 1000.0, 3)
+
+def benchmark_startup(repeat):
+    '''
+    Times interpreter startup, the script's imports and first paint.
+
+    Args:
+        repeat (int): Launches per measurement, the median is kept
+
+    Returns:
+        result (dict): Median times in milliseconds
+    '''
+    interpreter = [time_process("print(0)")[0] for _ in range(repeat)]
+    imports = [time_process(IMPORT_PROBE) for _ in range(repeat)]
+    paints = [time_process(PAINT_PROBE.format(script=SCRIPT)) for _ in range(repeat)]
+    return {
+        "interpreter_ms": median_ms(interpreter),
+        "process_ms": median_ms([process_s for process_s, _ in imports]),
+        "import_ms": median_ms([probe_s for _, probe_s in imports]),
+        "first_paint_ms": median_ms([probe_s for _, probe_s in paints]),
+        }
+
+def main():
+    '''
+    Parses the command line, times startup and saves the result.
+    '''
+    parser = argparse.ArgumentParser(description="Benchmark tg_splatter_craters startup.")
+    parser.add_argument("--repeat", type=int, default=10,
+                        help="launches per measurement, the median is kept")
+    parser.add_argument("--output", default="", help="results file, default is timestamped")
+    parser.add_argument("--compare", default="", help="earlier results file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative increase reported as a regression")
+    args = parser.parse_args()
+
+    result = benchmark_startup(max(args.repeat, 1))
+    for metric, milliseconds in result.items():
+        shown = "n/a (no display)" if milliseconds is None else f"{milliseconds:.1f} ms"
+        print(f"{metric:<16} {shown}")
+
+    report = {
+        "benchmark": "bench_startup",
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {"repeat": args.repeat},
+        "result": result,
+        }
+    output = args.output or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "results",
+        time.strftime("bench_startup-%Y%m%d-%H%M%S.json"))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    print(f"Saved {save_results(report, output)}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)["result"]
+        regressions = 0
+        for metric in COMPARED_METRICS:
+            before, after = baseline.get(metric), result[metric]
+            if not before or after is None:
+                continue
+            change = after / before - 1.0
+            if change > args.threshold:
+                regressions += 1
+                print(f"REGRESSION {metric}: {before} -> {after} (+{change:.0%})")
+        print(f"Compared with baseline: {regressions} regression(s)")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
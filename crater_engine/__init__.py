@@ -0,0 +1,69 @@
+'''
+crater_engine - Non-GUI building blocks of tg_splatter_craters.
+Names are imported from their modules when first used, so that importing
+crater_engine.settings or crater_engine.presets, as the window does at
+startup, doesn't also load numpy and terragen_rpc.
+'''
+
+import importlib
+
+# Public name: module it is defined in
+_EXPORTS = {
+    "CRATER_PLAN_COLUMNS": "crater_engine.plan",
+    "CRATER_PLAN_DTYPE": "crater_engine.plan",
+    "crater_plan_rows": "crater_engine.plan",
+    "iter_crater_plan": "crater_engine.plan",
+    "make_crater_plan": "crater_engine.plan",
+    "RpcBatchWriter": "crater_engine.rpc_batch",
+    "write_craters": "crater_engine.rpc_batch",
+    "write_craters_parallel": "crater_engine.parallel",
+    "AsyncRpcClient": "crater_engine.rpc_async",
+    "write_craters_pipelined": "crater_engine.rpc_async",
+    "PlanCache": "crater_engine.plan_file",
+    "PlanFileError": "crater_engine.plan_file",
+    "load_plan": "crater_engine.plan_file",
+    "load_replay": "crater_engine.plan_file",
+    "save_plan": "crater_engine.plan_file",
+    "CameraError": "crater_engine.culling",
+    "CameraView": "crater_engine.culling",
+    "cull_craters": "crater_engine.culling",
+    "read_camera": "crater_engine.culling",
+    "render_preview": "crater_engine.preview",
+    "export_clip": "crater_engine.clip_export",
+    "rasterize_craters": "crater_engine.raster",
+    "write_raster": "crater_engine.raster",
+    "DensityMap": "crater_engine.density",
+    "DensityMapError": "crater_engine.density",
+    "load_density_map": "crater_engine.density",
+    "CheckpointError": "crater_engine.checkpoint",
+    "load_checkpoint": "crater_engine.checkpoint",
+    "TargetError": "crater_engine.targets",
+    "JournalError": "crater_engine.journal",
+    "undo_last_run": "crater_engine.journal",
+    "ManifestError": "crater_engine.manifest",
+    "load_manifest": "crater_engine.manifest",
+    "save_manifest": "crater_engine.manifest",
+    "CRATER_PRESETS": "crater_engine.presets",
+    "PRESET_LABELS": "crater_engine.presets",
+    "preset_values": "crater_engine.presets",
+    "DEFAULT_VALUES": "crater_engine.settings",
+    "ApplySettings": "crater_engine.settings",
+    "SettingsError": "crater_engine.settings",
+    "run_apply": "crater_engine.pipeline",
+    "replay_plan": "crater_engine.pipeline",
+    "resume_apply": "crater_engine.pipeline",
+    "run_reapply": "crater_engine.reapply",
+    }
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module 'crater_engine' has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,8 @@
+'''
+Runs the tg_splatter_craters command line, see crater_engine.cli.
+'''
+
+import sys
+from crater_engine.cli import main
+
+sys.exit(main())
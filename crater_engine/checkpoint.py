@@ -0,0 +1,279 @@
+'''
+checkpoint.py - Resumable Apply checkpoints for tg_splatter_craters.
+A checkpointed Apply writes what it added before the craters into the
+checkpoint, with the seed and settings its crater plan is sampled from,
+or, when the plan can't be sampled again, i.e. once culled, keeps the
+plan next to the checkpoint file. It then
+appends the path of every crater whose parameters are all set as soon
+as it is committed. When the run fails halfway, i.e. Terragen stopped
+answering, the committed craters are kept in the project and
+pipeline.resume_apply() continues with the next crater of the same
+plan, chained to the last committed one.
+
+The checkpoint is a JSON lines file: the header first, then one line
+per commit. A line cut short by a crash is ignored when it's read.
+'''
+
+import json
+import os
+import threading
+import time
+from crater_engine.journal import delete_run_nodes
+from crater_engine.plan import make_crater_plan
+from crater_engine.plan_file import PLAN_SUFFIX, load_replay, save_plan
+from crater_engine.project_cache import project_cache
+from crater_engine.rpc_batch import PATH_METHOD, RpcBatchWriter
+from crater_engine.settings import ApplySettings
+
+CHECKPOINT_FORMAT = 1
+
+class CheckpointError(ValueError):
+    '''
+    Raised when a checkpoint can't be read or no longer matches the project.
+    '''
+
+class Checkpoint:
+    '''
+    Checkpoint file of one run. Commits can come from several worker
+    threads, see rpc_batch.write_craters().
+
+    Args:
+        file_path (str): Checkpoint file
+        header (dict): See start(), None until the run gets that far
+        crater_paths [str]: Paths of the craters committed so far, in plan order
+        stray_paths [str]: Paths of crater nodes created but never committed
+        stray_ids [str]: Node ids of those whose path wasn't known yet
+    '''
+    def __init__(self, file_path, header=None, crater_paths=(), stray_paths=(), stray_ids=()):
+        self.file_path = file_path
+        self.header = header
+        self.crater_paths = list(crater_paths)
+        self.stray_paths = list(stray_paths)
+        self.stray_ids = list(stray_ids)
+        # journaled nodes before the first crater of this part of the run
+        self.journal_start = 0
+        self._lock = threading.Lock()
+
+    @property
+    def plan_path(self):
+        '''
+        Plan file of the run, see plan_file.save_plan(). Only written
+        when the plan can't be sampled again from the header.
+        '''
+        return self.file_path + PLAN_SUFFIX
+
+    @property
+    def started(self):
+        '''
+        True once the header has been written.
+        '''
+        return self.header is not None
+
+    def start(self, journal, crater_plan, settings, seed, manifest, apply_result) -> None:
+        '''
+        Writes the header, and the plan file if there is a plan to keep,
+        replacing an earlier checkpoint, right before the first crater
+        is created.
+
+        Args:
+            journal <obj>: RunJournal of the run, with the paths of its nodes
+            crater_plan (ndarray): Plan of the Crater shaders to add, None
+                when the run samples it from seed as it goes
+            settings <obj>: ApplySettings
+            seed (int): Seed the plan is sampled with
+            manifest (dict): Manifest with the nodes added so far, see new_manifest()
+            apply_result (dict): Culling, raster and plan_file values of the run
+        '''
+        header = {
+            "format": CHECKPOINT_FORMAT,
+            "run_id": journal.run_id,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "nodes": journal.paths(),
+            "manifest": manifest,
+            "apply_result": apply_result,
+            }
+        if crater_plan is None:
+            # the same seed and settings give the same plan, see load_checkpoint_plan()
+            header["plan"] = {"seed": seed, "settings": settings.to_dict()}
+            try:
+                os.remove(self.plan_path)
+            except FileNotFoundError:
+                pass
+        else:
+            save_plan(self.plan_path, crater_plan, settings, seed)
+        temp_path = self.file_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write(json.dumps(header) + "\n")
+        os.replace(temp_path, self.file_path)
+        self.header = header
+        self.crater_paths = []
+        self.stray_paths = []
+        self.stray_ids = []
+        self.journal_start = len(journal.node_ids)
+
+    def commit(self, crater_paths) -> None:
+        '''
+        Appends committed craters, the next ones in plan order.
+
+        Args:
+            crater_paths [str]: Paths of the craters
+        '''
+        self._append({"craters": list(crater_paths)})
+        with self._lock:
+            self.crater_paths.extend(crater_paths)
+
+    def note_stray(self, stray_paths, stray_ids=()) -> None:
+        '''
+        Records the crater nodes to delete before resuming, replacing
+        the ones recorded before.
+
+        Args:
+            stray_paths [str]: Node paths, empty once they are deleted
+            stray_ids [str]: Node ids of the nodes without a known path
+        '''
+        self._append({"stray": list(stray_paths), "stray_ids": list(stray_ids)})
+        self.stray_paths = list(stray_paths)
+        self.stray_ids = list(stray_ids)
+
+    def _append(self, record) -> None:
+        with self._lock:
+            with open(self.file_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(record) + "\n")
+
+    def remove(self) -> None:
+        '''
+        Deletes the checkpoint and its plan file once the run has finished.
+        '''
+        for file_path in (self.file_path, self.plan_path):
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+
+def load_checkpoint(file_path):
+    '''
+    Reads a checkpoint.
+
+    Args:
+        file_path (str): Checkpoint file
+
+    Returns:
+        checkpoint <obj>: Checkpoint with the committed craters
+
+    Raises:
+        CheckpointError: The file can't be read or isn't a checkpoint
+    '''
+    try:
+        with open(file_path, encoding="utf-8") as file:
+            lines = file.read().splitlines()
+    except FileNotFoundError as e:
+        raise CheckpointError("There is no interrupted Apply to resume.") from e
+    except OSError as e:
+        raise CheckpointError(f"Can't read checkpoint {file_path}: {e}") from e
+    try:
+        header = json.loads(lines[0])
+    except (IndexError, ValueError) as e:
+        raise CheckpointError(f"{file_path} is not a tg_splatter_craters checkpoint.") from e
+    if not isinstance(header, dict) or header.get("format") != CHECKPOINT_FORMAT:
+        raise CheckpointError(f"{file_path} is not a tg_splatter_craters checkpoint.")
+    checkpoint = Checkpoint(file_path, header)
+    for line in lines[1:]:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            break # cut short while it was written, nothing after it was committed
+        checkpoint.crater_paths.extend(record.get("craters", []))
+        if "stray" in record:
+            checkpoint.stray_paths = list(record["stray"])
+            checkpoint.stray_ids = list(record.get("stray_ids", []))
+    return checkpoint
+
+def load_checkpoint_plan(checkpoint):
+    '''
+    Gets the crater plan and settings of a checkpointed run, sampling the
+    plan again from the seed and settings in the header, or reading the
+    plan file the run kept.
+
+    Args:
+        checkpoint <obj>: Checkpoint read by load_checkpoint()
+
+    Returns:
+        crater_plan (ndarray): Plan of all Crater shaders of the run
+        settings <obj>: ApplySettings of the run, with its seed
+
+    Raises:
+        PlanFileError: The plan file of the checkpoint can't be read
+    '''
+    plan = checkpoint.header.get("plan")
+    if plan is None:
+        return load_replay(checkpoint.plan_path)
+    settings = ApplySettings.from_dict({**plan["settings"], "seed": plan["seed"]})
+    crater_plan = make_crater_plan(
+        settings, settings.quantity, plan["seed"], settings.plan_workers)
+    return crater_plan, settings
+
+def keep_committed(journal, checkpoint):
+    '''
+    Deletes the crater nodes a failed run created but never committed,
+    by node id, and keeps everything else for resuming. Best effort:
+    when Terragen can't be reached their paths are recorded instead, and
+    deleted when the run is resumed.
+
+    Args:
+        journal <obj>: RunJournal of the failed run, marked "interrupted"
+        checkpoint <obj>: Started Checkpoint of the run
+
+    Returns:
+        num_stray (int): Number of uncommitted crater nodes
+    '''
+    committed = set(checkpoint.crater_paths)
+    stray_ids = [
+        node_id for node_id in journal.node_ids[checkpoint.journal_start:]
+        if journal.node_paths.get(node_id) not in committed
+        ]
+    journal.status = "interrupted"
+    if not stray_ids:
+        return 0
+    try:
+        RpcBatchWriter().call("delete", [stray_ids])
+        journal.forget(stray_ids)
+    except Exception: # the run's own error is what the caller reports
+        try:
+            checkpoint.note_stray(
+                [journal.node_paths[i] for i in stray_ids if i in journal.node_paths],
+                [i for i in stray_ids if i not in journal.node_paths])
+        except OSError:
+            pass
+    return len(stray_ids)
+
+def delete_strays(writer, checkpoint):
+    '''
+    Deletes the crater nodes an interrupted run left uncommitted before
+    it is resumed. Those only known by node id are deleted only while
+    they are still Crater shaders at the project root that aren't
+    committed, as node ids don't outlive a Terragen session.
+
+    Args:
+        writer <obj>: RpcBatchWriter
+        checkpoint <obj>: Checkpoint read by load_checkpoint()
+
+    Returns:
+        num_deleted (int): Number of nodes deleted
+    '''
+    num_deleted = 0
+    if checkpoint.stray_paths:
+        num_deleted, _ = delete_run_nodes(writer, checkpoint.stray_paths, [])
+    if checkpoint.stray_ids:
+        crater_ids = set(writer.call(
+            "children_filtered_by_class", [writer.root().id, "crater_shader"]))
+        node_ids = [i for i in checkpoint.stray_ids if i in crater_ids]
+        node_paths = writer.call_many([(PATH_METHOD, [i]) for i in node_ids])
+        committed = set(checkpoint.crater_paths)
+        deleted = [(i, path) for i, path in zip(node_ids, node_paths) if path not in committed]
+        if deleted:
+            writer.call("delete", [[i for i, _ in deleted]])
+            project_cache().note_deleted([path for _, path in deleted])
+            num_deleted += len(deleted)
+    if checkpoint.stray_paths or checkpoint.stray_ids:
+        checkpoint.note_stray([])
+    return num_deleted
@@ -0,0 +1,513 @@
+'''
+cli.py - Command line front end of tg_splatter_craters.
+Runs the same Apply as the window, without Tk or a display, so craters
+can be scripted or added on a render farm node. Values start from the
+window's defaults, then a JSON job file, then a preset, then --set
+overrides, each replacing the values before it.
+
+Examples:
+    python -m crater_engine --preset Tiny_craters --set quantity=500
+    python -m crater_engine --job craters.json --set "insert_into_flow=Merge tree"
+    python -m crater_engine --preset Basins --dry-run > craters.json
+    python -m crater_engine --set seed=42 --save-plan craters.npz
+    python -m crater_engine --replay craters.npz
+    python -m crater_engine --set quantity=500 --manifest craters.json
+    python -m crater_engine --set quantity=500 --set depth_check=1 --reapply craters.json
+    python -m crater_engine --preset Basins --journal runs.json
+    python -m crater_engine --undo runs.json
+    python -m crater_engine --set quantity=5000 --checkpoint craters.jsonl
+    python -m crater_engine --resume craters.jsonl
+    python -m crater_engine --set quantity=100000 --export craters.tgc
+    python -m crater_engine --set targets=All --set "target_plan=Per target"
+    python -m crater_engine --set targets=Selected --set "target_names=Compute terrain 01"
+
+A job file holds an optional preset and the values to override:
+    {"preset": "ALC_young", "values": {"quantity": "2000", "group": true}}
+'''
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from crater_engine.presets import CRATER_PRESETS, PRESET_LABELS, preset_values
+from crater_engine.settings import DEFAULT_VALUES, ApplySettings, SettingsError
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 1.0
+
+EXIT_OK = 0
+EXIT_APPLY_FAILED = 1
+EXIT_BAD_SETTINGS = 2
+EXIT_CANCELLED = 3
+
+def parse_bool(text):
+    '''
+    Converts command line text to a check button value.
+
+    Args:
+        text (str): i.e. "true", "0", "yes"
+
+    Returns:
+        value (bool): Parsed value
+    '''
+    lowered = str(text).strip().lower()
+    if lowered in ("1", "true", "yes", "on"):
+        return True
+    if lowered in ("0", "false", "no", "off"):
+        return False
+    raise SettingsError([f"{text!r} is not true or false."])
+
+def override_values(overrides):
+    '''
+    Parses --set KEY=VALUE arguments. Values of check buttons are
+    converted to bool, all others are kept as text like the window's.
+
+    Args:
+        overrides [str]: KEY=VALUE strings
+
+    Returns:
+        values (dict): Raw UI values
+    '''
+    values = {}
+    problems = []
+    for override in overrides:
+        key, separator, value = override.partition("=")
+        key = key.strip()
+        if not separator:
+            problems.append(f"--set {override!r} must look like KEY=VALUE.")
+        elif key not in DEFAULT_VALUES:
+            problems.append(f"--set {key!r} is not a known value.")
+        elif isinstance(DEFAULT_VALUES[key], bool):
+            try:
+                values[key] = parse_bool(value)
+            except SettingsError as e:
+                problems.append(f"--set {key}: {e}")
+        else:
+            values[key] = value
+    if problems:
+        raise SettingsError(problems)
+    return values
+
+def load_job(file_path):
+    '''
+    Reads a JSON job file.
+
+    Args:
+        file_path (str): Job file path
+
+    Returns:
+        preset (str): Preset name, empty if none
+        values (dict): Raw UI values
+    '''
+    try:
+        with open(file_path, encoding="utf-8") as file:
+            job = json.load(file)
+    except (OSError, ValueError) as e:
+        raise SettingsError([f"Can't read job file {file_path}: {e}"]) from e
+    if not isinstance(job, dict) or not isinstance(job.get("values", {}), dict):
+        raise SettingsError([f"Job file {file_path} must hold an object with a values object."])
+    values = job.get("values", {})
+    unknown = [key for key in values if key not in DEFAULT_VALUES]
+    if unknown:
+        raise SettingsError([f"Job file {file_path}: unknown values {', '.join(unknown)}."])
+    return job.get("preset", ""), values
+
+def resolve_values(job_file, preset, overrides):
+    '''
+    Combines the defaults, job file, preset and overrides into one set
+    of raw UI values.
+
+    Args:
+        job_file (str): Job file path, empty if none
+        preset (str): Preset name, empty if none
+        overrides [str]: KEY=VALUE strings
+
+    Returns:
+        values (dict): Raw UI values
+    '''
+    values = dict(DEFAULT_VALUES)
+    if job_file:
+        job_preset, job_values = load_job(job_file)
+        values.update(checked_preset_values(job_preset))
+        values.update(job_values)
+    values.update(checked_preset_values(preset))
+    values.update(override_values(overrides))
+    return values
+
+def checked_preset_values(preset):
+    '''
+    Gets the values of a preset, reporting unknown names.
+
+    Args:
+        preset (str): Preset name, empty for none
+
+    Returns:
+        values (dict): Raw UI values set by the preset
+    '''
+    if not preset:
+        return {}
+    if preset not in CRATER_PRESETS:
+        raise SettingsError(
+            [f"Unknown preset {preset!r}, use one of: {', '.join(CRATER_PRESETS)}."])
+    return preset_values(preset)
+
+def run_headless(settings, report_path, quiet, crater_plan=None, plan_cache=None, plan_path="",
+                 manifest_path="", reapply=False, journal_path="", checkpoint_path="",
+                 resume=False):
+    '''
+    Runs Apply on a worker thread and prints progress. Ctrl+C stops
+    after the current crater, like the window's Cancel button.
+
+    Args:
+        settings <obj>: ApplySettings
+        report_path (str): JSON report file, empty for none
+        quiet (bool): Don't print progress
+        crater_plan (ndarray): Optional plan to add instead of sampling one
+        plan_cache <obj>: Optional PlanCache
+        plan_path (str): Plan file to write, empty for none
+        manifest_path (str): Manifest file to write, or to re-apply, empty for none
+        reapply (bool): Update the craters recorded in manifest_path instead of
+            adding new ones, see crater_engine.reapply
+        journal_path (str): Journal file the run is added to, empty for none
+        checkpoint_path (str): Checkpoint file of the run, empty for none
+        resume (bool): Continue the run of checkpoint_path instead of starting
+            one, see resume_apply()
+
+    Returns:
+        apply_result (dict): See run_apply(), resume_apply() and run_reapply()
+    '''
+    # imported here so --help, --list-presets and --dry-run don't need terragen_rpc
+    from crater_engine.pipeline import resume_apply, run_apply
+    from crater_engine.reapply import run_reapply
+
+    cancel_event = threading.Event()
+    outcome = {}
+    progress_state = {"last_print": 0.0}
+    start_time = time.perf_counter()
+
+    def progress(craters_done):
+        now = time.perf_counter()
+        if quiet or now - progress_state["last_print"] < PROGRESS_INTERVAL:
+            return
+        progress_state["last_print"] = now
+        rate = craters_done / max(now - start_time, 1e-9)
+        print(f"{craters_done}/{settings.quantity} craters, {rate:.1f}/s",
+              file=sys.stderr, flush=True)
+
+    def worker():
+        try:
+            if resume:
+                outcome["result"] = resume_apply(
+                    checkpoint_path, progress, cancel_event, report_path or None,
+                    manifest_path or None, journal_path or None)
+            elif reapply:
+                outcome["result"] = run_reapply(
+                    settings, manifest_path, progress, report_path or None, plan_cache,
+                    journal_path or None)
+            else:
+                outcome["result"] = run_apply(
+                    settings, progress, cancel_event, report_path or None, crater_plan,
+                    plan_cache, plan_path or None, manifest_path or None, journal_path or None,
+                    checkpoint_path or None)
+        except BaseException as e: # re-raised on the main thread
+            outcome["error"] = e
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    while thread.is_alive():
+        try:
+            thread.join(0.2)
+        except KeyboardInterrupt:
+            if cancel_event.is_set():
+                raise
+            print("Cancelling after the current crater, press Ctrl+C again to abort",
+                  file=sys.stderr, flush=True)
+            cancel_event.set()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+def set_rpc_address(host, port):
+    '''
+    Points terragen_rpc at another Terragen RPC server.
+
+    Args:
+        host (str): Host name, empty keeps the default
+        port (int): TCP port, 0 keeps the default
+    '''
+    import terragen_rpc.impl as tg_impl
+    if host:
+        tg_impl.TCP_IP = host
+    if port:
+        tg_impl.TCP_PORT = port
+
+def undo_command(args):
+    '''
+    Deletes every node of the last run in a journal and prints the result.
+
+    Args:
+        args <obj>: Parsed command line, see main()
+
+    Returns:
+        exit_code (int): EXIT_OK, EXIT_APPLY_FAILED or EXIT_BAD_SETTINGS when
+            there is nothing to undo
+    '''
+    import terragen_rpc as tg
+    from crater_engine.journal import JournalError, undo_last_run
+    set_rpc_address(args.host, args.port)
+    try:
+        undo_result = undo_last_run(
+            args.undo, args.manifest or None, args.report or None, args.checkpoint or None)
+    except JournalError as e:
+        print(str(e), file=sys.stderr)
+        return EXIT_BAD_SETTINGS
+    except ConnectionError as e:
+        print("Terragen RPC connection error: " + str(e), file=sys.stderr)
+        return EXIT_APPLY_FAILED
+    except TimeoutError as e:
+        print("Terragen RPC timeout error: " + str(e), file=sys.stderr)
+        return EXIT_APPLY_FAILED
+    except tg.ReplyError as e:
+        print("Terragen RPC reply error: " + str(e), file=sys.stderr)
+        return EXIT_APPLY_FAILED
+    except tg.ApiError as e:
+        print("Terragen RPC API error: " + str(e), file=sys.stderr)
+        return EXIT_APPLY_FAILED
+    except tg.Error as e:
+        print("Terragen RPC error: " + str(e), file=sys.stderr)
+        return EXIT_APPLY_FAILED
+    except OSError as e:
+        print("Can't write the journal file: " + str(e), file=sys.stderr)
+        return EXIT_APPLY_FAILED
+    except Exception as e:
+        print(str(e), file=sys.stderr)
+        return EXIT_APPLY_FAILED
+    undo_result.pop("report", None)
+    print(json.dumps(undo_result, indent=2))
+    return EXIT_OK
+
+def export_command(args, settings, crater_plan=None):
+    '''
+    Writes the crater network to a Terragen clip file and prints the
+    result. Ctrl+C stops the export and leaves no file behind.
+
+    Args:
+        args <obj>: Parsed command line, see main()
+        settings <obj>: ApplySettings
+        crater_plan (ndarray): Optional plan to write instead of sampling one
+
+    Returns:
+        exit_code (int): EXIT_OK, EXIT_APPLY_FAILED, EXIT_BAD_SETTINGS or EXIT_CANCELLED
+    '''
+    from crater_engine.clip_export import export_clip
+    from crater_engine.density import DensityMapError
+    progress_state = {"last_print": 0.0}
+    start_time = time.perf_counter()
+
+    def progress(craters_done):
+        now = time.perf_counter()
+        if args.quiet or now - progress_state["last_print"] < PROGRESS_INTERVAL:
+            return
+        progress_state["last_print"] = now
+        rate = craters_done / max(now - start_time, 1e-9)
+        print(f"{craters_done}/{settings.quantity} craters written, {rate:.1f}/s",
+              file=sys.stderr, flush=True)
+
+    try:
+        export_result = export_clip(settings, args.export, progress, crater_plan=crater_plan)
+    except DensityMapError as e:
+        print(str(e), file=sys.stderr)
+        return EXIT_BAD_SETTINGS
+    except KeyboardInterrupt:
+        print("Export cancelled", file=sys.stderr)
+        return EXIT_CANCELLED
+    except OSError as e:
+        print("Can't write the clip file: " + str(e), file=sys.stderr)
+        return EXIT_APPLY_FAILED
+    print(json.dumps(export_result, indent=2))
+    return EXIT_OK
+
+def resume_hint(args):
+    '''
+    Tells how to continue after a checkpointed Apply failed.
+
+    Args:
+        args <obj>: Parsed command line, see main()
+
+    Returns:
+        hint (str): Text to add to the error message, empty without a checkpoint
+    '''
+    checkpoint_path = args.resume or args.checkpoint
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return ""
+    return f"\nThe craters added so far are kept, continue with --resume {checkpoint_path}"
+
+def list_presets():
+    '''
+    Prints the preset names and their menu labels.
+    '''
+    for name, label in PRESET_LABELS.items():
+        print(f"{name:<20} {label}")
+
+def main(argv=None):
+    '''
+    Parses the command line and runs Apply headless.
+
+    Args:
+        argv [str]: Arguments, sys.argv[1:] if None
+
+    Returns:
+        exit_code (int): EXIT_OK, EXIT_APPLY_FAILED, EXIT_BAD_SETTINGS (also for
+            an unreadable plan file, a manifest that can't be re-applied, a
+            journal with nothing to undo or a checkpoint that can't be resumed)
+            or EXIT_CANCELLED
+    '''
+    parser = argparse.ArgumentParser(
+        prog="python -m crater_engine",
+        description="Splatter Crater shaders into the active Terragen project, without a window.")
+    parser.add_argument("--job", default="", help="JSON job file with a preset and values")
+    parser.add_argument("--preset", default="", help="preset name, see --list-presets")
+    parser.add_argument("--set", dest="overrides", action="append", default=[],
+                        metavar="KEY=VALUE", help="override one value, can be repeated")
+    parser.add_argument("--replay", default="",
+                        help="add the craters of a plan file with its saved settings")
+    parser.add_argument("--save-plan", default="", help="also write the crater plan here")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="don't reuse or keep plans in the plan cache")
+    parser.add_argument("--manifest", default="",
+                        help="write the manifest of the Apply here, for --reapply")
+    parser.add_argument("--reapply", default="", metavar="MANIFEST",
+                        help="update the craters recorded in a manifest instead of adding new ones")
+    parser.add_argument("--journal", default="",
+                        help="add the run and the nodes it creates to this journal, for --undo")
+    parser.add_argument("--undo", default="", metavar="JOURNAL",
+                        help="delete every node of the last run in a journal, add nothing")
+    parser.add_argument("--checkpoint", default="",
+                        help="write every finished crater here, so a failed or cancelled "
+                             "run can be continued with --resume; with --undo, delete it "
+                             "when it belongs to the undone run")
+    parser.add_argument("--resume", default="", metavar="CHECKPOINT",
+                        help="continue the run of a checkpoint from its next crater")
+    parser.add_argument("--export", default="", metavar="CLIP",
+                        help="write the crater network to a Terragen clip file instead of "
+                             "adding it, Terragen isn't needed")
+    parser.add_argument("--report", default="", help="write the JSON timing report here")
+    parser.add_argument("--host", default="", help="Terragen RPC host, default localhost")
+    parser.add_argument("--port", type=int, default=0, help="Terragen RPC port")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="check the values and print them as a job file, add nothing")
+    parser.add_argument("--list-presets", action="store_true")
+    parser.add_argument("--quiet", action="store_true", help="don't print progress")
+    args = parser.parse_args(argv)
+    if args.undo and (args.reapply or args.replay or args.journal):
+        parser.error("--undo can't be combined with --reapply, --replay or --journal")
+    if args.export and (args.undo or args.reapply or args.journal or args.manifest
+                        or args.save_plan or args.report):
+        parser.error("--export can't be combined with --undo, --reapply, --journal, "
+                     "--manifest, --save-plan or --report")
+    if args.resume and (args.undo or args.reapply or args.replay or args.export
+                        or args.checkpoint or args.save_plan):
+        parser.error("--resume can't be combined with --undo, --reapply, --replay, "
+                     "--export, --checkpoint or --save-plan")
+    if args.checkpoint and (args.reapply or args.export):
+        parser.error("--checkpoint can't be combined with --reapply or --export")
+    if args.reapply and (args.replay or args.manifest):
+        parser.error("--reapply updates its own manifest and can't be combined with "
+                     "--replay or --manifest")
+
+    if args.list_presets:
+        list_presets()
+        return EXIT_OK
+
+    if args.undo:
+        return undo_command(args)
+
+    crater_plan = None
+    values = {}
+    if args.resume:
+        # the settings and plan are the checkpoint's
+        from crater_engine.checkpoint import CheckpointError, load_checkpoint, load_checkpoint_plan
+        from crater_engine.plan_file import PlanFileError
+        try:
+            crater_plan, settings = load_checkpoint_plan(load_checkpoint(args.resume))
+        except (CheckpointError, PlanFileError) as e:
+            print(str(e), file=sys.stderr)
+            return EXIT_BAD_SETTINGS
+    elif args.replay:
+        # imported here so the other commands don't need numpy
+        from crater_engine.plan_file import PlanFileError, load_replay
+        try:
+            crater_plan, settings = load_replay(args.replay)
+        except PlanFileError as e:
+            print(str(e), file=sys.stderr)
+            return EXIT_BAD_SETTINGS
+    else:
+        try:
+            values = resolve_values(args.job, args.preset, args.overrides)
+            settings = ApplySettings.from_values(values)
+        except SettingsError as e:
+            print("Please correct these values:\n" + str(e), file=sys.stderr)
+            return EXIT_BAD_SETTINGS
+
+    if args.dry_run:
+        if args.replay or args.resume:
+            print(json.dumps({"settings": settings.to_dict()}, indent=2))
+        else:
+            print(json.dumps({"values": values}, indent=2))
+        return EXIT_OK
+
+    if args.export:
+        return export_command(args, settings, crater_plan)
+
+    import terragen_rpc as tg
+    set_rpc_address(args.host, args.port)
+
+    from crater_engine.checkpoint import CheckpointError
+    from crater_engine.culling import CameraError
+    from crater_engine.density import DensityMapError
+    from crater_engine.manifest import ManifestError
+    from crater_engine.plan_file import PlanCache, PlanFileError
+    from crater_engine.targets import TargetError
+    plan_cache = None if args.no_cache or args.replay or args.resume else PlanCache()
+
+    try:
+        apply_result = run_headless(
+            settings, args.report, args.quiet, crater_plan, plan_cache, args.save_plan,
+            args.reapply or args.manifest, bool(args.reapply), args.journal,
+            args.resume or args.checkpoint, bool(args.resume))
+    except (ManifestError, DensityMapError, CameraError, CheckpointError, PlanFileError,
+            TargetError) as e:
+        print(str(e), file=sys.stderr)
+        return EXIT_BAD_SETTINGS
+    except ConnectionError as e:
+        print("Terragen RPC connection error: " + str(e) + resume_hint(args), file=sys.stderr)
+        return EXIT_APPLY_FAILED
+    except TimeoutError as e:
+        print("Terragen RPC timeout error: " + str(e) + resume_hint(args), file=sys.stderr)
+        return EXIT_APPLY_FAILED
+    except tg.ReplyError as e:
+        print("Terragen RPC reply error: " + str(e), file=sys.stderr)
+        return EXIT_APPLY_FAILED
+    except tg.ApiError as e:
+        print("Terragen RPC API error: " + str(e), file=sys.stderr)
+        return EXIT_APPLY_FAILED
+    except tg.Error as e:
+        print("Terragen RPC error: " + str(e) + resume_hint(args), file=sys.stderr)
+        return EXIT_APPLY_FAILED
+    except OSError as e:
+        print("Can't write the plan, manifest, journal or checkpoint file: " + str(e),
+              file=sys.stderr)
+        return EXIT_APPLY_FAILED
+    except Exception as e:
+        print(str(e), file=sys.stderr)
+        return EXIT_APPLY_FAILED
+
+    apply_result.pop("report", None)
+    if args.replay:
+        apply_result["plan_file"] = args.replay
+    print(json.dumps(apply_result, indent=2))
+    if apply_result["cancelled"]:
+        return EXIT_CANCELLED
+    return EXIT_OK
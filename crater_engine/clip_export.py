@@ -0,0 +1,367 @@
+'''
+clip_export.py - Terragen clip file export for tg_splatter_craters.
+Writes the node network Apply would build, group, rim shader, Simple
+Shape, raster Image map, Crater chain or Merge tree, Fractal warp and
+Merge shader, as a clip file Terragen imports in one step, instead of
+creating the nodes one RPC call at a time. The plan is sampled and
+written chunk by chunk, so memory stays bounded whatever the number of
+craters.
+
+Without Terragen there is no Compute terrain to insert into and no
+camera to cull by: the node to connect to the Compute terrain is named
+in the result, and Cull below px is ignored.
+'''
+
+import os
+import re
+import time
+from xml.sax.saxutils import escape
+import numpy as np
+from crater_engine.journal import new_run_id
+from crater_engine.merge_tree import MERGE_PARAMS, crater_network_depth
+from crater_engine.pipeline import get_chain_length, rim_shader_params, sss_params, warp_scale
+from crater_engine.plan import crater_plan_rows, iter_crater_plan, new_seed, plan_chunks
+from crater_engine.raster import raster_shader_params, split_plan, write_raster
+from crater_engine.rpc_batch import CRATER_LINK_NAMES, crater_params, param_string
+
+CLIP_SUFFIX = ".tgc"
+
+CLIP_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="no" ?>\n<terragen_clip>\n'
+CLIP_FOOTER = "</terragen_clip>\n"
+
+# Node network spacing of the nodes written, x and y
+NODE_SPACING = (220, 80)
+
+# Characters replaced in parameter values, besides &, < and >
+ATTRIBUTE_ENTITIES = {'"': "&quot;", "\n": "&#10;", "\t": "&#9;"}
+ATTRIBUTE_SPECIAL = re.compile('[&<>"\n\t]')
+
+WRITE_BUFFER_SIZE = 1 << 20
+
+def export_clip(settings, file_path, progress=None, cancel_event=None, crater_plan=None):
+    '''
+    Writes the crater network of the settings to a clip file. The file is
+    replaced in one step, a cancelled export leaves no file behind.
+
+    Args:
+        settings <obj>: ApplySettings
+        file_path (str): Clip file to write, usually ending in CLIP_SUFFIX
+        progress <func>: Optional callback taking the number of craters written
+        cancel_event <obj>: Optional threading.Event, set to stop after the current chunk
+        crater_plan (ndarray): Optional plan to write instead of sampling one
+
+    Returns:
+        export_result (dict): Run id, file written, number of craters planned
+            and written, nodes written, the node to connect to the Compute
+            terrain, network depth, whether the export was cancelled, the
+            seed, the raster written, bytes written, seconds taken and MB/s
+    '''
+    start_time = time.perf_counter()
+    run_id = new_run_id()
+    names = ClipNames(run_id.rsplit("-", 1)[-1])
+    seed = settings.seed if settings.seed is not None else new_seed()
+    if crater_plan is None:
+        chunks = iter_crater_plan(settings, settings.quantity, seed, settings.plan_workers)
+    else:
+        chunks = plan_chunks(crater_plan)
+    chain_length = get_chain_length(settings)
+    temp_path = file_path + ".tmp"
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    try:
+        with open(temp_path, "w", encoding="utf-8", newline="\n",
+                  buffering=WRITE_BUFFER_SIZE) as file:
+            file.write(CLIP_HEADER)
+            nodes = ClipNodes(settings, names)
+            file.write(nodes.head())
+            raster_plans = []
+            num_written = 0
+            last_diameter = 0.0
+            for chunk in chunks:
+                if settings.raster_below is not None:
+                    chunk, raster_chunk = split_plan(chunk, settings.raster_below)
+                    raster_plans.append(raster_chunk)
+                file.write(nodes.craters(chunk, num_written, chain_length))
+                num_written += len(chunk)
+                if len(chunk):
+                    last_diameter = float(chunk["diameter"][-1])
+                if progress is not None:
+                    progress(num_written)
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+            cancelled = cancel_event is not None and cancel_event.is_set()
+            raster = None
+            if not cancelled:
+                if settings.raster_below is not None:
+                    raster = write_raster(
+                        np.concatenate(raster_plans), settings.x_range, settings.z_range,
+                        settings.raster_size)
+                    file.write(nodes.raster(raster["file"]))
+                file.write(nodes.tail(num_written, chain_length, last_diameter))
+                file.write(CLIP_FOOTER)
+        if cancelled:
+            os.remove(temp_path)
+            bytes_written = 0
+        else:
+            bytes_written = os.path.getsize(temp_path)
+            os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    elapsed = time.perf_counter() - start_time
+    return {
+        "run_id": run_id,
+        "file": "" if cancelled else file_path,
+        "num_craters": settings.quantity,
+        "craters_written": num_written,
+        "nodes_written": 0 if cancelled else nodes.num_nodes,
+        "output": "" if cancelled else nodes.output,
+        "network_depth": crater_network_depth(num_written, chain_length),
+        "cancelled": cancelled,
+        "seed": seed,
+        "raster": raster,
+        "bytes_written": bytes_written,
+        "elapsed": round(elapsed, 4),
+        "megabytes_per_second": round(bytes_written / 1e6 / max(elapsed, 1e-9), 2),
+        }
+
+class ClipNames:
+    '''
+    Names of the nodes of one export. Every name holds the export's tag,
+    so importing several exports into a project doesn't clash.
+
+    Args:
+        tag (str): Short text unique to the export, i.e. "3fa9c1"
+    '''
+    def __init__(self, tag):
+        self.tag = tag
+        self.rim_shader = f"Crater rim {tag}"
+        self.mountain = f"Crater shape {tag}"
+        self.raster = f"Crater raster {tag}"
+        self.warp = f"Crater warp {tag}"
+        self.merge_shader = f"Crater merge {tag}"
+
+    def crater(self, index):
+        '''
+        Name of a Crater shader.
+
+        Args:
+            index (int): Plan index of the crater written
+
+        Returns:
+            name (str): i.e. "Crater 3fa9c1 000001"
+        '''
+        return f"Crater {self.tag} {index + 1:06d}"
+
+    def merge(self, index):
+        '''
+        Name of a Merge shader of the Merge tree.
+
+        Args:
+            index (int): Merge shader number, level by level
+
+        Returns:
+            name (str): i.e. "Crater merge 3fa9c1 00001"
+        '''
+        return f"Crater merge {self.tag} {index + 1:05d}"
+
+class ClipNodes:
+    '''
+    Builds the XML of the nodes of one export, in the order Apply links
+    them: mountain or valley, raster, craters, Merge tree, warp and Merge
+    shader. Keeps count of the nodes and of the node the network ends in.
+
+    Args:
+        settings <obj>: ApplySettings
+        names <obj>: ClipNames
+    '''
+    def __init__(self, settings, names):
+        self.settings = settings
+        self.names = names
+        self.group_name = settings.group_name if settings.group else ""
+        self.rim_shader_name = names.rim_shader if settings.rim_shader_check else ""
+        self.crater_input = ""
+        if settings.on_mountain_or_valley:
+            self.crater_input = names.mountain
+        if settings.raster_below is not None:
+            self.crater_input = names.raster
+        self.num_nodes = 0
+        self.output = self.crater_input
+
+    def head(self):
+        '''
+        Builds the nodes ahead of the craters.
+
+        Returns:
+            xml (str): Group, rim shader and Simple Shape shader elements
+        '''
+        settings = self.settings
+        parts = []
+        if self.group_name:
+            parts.append(self.element("group", self.group_name, [], (-2, 0)))
+        if self.rim_shader_name:
+            parts.append(self.element(
+                settings.rim_shader_class, self.rim_shader_name,
+                rim_shader_params(settings, settings.rim_shader_class), (-2, 1)))
+        if settings.on_mountain_or_valley:
+            parts.append(self.element(
+                "simple_shape_shader", self.names.mountain, sss_params(settings, ""), (0, -2)))
+        return "".join(parts)
+
+    def raster(self, file_path):
+        '''
+        Builds the Image map shader of the rasterized craters, which the
+        first crater was linked to.
+
+        Args:
+            file_path (str): Tile file, see crater_engine.raster
+
+        Returns:
+            xml (str): Image map shader element
+        '''
+        main_input = self.names.mountain if self.settings.on_mountain_or_valley else ""
+        return self.element(
+            "image_map_shader", self.names.raster,
+            raster_shader_params(
+                file_path, self.settings.x_range, self.settings.z_range, main_input),
+            (0, -1))
+
+    def craters(self, crater_plan, first_index, chain_length):
+        '''
+        Builds the Crater shaders of a plan chunk, each one chained to the
+        crater before it, like chain_inputs().
+
+        Args:
+            crater_plan (ndarray): Plan chunk of CRATER_PLAN_DTYPE
+            first_index (int): Plan index of the chunk's first crater
+            chain_length (int): Craters per chain, 0 chains all craters together
+
+        Returns:
+            xml (str): Crater shader elements
+        '''
+        parts = []
+        names = self.names
+        input_node = names.crater(first_index - 1) if first_index else self.crater_input
+        for index, row in enumerate(crater_plan_rows(crater_plan), first_index):
+            if chain_length and index and index % chain_length == 0:
+                input_node = ""
+            name = names.crater(index)
+            params = [
+                (key, value) for key, value in crater_params(
+                    row, self.group_name, self.rim_shader_name, input_node)
+                if value or key not in CRATER_LINK_NAMES
+                ]
+            if chain_length:
+                position = (index // chain_length, index % chain_length)
+            else:
+                position = (0, index)
+            parts.append(self.element("crater_shader", name, params, position))
+            input_node = name
+        if parts:
+            self.output = name
+        return "".join(parts)
+
+    def tail(self, num_craters, chain_length, crater_diameter):
+        '''
+        Builds the nodes after the craters.
+
+        Args:
+            num_craters (int): Number of craters written
+            chain_length (int): Craters per chain, 0 when not in Merge tree mode
+            crater_diameter (float): Diameter of the last crater written
+
+        Returns:
+            xml (str): Merge tree, Fractal warp shader and Merge shader elements
+        '''
+        settings = self.settings
+        parts = []
+        if num_craters and chain_length:
+            parts.append(self.merge_tree(num_craters, chain_length))
+        if settings.append_warp:
+            parts.append(self.element(
+                "fractal_warp_shader", self.names.warp,
+                [("input_node", self.output), ("scale", param_string(warp_scale(crater_diameter)))],
+                (-1, -2)))
+            self.output = self.names.warp
+        if settings.insert_into_flow in ("Merge shader", "Merge tree"):
+            # Main input is left for the Compute terrain's current Main input
+            parts.append(self.element(
+                "merge_shader", self.names.merge_shader,
+                [("shader_A", self.output)] + MERGE_PARAMS, (-1, -1)))
+            self.output = self.names.merge_shader
+        return "".join(parts)
+
+    def merge_tree(self, num_craters, chain_length):
+        '''
+        Builds the Merge shaders joining the chain ends pairwise, level by
+        level, the same tree as merge_tree.build_merge_tree().
+
+        Args:
+            num_craters (int): Number of craters written
+            chain_length (int): Craters per chain
+
+        Returns:
+            xml (str): Merge shader elements
+        '''
+        names = self.names
+        level = [names.crater(index) for index in range(chain_length - 1, num_craters, chain_length)]
+        if num_craters % chain_length:
+            level.append(names.crater(num_craters - 1))
+        parts = []
+        num_merges = 0
+        depth = 0
+        while len(level) > 1:
+            next_level = []
+            for index in range(len(level) // 2):
+                name = names.merge(num_merges)
+                params = [("input_node", level[2 * index]), ("shader_A", level[2 * index + 1])]
+                parts.append(self.element(
+                    "merge_shader", name, params + MERGE_PARAMS, (2 * index, chain_length + depth)))
+                next_level.append(name)
+                num_merges += 1
+            if len(level) % 2:
+                next_level.append(level[-1])
+            level = next_level
+            depth += 1
+        self.output = level[0]
+        return "".join(parts)
+
+    def element(self, class_name, name, params, position):
+        '''
+        Builds the XML element of one node and counts it.
+
+        Args:
+            class_name (str): Node class, i.e. "crater_shader"
+            name (str): Node name
+            params [tuples]: (name, value string) pairs
+            position (tuple): Column and row in the node network
+
+        Returns:
+            xml (str): Node element
+        '''
+        self.num_nodes += 1
+        node_x = position[0] * NODE_SPACING[0]
+        node_y = -position[1] * NODE_SPACING[1]
+        lines = [
+            f"<{class_name}\n",
+            f"\tname = {attribute(name)}\n",
+            '\tgui_use_node_pos = "1"\n',
+            f'\tgui_node_pos = "{node_x} {node_y} 0"\n',
+            ]
+        lines.extend(f"\t{key} = {attribute(value)}\n" for key, value in params)
+        lines.append(f"\t>\n</{class_name}>\n")
+        return "".join(lines)
+
+def attribute(value):
+    '''
+    Quotes a parameter value as an XML attribute.
+
+    Args:
+        value (str): Parameter value string
+
+    Returns:
+        attribute (str): Escaped value in double quotes
+    '''
+    if ATTRIBUTE_SPECIAL.search(value) is None: # numbers, most names
+        return '"' + value + '"'
+    return '"' + escape(value, ATTRIBUTE_ENTITIES) + '"'
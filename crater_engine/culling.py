@@ -0,0 +1,168 @@
+'''
+culling.py - Camera level of detail culling for tg_splatter_craters.
+Craters far from the render camera can cover less than a pixel of the
+image, yet Terragen still evaluates their Crater shaders for every
+displacement sample. The camera of the first render node is read once
+per Apply, each crater's size in pixels is estimated from its diameter
+and its distance to the camera, and craters smaller than the threshold
+are left out before any node is created.
+'''
+
+import math
+import numpy as np
+from crater_engine.project_cache import project_cache
+
+# Used when the render node or camera leaves a value empty
+DEFAULT_IMAGE_WIDTH = 800
+DEFAULT_HORIZONTAL_FOV = 60.0
+
+class CameraError(ValueError):
+    '''
+    Raised when the project has no camera to cull craters by.
+    '''
+
+class CameraView:
+    '''
+    What the render camera sees, as far as culling needs it.
+
+    Args:
+        path (str): Camera node path
+        position (tuple): Camera x, y, z
+        horizontal_fov (float): Horizontal field of view in degrees
+        image_width (int): Rendered image width in pixels
+    '''
+    def __init__(self, path, position, horizontal_fov, image_width):
+        self.path = path
+        self.position = np.asarray(position, dtype=np.float64)
+        self.horizontal_fov = horizontal_fov
+        self.image_width = image_width
+        # pixels per radian in the middle of the image
+        self.pixels_per_radian = image_width / 2.0 / math.tan(math.radians(horizontal_fov) / 2.0)
+
+    def pixel_sizes(self, crater_plan):
+        '''
+        Estimates how many pixels wide each crater is in the rendered image.
+        Craters seen at a grazing angle look smaller than this, so the
+        estimate errs on the side of keeping craters.
+
+        Args:
+            crater_plan (ndarray): Structured array of CRATER_PLAN_DTYPE
+
+        Returns:
+            pixel_sizes (ndarray): Crater widths in pixels
+        '''
+        distances = np.linalg.norm(crater_plan["center"] - self.position, axis=1)
+        radii = np.abs(crater_plan["diameter"]) * 0.5
+        # a crater around the camera fills the image
+        angles = 2.0 * np.arctan2(radii, np.maximum(distances, 1e-9))
+        return angles * self.pixels_per_radian
+
+def read_camera(writer):
+    '''
+    Reads the camera of the first render node in the project, or the
+    first camera when there is no render node.
+
+    Args:
+        writer <obj>: RpcBatchWriter
+
+    Returns:
+        camera <obj>: CameraView
+
+    Raises:
+        CameraError: The project has no camera
+    '''
+    cache = project_cache()
+    renders = cache.children_filtered_by_class("render")
+    camera_path = ""
+    image_width = ""
+    if renders:
+        camera_path, image_width = writer.call_many([
+            ("get_param_as_string", [renders[0].id, "camera"]),
+            ("get_param_as_string", [renders[0].id, "image_width"]),
+            ])
+    camera = cache.node_by_path(camera_path) if camera_path else None
+    if camera is None:
+        cameras = cache.children_filtered_by_class("camera")
+        if not cameras:
+            raise CameraError("Culling needs a camera in the project, none was found.")
+        camera = cameras[0]
+        camera_path = cache.node_path(camera)
+    position, horizontal_fov, focal_length, film_aperture = writer.call_many([
+        ("get_param_as_string", [camera.id, name])
+        for name in ("position", "horizontal_fov", "focal_length_in_mm", "film_aperture_in_mm")
+        ])
+    try:
+        position = tuple(float(i) for i in position.split()[:3])
+    except ValueError:
+        position = ()
+    if len(position) != 3:
+        raise CameraError(f"Can't read the position of camera {camera_path}.")
+    return CameraView(
+        camera_path,
+        position,
+        camera_fov(horizontal_fov, focal_length, film_aperture),
+        int(first_number(image_width, DEFAULT_IMAGE_WIDTH))
+        )
+
+def camera_fov(horizontal_fov, focal_length, film_aperture):
+    '''
+    Gets the horizontal field of view from the camera parameters that
+    are set, the field of view itself or the focal length and film size.
+
+    Args:
+        horizontal_fov (str): Horizontal field of view in degrees
+        focal_length (str): Focal length in mm
+        film_aperture (str): Film width and height in mm
+
+    Returns:
+        horizontal_fov (float): Field of view in degrees, 0 to 180
+    '''
+    fov = first_number(horizontal_fov, 0.0)
+    if not 0.0 < fov < 180.0:
+        focal = first_number(focal_length, 0.0)
+        width = first_number(film_aperture, 0.0)
+        fov = math.degrees(2.0 * math.atan(width / 2.0 / focal)) \
+            if focal > 0.0 and width > 0.0 else DEFAULT_HORIZONTAL_FOV
+    return fov
+
+def first_number(value_string, default):
+    '''
+    Parses the first number of a parameter value string.
+
+    Args:
+        value_string (str): Parameter value, i.e. "36 24"
+        default (float): Returned when the value is empty or not a number
+
+    Returns:
+        number (float): The first number
+    '''
+    try:
+        return float(value_string.split()[0])
+    except (AttributeError, IndexError, ValueError):
+        return default
+
+def cull_craters(crater_plan, camera, min_pixels):
+    '''
+    Leaves out the craters smaller than a number of pixels in the image.
+
+    Args:
+        crater_plan (ndarray): Structured array of CRATER_PLAN_DTYPE
+        camera <obj>: CameraView
+        min_pixels (float): Smallest crater width kept, in pixels
+
+    Returns:
+        crater_plan (ndarray): The craters kept, in plan order
+        culling (dict): Camera, number of craters planned and culled and the
+            estimated share of crater shader evaluation saved
+    '''
+    keep = camera.pixel_sizes(crater_plan) >= min_pixels
+    num_culled = int(np.count_nonzero(~keep))
+    num_planned = len(crater_plan)
+    return crater_plan[keep], {
+        "camera": camera.path,
+        "min_pixels": min_pixels,
+        "craters_planned": num_planned,
+        "craters_culled": num_culled,
+        # each Crater shader in the network costs Terragen about the same to evaluate
+        "evaluation_saved": round(num_culled / num_planned, 4) if num_planned else 0.0,
+        }
@@ -0,0 +1,185 @@
+'''
+density.py - Density map placement for tg_splatter_craters.
+A grayscale image is stretched over the X/Z area and crater centers are
+drawn with probability proportional to its brightness, so one Apply can
+cover an irregular region and black areas get no craters at all. The
+cumulative sum of the pixel weights is built once per image and cached,
+then any number of centers is drawn with one vectorized binary search.
+'''
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Density maps kept in memory, the least recently used are dropped first
+MAX_CACHED_MAPS = 4
+
+_cached_maps = OrderedDict()
+_cache_lock = threading.Lock()
+
+class DensityMapError(ValueError):
+    '''
+    Raised when a density map can't be read or has no bright pixel.
+    '''
+
+class DensityMap:
+    '''
+    Weighted sampler of crater centers. Row 0 of the image is the
+    minimum Z edge of the area and column 0 the minimum X edge.
+
+    Args:
+        weights (ndarray): 2D grayscale values, or 3D with the channels
+            averaged, non-negative and not all zero
+    '''
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.ndim == 3:
+            weights = weights.mean(axis=2)
+        if weights.ndim != 2 or weights.size == 0:
+            raise DensityMapError("A density map must be a grayscale image.")
+        if not np.isfinite(weights).all() or (weights < 0).any():
+            raise DensityMapError("A density map can't have negative or missing values.")
+        self.height, self.width = weights.shape
+        self.cdf = np.cumsum(weights.ravel())
+        self.total = float(self.cdf[-1])
+        if self.total <= 0:
+            raise DensityMapError("The density map is black everywhere, no crater can be placed.")
+        digest = hashlib.sha256(repr(weights.shape).encode("ascii"))
+        digest.update(np.ascontiguousarray(weights).tobytes())
+        self.digest = digest.hexdigest()[:32]
+
+    def sample(self, rng, num_craters, x_range, z_range):
+        '''
+        Draws crater centers, each pixel as likely as its share of the
+        total brightness, at a random spot inside the pixel.
+
+        Args:
+            rng <obj>: numpy.random.Generator
+            num_craters (int): Number of centers
+            x_range (tuple): Min/max x of the area
+            z_range (tuple): Min/max z of the area
+
+        Returns:
+            x_coords (ndarray): Center x, rounded to two decimal places
+            z_coords (ndarray): Center z, rounded to two decimal places
+        '''
+        # one row of values per center, so fewer centers are a prefix of more
+        pixel, offset_x, offset_z = rng.random((num_craters, 3)).T
+        # side="right" never picks a pixel of zero weight
+        cells = np.searchsorted(self.cdf, pixel * self.total, side="right")
+        rows, columns = np.divmod(np.minimum(cells, self.cdf.size - 1), self.width)
+        x_min, x_max = x_range
+        z_min, z_max = z_range
+        x_coords = x_min + (columns + offset_x) * ((x_max - x_min) / self.width)
+        z_coords = z_min + (rows + offset_z) * ((z_max - z_min) / self.height)
+        return np.round(x_coords, 2), np.round(z_coords, 2)
+
+def load_density_map(file_path):
+    '''
+    Gets the density map of an image file, reading it only the first
+    time or after the file changed.
+
+    Args:
+        file_path (str): .pgm, .npy or, with Pillow installed, .png, .tif or .bmp file
+
+    Returns:
+        density_map <obj>: DensityMap
+
+    Raises:
+        DensityMapError: The file can't be read or isn't a usable density map
+    '''
+    try:
+        file_stat = os.stat(file_path)
+    except OSError as e:
+        raise DensityMapError(f"Can't read density map {file_path}: {e}") from e
+    key = (os.path.abspath(file_path), file_stat.st_mtime_ns, file_stat.st_size)
+    with _cache_lock:
+        if key in _cached_maps:
+            _cached_maps.move_to_end(key)
+            return _cached_maps[key]
+    try:
+        density_map = DensityMap(read_image(file_path))
+    except DensityMapError as e:
+        raise DensityMapError(f"{file_path}: {e}") from e
+    with _cache_lock:
+        _cached_maps[key] = density_map
+        while len(_cached_maps) > MAX_CACHED_MAPS:
+            _cached_maps.popitem(last=False)
+    return density_map
+
+def read_image(file_path):
+    '''
+    Reads the grayscale values of an image file.
+
+    Args:
+        file_path (str): Image file
+
+    Returns:
+        values (ndarray): 2D or 3D array of pixel values
+
+    Raises:
+        DensityMapError: The file can't be read
+    '''
+    suffix = os.path.splitext(file_path)[1].lower()
+    try:
+        if suffix == ".npy":
+            return np.load(file_path, allow_pickle=False)
+        if suffix == ".pgm":
+            with open(file_path, "rb") as file:
+                return read_pgm(file.read())
+    except (OSError, ValueError) as e:
+        raise DensityMapError(f"Can't read density map {file_path}: {e}") from e
+    try:
+        from PIL import Image
+    except ImportError as e:
+        raise DensityMapError(
+            f"Reading {suffix} density maps needs Pillow (pip install Pillow). "
+            "Save the map as .pgm or .npy instead.") from e
+    try:
+        with Image.open(file_path) as image:
+            return np.asarray(image.convert("F"))
+    except (OSError, ValueError) as e:
+        raise DensityMapError(f"Can't read density map {file_path}: {e}") from e
+
+def read_pgm(data):
+    '''
+    Decodes a binary (P5) or plain text (P2) PGM image, 8 or 16 bit.
+
+    Args:
+        data (bytes): File contents
+
+    Returns:
+        values (ndarray): 2D array of pixel values
+
+    Raises:
+        ValueError: The data isn't a PGM image
+    '''
+    fields = []
+    position = 0
+    # magic number, width, height and maximum value, separated by whitespace and comments
+    while len(fields) < 4:
+        while position < len(data) and data[position:position + 1].isspace():
+            position += 1
+        if data[position:position + 1] == b"#":
+            position = data.find(b"\n", position) + 1 or len(data)
+            continue
+        end = position
+        while end < len(data) and not data[end:end + 1].isspace() and data[end:end + 1] != b"#":
+            end += 1
+        if end == position:
+            raise ValueError("truncated PGM header")
+        fields.append(data[position:end])
+        position = end
+    magic, width, height, max_value = fields[0], int(fields[1]), int(fields[2]), int(fields[3])
+    if magic == b"P2":
+        values = np.array(data[position:].split()[:width * height], dtype=np.float64)
+    elif magic == b"P5":
+        dtype = np.dtype(">u2") if max_value > 255 else np.dtype(np.uint8)
+        values = np.frombuffer(data, dtype=dtype, count=width * height, offset=position + 1)
+    else:
+        raise ValueError("not a PGM image")
+    if values.size != width * height:
+        raise ValueError("truncated PGM image")
+    return values.reshape(height, width)
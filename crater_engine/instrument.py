@@ -0,0 +1,387 @@
+'''
+instrument.py - Terragen RPC call instrumentation for tg_splatter_craters.
+Records every RPC round-trip made during an Apply: calls per method,
+latency percentiles, errors, and time per pipeline stage. The report
+separates time spent waiting on Terragen from time spent in our own
+Python, and estimates how much of the RPC time is fixed per round-trip
+(connection and latency) and how much grows with every call (work done
+by Terragen).
+'''
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+import numpy as np
+import terragen_rpc.jsonrpc as tg_jsonrpc
+
+# terragen_rpc's own call, wrapped by instrumented_call()
+_rpc_call = tg_jsonrpc.call
+
+# RpcStats recording the current Apply, None when not instrumented
+_active_stats = None
+
+class RpcStats:
+    '''
+    Collects RPC timings of one run. Can be shared by several worker
+    threads, each of which is in a stage of its own, see carry_stage().
+    '''
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.end_time = None
+        self.methods = {}
+        self.stages = {}
+        self.stage_order = []
+        self._local = threading.local()
+        self.trip_calls = []
+        self.trip_seconds = []
+        self.trip_ends = []
+        self._lock = threading.Lock()
+
+    def record(self, methods, seconds, error=None):
+        '''
+        Records one round-trip.
+
+        Args:
+            methods [str]: Method of every call sent in the round-trip
+            seconds (float): Time from sending the request to parsing the reply
+            error <obj>: Exception raised by the round-trip, if any
+        '''
+        with self._lock:
+            self.trip_calls.append(len(methods))
+            self.trip_seconds.append(seconds)
+            self.trip_ends.append(time.perf_counter())
+            for method in set(methods):
+                method_stats = self.methods.setdefault(
+                    method, {"calls": 0, "round_trips": 0, "errors": {}, "seconds": []})
+                method_stats["calls"] += methods.count(method)
+                method_stats["round_trips"] += 1
+                method_stats["seconds"].append(seconds)
+                if error is not None:
+                    name = type(error).__name__
+                    method_stats["errors"][name] = method_stats["errors"].get(name, 0) + 1
+            stage = self.stages.get(self.current_stage)
+            if stage is not None:
+                stage["rpc_seconds"] += seconds
+                stage["round_trips"] += 1
+
+    @property
+    def current_stage(self):
+        '''
+        Name of the stage the calling thread is in, empty outside of any stage.
+        '''
+        return getattr(self._local, "stage", "")
+
+    @contextmanager
+    def stage(self, name):
+        '''
+        Times a pipeline stage. RPC time recorded meanwhile by this thread,
+        or by functions it hands to other threads with carry_stage(), is
+        counted towards the stage. Threads running stages at the same time
+        each add their time to the stage.
+
+        Args:
+            name (str): Stage name, i.e. "craters"
+        '''
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = {"seconds": 0.0, "rpc_seconds": 0.0, "round_trips": 0, "windows": []}
+                self.stages[name] = stage
+                self.stage_order.append(name)
+        previous_stage, self._local.stage = self.current_stage, name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self._local.stage = previous_stage
+            with self._lock:
+                stage["seconds"] += end - start
+                stage["windows"].append((start, end))
+
+    def carry_stage(self, func):
+        '''
+        Wraps a function to be run on another thread so that the RPC time
+        it records counts towards the calling thread's current stage.
+
+        Args:
+            func <func>: Function to wrap
+
+        Returns:
+            in_stage <func>: Function taking the same arguments
+        '''
+        name = self.current_stage
+
+        def in_stage(*args, **kwargs):
+            previous_stage, self._local.stage = self.current_stage, name
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.stage = previous_stage
+        return in_stage
+
+    def finish(self):
+        '''
+        Stops the run clock.
+        '''
+        self.end_time = time.perf_counter()
+
+    def report(self):
+        '''
+        Summarizes the recorded timings.
+
+        Returns:
+            report (dict): Totals, per stage and per method timings, in seconds
+                and milliseconds. rpc_seconds adds up the round-trips of all
+                workers, rpc_busy_seconds is the time at least one was running.
+        '''
+        with self._lock:
+            end_time = self.end_time if self.end_time is not None else time.perf_counter()
+            wall_seconds = end_time - self.start_time
+            rpc_seconds = float(sum(self.trip_seconds))
+            busy = merge_intervals(
+                [(end - seconds, end) for end, seconds in zip(self.trip_ends, self.trip_seconds)])
+            busy_seconds = overlap(busy, (self.start_time, end_time))
+            per_trip, per_call = fit_round_trip_cost(self.trip_calls, self.trip_seconds)
+            stages = {}
+            for name in self.stage_order:
+                stage = self.stages[name]
+                stage_busy = sum(overlap(busy, window) for window in stage["windows"])
+                stages[name] = {
+                    "seconds": round(stage["seconds"], 6),
+                    "rpc_seconds": round(stage["rpc_seconds"], 6),
+                    "python_seconds": round(max(stage["seconds"] - stage_busy, 0.0), 6),
+                    "round_trips": stage["round_trips"],
+                    }
+            methods = {}
+            for name, method_stats in sorted(self.methods.items()):
+                methods[name] = {
+                    "calls": method_stats["calls"],
+                    "round_trips": method_stats["round_trips"],
+                    "errors": dict(method_stats["errors"]),
+                    **latency_percentiles(method_stats["seconds"]),
+                    }
+            return {
+                "wall_seconds": round(wall_seconds, 6),
+                "rpc_seconds": round(rpc_seconds, 6),
+                "rpc_busy_seconds": round(busy_seconds, 6),
+                "python_seconds": round(max(wall_seconds - busy_seconds, 0.0), 6),
+                "round_trips": len(self.trip_seconds),
+                "calls": int(sum(self.trip_calls)),
+                "errors": sum(sum(m["errors"].values()) for m in self.methods.values()),
+                "round_trip_overhead_ms": per_trip,
+                "call_cost_ms": per_call,
+                "stages": stages,
+                "methods": methods,
+                }
+
+def merge_intervals(intervals):
+    '''
+    Merges overlapping time intervals, i.e. round-trips made at the same
+    time by several RPC workers.
+
+    Args:
+        intervals [tuples]: (start, end) times
+
+    Returns:
+        merged [tuples]: Sorted, non-overlapping (start, end) times
+    '''
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def overlap(merged, window):
+    '''
+    Time within a window covered by merged intervals.
+
+    Args:
+        merged [tuples]: Sorted, non-overlapping (start, end) times
+        window (tuple): (start, end) time
+
+    Returns:
+        seconds (float): Covered time
+    '''
+    window_start, window_end = window
+    return sum(
+        max(min(end, window_end) - max(start, window_start), 0.0) for start, end in merged)
+
+def latency_percentiles(seconds):
+    '''
+    Latency percentiles of a list of round-trip times.
+
+    Args:
+        seconds [float]: Round-trip times
+
+    Returns:
+        percentiles (dict): p50, p90, p99, max and mean in milliseconds
+    '''
+    if not seconds:
+        return {"p50_ms": 0.0, "p90_ms": 0.0, "p99_ms": 0.0, "max_ms": 0.0, "mean_ms": 0.0}
+    milliseconds = np.asarray(seconds) * 1000.0
+    p50, p90, p99 = np.percentile(milliseconds, [50, 90, 99]).tolist()
+    return {
+        "p50_ms": round(p50, 4),
+        "p90_ms": round(p90, 4),
+        "p99_ms": round(p99, 4),
+        "max_ms": round(float(milliseconds.max()), 4),
+        "mean_ms": round(float(milliseconds.mean()), 4),
+        }
+
+def fit_round_trip_cost(trip_calls, trip_seconds):
+    '''
+    Splits round-trip time into a fixed cost per round-trip and a cost
+    per call, by a least squares fit over round-trips of different batch
+    sizes. Without batches the two can't be told apart and all the time
+    is counted as fixed cost.
+
+    Args:
+        trip_calls [int]: Number of calls sent in each round-trip
+        trip_seconds [float]: Time taken by each round-trip
+
+    Returns:
+        round_trip_ms (float): Fixed cost per round-trip in milliseconds
+        call_ms (float): Cost per call in milliseconds, None if unknown
+    '''
+    if not trip_seconds:
+        return 0.0, None
+    calls = np.asarray(trip_calls, dtype=np.float64)
+    milliseconds = np.asarray(trip_seconds) * 1000.0
+    if np.all(calls == calls[0]):
+        return round(float(milliseconds.mean()), 4), None
+    slope, intercept = np.polyfit(calls, milliseconds, 1)
+    return round(max(float(intercept), 0.0), 4), round(max(float(slope), 0.0), 4)
+
+def carry_stage(func):
+    '''
+    Wraps a function to be run on another thread so that its RPC time
+    counts towards the current stage of the calling thread in the active
+    RpcStats. Returns the function itself when instrumentation is off.
+
+    Args:
+        func <func>: Function to wrap
+
+    Returns:
+        in_stage <func>: Function taking the same arguments
+    '''
+    stats = _active_stats
+    if stats is None:
+        return func
+    return stats.carry_stage(func)
+
+@contextmanager
+def round_trip(methods):
+    '''
+    Times one round-trip for the active RpcStats. Does nothing when
+    instrumentation is off.
+
+    Args:
+        methods [str]: Method of every call sent in the round-trip
+    '''
+    stats = _active_stats
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        stats.record(methods, time.perf_counter() - start, e)
+        raise
+    stats.record(methods, time.perf_counter() - start)
+
+def instrumented_call(method, params=None):
+    '''
+    Stand-in for terragen_rpc.jsonrpc.call() that times the call.
+
+    Args:
+        method (str): RPC method name
+        params []: RPC method parameters
+
+    Returns:
+        reply <obj>: terragen_rpc Reply
+    '''
+    with round_trip([method]):
+        return _rpc_call(method, [] if params is None else params)
+
+@contextmanager
+def instrument_rpc(stats):
+    '''
+    Records every Terragen RPC call made during the with block, including
+    those made by terragen_rpc's Node methods, into stats.
+
+    Args:
+        stats <obj>: RpcStats
+
+    Yields:
+        stats <obj>: The same RpcStats
+    '''
+    global _active_stats
+    previous_stats = _active_stats
+    _active_stats = stats
+    tg_jsonrpc.call = instrumented_call
+    try:
+        yield stats
+    finally:
+        stats.finish()
+        _active_stats = previous_stats
+        if previous_stats is None:
+            tg_jsonrpc.call = _rpc_call
+
+def write_report(report, file_path):
+    '''
+    Writes an Apply report as JSON.
+
+    Args:
+        report (dict): Report, see RpcStats.report()
+        file_path (str): File to write
+    '''
+    with open(file_path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+
+def report_summary(report, max_methods=5):
+    '''
+    Formats the main figures of a report for display.
+
+    Args:
+        report (dict): Report, see RpcStats.report()
+        max_methods (int): Number of slowest methods listed
+
+    Returns:
+        summary (str): Multi-line summary
+    '''
+    lines = [
+        f"Total {report['wall_seconds']:.2f}s: waiting on Terragen RPC "
+        f"{report['rpc_busy_seconds']:.2f}s, Python {report['python_seconds']:.2f}s",
+        f"{report['round_trips']} round-trips, {report['calls']} calls, "
+        f"{report['errors']} errors",
+        ]
+    if report["rpc_seconds"] > report["rpc_busy_seconds"] * 1.01:
+        lines.append(f"{report['rpc_seconds']:.2f}s of RPC time over all workers")
+    if report["call_cost_ms"] is None:
+        lines.append(f"{report['round_trip_overhead_ms']:.3f} ms per round-trip")
+    else:
+        lines.append(
+            f"{report['round_trip_overhead_ms']:.3f} ms per round-trip "
+            f"+ {report['call_cost_ms']:.3f} ms per call")
+    lines.append("")
+    lines.append("Stages:")
+    for name, stage in report["stages"].items():
+        lines.append(
+            f"  {name}: {stage['seconds']:.2f}s (RPC {stage['rpc_seconds']:.2f}s, "
+            f"{stage['round_trips']} round-trips)")
+    lines.append("")
+    lines.append("Slowest methods:")
+    slowest = sorted(
+        report["methods"].items(),
+        key=lambda item: item[1]["mean_ms"] * item[1]["round_trips"],
+        reverse=True)
+    for name, method in slowest[:max_methods]:
+        lines.append(
+            f"  {name}: {method['calls']} calls, p50 {method['p50_ms']:.2f} ms, "
+            f"p99 {method['p99_ms']:.2f} ms")
+    return "\n".join(lines)
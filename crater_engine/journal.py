@@ -0,0 +1,372 @@
+'''
+journal.py - Run journal and bulk undo for tg_splatter_craters.
+Every Apply gets a run id and journals every node it creates at the
+project root, together with the Compute terrain's Main input before the
+run. Undo deletes all nodes of a run with one RPC call and restores
+that Main input. The same journal removes the nodes of a run that
+failed halfway, so a broken run doesn't leave half a crater field
+behind.
+'''
+
+import json
+import os
+import secrets
+import threading
+import time
+from crater_engine.instrument import RpcStats, instrument_rpc, write_report
+from crater_engine.project_cache import project_cache
+from crater_engine.rpc_batch import PATH_METHOD, RpcBatchWriter
+
+JOURNAL_FORMAT = 1
+
+# Runs kept in a journal file, the oldest are dropped first
+MAX_RUNS = 20
+
+class JournalError(ValueError):
+    '''
+    Raised when a journal can't be read or has nothing to undo.
+    '''
+
+def new_run_id():
+    '''
+    Makes a run id that sorts by start time.
+
+    Returns:
+        run_id (str): i.e. "20240131-154502-3fa9c1"
+    '''
+    return time.strftime("%Y%m%d-%H%M%S") + "-" + secrets.token_hex(3)
+
+class RunJournal:
+    '''
+    Nodes created by one run. Filled in by the project cache while the
+    run journals, see ProjectCache.journaling(). Can be shared by several
+    worker threads.
+
+    Args:
+        run_id (str): Run id, a new one if None
+        earlier_paths [str]: Paths of the nodes the run created before it
+            was resumed, see crater_engine.checkpoint
+    '''
+    def __init__(self, run_id=None, earlier_paths=()):
+        self.run_id = run_id or new_run_id()
+        self.started = time.strftime("%Y-%m-%dT%H:%M:%S")
+        self.status = "running"
+        # Compute terrain path and its Main input before the run, empty if not inserted
+        self.compute_terrain = []
+        # The same of every target of a run into several Compute terrain nodes
+        self.targets = []
+        self.earlier_paths = list(earlier_paths)
+        self.node_ids = []
+        self.node_paths = {}
+        self._lock = threading.Lock()
+
+    def add(self, node_ids) -> None:
+        '''
+        Journals created nodes, right after they were created.
+
+        Args:
+            node_ids [str]: Node ids
+        '''
+        with self._lock:
+            self.node_ids.extend(node_ids)
+
+    def add_paths(self, node_ids, node_paths) -> None:
+        '''
+        Journals the paths of created nodes.
+
+        Args:
+            node_ids [str]: Node ids
+            node_paths [str]: Paths of the nodes
+        '''
+        with self._lock:
+            self.node_paths.update(zip(node_ids, node_paths))
+
+    def forget(self, node_ids) -> None:
+        '''
+        Drops nodes the run has deleted again.
+
+        Args:
+            node_ids [str]: Node ids
+        '''
+        forgotten = set(node_ids)
+        with self._lock:
+            self.node_ids = [i for i in self.node_ids if i not in forgotten]
+            for node_id in forgotten:
+                self.node_paths.pop(node_id, None)
+
+    def resolve_paths(self, writer) -> None:
+        '''
+        Gets the paths of the nodes journaled without one, so the run can
+        still be undone after the node ids changed, i.e. in a new session.
+
+        Args:
+            writer <obj>: RpcBatchWriter
+        '''
+        with self._lock:
+            node_ids = [i for i in self.node_ids if i not in self.node_paths]
+        node_paths = writer.call_many([(PATH_METHOD, [node_id]) for node_id in node_ids])
+        with self._lock:
+            self.node_paths.update(zip(node_ids, node_paths))
+
+    def paths(self):
+        '''
+        Gets the paths of the journaled nodes, in creation order, after
+        those created before the run was resumed.
+
+        Returns:
+            node_paths [str]: Node paths
+        '''
+        with self._lock:
+            return self.earlier_paths + [
+                self.node_paths[i] for i in self.node_ids if i in self.node_paths]
+
+    def to_dict(self):
+        '''
+        Converts the journal to what a journal file stores.
+
+        Returns:
+            run (dict): run_id, started, status, compute_terrain, targets and nodes
+        '''
+        return {
+            "run_id": self.run_id,
+            "started": self.started,
+            "status": self.status,
+            "compute_terrain": list(self.compute_terrain),
+            "targets": [list(target) for target in self.targets],
+            "nodes": self.paths(),
+            }
+
+def run_compute_terrains(run):
+    '''
+    Gets the Compute terrain nodes a journaled run inserted into.
+
+    Args:
+        run (dict): See RunJournal.to_dict(), runs journaled before
+            targets were added included
+
+    Returns:
+        compute_terrains [lists]: Compute terrain path and its Main input
+            before the run, empty if the run didn't insert into one
+    '''
+    if run.get("targets"):
+        return [list(target) for target in run["targets"]]
+    return [list(run["compute_terrain"])] if run["compute_terrain"] else []
+
+def load_journal(file_path):
+    '''
+    Reads the runs of a journal file.
+
+    Args:
+        file_path (str): Journal file, see save_journal()
+
+    Returns:
+        runs [dict]: See RunJournal.to_dict(), oldest first, empty if there
+            is no journal yet
+
+    Raises:
+        JournalError: The file can't be read or isn't a journal
+    '''
+    try:
+        with open(file_path, encoding="utf-8") as file:
+            journal = json.load(file)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        raise JournalError(f"Can't read journal {file_path}: {e}") from e
+    if not isinstance(journal, dict) or journal.get("format") != JOURNAL_FORMAT:
+        raise JournalError(f"{file_path} is not a tg_splatter_craters journal.")
+    return journal["runs"]
+
+def save_journal(file_path, runs) -> None:
+    '''
+    Writes a journal file, keeping the MAX_RUNS most recent runs. The
+    file is replaced in one step.
+
+    Args:
+        file_path (str): File to write
+        runs [dict]: See RunJournal.to_dict(), oldest first
+    '''
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump({"format": JOURNAL_FORMAT, "runs": runs[-MAX_RUNS:]}, file)
+    os.replace(temp_path, file_path)
+
+def record_run(file_path, run) -> None:
+    '''
+    Adds a run to a journal file, or replaces the run with the same id.
+    An unreadable journal is started over.
+
+    Args:
+        file_path (str): Journal file
+        run (dict): See RunJournal.to_dict()
+    '''
+    try:
+        runs = load_journal(file_path)
+    except JournalError:
+        runs = []
+    runs = [i for i in runs if i["run_id"] != run["run_id"]] + [run]
+    save_journal(file_path, runs)
+
+def amend_run(file_path, run_id, added_paths, deleted_paths) -> None:
+    '''
+    Updates the nodes of a journaled run after Re-apply created or
+    deleted some of them.
+
+    Args:
+        file_path (str): Journal file
+        run_id (str): Run to update, nothing happens if it isn't journaled
+        added_paths [str]: Paths of nodes created
+        deleted_paths [str]: Paths of nodes deleted
+    '''
+    try:
+        runs = load_journal(file_path)
+    except JournalError:
+        return
+    deleted = set(deleted_paths)
+    for run in runs:
+        if run["run_id"] == run_id:
+            run["nodes"] = [i for i in run["nodes"] if i not in deleted] + list(added_paths)
+            save_journal(file_path, runs)
+            return
+
+def delete_run_nodes(writer, node_paths, compute_terrains):
+    '''
+    Deletes the nodes of a run that are still in the project with one
+    RPC call and restores the Compute terrains' Main input.
+
+    Args:
+        writer <obj>: RpcBatchWriter
+        node_paths [str]: Paths of the nodes created by the run
+        compute_terrains [lists]: Compute terrain path and its Main input
+            before the run of every node the run inserted into, see
+            run_compute_terrains()
+
+    Returns:
+        num_deleted (int): Number of nodes deleted
+        num_missing (int): Number of nodes already gone
+    '''
+    cache = project_cache()
+    node_ids = cache.cached_node_ids(node_paths)
+    lookup_paths = [path for path in node_paths if path not in node_ids]
+    found_ids = writer.call_many([("node_by_path", [path]) for path in lookup_paths])
+    node_ids.update(
+        (path, node_id) for path, node_id in zip(lookup_paths, found_ids)
+        if node_id not in ("0", "", None))
+    restore_main_inputs(writer, compute_terrains)
+    deleted_paths = [path for path in node_paths if path in node_ids]
+    if deleted_paths:
+        writer.call("delete", [[node_ids[path] for path in deleted_paths]])
+        cache.note_deleted(deleted_paths)
+    return len(deleted_paths), len(node_paths) - len(deleted_paths)
+
+def restore_main_inputs(writer, compute_terrains) -> None:
+    '''
+    Sets the Main input of Compute terrain nodes back to what it was
+    before a run, all in one round-trip. Nodes no longer in the project
+    are skipped.
+
+    Args:
+        writer <obj>: RpcBatchWriter
+        compute_terrains [lists]: Compute terrain path and its Main input
+    '''
+    cache = project_cache()
+    calls = []
+    for path, main_input in compute_terrains:
+        compute_terrain_node = cache.node_by_path(path)
+        if compute_terrain_node is not None:
+            calls.append(
+                ("set_param_from_string", [compute_terrain_node.id, "input_node", main_input]))
+    writer.call_many(calls)
+
+def clean_up_run(journal):
+    '''
+    Deletes the nodes of a run that failed halfway, by node id since
+    their paths may not be known yet. Best effort: the run is marked
+    "failed" and stays journaled when Terragen can't be reached.
+
+    Args:
+        journal <obj>: RunJournal of the failed run
+
+    Returns:
+        cleaned_up (bool): True if the nodes were deleted
+    '''
+    writer = RpcBatchWriter()
+    try:
+        restore_main_inputs(writer, run_compute_terrains(journal.to_dict()))
+        if journal.node_ids:
+            writer.call("delete", [list(journal.node_ids)])
+    except Exception: # the run's own error is what the caller reports
+        journal.status = "failed"
+        try:
+            journal.resolve_paths(writer)
+        except Exception:
+            pass
+        return False
+    journal.status = "cleaned up"
+    return True
+
+def undo_last_run(file_path, manifest_path=None, report_path=None, checkpoint_path=None):
+    '''
+    Deletes every node of the most recent journaled run and restores the
+    Compute terrain's Main input, then drops the run from the journal.
+
+    Args:
+        file_path (str): Journal file
+        manifest_path (str): Optional manifest, deleted when it belongs to
+            the undone run so Re-apply doesn't update deleted craters
+        report_path (str): Optional file the JSON timing report is written to
+        checkpoint_path (str): Optional checkpoint, deleted with its plan file
+            when it belongs to the undone run so it isn't resumed
+
+    Returns:
+        undo_result (dict): Run id, number of nodes deleted and already gone,
+            round-trips used and the timing report
+
+    Raises:
+        JournalError: The journal can't be read or has no runs to undo
+    '''
+    runs = load_journal(file_path)
+    undoable = [run for run in runs if run["status"] != "cleaned up"]
+    if not undoable:
+        raise JournalError("Nothing to undo.")
+    run = undoable[-1]
+    stats = RpcStats()
+    writer = RpcBatchWriter()
+    try:
+        with instrument_rpc(stats):
+            project_cache().validate()
+            with stats.stage("undo"):
+                num_deleted, num_missing = delete_run_nodes(
+                    writer, run["nodes"], run_compute_terrains(run))
+    finally:
+        if report_path:
+            try:
+                write_report(stats.report(), report_path)
+            except OSError:
+                pass # the report is for diagnosis only, never fail the undo over it
+    # only the undone run is dropped, cleaned up runs stay on record
+    save_journal(file_path, [other for other in runs if other is not run])
+    if manifest_path:
+        try:
+            with open(manifest_path, encoding="utf-8") as file:
+                manifest_run_id = json.load(file).get("run_id")
+        except (OSError, ValueError):
+            manifest_run_id = None
+        if manifest_run_id == run["run_id"]:
+            os.remove(manifest_path)
+    if checkpoint_path:
+        # imported here, crater_engine.checkpoint imports this module
+        from crater_engine.checkpoint import CheckpointError, load_checkpoint
+        try:
+            checkpoint = load_checkpoint(checkpoint_path)
+        except CheckpointError:
+            checkpoint = None
+        if checkpoint is not None and checkpoint.header["run_id"] == run["run_id"]:
+            checkpoint.remove()
+    return {
+        "run_id": run["run_id"],
+        "nodes_deleted": num_deleted,
+        "nodes_missing": num_missing,
+        "round_trips": writer.round_trips,
+        "report": stats.report(),
+        }
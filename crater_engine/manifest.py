@@ -0,0 +1,121 @@
+'''
+manifest.py - Apply manifests for tg_splatter_craters.
+A manifest records what one Apply added to the project: the path of
+every node, the parameter values sent to every Crater shader, and
+which nodes take the crater network's output. Re-apply compares a new
+crater plan with it and only sends what changed, see reapply.py.
+'''
+
+import json
+import os
+import time
+
+MANIFEST_FORMAT = 1
+
+class ManifestError(ValueError):
+    '''
+    Raised when a manifest can't be read or no longer matches the project.
+    '''
+
+def new_manifest(settings, seed):
+    '''
+    Starts the manifest of an Apply. The pipeline fills in the nodes as
+    it adds them.
+
+    Args:
+        settings <obj>: ApplySettings of the Apply
+        seed (int): Seed the crater plan was sampled with
+
+    Returns:
+        manifest (dict): Manifest without nodes
+    '''
+    return {
+        "format": MANIFEST_FORMAT,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seed": seed,
+        "settings": settings.to_dict(),
+        # name of the group and rim shader, path of the other nodes, empty if not added
+        "nodes": {
+            "group": "", "rim_shader": "", "mountain": "", "raster": "", "warp": "",
+            "merge_shader": "",
+            },
+        # node paths: {parameter name: value string} of the nodes above that
+        # re-apply may update
+        "node_params": {},
+        # Compute terrain path and its Main input before the Apply, empty if not inserted
+        "compute_terrain": [],
+        "main_input": "",
+        "craters": [],
+        "crater_params": {},
+        "merge_tree": [],
+        "output": "",
+        # (node path, parameter name) of every parameter set to the output
+        "output_links": [],
+        }
+
+def crater_param_columns(crater_params):
+    '''
+    Converts the parameters of every crater into one column per parameter,
+    which is how a manifest stores them.
+
+    Args:
+        crater_params [lists]: (name, value string) pairs of each crater, see
+            rpc_batch.crater_params()
+
+    Returns:
+        columns (dict): Parameter name: value string of each crater
+    '''
+    columns = {}
+    for index, params in enumerate(crater_params):
+        for name, value in params:
+            columns.setdefault(name, [""] * len(crater_params))[index] = value
+    return columns
+
+def root_node_path(name):
+    '''
+    Gets the path of a node added at the project root from its name.
+
+    Args:
+        name (str): Node name or path
+
+    Returns:
+        path (str): Node path
+    '''
+    return name if name.startswith("/") else "/" + name
+
+def save_manifest(file_path, manifest):
+    '''
+    Writes a manifest as JSON, replacing the file in one step.
+
+    Args:
+        file_path (str): File to write
+        manifest (dict): See new_manifest()
+    '''
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file)
+    os.replace(temp_path, file_path)
+
+def load_manifest(file_path):
+    '''
+    Reads a manifest.
+
+    Args:
+        file_path (str): File written by save_manifest()
+
+    Returns:
+        manifest (dict): See new_manifest()
+
+    Raises:
+        ManifestError: The file can't be read or isn't a manifest
+    '''
+    try:
+        with open(file_path, encoding="utf-8") as file:
+            manifest = json.load(file)
+    except FileNotFoundError as e:
+        raise ManifestError("Nothing to re-apply yet. Click Apply first.") from e
+    except (OSError, ValueError) as e:
+        raise ManifestError(f"Can't read manifest {file_path}: {e}") from e
+    if not isinstance(manifest, dict) or manifest.get("format") != MANIFEST_FORMAT:
+        raise ManifestError(f"{file_path} is not a tg_splatter_craters manifest.")
+    return manifest
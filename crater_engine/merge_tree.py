@@ -0,0 +1,116 @@
+'''
+merge_tree.py - Balanced Merge shader tree layout for tg_splatter_craters.
+Instead of one chain of N Crater shaders, the craters are split into
+short chains whose ends are combined pairwise by Merge shaders, level
+by level, so Terragen walks O(fan-in + log N) nodes per displacement
+sample instead of O(N).
+'''
+
+import math
+from crater_engine.rpc_batch import create_nodes, param_string
+
+DEFAULT_FAN_IN = 8
+
+# Same merge settings as the Merge shader insertion mode
+MERGE_PARAMS = [
+    ("mix_to_A", "1"),
+    ("merge_colour", "1"),
+    ("colour_merge_mode", "1"),
+    ("merge_displacement", "1"),
+    ("displace_merge_mode", "1"),
+    ]
+
+def chain_ends(crater_paths, chain_length):
+    '''
+    Gets the last crater of each chain, which become the leaves of the tree.
+
+    Args:
+        crater_paths [str]: Crater shader paths, in plan order
+        chain_length (int): Craters per chain
+
+    Returns:
+        leaf_paths [str]: Path of the last crater of each chain
+    '''
+    leaf_paths = crater_paths[chain_length - 1::chain_length]
+    if len(crater_paths) % chain_length:
+        leaf_paths.append(crater_paths[-1])
+    return leaf_paths
+
+def build_merge_tree(writer, leaf_paths):
+    '''
+    Merges the leaves pairwise, one level of Merge shaders at a time,
+    until a single root node is left. Each level is written with one
+    create, one path and a few parameter set requests.
+
+    Args:
+        writer <obj>: RpcBatchWriter
+        leaf_paths [str]: Paths of the nodes to merge
+
+    Returns:
+        root_path (str): Path of the root Merge shader, or the only leaf
+        merge_paths [str]: Paths of all Merge shaders added, level by level
+    '''
+    level_paths = list(leaf_paths)
+    all_merge_paths = []
+    while len(level_paths) > 1:
+        merge_ids, merge_paths = create_nodes(writer, "merge_shader", len(level_paths) // 2)
+        writer.call_many(merge_param_calls(merge_ids, level_paths))
+        all_merge_paths.extend(merge_paths)
+        level_paths = next_level(merge_paths, level_paths)
+    return level_paths[0], all_merge_paths
+
+def merge_param_calls(merge_ids, level_paths):
+    '''
+    Builds the parameter set calls of one level of Merge shaders, each
+    merging the next two nodes of the level below.
+
+    Args:
+        merge_ids [str]: Node ids of the level's Merge shaders
+        level_paths [str]: Paths of the nodes of the level below
+
+    Returns:
+        calls [tuples]: (method, params) pairs
+    '''
+    param_calls = []
+    for index, merge_id in enumerate(merge_ids):
+        params = [
+            ("input_node", level_paths[2 * index]),
+            ("shader_A", level_paths[2 * index + 1]),
+            ] + MERGE_PARAMS
+        param_calls.extend(
+            ("set_param_from_string", [merge_id, name, param_string(value)])
+            for name, value in params
+            )
+    return param_calls
+
+def next_level(merge_paths, level_paths):
+    '''
+    Gets the nodes of the next level up: the level's Merge shaders, and
+    the last node below when it had no partner.
+
+    Args:
+        merge_paths [str]: Paths of the level's Merge shaders
+        level_paths [str]: Paths of the nodes of the level below
+
+    Returns:
+        level_paths [str]: Paths of the nodes to merge next
+    '''
+    if len(level_paths) % 2:
+        return merge_paths + [level_paths[-1]]
+    return list(merge_paths)
+
+def crater_network_depth(num_craters, chain_length):
+    '''
+    Longest run of nodes Terragen walks through the crater network.
+
+    Args:
+        num_craters (int): Number of Crater shaders
+        chain_length (int): Craters per chain, 0 for a single chain
+
+    Returns:
+        depth (int): Number of nodes
+    '''
+    if not chain_length or num_craters <= chain_length:
+        return num_craters
+    num_leaves = math.ceil(num_craters / chain_length)
+    return chain_length + math.ceil(math.log2(num_leaves))
@@ -0,0 +1,528 @@
+'''
+mock_server.py - A local stand-in for the Terragen RPC server.
+Speaks the same length-prefixed JSON-RPC 2.0 protocol as Terragen and
+keeps a small node network in memory, so tg_splatter_craters can be run
+and measured without Terragen. Implements the methods used by this tool
+and answers bad calls with the same JSON-RPC error codes, so the usual
+terragen_rpc exceptions are raised on the client side.
+
+Run it on its own with:
+    python -m crater_engine.mock_server --port 36971 --latency 0.002
+'''
+
+import argparse
+import json
+import random
+import socketserver
+import threading
+import time
+from contextlib import contextmanager
+import terragen_rpc.impl as tg_impl
+from crater_engine.project_cache import reset_project_caches
+from crater_engine.rpc_batch import reset_batch_support
+
+# JSON-RPC 2.0 error codes, raised by terragen_rpc as
+# LowLevelParseError, LowLevelInvalidRequest, ApiMethodNotFound,
+# ApiInvalidParams and LowLevelInternalError
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+ROOT_ID = "1"
+
+class MockRpcError(Exception):
+    '''
+    Error returned to the client as a JSON-RPC error reply.
+    '''
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+class MockNode:
+    '''
+    A node of the mock project.
+    '''
+    def __init__(self, node_id, class_name, name, parent_id):
+        self.node_id = node_id
+        self.class_name = class_name
+        self.name = name
+        self.parent_id = parent_id
+        self.children = []
+        self.params = {}
+
+class MockProject:
+    '''
+    The node network of the mock server, loosely matching a new
+    Terragen project: a Compute terrain fed by a Fractal warp shader
+    and a Power fractal, and a render node with its camera. Projects
+    with several terrain branches add a Compute terrain fed by a Power
+    fractal of its own for each extra branch.
+
+    Args:
+        terrains (int): Number of Compute terrain nodes
+    '''
+    def __init__(self, terrains=1):
+        self.nodes = {}
+        self.name_counts = {}
+        self.next_id = int(ROOT_ID)
+        self.lock = threading.Lock()
+        self.add_node("project", None, "Project")
+        fractal = self.add_node("power_fractal_shader_v3", ROOT_ID)
+        warp = self.add_node("fractal_warp_shader", ROOT_ID)
+        warp.params["input_node"] = fractal.name
+        compute = self.add_node("compute_terrain", ROOT_ID, "Compute Terrain")
+        compute.params["input_node"] = warp.name
+        for _ in range(terrains - 1):
+            fractal = self.add_node("power_fractal_shader_v3", ROOT_ID)
+            compute = self.add_node("compute_terrain", ROOT_ID)
+            compute.params["input_node"] = fractal.name
+        self.add_node("planet", ROOT_ID)
+        camera = self.add_node("camera", ROOT_ID, "Render Camera")
+        camera.params.update({"position": "0 1500 -4000", "horizontal_fov": "60"})
+        render = self.add_node("render", ROOT_ID, "Render 01")
+        render.params.update({"camera": "/Render Camera", "image_width": "800"})
+
+    def add_node(self, class_name, parent_id, name=None):
+        '''
+        Adds a node, named the way Terragen names new nodes when no name is given.
+
+        Args:
+            class_name (str): Node class
+            parent_id (str): Parent node id, None for the root
+            name (str): Optional node name
+
+        Returns:
+            node <obj>: The new MockNode
+        '''
+        node_id = str(self.next_id)
+        self.next_id += 1
+        if name is None:
+            name = self.unique_name(class_name.replace("_", " ").capitalize())
+        node = MockNode(node_id, class_name, name, parent_id)
+        self.nodes[node_id] = node
+        if parent_id is not None:
+            self.nodes[parent_id].children.append(node_id)
+        return node
+
+    def unique_name(self, base_name):
+        '''
+        Numbers a node name, i.e. "Crater shader 01".
+
+        Args:
+            base_name (str): Name without number
+
+        Returns:
+            name (str): Numbered name
+        '''
+        count = self.name_counts.get(base_name, 0) + 1
+        self.name_counts[base_name] = count
+        return f"{base_name} {count:02d}"
+
+    def node(self, node_id):
+        '''
+        Looks up a node by id.
+
+        Args:
+            node_id (str): Node id
+
+        Returns:
+            node <obj>: MockNode
+        '''
+        node = self.nodes.get(str(node_id))
+        if node is None:
+            raise MockRpcError(INVALID_PARAMS, f"Invalid node ID: {node_id}")
+        return node
+
+    def path(self, node):
+        '''
+        Path of a node, the way terragen_rpc Node.path() returns it.
+
+        Args:
+            node <obj>: MockNode
+
+        Returns:
+            path (str): "/" separated path, or the name of the root
+        '''
+        if node.parent_id is None:
+            return node.name
+        names = []
+        while node.parent_id is not None:
+            names.append(node.name)
+            node = self.nodes[node.parent_id]
+        return "/" + "/".join(reversed(names))
+
+    def set_param(self, node, param_name, value):
+        '''
+        Sets a parameter. Renaming a node keeps names unique among its siblings.
+
+        Args:
+            node <obj>: MockNode
+            param_name (str): Parameter name
+            value (str): Parameter value as string
+        '''
+        if param_name != "name":
+            node.params[param_name] = value
+            return
+        siblings = self.nodes[node.parent_id].children if node.parent_id else []
+        taken = {self.nodes[i].name for i in siblings if i != node.node_id}
+        node.name = value if value not in taken else self.unique_name(value)
+
+    def get_param(self, node, param_name):
+        '''
+        Gets a parameter as string. Unset parameters are empty.
+
+        Args:
+            node <obj>: MockNode
+            param_name (str): Parameter name
+
+        Returns:
+            value (str): Parameter value as string
+        '''
+        if param_name == "name":
+            return node.name
+        return node.params.get(param_name, "")
+
+    def node_by_path(self, path):
+        '''
+        Looks up a node by path.
+
+        Args:
+            path (str): Node path
+
+        Returns:
+            node_id (str): Node id, or "0" when there is no such node
+        '''
+        node = self.nodes[ROOT_ID]
+        for name in [part for part in path.split("/") if part]:
+            node = next(
+                (self.nodes[i] for i in node.children if self.nodes[i].name == name), None)
+            if node is None:
+                return "0"
+        return node.node_id
+
+    def delete(self, node_ids):
+        '''
+        Deletes nodes and their children, the way terragen_rpc delete() does.
+
+        Args:
+            node_ids: Node id, or list of node ids
+        '''
+        nodes = [self.node(node_id) for node_id in
+                 (node_ids if isinstance(node_ids, list) else [node_ids])]
+        for node in nodes:
+            if node.node_id not in self.nodes:
+                continue
+            if node.parent_id is not None:
+                self.nodes[node.parent_id].children.remove(node.node_id)
+            removed = [node.node_id]
+            while removed:
+                node_id = removed.pop()
+                removed.extend(self.nodes.pop(node_id).children)
+
+    def call(self, method, params):
+        '''
+        Runs one RPC method.
+
+        Args:
+            method (str): RPC method name
+            params []: RPC method parameters
+
+        Returns:
+            value: Result of the call
+        '''
+        handler = MOCK_METHODS.get(method)
+        if handler is None:
+            raise MockRpcError(METHOD_NOT_FOUND, f"Method not found: {method}")
+        try:
+            with self.lock:
+                return handler(self, *params)
+        except TypeError as e:
+            raise MockRpcError(INVALID_PARAMS, f"Invalid params: {e}") from e
+
+    def nodes_of_class(self, class_name):
+        '''
+        Gets all nodes of a class, for checking the network after a run.
+
+        Args:
+            class_name (str): Node class
+
+        Returns:
+            nodes [MockNode]: Nodes in creation order
+        '''
+        return [node for node in self.nodes.values() if node.class_name == class_name]
+
+def _create_child(project, parent_id, class_name):
+    return project.add_node(class_name, project.node(parent_id).node_id).node_id
+
+def _children_filtered_by_class(project, node_id, class_name):
+    node = project.node(node_id)
+    return [i for i in node.children if project.nodes[i].class_name == class_name]
+
+MOCK_METHODS = {
+    "root": lambda project: ROOT_ID,
+    "create_child": _create_child,
+    "name": lambda project, node_id: project.node(node_id).name,
+    "path": lambda project, node_id: project.path(project.node(node_id)),
+    "name_and_path": lambda project, node_id: project.path(project.node(node_id)),
+    "node_by_path": lambda project, path: project.node_by_path(path),
+    "delete": lambda project, node_ids: project.delete(node_ids),
+    "children": lambda project, node_id: list(project.node(node_id).children),
+    "children_filtered_by_class": _children_filtered_by_class,
+    "get_param_as_string":
+        lambda project, node_id, param_name: project.get_param(project.node(node_id), param_name),
+    "set_param_from_string":
+        lambda project, node_id, param_name, value:
+            project.set_param(project.node(node_id), param_name, str(value)),
+    }
+
+class MockTerragenServer(socketserver.ThreadingTCPServer):
+    '''
+    Threaded TCP server answering Terragen RPC requests from a MockProject.
+
+    Args:
+        port (int): TCP port, 0 picks a free one
+        latency (float): Seconds added to every round-trip
+        call_latency (float): Seconds added to every call, including each call of a batch
+        batch (bool): Accept JSON-RPC batch requests, Terragen itself may not
+        error_rate (float): Fraction of calls answered with error_code instead
+        error_code (int): JSON-RPC error code of the injected errors
+        seed (int): Seed for choosing which calls fail
+        serial (bool): Work through calls one at a time, as Terragen does,
+            so call_latency of concurrent requests adds up
+        terrains (int): Number of Compute terrain nodes in the project
+    '''
+    daemon_threads = True
+    allow_reuse_address = True
+    # pipelined clients open many connections at once
+    request_queue_size = 64
+
+    def __init__(self, port=0, latency=0.0, call_latency=0.0, batch=True,
+                 error_rate=0.0, error_code=INVALID_PARAMS, seed=None, serial=False,
+                 terrains=1):
+        super().__init__(("localhost", port), MockRequestHandler)
+        self.project = MockProject(terrains)
+        self.latency = latency
+        self.call_latency = call_latency
+        self.batch = batch
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.random = random.Random(seed)
+        self.serial = serial
+        self.work_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.round_trips = 0
+        self.method_counts = {}
+        self.errors = 0
+        self.thread = None
+
+    @property
+    def port(self):
+        '''
+        TCP port the server listens on.
+        '''
+        return self.server_address[1]
+
+    def start(self):
+        '''
+        Starts serving on a background thread.
+
+        Returns:
+            server <obj>: self
+        '''
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        '''
+        Stops serving and closes the socket.
+        '''
+        self.shutdown()
+        self.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def stats(self):
+        '''
+        Gets the request counters.
+
+        Returns:
+            stats (dict): Round-trips, calls, calls per method and injected errors
+        '''
+        with self.stats_lock:
+            return {
+                "round_trips": self.round_trips,
+                "calls": sum(self.method_counts.values()),
+                "method_counts": dict(self.method_counts),
+                "errors": self.errors,
+                }
+
+    def reply_to(self, message):
+        '''
+        Answers one request, single or batch.
+
+        Args:
+            message (bytes): Request JSON
+
+        Returns:
+            reply (dict | list): Reply object, or list of replies for a batch
+        '''
+        try:
+            request = json.loads(message)
+        except ValueError:
+            return error_reply(None, PARSE_ERROR, "Parse error")
+        if isinstance(request, dict) and request.get("method") == "mock_stats":
+            # not counted, so the client can read the counters without changing them
+            return {"jsonrpc": "2.0", "id": request.get("id"), "result": self.stats()}
+        with self.stats_lock:
+            self.round_trips += 1
+        if isinstance(request, list):
+            if not self.batch or not request:
+                return error_reply(None, INVALID_REQUEST, "Invalid Request")
+            return [self.reply_to_call(item) for item in request]
+        return self.reply_to_call(request)
+
+    def reply_to_call(self, request):
+        '''
+        Answers one call.
+
+        Args:
+            request (dict): JSON-RPC request object
+
+        Returns:
+            reply (dict): JSON-RPC reply object
+        '''
+        if not isinstance(request, dict) or "method" not in request:
+            return error_reply(None, INVALID_REQUEST, "Invalid Request")
+        request_id = request.get("id")
+        method = request["method"]
+        params = request.get("params", [])
+        if self.call_latency and self.serial:
+            with self.work_lock:
+                time.sleep(self.call_latency)
+        elif self.call_latency:
+            time.sleep(self.call_latency)
+        with self.stats_lock:
+            self.method_counts[method] = self.method_counts.get(method, 0) + 1
+            fail = self.error_rate and self.random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        if fail:
+            return error_reply(request_id, self.error_code, "Injected error")
+        try:
+            result = self.project.call(method, params)
+        except MockRpcError as e:
+            return error_reply(request_id, e.code, e.message)
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+class MockRequestHandler(socketserver.BaseRequestHandler):
+    '''
+    Reads one length-prefixed request, replies and closes the connection,
+    the same as the Terragen RPC server.
+    '''
+    def handle(self):
+        length_info = self.receive(4)
+        if len(length_info) < 4:
+            return
+        message = self.receive(int.from_bytes(length_info, byteorder="little"))
+        reply = self.server.reply_to(message)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.request.sendall(json.dumps(reply).encode())
+
+    def receive(self, num_bytes):
+        '''
+        Reads an exact number of bytes, or fewer if the client hangs up.
+
+        Args:
+            num_bytes (int): Number of bytes to read
+
+        Returns:
+            data (bytes): Bytes read
+        '''
+        chunks = []
+        while num_bytes > 0:
+            chunk = self.request.recv(min(num_bytes, 65536))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            num_bytes -= len(chunk)
+        return b"".join(chunks)
+
+def error_reply(request_id, code, message):
+    '''
+    Builds a JSON-RPC error reply.
+
+    Args:
+        request_id: Id of the request, None if unknown
+        code (int): JSON-RPC error code
+        message (str): Error message
+
+    Returns:
+        reply (dict): JSON-RPC reply object
+    '''
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+@contextmanager
+def mock_terragen(**server_options):
+    '''
+    Runs a MockTerragenServer on a free port and points terragen_rpc at it
+    for the duration of the with block.
+
+    Args:
+        server_options: Keyword arguments of MockTerragenServer
+
+    Yields:
+        server <obj>: The running MockTerragenServer
+    '''
+    server = MockTerragenServer(**server_options).start()
+    address = tg_impl.TCP_IP, tg_impl.TCP_PORT
+    tg_impl.TCP_IP, tg_impl.TCP_PORT = "localhost", server.port
+    reset_batch_support()
+    reset_project_caches()
+    try:
+        yield server
+    finally:
+        tg_impl.TCP_IP, tg_impl.TCP_PORT = address
+        reset_batch_support()
+        reset_project_caches()
+        server.stop()
+
+def main():
+    '''
+    Runs the mock server until interrupted. Prints the port first, so a
+    parent process can connect to a server started with --port 0.
+    '''
+    parser = argparse.ArgumentParser(description="Local stand-in for the Terragen RPC server.")
+    parser.add_argument("--port", type=int, default=tg_impl.TCP_PORT)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds added to every round-trip")
+    parser.add_argument("--call-latency", type=float, default=0.0,
+                        help="seconds added to every call")
+    parser.add_argument("--no-batch", action="store_true",
+                        help="reject JSON-RPC batch requests")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of calls answered with an error")
+    parser.add_argument("--error-code", type=int, default=INVALID_PARAMS)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--serial", action="store_true",
+                        help="work through calls one at a time")
+    parser.add_argument("--terrains", type=int, default=1,
+                        help="number of Compute terrain nodes in the project")
+    args = parser.parse_args()
+    server = MockTerragenServer(
+        args.port, args.latency, args.call_latency, not args.no_batch,
+        args.error_rate, args.error_code, args.seed, args.serial, args.terrains)
+    print(server.port, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+'''
+parallel.py - Concurrent Crater shader creation for tg_splatter_craters.
+A producer thread samples the crater plan chunk by chunk while the
+Crater shaders of earlier chunks are created, in plan order so that
+node names match the serial path, and a pool of RPC workers sets their
+parameters, including the Main input chain.
+'''
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+from crater_engine.instrument import carry_stage
+from crater_engine.plan import CRATER_PLAN_DTYPE, crater_plan_rows
+from crater_engine.rpc_batch import chained_param_calls, craters_per_step, create_craters
+
+DEFAULT_WORKERS = 4
+
+# Plan chunks sampled ahead of the RPC writers
+PLAN_QUEUE_SIZE = 4
+
+_END_OF_PLAN = object()
+
+def produce_plan_chunks(plan_chunks, chunk_queue, stop_event):
+    '''
+    Samples plan chunks and hands them to the consumer. Runs on the
+    producer thread.
+
+    Args:
+        plan_chunks <iter>: Crater plan chunks, see iter_crater_plan()
+        chunk_queue <obj>: queue.Queue receiving chunks, then _END_OF_PLAN
+        stop_event <obj>: threading.Event set when the consumer stops early
+    '''
+    try:
+        for chunk in plan_chunks:
+            if stop_event.is_set():
+                break
+            chunk_queue.put(chunk)
+    except Exception as e:
+        chunk_queue.put(e)
+    chunk_queue.put(_END_OF_PLAN)
+
+def consume_plan_chunks(chunk_queue):
+    '''
+    Yields plan chunks from the producer thread.
+
+    Args:
+        chunk_queue <obj>: queue.Queue filled by produce_plan_chunks()
+
+    Yields:
+        chunk (ndarray): Crater plan chunk
+    '''
+    while True:
+        chunk = chunk_queue.get()
+        if chunk is _END_OF_PLAN:
+            return
+        if isinstance(chunk, Exception):
+            raise chunk
+        yield chunk
+
+def stop_producer(producer, chunk_queue, stop_event):
+    '''
+    Stops the producer thread and waits for it to finish.
+
+    Args:
+        producer <obj>: Producer threading.Thread
+        chunk_queue <obj>: queue.Queue filled by produce_plan_chunks()
+        stop_event <obj>: threading.Event checked by the producer
+    '''
+    stop_event.set()
+    while producer.is_alive():
+        try:
+            chunk_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    producer.join()
+
+def write_craters_parallel(writer, plan_chunks, group_name, rim_shader_name, input_node,
+                           workers=DEFAULT_WORKERS, progress=None, cancel_event=None,
+                           chain_length=0, first_index=0, commit=None):
+    '''
+    Adds Crater shaders to the project using a pool of RPC workers.
+    Produces the same network as write_craters() for the same plan.
+
+    Args:
+        writer <obj>: RpcBatchWriter shared by all workers
+        plan_chunks <iter>: Crater plan chunks, see iter_crater_plan()
+        group_name (str): Name of group node or empty string
+        rim_shader_name (str): Name of rim shader or empty string
+        input_node (str): Path of node to assign to the first crater's Main input
+        workers (int): Number of RPC worker threads
+        progress <func>: Optional callback taking the number of craters done
+        cancel_event <obj>: Optional threading.Event, set to stop after the current crater
+        chain_length (int): Craters per chain, 0 chains all craters together
+        first_index (int): Plan index of the first crater, when resuming a run
+        commit <func>: Optional callback taking the paths of craters whose
+            parameters are all set, in plan order, see crater_engine.checkpoint
+
+    Returns:
+        crater_paths [str]: Paths of the new Crater shaders, in plan order
+        crater_plan (ndarray): The part of the plan that was written
+    '''
+    workers = max(int(workers), 1)
+    step = craters_per_step(writer) # also probes batch support before the workers share it
+    chunk_queue = queue.Queue(maxsize=PLAN_QUEUE_SIZE)
+    stop_event = threading.Event()
+    producer = threading.Thread(
+        target=produce_plan_chunks, args=(plan_chunks, chunk_queue, stop_event), daemon=True)
+    producer.start()
+
+    crater_paths = []
+    written_chunks = []
+    pending = set()
+    # (crater paths, parameter jobs) of batches not committed yet, in plan order
+    uncommitted = []
+    call_many = carry_stage(writer.call_many)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for chunk in consume_plan_chunks(chunk_queue):
+                crater_rows = crater_plan_rows(chunk)
+                num_written = 0
+                for start in range(0, len(crater_rows), step):
+                    if cancel_event is not None and cancel_event.is_set():
+                        break
+                    batch_rows = crater_rows[start:start + step]
+                    crater_ids, batch_paths = create_craters(writer, len(batch_rows))
+                    param_calls = chained_param_calls(
+                        crater_ids, batch_rows, batch_paths, group_name, rim_shader_name,
+                        input_node, first_index + len(crater_paths), chain_length)
+                    jobs = [
+                        pool.submit(
+                            call_many,
+                            param_calls[call_start:call_start + writer.batch_size])
+                        for call_start in range(0, len(param_calls), writer.batch_size)
+                        ]
+                    pending.update(jobs)
+                    uncommitted.append((batch_paths, jobs))
+                    input_node = batch_paths[-1]
+                    crater_paths.extend(batch_paths)
+                    num_written += len(batch_rows)
+                    pending = wait_for_workers(pending, workers * 2)
+                    commit_finished(uncommitted, commit)
+                    if progress is not None:
+                        progress(len(crater_paths))
+                written_chunks.append(chunk[:num_written])
+                if num_written < len(chunk):
+                    break
+            wait_for_workers(pending, 0)
+    finally:
+        stop_producer(producer, chunk_queue, stop_event)
+        # the pool has finished every job here, also when one failed
+        commit_finished(uncommitted, commit)
+
+    if not written_chunks:
+        return crater_paths, np.zeros(0, dtype=CRATER_PLAN_DTYPE)
+    return crater_paths, np.concatenate(written_chunks)
+
+def commit_finished(uncommitted, commit) -> None:
+    '''
+    Commits the leading batches whose parameter jobs all succeeded.
+
+    Args:
+        uncommitted [tuples]: (crater paths, jobs) of batches in plan order,
+            the committed ones are removed
+        commit <func>: Callback taking crater paths, or None
+    '''
+    while uncommitted and all(
+            job.done() and not job.cancelled() and job.exception() is None
+            for job in uncommitted[0][1]):
+        batch_paths, _ = uncommitted.pop(0)
+        if commit is not None:
+            commit(batch_paths)
+
+def wait_for_workers(pending, max_pending):
+    '''
+    Waits until no more than max_pending worker jobs are outstanding and
+    re-raises the first worker error.
+
+    Args:
+        pending {futures}: Outstanding worker jobs
+        max_pending (int): Number of jobs allowed to remain outstanding
+
+    Returns:
+        pending {futures}: Jobs still outstanding
+    '''
+    while len(pending) > max_pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            future.result()
+    return pending
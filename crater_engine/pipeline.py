@@ -0,0 +1,1342 @@
+'''
+pipeline.py - The Apply pipeline of tg_splatter_craters.
+Adds the group, rim shader, Simple Shape, Crater, Fractal Warp and
+Merge shaders to the active Terragen project and inserts them into the
+node network. Runs from a validated ApplySettings and never touches
+Tk, so it can run on a worker thread. Terragen RPC errors are raised to
+the caller instead of being reported here.
+'''
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import terragen_rpc as tg
+from crater_engine.checkpoint import (
+    Checkpoint,
+    CheckpointError,
+    delete_strays,
+    keep_committed,
+    load_checkpoint,
+    load_checkpoint_plan,
+    )
+from crater_engine.culling import cull_craters, read_camera
+from crater_engine.instrument import RpcStats, instrument_rpc, write_report
+from crater_engine.journal import RunJournal, clean_up_run, record_run
+from crater_engine.manifest import (
+    crater_param_columns,
+    new_manifest,
+    root_node_path,
+    save_manifest,
+    )
+from crater_engine.merge_tree import (
+    build_merge_tree,
+    chain_ends,
+    crater_network_depth,
+    )
+from crater_engine.parallel import write_craters_parallel
+from crater_engine.plan import (
+    crater_plan_rows,
+    iter_crater_plan,
+    make_crater_plan,
+    new_seed,
+    plan_chunks,
+    )
+from crater_engine.plan_file import load_replay, plan_key, save_plan
+from crater_engine.project_cache import project_cache
+from crater_engine.raster import raster_shader_params, split_plan, write_raster
+from crater_engine.rpc_async import build_merge_tree_pipelined, write_craters_pipelined
+from crater_engine.rpc_batch import (
+    PATH_METHOD,
+    RpcBatchWriter,
+    chain_inputs,
+    crater_params,
+    param_string,
+    write_craters,
+    )
+from crater_engine.targets import select_targets, target_seeds
+
+# Simple Shape shader parameters set by set_sss_params(), in order
+SSS_PARAMS = [
+    "position",
+    "type_of_shape",
+    "size",
+    "displacement_amplitude",
+    "displacement_edge_profile",
+    "displacement_edge_width",
+    "displacement_edge_units",
+    "input_node",
+    "apply_displacement"
+    ]
+
+def run_apply(settings, progress=None, cancel_event=None, report_path=None,
+              crater_plan=None, plan_cache=None, plan_path=None, manifest_path=None,
+              journal_path=None, checkpoint_path=None):
+    '''
+    Triggers the creation of all new shaders to the project.
+    Including crater, group, and other shaders assigned to
+    the Crater's Rim shader input. Every Terragen RPC call is timed
+    per pipeline stage, see crater_engine.instrument.
+
+    Args:
+        settings <obj>: ApplySettings, see ApplySettings.from_values()
+        progress <func>: Optional callback taking the number of craters done
+        cancel_event <obj>: Optional threading.Event, set to stop after the current crater
+        report_path (str): Optional file the JSON timing report is written to,
+            also when the run fails
+        crater_plan (ndarray): Optional plan to add instead of sampling one, see replay_plan()
+        plan_cache <obj>: Optional PlanCache to reuse and keep sampled plans in
+        plan_path (str): Optional file the sampled plan is written to
+        manifest_path (str): Optional file the manifest of a finished run is
+            written to, see crater_engine.manifest
+        journal_path (str): Optional journal file the run and the nodes it
+            created are added to, for undo, see crater_engine.journal
+        checkpoint_path (str): Optional checkpoint file the committed craters
+            are written to. A run that fails or is cancelled after the first
+            crater keeps them and can be continued with resume_apply(), see
+            crater_engine.checkpoint
+
+    Returns:
+        apply_result (dict): Run id, number of craters planned and added, round-trips
+            used and retried, depth of the crater network, whether the run was
+            cancelled, the seed, the plan file written or reused, the craters
+            culled and rasterized, the project cache counters and the timing report.
+            With several targets also those of every target, see target_stages()
+    '''
+    checkpoint = Checkpoint(checkpoint_path) if checkpoint_path else None
+    return run_journaled(
+        RunJournal(), checkpoint, report_path, manifest_path, journal_path,
+        lambda stats, journal: apply_stages(
+            settings, stats, progress, cancel_event, crater_plan, plan_cache, plan_path,
+            journal, checkpoint))
+
+def resume_apply(checkpoint_path, progress=None, cancel_event=None, report_path=None,
+                 manifest_path=None, journal_path=None):
+    '''
+    Continues a checkpointed Apply that failed or was cancelled, from the
+    crater after the last committed one, with the same plan and settings.
+    Crater shaders that were created but never committed are deleted
+    first. The run keeps its run id and is journaled as one run.
+
+    Args:
+        checkpoint_path (str): Checkpoint file given to run_apply()
+        progress <func>: Optional callback taking the number of craters done,
+            counting the committed ones
+        cancel_event <obj>: Optional threading.Event, set to stop after the current crater
+        report_path (str): Optional file the JSON timing report is written to
+        manifest_path (str): Optional file the manifest of the finished run is written to
+        journal_path (str): Optional journal file the run is added to
+
+    Returns:
+        apply_result (dict): See run_apply(), with the number of craters resumed from
+
+    Raises:
+        CheckpointError: There is nothing to resume, or the project no
+            longer has the committed craters
+        PlanFileError: The plan file of the checkpoint can't be read
+    '''
+    checkpoint = load_checkpoint(checkpoint_path)
+    crater_plan, settings = load_checkpoint_plan(checkpoint)
+    journal = RunJournal(
+        checkpoint.header["run_id"], checkpoint.header["nodes"] + checkpoint.crater_paths)
+    journal.compute_terrain = list(checkpoint.header["manifest"]["compute_terrain"])
+    return run_journaled(
+        journal, checkpoint, report_path, manifest_path, journal_path,
+        lambda stats, journal: resume_stages(
+            settings, stats, checkpoint, crater_plan, progress, cancel_event))
+
+def run_journaled(journal, checkpoint, report_path, manifest_path, journal_path, stages):
+    '''
+    Runs the stages of an Apply with every RPC call timed and every node
+    created journaled. A run that fails is cleaned up, or, once its
+    checkpoint has started, keeps its committed craters for resuming.
+
+    Args:
+        journal <obj>: RunJournal of the run
+        checkpoint <obj>: Checkpoint of the run, or None
+        report_path (str): Optional file the JSON timing report is written to,
+            also when the run fails
+        manifest_path (str): Optional file the manifest of a finished run is written to
+        journal_path (str): Optional journal file the run is added to
+        stages <func>: Takes the RpcStats and RunJournal and returns the
+            apply result, with the manifest
+
+    Returns:
+        apply_result (dict): See run_apply()
+    '''
+    stats = RpcStats()
+    try:
+        with instrument_rpc(stats):
+            try:
+                with project_cache().journaling(journal):
+                    apply_result = stages(stats, journal)
+            except Exception:
+                if checkpoint is not None and checkpoint.started:
+                    with stats.stage("clean up"):
+                        keep_committed(journal, checkpoint)
+                else:
+                    # don't leave half a crater field behind
+                    with stats.stage("clean up"):
+                        clean_up_run(journal)
+                if journal_path and journal.status in ("failed", "interrupted"):
+                    try:
+                        record_run(journal_path, journal.to_dict())
+                    except OSError:
+                        pass # the run's own error is what the caller reports
+                raise
+            manifest = apply_result.pop("manifest")
+            manifest["run_id"] = journal.run_id
+            if manifest_path and not apply_result["cancelled"]:
+                save_manifest(manifest_path, manifest)
+            if journal_path:
+                with stats.stage("journal"):
+                    journal.resolve_paths(RpcBatchWriter())
+                    journal.status = "cancelled" if apply_result["cancelled"] else "finished"
+                    record_run(journal_path, journal.to_dict())
+            if checkpoint is not None and not apply_result["cancelled"]:
+                checkpoint.remove()
+    except (ConnectionError, TimeoutError, tg.Error):
+        # the project may have changed or be gone, look everything up again
+        project_cache().invalidate()
+        raise
+    finally:
+        if report_path:
+            try:
+                write_report(stats.report(), report_path)
+            except OSError:
+                pass # the report is for diagnosis only, never fail the Apply over it
+    apply_result["report"] = stats.report()
+    return apply_result
+
+def replay_plan(file_path, progress=None, cancel_event=None, report_path=None,
+                manifest_path=None, journal_path=None):
+    '''
+    Adds the craters of a plan file to the project with the settings it
+    was saved with, without sampling them again.
+
+    Args:
+        file_path (str): Plan file, see crater_engine.plan_file
+        progress <func>: Optional callback taking the number of craters done
+        cancel_event <obj>: Optional threading.Event, set to stop after the current crater
+        report_path (str): Optional file the JSON timing report is written to
+        manifest_path (str): Optional file the manifest is written to
+        journal_path (str): Optional journal file the run is added to
+
+    Returns:
+        apply_result (dict): See run_apply()
+
+    Raises:
+        PlanFileError: The file can't be read or isn't a crater plan
+    '''
+    crater_plan, settings = load_replay(file_path)
+    apply_result = run_apply(
+        settings, progress, cancel_event, report_path, crater_plan,
+        manifest_path=manifest_path, journal_path=journal_path)
+    apply_result["plan_file"] = file_path
+    return apply_result
+
+def apply_stages(settings, stats, progress=None, cancel_event=None, crater_plan=None,
+                 plan_cache=None, plan_path=None, journal=None, checkpoint=None):
+    '''
+    Runs the stages of the Apply pipeline in order, timing each one.
+
+    Args:
+        settings <obj>: ApplySettings
+        stats <obj>: RpcStats recording the run
+        progress <func>: Optional callback taking the number of craters done
+        cancel_event <obj>: Optional threading.Event, set to stop after the current crater
+        crater_plan (ndarray): Optional plan to add instead of sampling one
+        plan_cache <obj>: Optional PlanCache
+        plan_path (str): Optional file the sampled plan is written to
+        journal <obj>: Optional RunJournal, given the Compute terrain's Main input
+        checkpoint <obj>: Optional Checkpoint, started before the first crater;
+            needs the journal. Not used with several targets, see target_stages()
+
+    Returns:
+        apply_result (dict): See run_apply(), without the report
+    '''
+    seed = settings.seed if settings.seed is not None else new_seed()
+    plan_file = ""
+    if crater_plan is None and plan_cache is not None:
+        with stats.stage("plan cache"):
+            crater_plan = plan_cache.load(plan_key(settings, seed))
+            if crater_plan is not None:
+                plan_file = plan_cache.path(plan_key(settings, seed))
+    sampled = crater_plan is None
+    manifest = new_manifest(settings, seed)
+    with stats.stage("project cache"):
+        project_cache().validate()
+    writer = RpcBatchWriter(retries=settings.rpc_retries)
+    with stats.stage("compute terrain"):
+        targets = get_targets(settings, writer)
+    if journal is not None:
+        journal.compute_terrain = list(targets[0][0])
+        if len(targets) > 1:
+            journal.targets = [list(compute_terrain_tuple) for compute_terrain_tuple, _ in targets]
+    if len(targets) > 1:
+        return target_stages(
+            settings, stats, writer, targets, seed, crater_plan, plan_file, progress,
+            cancel_event, plan_cache, plan_path, journal)
+    compute_terrain_tuple, main_input = targets[0]
+    full_plan = crater_plan
+    if settings.cull_pixels is not None or settings.raster_below is not None:
+        # the whole plan is needed up front, the plan file keeps it uncut
+        if full_plan is None:
+            with stats.stage("plan"):
+                full_plan = make_crater_plan(
+                    settings, settings.quantity, seed, settings.plan_workers)
+        crater_plan = full_plan
+    camera = None
+    if settings.cull_pixels is not None:
+        with stats.stage("camera"):
+            camera = read_camera(writer)
+    crater_plan, culling, raster = cut_plan(settings, stats, crater_plan, camera)
+    with stats.stage("group"):
+        final_crater_group_name = get_group_name(settings)
+    with stats.stage("rim shader"):
+        final_rim_shader_name = get_rim_shader_name(settings)
+    crater_input = add_network_inputs(
+        settings, stats, writer, manifest, final_crater_group_name, final_rim_shader_name,
+        compute_terrain_tuple, main_input, raster)
+    if checkpoint is not None:
+        with stats.stage("checkpoint"):
+            journal.resolve_paths(writer)
+            checkpoint.start(
+                journal, crater_plan, settings, seed, manifest,
+                {"culling": culling, "raster": raster, "plan_file": plan_file})
+    with stats.stage("craters"):
+        crater_paths, crater_diameter, crater_plan, cancelled = make_craters(
+            settings,
+            writer,
+            final_crater_group_name,
+            final_rim_shader_name,
+            crater_input,
+            progress,
+            cancel_event,
+            seed,
+            crater_plan,
+            commit=checkpoint.commit if checkpoint is not None else None
+            )
+    num_craters = settings.quantity
+    chain_length = get_chain_length(settings)
+    if not cancelled:
+        if sampled:
+            with stats.stage("plan file"):
+                plan_file = save_crater_plan(
+                    settings, seed, crater_plan if full_plan is None else full_plan,
+                    plan_cache, plan_path)
+        finish_network(
+            settings, stats, writer, manifest, crater_plan, crater_paths, crater_diameter,
+            compute_terrain_tuple)
+    return {
+        "run_id": journal.run_id if journal is not None else "",
+        "num_craters": num_craters,
+        "craters_added": len(crater_paths),
+        "round_trips": writer.round_trips,
+        "round_trips_per_crater": writer.round_trips_per_crater(len(crater_paths)),
+        "retries": writer.retried,
+        "network_depth": crater_network_depth(len(crater_paths), chain_length),
+        "cancelled": cancelled,
+        "seed": seed,
+        "plan_file": plan_file,
+        "culling": culling,
+        "raster": raster,
+        "project_cache": project_cache().stats(),
+        "manifest": manifest,
+        }
+
+def target_stages(settings, stats, writer, targets, seed, crater_plan=None, plan_file="",
+                  progress=None, cancel_event=None, plan_cache=None, plan_path=None,
+                  journal=None):
+    '''
+    Runs the stages of an Apply into several Compute terrain nodes, see
+    crater_engine.targets. The group and rim shader are shared, then the
+    crater network of every target is added at the same time, one thread
+    each. Such a run isn't checkpointed, it is cleaned up when it fails.
+
+    Args:
+        settings <obj>: ApplySettings
+        stats <obj>: RpcStats recording the run
+        writer <obj>: RpcBatchWriter
+        targets [tuples]: Compute terrain tuple and Main input of each
+            target, see get_targets()
+        seed (int): Seed of the Apply, the plan seed of the first target
+        crater_plan (ndarray): Optional plan to add instead of sampling one,
+            the first target's with a plan per target
+        plan_file (str): Plan file crater_plan was read from, empty if none
+        progress <func>: Optional callback taking the number of craters done,
+            averaged over the targets
+        cancel_event <obj>: Optional threading.Event, set to stop after the current crater
+        plan_cache <obj>: Optional PlanCache
+        plan_path (str): Optional file the sampled plan of the first target is written to
+        journal <obj>: Optional RunJournal
+
+    Returns:
+        apply_result (dict): See run_apply(), without the report, with the
+            Compute terrain path, plan seed and craters added of every target
+    '''
+    sampled = crater_plan is None
+    seeds = target_seeds(settings, seed, len(targets))
+    camera = None
+    if settings.cull_pixels is not None:
+        with stats.stage("camera"):
+            camera = read_camera(writer)
+    # every plan is sampled up front, so a shared one is cut and rasterized once
+    full_plans = {}
+    plans = {}
+    for plan_seed in dict.fromkeys(seeds):
+        full_plan = crater_plan if plan_seed == seed else None
+        if full_plan is None:
+            with stats.stage("plan"):
+                full_plan = make_crater_plan(
+                    settings, settings.quantity, plan_seed, settings.plan_workers)
+        full_plans[plan_seed] = full_plan
+        plans[plan_seed] = cut_plan(settings, stats, full_plan, camera)
+    with stats.stage("group"):
+        group_name = get_group_name(settings)
+    with stats.stage("rim shader"):
+        rim_shader_name = get_rim_shader_name(settings)
+    # set when a target fails, the run is cleaned up so the others can stop
+    stop_event = cancel_event if cancel_event is not None else threading.Event()
+    craters_done = [0] * len(targets)
+    progress_lock = threading.Lock()
+
+    def target_progress(index):
+        def report(target_craters_done):
+            with progress_lock:
+                craters_done[index] = target_craters_done
+                average = sum(craters_done) // len(craters_done)
+            progress(average)
+        return report if progress is not None else None
+
+    def add_target(index):
+        try:
+            return add_target_network(
+                settings, stats, writer, targets[index], seeds[index], plans[seeds[index]],
+                group_name, rim_shader_name, target_progress(index), stop_event)
+        except Exception:
+            stop_event.set()
+            raise
+
+    with stats.stage("targets"):
+        with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+            target_results = list(pool.map(stats.carry_stage(add_target), range(len(targets))))
+    cancelled = any(target_result["cancelled"] for target_result in target_results)
+    if not cancelled and sampled:
+        with stats.stage("plan file"):
+            plan_file = save_crater_plan(settings, seed, full_plans[seed], plan_cache, plan_path)
+    manifests = [target_result.pop("manifest") for target_result in target_results]
+    manifest = manifests[0]
+    manifest["other_targets"] = manifests[1:]
+    craters_added = sum(target_result["craters_added"] for target_result in target_results)
+    return {
+        "run_id": journal.run_id if journal is not None else "",
+        "num_craters": settings.quantity * len(targets),
+        "craters_added": craters_added,
+        "round_trips": writer.round_trips,
+        "round_trips_per_crater": writer.round_trips_per_crater(craters_added),
+        "retries": writer.retried,
+        "network_depth": max(target_result["network_depth"] for target_result in target_results),
+        "cancelled": cancelled,
+        "seed": seed,
+        "plan_file": plan_file,
+        "culling": target_results[0]["culling"],
+        "raster": target_results[0]["raster"],
+        "targets": target_results,
+        "project_cache": project_cache().stats(),
+        "manifest": manifest,
+        }
+
+def add_target_network(settings, stats, writer, target, seed, plan, group_name,
+                       rim_shader_name, progress=None, cancel_event=None):
+    '''
+    Adds the crater network of one target of target_stages() and inserts
+    it into the target, unless cancelled.
+
+    Args:
+        settings <obj>: ApplySettings
+        stats <obj>: RpcStats recording the run
+        writer <obj>: RpcBatchWriter
+        target (tuple): Compute terrain tuple and Main input, see get_targets()
+        seed (int): Seed of the target's plan
+        plan (tuple): Crater plan, culling and raster of the target, see cut_plan()
+        group_name (str): Final group node name or empty string
+        rim_shader_name (str): Final rim shader name or empty string
+        progress <func>: Optional callback taking the number of craters done
+        cancel_event <obj>: Optional threading.Event, set to stop after the current crater
+
+    Returns:
+        target_result (dict): Compute terrain path, plan seed, craters added,
+            depth of the crater network, whether it was cancelled, culling,
+            raster and the manifest of the target
+    '''
+    compute_terrain_tuple, main_input = target
+    crater_plan, culling, raster = plan
+    manifest = new_manifest(settings, seed)
+    crater_input = add_network_inputs(
+        settings, stats, writer, manifest, group_name, rim_shader_name,
+        compute_terrain_tuple, main_input, raster)
+    with stats.stage("craters"):
+        crater_paths, crater_diameter, crater_plan, cancelled = make_craters(
+            settings, writer, group_name, rim_shader_name, crater_input, progress,
+            cancel_event, seed, crater_plan)
+    if not cancelled:
+        finish_network(
+            settings, stats, writer, manifest, crater_plan, crater_paths, crater_diameter,
+            compute_terrain_tuple)
+    return {
+        "compute_terrain": compute_terrain_tuple[0],
+        "seed": seed,
+        "craters_added": len(crater_paths),
+        "network_depth": crater_network_depth(len(crater_paths), get_chain_length(settings)),
+        "cancelled": cancelled,
+        "culling": culling,
+        "raster": raster,
+        "manifest": manifest,
+        }
+
+def cut_plan(settings, stats, crater_plan, camera=None):
+    '''
+    Culls the craters the camera would barely see and rasterizes those
+    below the raster threshold, as the settings ask.
+
+    Args:
+        settings <obj>: ApplySettings
+        stats <obj>: RpcStats recording the run
+        crater_plan (ndarray): Whole plan, None when neither is asked for
+        camera <obj>: CameraView to cull by, see read_camera(), None if not culling
+
+    Returns:
+        crater_plan (ndarray): Plan of the Crater shaders to add
+        culling (dict): See cull_craters(), None if not culled
+        raster (dict): See write_raster(), None if not rasterized
+    '''
+    culling = raster = None
+    if camera is not None:
+        with stats.stage("culling"):
+            crater_plan, culling = cull_craters(crater_plan, camera, settings.cull_pixels)
+    if settings.raster_below is not None:
+        with stats.stage("raster"):
+            crater_plan, raster_plan = split_plan(crater_plan, settings.raster_below)
+            raster = write_raster(
+                raster_plan, settings.x_range, settings.z_range, settings.raster_size)
+    return crater_plan, culling, raster
+
+def add_network_inputs(settings, stats, writer, manifest, group_name, rim_shader_name,
+                       compute_terrain_tuple, main_input, raster):
+    '''
+    Adds the mountain or valley and the Image map shader of the
+    rasterized craters ahead of the craters, and records them and the
+    group and rim shader in the manifest.
+
+    Args:
+        settings <obj>: ApplySettings
+        stats <obj>: RpcStats recording the run
+        writer <obj>: RpcBatchWriter
+        manifest (dict): See crater_engine.manifest.new_manifest()
+        group_name (str): Final group node name or empty string
+        rim_shader_name (str): Final rim shader name or empty string
+        compute_terrain_tuple (tuple): Compute terrain path, input_node assignment
+        main_input (str): Path of node to assign to the first new node's Main input
+        raster (dict): Tile of the rasterized craters, see cut_plan(), or None
+
+    Returns:
+        crater_input (str): Main input of the first crater
+    '''
+    with stats.stage("mountain/valley"):
+        crater_input = add_mountain_or_valley(settings, main_input)
+    record_nodes(
+        manifest, settings, group_name, rim_shader_name, compute_terrain_tuple, main_input,
+        crater_input)
+    if raster is not None:
+        with stats.stage("raster"):
+            crater_input = add_raster_shader(settings, writer, raster["file"], crater_input)
+        manifest["main_input"] = crater_input
+        manifest["nodes"]["raster"] = crater_input
+        manifest["node_params"][crater_input] = {"image_filename": raster["file"]}
+    return crater_input
+
+def resume_stages(settings, stats, checkpoint, crater_plan, progress=None, cancel_event=None):
+    '''
+    Adds the craters a checkpointed run didn't commit and finishes the
+    network the way apply_stages() does.
+
+    Args:
+        settings <obj>: ApplySettings of the run
+        stats <obj>: RpcStats recording the run
+        checkpoint <obj>: Checkpoint read by load_checkpoint()
+        crater_plan (ndarray): Plan of all Crater shaders of the run
+        progress <func>: Optional callback taking the number of craters done
+        cancel_event <obj>: Optional threading.Event, set to stop after the current crater
+
+    Returns:
+        apply_result (dict): See resume_apply(), without the report
+    '''
+    manifest = checkpoint.header["manifest"]
+    group_name = manifest["nodes"]["group"]
+    rim_shader_name = manifest["nodes"]["rim_shader"]
+    committed_paths = list(checkpoint.crater_paths)
+    num_committed = len(committed_paths)
+    with stats.stage("project cache"):
+        project_cache().validate()
+    writer = RpcBatchWriter(retries=settings.rpc_retries)
+    with stats.stage("checkpoint"):
+        # the craters are chained to the last committed one, which must still be there
+        last_path = committed_paths[-1] if committed_paths else manifest["main_input"]
+        if last_path and writer.call("node_by_path", [last_path]) in ("0", "", None):
+            raise CheckpointError(
+                f"Can't resume, {last_path} is no longer in the project. Undo the" \
+                    " interrupted run and Apply again.")
+        delete_strays(writer, checkpoint)
+    progress_after = None
+    if progress is not None:
+        progress_after = lambda craters_done: progress(num_committed + craters_done)
+    with stats.stage("craters"):
+        crater_paths, crater_diameter, _, cancelled = make_craters(
+            settings,
+            writer,
+            group_name,
+            rim_shader_name,
+            committed_paths[-1] if committed_paths else manifest["main_input"],
+            progress_after,
+            cancel_event,
+            crater_plan=crater_plan[num_committed:],
+            first_index=num_committed,
+            commit=checkpoint.commit
+            )
+    crater_paths = committed_paths + crater_paths
+    if crater_paths and len(crater_paths) == num_committed:
+        crater_diameter = float(crater_plan["diameter"][num_committed - 1])
+    chain_length = get_chain_length(settings)
+    if not cancelled:
+        finish_network(
+            settings, stats, writer, manifest, crater_plan, crater_paths, crater_diameter,
+            tuple(manifest["compute_terrain"]))
+    apply_result = dict(checkpoint.header["apply_result"])
+    apply_result.update({
+        "run_id": checkpoint.header["run_id"],
+        "num_craters": settings.quantity,
+        "craters_added": len(crater_paths),
+        "resumed_from": num_committed,
+        "round_trips": writer.round_trips,
+        "round_trips_per_crater": writer.round_trips_per_crater(
+            len(crater_paths) - num_committed),
+        "retries": writer.retried,
+        "network_depth": crater_network_depth(len(crater_paths), chain_length),
+        "cancelled": cancelled,
+        "seed": manifest["seed"],
+        "project_cache": project_cache().stats(),
+        "manifest": manifest,
+        })
+    return apply_result
+
+def finish_network(settings, stats, writer, manifest, crater_plan, crater_paths,
+                   crater_diameter, compute_terrain_tuple) -> None:
+    '''
+    Records the craters in the manifest, then adds the Merge tree and
+    Fractal warp shader and inserts the crater network into the project.
+
+    Args:
+        settings <obj>: ApplySettings
+        stats <obj>: RpcStats recording the run
+        writer <obj>: RpcBatchWriter
+        manifest (dict): Manifest with the nodes added before the craters
+        crater_plan (ndarray): Plan of the Crater shaders
+        crater_paths [str]: Paths of the Crater shaders added
+        crater_diameter (float): Diameter of the last crater
+        compute_terrain_tuple (tuple): Compute terrain path, input_node assignment
+
+    Returns:
+        None
+    '''
+    crater_input = manifest["main_input"]
+    chain_length = get_chain_length(settings)
+    main_input = crater_input
+    record_craters(
+        manifest, crater_plan, crater_paths, manifest["nodes"]["group"],
+        manifest["nodes"]["rim_shader"], crater_input, chain_length)
+    if crater_paths and chain_length:
+        with stats.stage("merge tree"):
+            leaf_paths = chain_ends(crater_paths, chain_length)
+            if settings.rpc_window > 1:
+                main_input, manifest["merge_tree"] = build_merge_tree_pipelined(
+                    writer, leaf_paths, settings.rpc_window)
+            else:
+                main_input, manifest["merge_tree"] = build_merge_tree(writer, leaf_paths)
+    elif crater_paths:
+        main_input = crater_paths[-1]
+    manifest["output"] = main_input
+    with stats.stage("warp"):
+        main_input = add_fractal_warp(settings, crater_diameter, main_input)
+    if settings.append_warp:
+        manifest["nodes"]["warp"] = main_input
+        manifest["node_params"][main_input] = {"scale": param_string(warp_scale(crater_diameter))}
+        manifest["output_links"].append([main_input, "input_node"])
+    with stats.stage("insertion"):
+        link = insert_into_network(settings, compute_terrain_tuple, main_input)
+    if link is not None:
+        if settings.insert_into_flow != "Output > Main input":
+            manifest["nodes"]["merge_shader"] = link[0]
+        if not settings.append_warp:
+            manifest["output_links"].append(list(link))
+
+def record_nodes(manifest, settings, group_name, rim_shader_name, compute_terrain_tuple,
+                 main_input, crater_input) -> None:
+    '''
+    Records the nodes added before the craters in the manifest.
+
+    Args:
+        manifest (dict): See crater_engine.manifest.new_manifest()
+        settings <obj>: ApplySettings
+        group_name (str): Final group node name or empty string
+        rim_shader_name (str): Final rim shader name or empty string
+        compute_terrain_tuple (tuple): Compute terrain path, input_node assignment
+        main_input (str): Main input of the Simple Shape shader
+        crater_input (str): Main input of the first crater
+
+    Returns:
+        None
+    '''
+    manifest["nodes"]["group"] = group_name
+    manifest["nodes"]["rim_shader"] = rim_shader_name
+    manifest["compute_terrain"] = list(compute_terrain_tuple)
+    manifest["main_input"] = crater_input
+    if rim_shader_name:
+        rim_params = rim_shader_params(settings, settings.rim_shader_class)
+        if rim_params:
+            manifest["node_params"][root_node_path(rim_shader_name)] = dict(rim_params)
+    if settings.on_mountain_or_valley:
+        mountain_path = root_node_path(crater_input)
+        manifest["nodes"]["mountain"] = mountain_path
+        manifest["node_params"][mountain_path] = dict(sss_params(settings, main_input))
+
+def record_craters(manifest, crater_plan, crater_paths, group_name, rim_shader_name,
+                   crater_input, chain_length) -> None:
+    '''
+    Records the craters added and the parameter values they were given.
+
+    Args:
+        manifest (dict): See crater_engine.manifest.new_manifest()
+        crater_plan (ndarray): Plan of the craters
+        crater_paths [str]: Paths of the Crater shaders added
+        group_name (str): Final group node name or empty string
+        rim_shader_name (str): Final rim shader name or empty string
+        crater_input (str): Main input of the first crater
+        chain_length (int): Craters per chain, 0 chains all craters together
+
+    Returns:
+        None
+    '''
+    input_nodes = chain_inputs(crater_paths, crater_input, 0, chain_length)
+    rows = crater_plan_rows(crater_plan[:len(crater_paths)])
+    manifest["craters"] = list(crater_paths)
+    manifest["crater_params"] = crater_param_columns([
+        crater_params(row, group_name, rim_shader_name, input_node)
+        for row, input_node in zip(rows, input_nodes)
+        ])
+
+def save_crater_plan(settings, seed, crater_plan, plan_cache=None, plan_path=None):
+    '''
+    Keeps a freshly sampled plan in the plan cache and/or a plan file.
+    The cache is best effort, a plan file that can't be written raises
+    OSError.
+
+    Args:
+        settings <obj>: ApplySettings
+        seed (int): Seed the plan was sampled with
+        crater_plan (ndarray): Structured array of CRATER_PLAN_DTYPE
+        plan_cache <obj>: Optional PlanCache
+        plan_path (str): Optional plan file path
+
+    Returns:
+        plan_file (str): Plan file written, empty if none
+    '''
+    plan_file = ""
+    if plan_cache is not None:
+        try:
+            plan_file = plan_cache.save(plan_key(settings, seed), crater_plan, settings, seed)
+        except OSError:
+            pass
+    if plan_path:
+        save_plan(plan_path, crater_plan, settings, seed)
+        plan_file = plan_path
+    return plan_file
+
+def insert_into_network(settings, compute_terrain_tuple, main_input):
+    '''
+    Connect last node added to project to the Compute terrain node,
+    the first in project unless other targets are set, see get_targets().
+    The Merge tree mode connects via a Merge shader, the same as the
+    Merge shader mode.
+
+    Args:
+        settings <obj>: ApplySettings
+        compute_terrain_tuple (tuple): Compute terrain path, input_node assignment
+        main_input (str): Path of the last node added
+
+    Returns:
+        link (tuple): Path of the node and name of the parameter set to
+            main_input, None if not inserted
+    '''
+    if not compute_terrain_tuple:
+        return None
+    if settings.insert_into_flow == "Output > Main input":
+        set_compute_terrain_node_main_input(compute_terrain_tuple[0], main_input)
+        return compute_terrain_tuple[0], "input_node"
+    if settings.insert_into_flow in ("Merge shader", "Merge tree"):
+        merge_shader_path = add_merge_shader(compute_terrain_tuple, main_input)
+        set_compute_terrain_node_main_input(compute_terrain_tuple[0], merge_shader_path)
+        return root_node_path(merge_shader_path), "shader_A"
+    return None
+
+def add_fractal_warp(settings, crater_diameter, main_input):
+    '''
+    Triggers a Fractal Warp shader to be added after all crater shaders
+    are added. Scale is based on crater diameter.
+
+    Args:
+        settings <obj>: ApplySettings
+        crater_diameter (float): Crater diameter
+        main_input (str): Path of the last node added
+
+    Returns:
+        main_input (str): Path of the Fractal Warp shader, or main_input if none added
+    '''
+    if settings.append_warp:
+        return add_warp_shader(crater_diameter, main_input)
+    return main_input
+
+def make_craters(settings, writer, final_crater_group_name, final_rim_shader_name, main_input,
+                 progress=None, cancel_event=None, seed=None, crater_plan=None, first_index=0,
+                 commit=None):
+    '''
+    Triggers calculation of crater parameters and creation of crater nodes.
+    All crater parameters are sampled up front as one crater plan, unless
+    a ready-made plan is given.
+
+    Args:
+        settings <obj>: ApplySettings
+        writer <obj>: RpcBatchWriter
+        final_crater_group_name (str): Crater name as determined by Terragen
+        final_rim_shader_name (str): Path of shader assigned to rim shader
+        main_input (str): Path of node to assign to the first crater's Main input
+        progress <func>: Optional callback taking the number of craters done
+        cancel_event <obj>: Optional threading.Event, set to stop after the current crater
+        seed (int): Seed the plan is sampled with, fresh entropy if None
+        crater_plan (ndarray): Optional plan to add instead of sampling one
+        first_index (int): Plan index of the first crater, when resuming a run
+        commit <func>: Optional callback taking the paths of committed craters,
+            see crater_engine.checkpoint
+
+    Returns:
+        crater_paths [str]: Paths of the Crater shaders added
+        crater_diameter (float): Diameter of last crater shader
+        crater_plan (ndarray): Plan of the craters, only those written when
+            cancelled with several RPC workers or an RPC window above 1
+        cancelled (bool): True if cancelled before the last crater of the
+            plan, which may have fewer craters than the quantity
+    '''
+    num_craters = settings.quantity
+    workers = settings.rpc_workers
+    chain_length = get_chain_length(settings)
+    # craters of the plan handed to the writer, and whether that was all of them
+    planned = {"craters": 0, "done": False}
+    if settings.rpc_window > 1:
+        if crater_plan is None:
+            chunks = iter_crater_plan(settings, num_craters, seed, settings.plan_workers)
+        else:
+            chunks = plan_chunks(crater_plan)
+        crater_paths, crater_plan = write_craters_pipelined(
+            writer,
+            count_chunks(chunks, planned),
+            final_crater_group_name,
+            final_rim_shader_name,
+            main_input,
+            settings.rpc_window,
+            progress,
+            cancel_event,
+            chain_length,
+            first_index,
+            commit
+            )
+    elif workers > 1:
+        if crater_plan is None:
+            chunks = iter_crater_plan(settings, num_craters, seed, settings.plan_workers)
+        else:
+            chunks = plan_chunks(crater_plan)
+        crater_paths, crater_plan = write_craters_parallel(
+            writer,
+            count_chunks(chunks, planned),
+            final_crater_group_name,
+            final_rim_shader_name,
+            main_input,
+            workers,
+            progress,
+            cancel_event,
+            chain_length,
+            first_index,
+            commit
+            )
+    else:
+        if crater_plan is None:
+            crater_plan = make_crater_plan(settings, num_craters, seed, settings.plan_workers)
+        planned.update(craters=len(crater_plan), done=True)
+        crater_paths = write_craters(
+            writer,
+            crater_plan_rows(crater_plan),
+            final_crater_group_name,
+            final_rim_shader_name,
+            main_input,
+            progress,
+            cancel_event,
+            chain_length,
+            first_index,
+            commit
+            )
+    crater_diameter = 0.0
+    if crater_paths:
+        crater_diameter = float(crater_plan["diameter"][len(crater_paths) - 1])
+    # a cancel after the last crater was written doesn't count
+    cancelled = cancel_event is not None and cancel_event.is_set() \
+        and not (planned["done"] and len(crater_paths) == planned["craters"])
+    return crater_paths, crater_diameter, crater_plan, cancelled
+
+def count_chunks(chunks, planned):
+    '''
+    Hands plan chunks on to a writer, counting them for make_craters().
+
+    Args:
+        chunks <iter>: Crater plan chunks, see iter_crater_plan()
+        planned (dict): Number of "craters" handed on so far, "done" set
+            once the chunks ran out
+
+    Yields:
+        crater_plan (ndarray): Chunk of the plan
+    '''
+    for chunk in chunks:
+        planned["craters"] += len(chunk)
+        yield chunk
+    planned["done"] = True
+
+def get_chain_length(settings):
+    '''
+    Gets the number of craters chained under each leaf of the Merge tree.
+
+    Args:
+        settings <obj>: ApplySettings
+
+    Returns:
+        chain_length (int): Craters per chain, 0 when not in Merge tree mode
+    '''
+    if settings.insert_into_flow != "Merge tree":
+        return 0
+    return settings.merge_fan_in
+
+def add_mountain_or_valley(settings, main_input):
+    '''
+    Triggers functions to add a Simple Shape shader to the project and
+    updates shader path to assign to Main input.
+
+    Args:
+        settings <obj>: ApplySettings
+        main_input (str): Path of node to assign to the Simple Shape's Main input
+
+    Returns:
+        main_input (str): Name of the Simple Shape shader, or main_input if none added
+    '''
+    if settings.on_mountain_or_valley:
+        sss_node_id, sss_node_name = add_simple_shape_shader()
+        calc_sss_params(settings, sss_node_id, main_input)
+        return sss_node_name
+    return main_input
+
+def add_raster_shader(settings, writer, file_path, main_input):
+    '''
+    Adds the Image map shader displacing the terrain by the tile of
+    rasterized craters, ahead of the crater network.
+
+    Args:
+        settings <obj>: ApplySettings
+        writer <obj>: RpcBatchWriter
+        file_path (str): Tile file, see crater_engine.raster
+        main_input (str): Path of node to assign to Main input
+
+    Returns:
+        image_map_path (str): Path of the Image map shader added to the project
+    '''
+    image_map_node = project_cache().create_child('image_map_shader')
+    writer.call_many([
+        ("set_param_from_string", [image_map_node.id, name, value])
+        for name, value in raster_shader_params(
+            file_path, settings.x_range, settings.z_range, main_input)
+        ])
+    return project_cache().node_path(image_map_node)
+
+def get_group_name(settings):
+    '''
+    Triggers creation of group node.
+
+    Args:
+        settings <obj>: ApplySettings
+
+    Returns:
+        crater_group_name (str): Final group node name or empty string
+    '''
+    if settings.group:
+        final_crater_group_name = add_group(settings.group_name)
+    else:
+        final_crater_group_name = ""
+    return final_crater_group_name
+
+def get_rim_shader_name(settings):
+    '''
+    Triggers creation of rim shader. Determines type of shader to be
+    assigned to rim shader, calls func to add shader to project.
+
+    Args:
+        settings <obj>: ApplySettings
+
+    Returns:
+        rim_shader_name (str): Final name of shader assigned to rim shader parameter.
+    '''
+    if settings.rim_shader_check:
+        selected_rim_shader = settings.rim_shader_class
+        rim_shader_id, rim_shader_name = add_rim_shader(selected_rim_shader)
+        set_rim_shader_params(settings, rim_shader_id, selected_rim_shader)
+    else:
+        rim_shader_name = ""
+    return rim_shader_name
+
+def add_rim_shader(shader_class):
+    '''
+    Adds a shader to the project to be assigned to the crater's
+    rim shader input.
+
+    Args:
+        shader_class (str): Type of shader to add
+
+    Returns:
+        node_id <obj>: Shader node id
+        node_name (str): Shader's name as determined by Terragen
+    '''
+    node_id = project_cache().create_child(shader_class)
+    node_name = node_id.name()
+    return node_id, node_name
+
+def set_rim_shader_params(settings, rim_shader_id, selected_rim_shader) -> None:
+    '''
+    Sets certain parameters for various Shader types assigned
+    to the crater's Rim shader input.
+
+    Args:
+        settings <obj>: ApplySettings
+        rim_shader_id <obj>: Crater shader node id
+        selected_rim_shader (str): Class of assigned shader
+
+    Returns:
+        None
+    '''
+    for name, value in rim_shader_params(settings, selected_rim_shader):
+        rim_shader_id.set_param(name, value)
+
+def rim_shader_params(settings, selected_rim_shader):
+    '''
+    Calculates the parameters set on the rim shader, which depend on
+    the shader class.
+
+    Args:
+        settings <obj>: ApplySettings
+        selected_rim_shader (str): Class of assigned shader
+
+    Returns:
+        params [tuples]: (name, value string) pairs, empty for most classes
+    '''
+    if selected_rim_shader == "fake_stones_shader":
+        max_diameter = settings.diameter_range[1]
+        stone_scale = get_percentage_of_diameter(max_diameter, 0.01)
+        return [("stone_scale", param_string(stone_scale))]
+    return []
+
+def get_targets(settings, writer):
+    '''
+    Gets the Compute terrain nodes the craters are inserted into, see
+    crater_engine.targets, and whatever new nodes assign to Main input
+    for each. The project is searched once.
+
+    Args:
+        settings <obj>: ApplySettings
+        writer <obj>: RpcBatchWriter
+
+    Returns:
+        targets [tuples]: Compute terrain tuple and Main input of each
+            target, one with an empty tuple when the craters aren't inserted
+
+    Raises:
+        TargetError: A Compute terrain node named in the settings wasn't found
+    '''
+    insert_mode = settings.insert_into_flow
+    if insert_mode == "Don't" or settings.targets == "First":
+        return [get_main_input_node(settings)]
+    targets = select_targets(settings, get_all_compute_terrain_nodes(writer))
+    if not targets:
+        return [((), "")]
+    return [
+        (compute_terrain_tuple,
+         compute_terrain_tuple[1] if insert_mode == "Output > Main input" else "")
+        for compute_terrain_tuple in targets
+        ]
+
+def get_main_input_node(settings):
+    '''
+    Get the first Compute terrain node in the project and whatever is
+    assigned to its Main input.
+
+    Args:
+        settings <obj>: ApplySettings
+
+    Returns:
+        compute_terrain_tuple (tuple): Compute terrain path, input_node assignment
+        main_input (str): Path of node to assign to the first new node's Main input
+    '''
+    compute_terrain_tuple = ()
+    main_input = ""
+    insert_mode = settings.insert_into_flow
+    if insert_mode != "Don't":
+        compute_terrain_tuple = get_compute_terrain_nodes()
+        if compute_terrain_tuple and insert_mode == "Output > Main input":
+            main_input = compute_terrain_tuple[1]
+    return compute_terrain_tuple, main_input
+
+def add_merge_shader(compute_terrain_tuple, main_input):
+    '''
+    Add Merge shader to project, set params, and connect new crater
+    network to existing node network.
+
+    Args:
+        compute_terrain_tuple (tuple): Compute terrain path, input_node assignment
+        main_input (str): Path of node to assign to shader A
+
+    Returns:
+        node_name (str): Name of Merge shader added to project
+    '''
+    compute_terrain_main_input = compute_terrain_tuple[1]
+    node_id = project_cache().create_child('merge_shader')
+    node_id.set_param('input_node',compute_terrain_main_input)
+    node_id.set_param('shader_A',main_input)
+    node_id.set_param('mix_to_A',"1")
+    node_id.set_param('merge_colour',"1")
+    node_id.set_param('colour_merge_mode',"1")
+    node_id.set_param('merge_displacement',"1")
+    node_id.set_param('displace_merge_mode',"1")
+    node_name = node_id.name()
+    return node_name
+
+def add_simple_shape_shader():
+    '''
+    Adds a Simple Shape shader to the project.
+
+    Returns:
+        node_id <obj>: Simple Shape shader's node id
+        node_name (str): Simple Shape shader's name
+    '''
+    node_id = project_cache().create_child('simple_shape_shader')
+    node_name = node_id.name()
+    return node_id, node_name
+
+def calc_sss_params(settings, node_id, main_input) -> None:
+    '''
+    Calculates the parameter values for a Simple Shape shader and calls
+    func to update sss node.
+
+    Args:
+        settings <obj>: ApplySettings
+        node_id <obj>: Simple Shape shader's node id
+        main_input (str): Path of node to assign to Main input
+
+    Returns:
+        None
+    '''
+    sss_param_values = [value for _, value in sss_params(settings, main_input)]
+    set_sss_params(node_id, sss_param_values)
+
+def sss_params(settings, main_input):
+    '''
+    Calculates the parameter values for a Simple Shape shader.
+
+    Args:
+        settings <obj>: ApplySettings
+        main_input (str): Path of node to assign to Main input
+
+    Returns:
+        params [tuples]: (name, value string) pairs in SSS_PARAMS order
+    '''
+    position = str(settings.x_pos) + " 0.0 " + str(settings.z_pos)
+    shape = "1" # circle / elipse
+    size = mountain_valley_size(settings)
+    displacement_amp = str(settings.amplitude)
+    displacement_edge_profile = "1" # smooth step
+    displacement_edge_width = "100" # max smoothing
+    displacement_edge_units = "1" # percent ?
+    apply_displacement = "1"
+    sss_param_values = [
+        position,
+        shape,
+        size,
+        displacement_amp,
+        displacement_edge_profile,
+        displacement_edge_width,
+        displacement_edge_units,
+        main_input,
+        apply_displacement
+        ]
+    return list(zip(SSS_PARAMS, sss_param_values))
+
+def set_sss_params(node_id, sss_param_values) -> None:
+    '''
+    Sets a Simple Shape shader's parameters in the project.
+
+    Args:
+        node_id <obj>: Simple Shape shader's node id.
+        sss_params [list]: Parameter values as strings.
+
+    Returns:
+        None
+    '''
+    for index, value in enumerate(SSS_PARAMS):
+        node_id.set_param(value, sss_param_values[index])
+
+def mountain_valley_size(settings):
+    '''
+    Calculates the size needed for the Simple Shape shader
+    acting as the mountain or valley node.
+
+    Args:
+        settings <obj>: ApplySettings
+
+    Returns:
+        size_str (str): XY size values
+    '''
+    max_area = max(settings.x_area, settings.y_area)
+    size = max_area + settings.diameter_range[1]
+    size_str = f"{size} {size}"
+    return size_str
+
+def add_group(group_name):
+    '''
+    Adds a group node to the project.
+
+    Args:
+        group_name (str): Name suggested for group by user.
+
+    Returns:
+        crater_name (str): Final name as determined by Terragen.
+    '''
+    crater_group_id = project_cache().create_child('group')
+    crater_group_id.set_param('name', group_name)
+    crater_name = crater_group_id.get_param('name')
+    return crater_name
+
+def add_warp_shader(crater_diameter, main_input):
+    '''
+    Adds a warp shader to the project. Sets its parameters based on the crater diameter.
+
+    Args:
+        crater_diameter (float): Diameter of last crater added
+        main_input (str): Path of node to assign to Main input
+
+    Returns:
+        fractal_warp_path (str): Path of Warp shader added to project.
+    '''
+    fractal_warp_node = project_cache().create_child('fractal_warp_shader')
+    fractal_warp_node.set_param('input_node', main_input)
+    scale = warp_scale(crater_diameter)
+    fractal_warp_node.set_param('scale',scale)
+    fractal_warp_path = fractal_warp_node.path()
+    return fractal_warp_path
+
+def warp_scale(crater_diameter):
+    '''
+    Scale of the Fractal Warp shader, based on the crater diameter.
+
+    Args:
+        crater_diameter (float): Diameter of last crater added
+
+    Returns:
+        scale (float): Warp scale
+    '''
+    return crater_diameter * .25
+
+def set_compute_terrain_node_main_input(compute_terrain, main_input) -> None:
+    '''
+    Sets the Main input the Compute terrain node after all craters and
+    shaders are added to the project.
+
+    Args:
+        compute_terrain (str): Compute terrain node path
+        main_input (str): Path of node to assign to Main input
+    '''
+    compute_terrain_node = project_cache().node_by_path(compute_terrain)
+    compute_terrain_node.set_param('input_node',main_input)
+
+def get_compute_terrain_nodes():
+    '''
+    Gets first compute terrain node and returns its id and path of shader assigned to its main input.
+    The node and its path come from the session's project cache, only its main input is read every time.
+
+    Example:
+        ('/Compute Terrain', 'Fractal warp shader 01')
+
+    Return:
+        compute_terrain_tuple (tuple): Compute terrain path, input_node assingment
+    '''
+    compute_terrain_tuple = ()
+    cache = project_cache()
+    compute_terrain_node_ids = cache.children_filtered_by_class('compute_terrain')
+    if compute_terrain_node_ids:
+        for node in compute_terrain_node_ids:
+            node_path = cache.node_path(node)
+            node_input = node.get_param('input_node')
+            compute_terrain_tuple = (node_path, node_input)
+            break # quit after first
+    return compute_terrain_tuple
+
+def get_all_compute_terrain_nodes(writer):
+    '''
+    Gets all compute terrain nodes in project at root level and
+    returns their node path and main input parameter assignment.
+    The nodes come from the session's project cache, their paths and
+    main inputs are read in one round-trip.
+
+    Example:
+        [('/Compute Terrain', 'Fractal warp shader 01'), ('/Compute terrain 01', 'Heightfield 01')]
+
+    Args:
+        writer <obj>: RpcBatchWriter
+
+    Return:
+        compute_terrain_list [tuples]: Compute terrain path, input_node assingment
+    '''
+    cache = project_cache()
+    compute_terrain_node_ids = cache.children_filtered_by_class('compute_terrain')
+    values = writer.call_many(
+        [(PATH_METHOD, [node.id]) for node in compute_terrain_node_ids]
+        + [("get_param_as_string", [node.id, "input_node"]) for node in compute_terrain_node_ids])
+    node_paths = values[:len(compute_terrain_node_ids)]
+    node_inputs = values[len(compute_terrain_node_ids):]
+    for node, node_path in zip(compute_terrain_node_ids, node_paths):
+        cache.add_node(node_path, node.id)
+    return list(zip(node_paths, node_inputs))
+
+def get_percentage_of_diameter(diameter_value, percent):
+    '''
+    Calculates a rounded off portion of a percent of the
+    value passed to it.  Typically a diameter and a percentage.
+
+    Args:
+        diameter_value (float): Typically a diameter value
+        percent (float): Percentage of diameter_value needed
+
+    Returns:
+        rounded_percentage_of_diameter (float): A percentge of the diameter_value
+    '''
+    percent_of_diameter = diameter_value * percent
+    rounded_percent_of_diameter = round(percent_of_diameter, 2)
+    return rounded_percent_of_diameter
@@ -0,0 +1,144 @@
+'''
+placement.py - Non-overlapping crater placement for tg_splatter_craters.
+Crater centers are placed by dart throwing, largest craters first, so
+that no two craters are closer than the spacing factor times their mean
+diameter. Placed craters are kept in a uniform grid, so each candidate
+is only tested against craters in nearby cells and placing N craters
+takes roughly linear time. Craters with no free spot are dropped.
+With a density map, the other spots tried are drawn from it as well.
+'''
+
+import math
+import numpy as np
+from crater_engine.density import load_density_map
+
+DEFAULT_ATTEMPTS = 16
+
+class SpacedPlacement:
+    '''
+    Places crater centers inside the X/Z area, keeping craters apart.
+    Keeps the craters placed so far, so a plan can be placed chunk by chunk.
+    '''
+    def __init__(self, x_range, z_range, spacing, max_diameter, attempts=DEFAULT_ATTEMPTS,
+                 density_map=None):
+        self.x_range = x_range
+        self.z_range = z_range
+        self.density_map = density_map
+        self.spacing = spacing
+        self.max_diameter = abs(max_diameter)
+        self.attempts = max(int(attempts), 1)
+        self.cell_size = max(spacing * self.max_diameter * 0.5, 1e-6)
+        self.grid = {}
+
+    def place(self, crater_plan, rng):
+        '''
+        Moves each crater of a plan chunk to a spot clear of the craters
+        placed so far, trying its sampled center first.
+
+        Args:
+            crater_plan (ndarray): Plan chunk of CRATER_PLAN_DTYPE
+            rng <obj>: numpy.random.Generator
+
+        Returns:
+            crater_plan (ndarray): The craters that could be placed, in plan order
+        '''
+        num_craters = len(crater_plan)
+        extra = (num_craters, self.attempts - 1)
+        if self.density_map is not None:
+            candidates_x, candidates_z = self.density_map.sample(
+                rng, num_craters * extra[1], self.x_range, self.z_range)
+            candidates_x = candidates_x.reshape(extra).tolist()
+            candidates_z = candidates_z.reshape(extra).tolist()
+        else:
+            x_min, x_max = self.x_range
+            z_min, z_max = self.z_range
+            candidates_x = np.round(rng.uniform(x_min, x_max, extra), 2).tolist()
+            candidates_z = np.round(rng.uniform(z_min, z_max, extra), 2).tolist()
+        centers = crater_plan["center"].copy()
+        diameters = crater_plan["diameter"].tolist()
+        placed = np.zeros(num_craters, dtype=bool)
+
+        for index in np.argsort(-crater_plan["diameter"], kind="stable").tolist():
+            diameter = diameters[index]
+            spots = zip(
+                [centers[index, 0]] + candidates_x[index],
+                [centers[index, 2]] + candidates_z[index]
+                )
+            for x_coord, z_coord in spots:
+                if self.is_clear(x_coord, z_coord, diameter):
+                    self.add(x_coord, z_coord, diameter)
+                    centers[index, 0] = x_coord
+                    centers[index, 2] = z_coord
+                    placed[index] = True
+                    break
+
+        crater_plan = crater_plan[placed]
+        crater_plan["center"] = centers[placed]
+        return crater_plan
+
+    def is_clear(self, x_coord, z_coord, diameter):
+        '''
+        Checks that a crater does not come too close to any crater placed so far.
+
+        Args:
+            x_coord (float): Crater center x
+            z_coord (float): Crater center z
+            diameter (float): Crater diameter
+
+        Returns:
+            clear (bool): True if the crater can be placed here
+        '''
+        reach = self.spacing * (diameter + self.max_diameter) * 0.5
+        cell_x, cell_z = self.cell(x_coord, z_coord)
+        cells = math.ceil(reach / self.cell_size)
+        for grid_x in range(cell_x - cells, cell_x + cells + 1):
+            for grid_z in range(cell_z - cells, cell_z + cells + 1):
+                for other_x, other_z, other_diameter in self.grid.get((grid_x, grid_z), ()):
+                    min_distance = self.spacing * (diameter + other_diameter) * 0.5
+                    delta_x = x_coord - other_x
+                    delta_z = z_coord - other_z
+                    if delta_x * delta_x + delta_z * delta_z < min_distance * min_distance:
+                        return False
+        return True
+
+    def add(self, x_coord, z_coord, diameter):
+        '''
+        Adds a placed crater to the grid.
+
+        Args:
+            x_coord (float): Crater center x
+            z_coord (float): Crater center z
+            diameter (float): Crater diameter
+        '''
+        self.grid.setdefault(self.cell(x_coord, z_coord), []).append(
+            (x_coord, z_coord, diameter))
+
+    def cell(self, x_coord, z_coord):
+        '''
+        Grid cell of a position.
+
+        Args:
+            x_coord (float): Position x
+            z_coord (float): Position z
+
+        Returns:
+            cell (tuple): Integer grid coordinates
+        '''
+        return math.floor(x_coord / self.cell_size), math.floor(z_coord / self.cell_size)
+
+def make_placement(settings):
+    '''
+    Creates the placement engine selected in the settings.
+
+    Args:
+        settings <obj>: ApplySettings
+
+    Returns:
+        placement <obj>: SpacedPlacement, or None to keep the uniform centers
+    '''
+    if settings.placement != "Spaced":
+        return None
+    density_map = load_density_map(settings.density_map) if settings.density_map else None
+    return SpacedPlacement(
+        settings.x_range, settings.z_range, settings.spacing, max(settings.diameter_range),
+        density_map=density_map)
@@ -0,0 +1,296 @@
+'''
+plan.py - Vectorized crater plan generation for tg_splatter_craters.
+Every crater's parameter values are sampled in one pass with NumPy and
+returned as a structured array with one row per crater, instead of
+calling the random helpers once per crater and per parameter. Each chunk
+of the plan draws from its own random stream spawned from the seed, so
+chunks can be sampled in any order or in several processes, see
+crater_engine.plan_pool, and give the same plan. Within a chunk, each
+column has a stream of its own.
+'''
+
+import secrets
+import numpy as np
+from crater_engine.density import load_density_map
+from crater_engine.placement import make_placement
+
+CRATER_PLAN_DTYPE = np.dtype([
+    ("center", np.float64, (3,)),
+    ("diameter", np.float64),
+    ("depth", np.float64),
+    ("rim_height", np.float64),
+    ("rim_skirt", np.float64),
+    ("rim_softness", np.float64),
+    ("rim_tightness", np.float64),
+    ])
+
+# Crater shader parameter names, in plan column order.
+CRATER_PLAN_COLUMNS = CRATER_PLAN_DTYPE.names
+
+# Columns drawn from their own random stream, in stream order. With a
+# density map, the center is drawn from the center_x stream.
+SAMPLED_COLUMNS = (
+    "center_x", "center_z", "diameter", "depth", "rim_height", "rim_skirt",
+    "rim_softness", "rim_tightness",
+    )
+
+# Number of craters sampled per vectorized pass
+PLAN_CHUNK_SIZE = 4096
+
+# Version of how a seed maps to craters, part of the plan cache key
+SAMPLING_VERSION = 3
+
+# Smaller plans are sampled in this process, starting a process pool
+# takes longer than sampling them
+PARALLEL_MIN_CRATERS = 1 << 18
+
+def make_crater_plan(settings, num_craters, seed=None, workers=1):
+    '''
+    Samples the parameter values of every crater in vectorized passes of
+    PLAN_CHUNK_SIZE craters.
+
+    Args:
+        settings <obj>: ApplySettings
+        num_craters (int): Number of craters to plan
+        seed (int): Optional seed, fresh entropy is used if None
+        workers (int): Processes sampling chunks, the plan is the same for any number
+
+    Returns:
+        crater_plan (ndarray): Structured array of CRATER_PLAN_DTYPE
+    '''
+    chunks = list(iter_crater_plan(settings, num_craters, seed, workers))
+    if not chunks:
+        return np.zeros(0, dtype=CRATER_PLAN_DTYPE)
+    return np.concatenate(chunks)
+
+def iter_crater_plan(settings, num_craters, seed=None, workers=1):
+    '''
+    Yields the crater plan in chunks of PLAN_CHUNK_SIZE craters, so that
+    sampling can overlap with sending earlier chunks to Terragen. The
+    chunks joined together are identical to make_crater_plan() for the
+    same seed. With spaced placement, craters that cannot be placed are
+    left out of their chunk; placement runs chunk by chunk in this
+    process, as it depends on the craters placed before.
+
+    Args:
+        settings <obj>: ApplySettings
+        num_craters (int): Number of craters to plan
+        seed (int): Optional seed, fresh entropy is used if None
+        workers (int): Processes sampling chunks, see crater_engine.plan_pool
+
+    Yields:
+        crater_plan (ndarray): Structured array of CRATER_PLAN_DTYPE
+    '''
+    num_craters = max(int(num_craters), 0)
+    streams = chunk_streams(seed, -(-num_craters // PLAN_CHUNK_SIZE))
+    placement = make_placement(settings)
+    if workers > 1 and len(streams) > 1 and num_craters >= PARALLEL_MIN_CRATERS:
+        # imported here, the process pool isn't needed for most plans
+        from crater_engine.plan_pool import sample_chunks_parallel
+        chunks = sample_chunks_parallel(settings, num_craters, streams, workers)
+    else:
+        chunks = (
+            sample_crater_plan(
+                settings, min(PLAN_CHUNK_SIZE, num_craters - index * PLAN_CHUNK_SIZE),
+                sample_stream)
+            for index, (sample_stream, _) in enumerate(streams)
+            )
+    for chunk, (_, place_stream) in zip(chunks, streams):
+        if placement is not None:
+            chunk = placement.place(chunk, np.random.default_rng(place_stream))
+        yield chunk
+
+def chunk_streams(seed, num_chunks):
+    '''
+    Spawns the independent random streams of the plan chunks from a seed.
+    Chunk i always gets the same streams, however many chunks there are.
+
+    Args:
+        seed (int): Seed, fresh entropy is used if None
+        num_chunks (int): Number of chunks
+
+    Returns:
+        streams [tuples]: numpy.random.SeedSequence for sampling and for
+            placing each chunk
+    '''
+    chunk_sequences = np.random.SeedSequence(seed).spawn(num_chunks)
+    return [tuple(sequence.spawn(2)) for sequence in chunk_sequences]
+
+def new_seed():
+    '''
+    Picks a random seed, short enough to be typed back into the window.
+
+    Returns:
+        seed (int): Seed between 0 and 2**32 - 1
+    '''
+    return secrets.randbelow(2**32)
+
+def plan_chunks(crater_plan):
+    '''
+    Splits a ready-made crater plan into chunks of PLAN_CHUNK_SIZE craters,
+    to be written like the chunks of iter_crater_plan().
+
+    Args:
+        crater_plan (ndarray): Structured array of CRATER_PLAN_DTYPE
+
+    Yields:
+        crater_plan (ndarray): Chunk of the plan
+    '''
+    for start in range(0, len(crater_plan), PLAN_CHUNK_SIZE):
+        yield crater_plan[start:start + PLAN_CHUNK_SIZE]
+
+def sample_crater_plan(settings, num_craters, sample_stream):
+    '''
+    Samples the parameter values of a number of craters in one vectorized
+    pass. Each column draws one value per crater from its own stream,
+    whatever its mode, so changing one setting leaves the other columns
+    as they were and changing the quantity only adds or removes craters.
+
+    Args:
+        settings <obj>: ApplySettings
+        num_craters (int): Number of craters to plan
+        sample_stream <obj>: numpy.random.SeedSequence of the chunk
+
+    Returns:
+        crater_plan (ndarray): Structured array of CRATER_PLAN_DTYPE
+    '''
+    crater_plan = np.zeros(num_craters, dtype=CRATER_PLAN_DTYPE)
+    rngs = dict(zip(
+        SAMPLED_COLUMNS, map(np.random.default_rng, column_streams(sample_stream))))
+
+    if settings.density_map:
+        density_map = load_density_map(settings.density_map)
+        crater_plan["center"][:, 0], crater_plan["center"][:, 2] = density_map.sample(
+            rngs.pop("center_x"), num_craters, settings.x_range, settings.z_range)
+        del rngs["center_z"]
+    quantiles = {name: rng.random(num_craters) for name, rng in rngs.items()}
+    if not settings.density_map:
+        crater_plan["center"][:, 0] = scale_quantiles(quantiles["center_x"], *settings.x_range)
+        crater_plan["center"][:, 2] = scale_quantiles(quantiles["center_z"], *settings.z_range)
+
+    diameter = sample_diameters(quantiles["diameter"], settings)
+    crater_plan["diameter"] = diameter
+    crater_plan["depth"] = percent_or_range_column(
+        quantiles["depth"], diameter, settings.depth)
+    crater_plan["rim_height"] = percent_or_range_column(
+        quantiles["rim_height"], diameter, settings.rim_height)
+    crater_plan["rim_skirt"] = percent_or_range_column(
+        quantiles["rim_skirt"], diameter, settings.rim_skirt, invert_offset=True)
+    crater_plan["rim_softness"] = scale_quantiles(
+        quantiles["rim_softness"], *settings.softness_range)
+    crater_plan["rim_tightness"] = scale_quantiles(
+        quantiles["rim_tightness"], *settings.tightness_range)
+    return crater_plan
+
+def column_streams(sample_stream):
+    '''
+    Gets the random stream of each sampled column of a chunk. Unlike
+    SeedSequence.spawn(), the same chunk stream always gives the same
+    column streams, however often it is called.
+
+    Args:
+        sample_stream <obj>: numpy.random.SeedSequence of the chunk
+
+    Returns:
+        streams [objs]: numpy.random.SeedSequence of each of SAMPLED_COLUMNS
+    '''
+    return [
+        np.random.SeedSequence(
+            sample_stream.entropy, spawn_key=sample_stream.spawn_key + (index,))
+        for index in range(len(SAMPLED_COLUMNS))
+        ]
+
+def crater_plan_rows(crater_plan):
+    '''
+    Converts a crater plan to plain Python values, ready to be sent
+    to Terragen.
+
+    Args:
+        crater_plan (ndarray): Structured array of CRATER_PLAN_DTYPE
+
+    Returns:
+        rows [tuples]: One tuple per crater in CRATER_PLAN_COLUMNS order,
+            with the center as a list of three floats
+    '''
+    centers = crater_plan["center"].tolist()
+    other_columns = [crater_plan[name].tolist() for name in CRATER_PLAN_COLUMNS[1:]]
+    return [(center, *values) for center, *values in zip(centers, *other_columns)]
+
+def percent_or_range_column(quantiles, diameter, column_settings, invert_offset=False):
+    '''
+    Samples a column that is either a percentage of the crater diameter,
+    optionally with a random +/- offset, or a value between min and max.
+
+    Args:
+        quantiles (ndarray): Uniform random values in [0, 1), one per crater
+        diameter (ndarray): Crater diameters
+        column_settings <obj>: PercentSettings
+        invert_offset (bool): Use 1 / percent as offset factor when percent > 1.0
+
+    Returns:
+        values (ndarray): Sampled column values rounded to two decimal places
+    '''
+    if not column_settings.use_percent:
+        return scale_quantiles(quantiles, *column_settings.range)
+    percent = column_settings.percent
+    values = np.round(diameter * percent, 2)
+    if column_settings.offset:
+        if invert_offset and percent > 1.0:
+            percent = 1 / percent
+        offset_delta = values * percent
+        values = np.round(values - offset_delta + quantiles * (2 * offset_delta), 2)
+    return values
+
+def sample_diameters(quantiles, settings):
+    '''
+    Samples crater diameters, either uniformly or from a power-law
+    size-frequency distribution between the min and max diameter.
+
+    Args:
+        quantiles (ndarray): Uniform random values in [0, 1), one per crater
+        settings <obj>: ApplySettings
+
+    Returns:
+        diameters (ndarray): Diameters rounded to two decimal places
+    '''
+    dia_min, dia_max = settings.diameter_range
+    if settings.size_distribution != "Power law":
+        return scale_quantiles(quantiles, dia_min, dia_max)
+    return np.round(power_law_diameters(
+        quantiles, dia_min, dia_max, settings.size_exponent), 2)
+
+def power_law_diameters(quantiles, dia_min, dia_max, exponent):
+    '''
+    Inverse CDF of a cumulative power-law size-frequency distribution,
+    N(>D) proportional to D ** -exponent, truncated to [dia_min, dia_max].
+    Larger exponents give more small craters and fewer large ones.
+
+    Args:
+        quantiles (ndarray): Uniform random values in [0, 1)
+        dia_min (float): Minimum diameter, greater than 0
+        dia_max (float): Maximum diameter, greater than 0
+        exponent (float): Cumulative distribution exponent
+
+    Returns:
+        diameters (ndarray): Diameters, not rounded
+    '''
+    if exponent == 0:
+        # N(>D) constant, density 1/D: log-uniform
+        return dia_min * (dia_max / dia_min) ** quantiles
+    low = dia_min ** -exponent
+    high = dia_max ** -exponent
+    return (low + quantiles * (high - low)) ** (-1.0 / exponent)
+
+def scale_quantiles(quantiles, minimum, maximum):
+    '''
+    Maps uniform random values in [0, 1) to values between the min and max arguments.
+
+    Args:
+        quantiles (ndarray): Uniform random values in [0, 1)
+        minimum (float): minimum value
+        maximum (float): maximum value
+
+    Returns:
+        values (ndarray): Values rounded to two decimal places
+    '''
+    return np.round(minimum + quantiles * (maximum - minimum), 2)
@@ -0,0 +1,237 @@
+'''
+plan_file.py - Crater plan files and plan cache for tg_splatter_craters.
+A plan file holds every crater's parameter values, one compressed column
+per Crater shader parameter, plus the settings and seed they were
+sampled with, so that a crater field can be sent to Terragen again,
+i.e. by a render farm node rebuilding the same project, without
+sampling it again. Recent plans are kept in a size-bounded cache keyed
+by a hash of the settings and seed.
+'''
+
+import hashlib
+import json
+import os
+import time
+import numpy as np
+from crater_engine.density import load_density_map
+from crater_engine.plan import CRATER_PLAN_COLUMNS, CRATER_PLAN_DTYPE, SAMPLING_VERSION
+from crater_engine.settings import ApplySettings
+
+PLAN_FORMAT = 1
+PLAN_SUFFIX = ".npz"
+
+# ApplySettings fields the crater plan depends on, the others only
+# change how the craters are added to the project
+PLAN_SETTINGS = (
+    "quantity",
+    "x_range",
+    "z_range",
+    "diameter_range",
+    "depth",
+    "rim_height",
+    "rim_skirt",
+    "softness_range",
+    "tightness_range",
+    "size_distribution",
+    "size_exponent",
+    "placement",
+    "spacing",
+    )
+
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+class PlanFileError(ValueError):
+    '''
+    Raised when a plan file can't be read or isn't a crater plan.
+    '''
+
+def plan_key(settings, seed):
+    '''
+    Hashes the settings a crater plan depends on and the seed. A density
+    map is hashed by its pixels, so editing the image samples a new plan.
+
+    Args:
+        settings <obj>: ApplySettings
+        seed (int): Seed of the random generator
+
+    Returns:
+        key (str): Hex digest, the same for settings that sample the same plan
+    '''
+    fields = settings.to_dict()
+    keyed = {name: fields[name] for name in PLAN_SETTINGS}
+    if settings.density_map:
+        keyed["density_map"] = load_density_map(settings.density_map).digest
+    text = json.dumps(
+        {"format": PLAN_FORMAT, "sampling": SAMPLING_VERSION, "seed": seed, "settings": keyed},
+        sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+def save_plan(file_path, crater_plan, settings, seed):
+    '''
+    Writes a crater plan file. The file is replaced in one step, so a
+    reader never sees half a plan.
+
+    Args:
+        file_path (str): File to write, usually ending in PLAN_SUFFIX
+        crater_plan (ndarray): Structured array of CRATER_PLAN_DTYPE
+        settings <obj>: ApplySettings the plan was sampled with
+        seed (int): Seed the plan was sampled with
+    '''
+    meta = {
+        "format": PLAN_FORMAT,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seed": seed,
+        "craters": len(crater_plan),
+        "settings": settings.to_dict(),
+        }
+    columns = {name: np.ascontiguousarray(crater_plan[name]) for name in CRATER_PLAN_COLUMNS}
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "wb") as file:
+        np.savez_compressed(file, meta=np.array(json.dumps(meta)), **columns)
+    os.replace(temp_path, file_path)
+
+def load_plan(file_path):
+    '''
+    Reads a crater plan file.
+
+    Args:
+        file_path (str): File written by save_plan()
+
+    Returns:
+        crater_plan (ndarray): Structured array of CRATER_PLAN_DTYPE
+        meta (dict): format, created, seed, craters and settings (see ApplySettings.to_dict())
+
+    Raises:
+        PlanFileError: The file can't be read or isn't a crater plan
+    '''
+    try:
+        with np.load(file_path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("format") != PLAN_FORMAT:
+                raise PlanFileError(f"{file_path} has unknown plan format {meta.get('format')}.")
+            crater_plan = np.zeros(meta["craters"], dtype=CRATER_PLAN_DTYPE)
+            for name in CRATER_PLAN_COLUMNS:
+                crater_plan[name] = data[name]
+    except PlanFileError:
+        raise
+    except (OSError, KeyError, TypeError, ValueError) as e:
+        raise PlanFileError(f"{file_path} is not a crater plan: {e}") from e
+    return crater_plan, meta
+
+def load_replay(file_path):
+    '''
+    Reads a plan file together with the settings to add it with, which
+    are the settings it was saved with.
+
+    Args:
+        file_path (str): File written by save_plan()
+
+    Returns:
+        crater_plan (ndarray): Structured array of CRATER_PLAN_DTYPE
+        settings <obj>: ApplySettings, with the seed the plan was sampled with
+
+    Raises:
+        PlanFileError: The file can't be read or isn't a crater plan
+    '''
+    crater_plan, meta = load_plan(file_path)
+    try:
+        settings = ApplySettings.from_dict({**meta["settings"], "seed": meta["seed"]})
+    except (KeyError, TypeError) as e:
+        raise PlanFileError(f"{file_path} has invalid settings: {e}") from e
+    return crater_plan, settings
+
+def default_cache_folder():
+    '''
+    Gets the folder of the plan cache, in the user's local application
+    data on Windows and ~/.cache elsewhere.
+
+    Returns:
+        folder (str): Plan cache folder, not created yet
+    '''
+    base = os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "tg_splatter_craters", "plans")
+
+class PlanCache:
+    '''
+    Folder of recent plan files named by plan_key(). When the files add
+    up to more than max_bytes, the least recently used are deleted.
+    '''
+    def __init__(self, folder=None, max_bytes=DEFAULT_CACHE_BYTES):
+        self.folder = folder or default_cache_folder()
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        '''
+        Gets the file a plan is cached in.
+
+        Args:
+            key (str): See plan_key()
+
+        Returns:
+            file_path (str): Plan file path, which may not exist
+        '''
+        return os.path.join(self.folder, key + PLAN_SUFFIX)
+
+    def load(self, key):
+        '''
+        Reads a cached plan and marks it as recently used.
+
+        Args:
+            key (str): See plan_key()
+
+        Returns:
+            crater_plan (ndarray): Cached plan, None if not cached or unreadable
+        '''
+        file_path = self.path(key)
+        try:
+            crater_plan, _ = load_plan(file_path)
+            os.utime(file_path)
+        except (PlanFileError, OSError):
+            return None
+        return crater_plan
+
+    def save(self, key, crater_plan, settings, seed):
+        '''
+        Caches a plan, then deletes the least recently used plans over
+        the size limit.
+
+        Args:
+            key (str): See plan_key()
+            crater_plan (ndarray): Structured array of CRATER_PLAN_DTYPE
+            settings <obj>: ApplySettings the plan was sampled with
+            seed (int): Seed the plan was sampled with
+
+        Returns:
+            file_path (str): Plan file written
+        '''
+        os.makedirs(self.folder, exist_ok=True)
+        file_path = self.path(key)
+        save_plan(file_path, crater_plan, settings, seed)
+        self.evict(keep=file_path)
+        return file_path
+
+    def evict(self, keep=""):
+        '''
+        Deletes the least recently used plans until the cache fits in
+        max_bytes.
+
+        Args:
+            keep (str): Plan file never deleted, i.e. the one just written
+        '''
+        entries = []
+        with os.scandir(self.folder) as scan:
+            for entry in scan:
+                if entry.is_file() and entry.name.endswith(PLAN_SUFFIX):
+                    entry_stat = entry.stat()
+                    entries.append((entry_stat.st_mtime, entry_stat.st_size, entry.path))
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, file_path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            if os.path.abspath(file_path) == os.path.abspath(keep):
+                continue
+            try:
+                os.remove(file_path)
+            except OSError:
+                continue
+            total_bytes -= size
@@ -0,0 +1,107 @@
+'''
+plan_pool.py - Multi-process crater plan sampling for tg_splatter_craters.
+Very large plans are sampled chunk by chunk in a pool of worker
+processes. Every chunk draws from its own seed stream, see
+plan.chunk_streams(), so the plan doesn't depend on the number of
+workers or on which worker samples which chunk. Workers write their
+chunks straight into one shared memory block instead of sending them
+back pickled, and chunks are handed on in plan order as soon as they
+and every chunk before them are done. Each task samples a run of
+chunks, so the pool isn't kept busy with tiny tasks.
+'''
+
+import concurrent.futures
+import math
+from multiprocessing import shared_memory
+import numpy as np
+from crater_engine.plan import CRATER_PLAN_DTYPE, PLAN_CHUNK_SIZE, sample_crater_plan
+from crater_engine.settings import ApplySettings
+
+# Tasks per worker process, a few so that workers finishing early pick up more
+TASKS_PER_WORKER = 4
+
+# Set in each worker process by init_worker()
+_worker_state = {}
+
+def init_worker(settings_fields, memory_name, num_craters) -> None:
+    '''
+    Attaches a worker process to the shared plan. Runs once per worker.
+
+    Args:
+        settings_fields (dict): ApplySettings.to_dict() of the plan
+        memory_name (str): Name of the shared memory block holding the plan
+        num_craters (int): Number of craters in the plan
+    '''
+    # pool workers share the resource tracker of the process that created
+    # the block, so attaching doesn't register it twice and unlink() there
+    # still removes it
+    memory = shared_memory.SharedMemory(name=memory_name)
+    _worker_state.update(
+        settings=ApplySettings.from_dict(settings_fields),
+        memory=memory,
+        plan=np.ndarray((num_craters,), dtype=CRATER_PLAN_DTYPE, buffer=memory.buf),
+        )
+
+def sample_chunks(first_index, sample_streams) -> int:
+    '''
+    Samples a run of chunks into the shared plan. Runs in a worker process.
+
+    Args:
+        first_index (int): Number of the first chunk
+        sample_streams [objs]: numpy.random.SeedSequence of each chunk
+
+    Returns:
+        num_chunks (int): Chunks sampled, the chunks themselves are in shared memory
+    '''
+    plan = _worker_state["plan"]
+    for index, sample_stream in enumerate(sample_streams, first_index):
+        start = index * PLAN_CHUNK_SIZE
+        stop = min(start + PLAN_CHUNK_SIZE, len(plan))
+        plan[start:stop] = sample_crater_plan(
+            _worker_state["settings"], stop - start, sample_stream)
+    return len(sample_streams)
+
+def sample_chunks_parallel(settings, num_craters, streams, workers):
+    '''
+    Samples plan chunks in a pool of worker processes.
+
+    Args:
+        settings <obj>: ApplySettings
+        num_craters (int): Number of craters in the plan
+        streams [tuples]: Seed streams of each chunk, see plan.chunk_streams()
+        workers (int): Number of worker processes
+
+    Yields:
+        crater_plan (ndarray): Chunk of CRATER_PLAN_DTYPE, in plan order,
+            before placement
+    '''
+    workers = min(workers, len(streams))
+    sample_streams = [sample_stream for sample_stream, _ in streams]
+    run_length = math.ceil(len(streams) / (workers * TASKS_PER_WORKER))
+    memory = shared_memory.SharedMemory(
+        create=True, size=max(num_craters * CRATER_PLAN_DTYPE.itemsize, 1))
+    plan = np.ndarray((num_craters,), dtype=CRATER_PLAN_DTYPE, buffer=memory.buf)
+    try:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=init_worker,
+                initargs=(settings.to_dict(), memory.name, num_craters)) as pool:
+            futures = [
+                (first_index, pool.submit(
+                    sample_chunks, first_index,
+                    sample_streams[first_index:first_index + run_length]))
+                for first_index in range(0, len(streams), run_length)
+                ]
+            try:
+                for first_index, future in futures:
+                    for index in range(first_index, first_index + future.result()):
+                        start = index * PLAN_CHUNK_SIZE
+                        # a copy, the shared block is gone once the pool is done
+                        yield plan[start:start + PLAN_CHUNK_SIZE].copy()
+            finally:
+                for _, future in futures:
+                    future.cancel()
+    finally:
+        del plan # the block can't be closed while a view of it is alive
+        memory.close()
+        memory.unlink()
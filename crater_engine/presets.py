@@ -0,0 +1,86 @@
+'''
+presets.py - Crater presets of tg_splatter_craters.
+These values are meant to be artistically fun and are not scientifically
+accurate. Shared by the window's Presets menu and the command line.
+'''
+
+# UI value keys set by a preset, in preset tuple order
+PRESET_KEYS = (
+    "dia_min", "dia_max", "depth_min", "depth_max", "depth_percent",
+    "rim_min", "rim_max", "rim_height_percent",
+    "skirt_min", "skirt_max", "rim_skirt_percent",
+    "soft_min", "soft_max", "tight_min", "tight_max",
+    )
+
+# dia min, dia max, depth min, depth max, depth percent
+# rim min, rim max, rim height percent,
+# skirt min, skirt max, rim skirt percent,
+# soft min, soft max, tight min, tight max,
+# size exponent ("" for a uniform size distribution)
+CRATER_PRESETS = {
+    "Very_tiny_craters": (
+        "1", "10", "0.005", "0.25", "0.25",
+        "0.05", "0.2", "0.1",
+        "1", "20", "2",
+        "0.15", "1", "2", "8",
+        "2.0"),
+    "Tiny_craters": (
+        "30", "100", "3", "12", "0.12",
+        "5", "30", "0.1",
+        "50", "150", "10",
+        "0.6", "1", "3", "5",
+        "2.0"),
+    "ALC_young": (
+        "1000", "10000", "100", "1000", "0.2",
+        "100", "200", "0.2",
+        "500", "4000", "0.4",
+        "0.2", "0.4", "10", "16",
+        "2.0"),
+    "Mid_50k-200k": (
+        "50000", "250000", "1000", "2000", "0.02",
+        "100", "1000", "0.01",
+        "1000", "10000", "0.1",
+        "0.01", "0.45", "3", "4",
+        "1.5"),
+    "Basins": (
+        "250000", "500000", "5000", "12000", "0.06",
+        "5000", "25000", "0.1",
+        "100000", "300000", "0.05",
+        "0.12", "0.05", "0.5", "6",
+        ""),
+    "Sci-fi_basins": (
+        "250000", "500000", "5000", "12000", "0.06",
+        "10000", "150000", "0.4",
+        "100000", "300000", "0.05",
+        "0.12", "0.05", "0.5", "6",
+        "")
+}
+
+# Presets menu labels, in menu order
+PRESET_LABELS = {
+    "Very_tiny_craters": "Very tiny craters 1m-10m",
+    "Tiny_craters": "Tiny craters 30m-100m",
+    "ALC_young": "ALC young 1k-10k",
+    "Mid_50k-200k": "Mid 50k-200k",
+    "Basins": "Basins 250k-500k",
+    "Sci-fi_basins": "Sci-Fi Basins 250k-500k",
+    }
+
+def preset_values(preset):
+    '''
+    Gets the UI values set by a preset.
+
+    Args:
+        preset (str): Name of preset and CRATER_PRESETS key
+
+    Returns:
+        values (dict): Raw UI values keyed by variable name, without "_var"
+    '''
+    param_values = CRATER_PRESETS[preset]
+    values = dict(zip(PRESET_KEYS, param_values))
+    if param_values[15]:
+        values["size_distribution"] = "Power law"
+        values["size_exponent"] = param_values[15]
+    else:
+        values["size_distribution"] = "Uniform"
+    return values
@@ -0,0 +1,148 @@
+'''
+preview.py - Heightmap preview for tg_splatter_craters.
+Draws the craters of the current settings as a small top-down shaded
+height image, with NumPy only, so settings can be checked before any
+Terragen RPC call. The image covers the X/Z area, row 0 at the minimum
+Z edge, on top of the Simple Shape shader of the mountain or valley.
+Crater shapes are the approximation used for rasterized craters, see
+crater_engine.raster, and the center of every crater that would become
+a Crater shader is marked.
+'''
+
+import time
+import numpy as np
+from crater_engine.plan import make_crater_plan, new_seed
+from crater_engine.raster import rasterize_craters, tile_shape
+
+PREVIEW_SIZE = 320
+
+# RGB of the crater center marks
+MARK_COLOUR = (230, 70, 40)
+
+# Direction the preview is lit from: x, up, z
+LIGHT_DIRECTION = (-1.0, 1.5, -1.0)
+
+def render_preview(settings, seed=None, size=PREVIEW_SIZE):
+    '''
+    Samples the crater plan of the settings and draws it.
+
+    Args:
+        settings <obj>: ApplySettings
+        seed (int): Optional seed, the settings' seed or a new one if None
+        size (int): Pixels along the longer side of the area
+
+    Returns:
+        preview (dict): PPM image data, its width and height, the seed,
+            number of craters drawn and marked, lowest and highest
+            displacement and seconds taken
+    '''
+    start_time = time.perf_counter()
+    if seed is None:
+        seed = settings.seed if settings.seed is not None else new_seed()
+    crater_plan = make_crater_plan(settings, settings.quantity, seed)
+    heights, pixel_size = preview_heights(settings, crater_plan, size)
+    rgb = shade(heights, pixel_size)
+    node_plan = crater_plan
+    if settings.raster_below is not None:
+        node_plan = crater_plan[np.abs(crater_plan["diameter"]) >= settings.raster_below]
+    mark_centers(rgb, node_plan, settings.x_range, settings.z_range, pixel_size)
+    return {
+        "image": ppm_data(rgb),
+        "width": rgb.shape[1],
+        "height": rgb.shape[0],
+        "seed": seed,
+        "num_craters": len(crater_plan),
+        "num_marked": len(node_plan),
+        "height_range": (float(heights.min()), float(heights.max())),
+        "elapsed": time.perf_counter() - start_time,
+        }
+
+def preview_heights(settings, crater_plan, size=PREVIEW_SIZE):
+    '''
+    Adds up the displacement of the mountain or valley and the craters.
+
+    Args:
+        settings <obj>: ApplySettings
+        crater_plan (ndarray): Structured array of CRATER_PLAN_DTYPE
+        size (int): Pixels along the longer side of the area
+
+    Returns:
+        heights (ndarray): Displacement in metres, rows along z
+        pixel_size (float): Pixel width in metres
+    '''
+    heights, pixel_size = rasterize_craters(crater_plan, settings.x_range, settings.z_range, size)
+    if settings.on_mountain_or_valley:
+        heights += mountain_heights(settings, size)
+    return heights, pixel_size
+
+def mountain_heights(settings, size=PREVIEW_SIZE):
+    '''
+    Approximates the Simple Shape shader added by add_mountain_or_valley():
+    a circle around the area centre, smooth stepped from its edge to the
+    full amplitude in the middle.
+
+    Args:
+        settings <obj>: ApplySettings
+        size (int): Pixels along the longer side of the area
+
+    Returns:
+        heights (ndarray): Displacement in metres, rows along z
+    '''
+    height, width, pixel_size = tile_shape(settings.x_range, settings.z_range, size)
+    x_coords = settings.x_range[0] + (np.arange(width) + 0.5) * pixel_size - settings.x_pos
+    z_coords = settings.z_range[0] + (np.arange(height) + 0.5) * pixel_size - settings.z_pos
+    # same size as pipeline.mountain_valley_size()
+    radius = (max(settings.x_area, settings.y_area) + settings.diameter_range[1]) * 0.5
+    t = np.clip(1.0 - np.hypot(x_coords[None, :], z_coords[:, None]) / radius, 0.0, 1.0)
+    return settings.amplitude * t * t * (3.0 - 2.0 * t)
+
+def shade(heights, pixel_size):
+    '''
+    Shades a heightmap, blending the lighting of its slopes with its height.
+
+    Args:
+        heights (ndarray): Displacement in metres
+        pixel_size (float): Pixel width in metres
+
+    Returns:
+        rgb (ndarray): uint8 image of shape (rows, columns, 3)
+    '''
+    if min(heights.shape) > 1:
+        slope_z, slope_x = np.gradient(heights, pixel_size)
+    else:
+        slope_z = slope_x = np.zeros_like(heights)
+    light = np.asarray(LIGHT_DIRECTION) / np.linalg.norm(LIGHT_DIRECTION)
+    lighting = (-slope_x * light[0] + light[1] - slope_z * light[2]) \
+        / np.sqrt(slope_x * slope_x + 1.0 + slope_z * slope_z)
+    low, high = float(heights.min()), float(heights.max())
+    level = (heights - low) / (high - low) if high > low else np.full_like(heights, 0.5)
+    gray = np.clip(0.2 + 0.55 * np.clip(lighting, 0.0, 1.0) + 0.25 * level, 0.0, 1.0)
+    return np.repeat((gray * 255.0).astype(np.uint8)[:, :, None], 3, axis=2)
+
+def mark_centers(rgb, crater_plan, x_range, z_range, pixel_size) -> None:
+    '''
+    Colours the pixel of every crater center.
+
+    Args:
+        rgb (ndarray): Image from shade(), changed in place
+        crater_plan (ndarray): Craters to mark
+        x_range (tuple): Min/max x of the area
+        z_range (tuple): Min/max z of the area
+        pixel_size (float): Pixel width in metres
+    '''
+    columns = np.floor((crater_plan["center"][:, 0] - x_range[0]) / pixel_size).astype(np.int64)
+    rows = np.floor((crater_plan["center"][:, 2] - z_range[0]) / pixel_size).astype(np.int64)
+    rgb[np.clip(rows, 0, rgb.shape[0] - 1), np.clip(columns, 0, rgb.shape[1] - 1)] = MARK_COLOUR
+
+def ppm_data(rgb):
+    '''
+    Encodes an image as binary PPM, which Tk's PhotoImage reads without Pillow.
+
+    Args:
+        rgb (ndarray): uint8 image of shape (rows, columns, 3)
+
+    Returns:
+        data (bytes): PPM file contents
+    '''
+    header = f"P6 {rgb.shape[1]} {rgb.shape[0]} 255\n".encode("ascii")
+    return header + np.ascontiguousarray(rgb, dtype=np.uint8).tobytes()
@@ -0,0 +1,288 @@
+'''
+project_cache.py - Session cache of Terragen project handles for tg_splatter_craters.
+Keeps the project root, node handles by path and class filtered child
+lists of the root between Applies, so repeated Applies in one session
+don't look up the same nodes again. The cache is checked once per Apply
+against the number of nodes at the project root and cleared when it
+changed behind our back, i.e. nodes were added or deleted in Terragen,
+or when an RPC call failed. While a run journals, every node created
+at the root is also added to its RunJournal, see crater_engine.journal.
+'''
+
+import threading
+from contextlib import contextmanager
+import terragen_rpc as tg
+import terragen_rpc.impl as tg_impl
+
+# ProjectCache of each RPC server, keyed by (host, port)
+_project_caches = {}
+_caches_lock = threading.Lock()
+
+def project_cache():
+    '''
+    Gets the cache of the RPC server terragen_rpc currently talks to.
+
+    Returns:
+        cache <obj>: ProjectCache, kept for the whole session
+    '''
+    server = (tg_impl.TCP_IP, tg_impl.TCP_PORT)
+    with _caches_lock:
+        if server not in _project_caches:
+            _project_caches[server] = ProjectCache()
+        return _project_caches[server]
+
+def reset_project_caches():
+    '''
+    Forgets the cached handles of every RPC server, i.e. after a server
+    was restarted on the same port.
+    '''
+    with _caches_lock:
+        _project_caches.clear()
+
+class ProjectCache:
+    '''
+    Node handles of one Terragen project. Nodes created or deleted
+    through the cache are counted, so only changes made by others
+    clear it. Can be shared by several worker threads.
+    '''
+    def __init__(self):
+        self._root = None
+        self._nodes_by_path = {}
+        self._paths_by_id = {}
+        self._children_by_class = {}
+        # number of nodes at the project root, None until validated
+        self._root_count = None
+        self._hits = {"root": 0, "path": 0, "children": 0}
+        self._misses = {"root": 0, "path": 0, "children": 0}
+        self._invalidations = 0
+        self._journal = None
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def journaling(self, journal):
+        '''
+        Adds the nodes created in the with block to a run journal.
+
+        Args:
+            journal <obj>: RunJournal
+        '''
+        self._journal = journal
+        try:
+            yield journal
+        finally:
+            self._journal = None
+
+    def invalidate(self) -> None:
+        '''
+        Forgets every cached handle.
+        '''
+        with self._lock:
+            self._root = None
+            self._nodes_by_path.clear()
+            self._paths_by_id.clear()
+            self._children_by_class.clear()
+            self._root_count = None
+            self._invalidations += 1
+
+    def validate(self) -> None:
+        '''
+        Clears the cache when the number of nodes at the project root
+        is not what it was after the last Apply. Costs one round-trip,
+        call it once at the start of an Apply.
+        '''
+        with self._lock:
+            try:
+                root_count = len(self.root().children())
+            except (tg.ReplyError, tg.ApiError):
+                # the cached root belongs to a project that was closed
+                self.invalidate()
+                root_count = len(self.root().children())
+            if self._root_count is not None and root_count != self._root_count:
+                self.invalidate()
+            self._root_count = root_count
+
+    def root(self):
+        '''
+        Gets the project root node.
+
+        Returns:
+            root <obj>: Project root node id
+        '''
+        with self._lock:
+            if self._root is None:
+                self._misses["root"] += 1
+                self._root = tg.root()
+            else:
+                self._hits["root"] += 1
+            return self._root
+
+    def node_by_path(self, path):
+        '''
+        Gets a node by its path.
+
+        Args:
+            path (str): Node path
+
+        Returns:
+            node <obj>: Node id, None if there is no such node
+        '''
+        with self._lock:
+            node = self._nodes_by_path.get(path)
+            if node is not None:
+                self._hits["path"] += 1
+                return node
+            self._misses["path"] += 1
+        node = tg.node_by_path(path)
+        if node is not None:
+            self.add_node(path, node.id)
+        return node
+
+    def cached_node_ids(self, paths):
+        '''
+        Gets the node ids of the paths that are cached.
+
+        Args:
+            paths [str]: Node paths
+
+        Returns:
+            node_ids (dict): Node path: node id, only for cached paths
+        '''
+        with self._lock:
+            node_ids = {
+                path: self._nodes_by_path[path].id
+                for path in paths if path in self._nodes_by_path
+                }
+            self._hits["path"] += len(node_ids)
+            self._misses["path"] += len(set(paths)) - len(node_ids)
+            return node_ids
+
+    def node_path(self, node):
+        '''
+        Gets the path of a node.
+
+        Args:
+            node <obj>: Node id
+
+        Returns:
+            path (str): Node path
+        '''
+        with self._lock:
+            path = self._paths_by_id.get(node.id)
+            if path is not None:
+                self._hits["path"] += 1
+                return path
+            self._misses["path"] += 1
+        path = node.path()
+        self.add_node(path, node.id)
+        return path
+
+    def children_filtered_by_class(self, class_name):
+        '''
+        Gets the nodes of a class at the project root.
+
+        Args:
+            class_name (str): Node class, i.e. "compute_terrain"
+
+        Returns:
+            nodes [obj]: Node ids
+        '''
+        with self._lock:
+            nodes = self._children_by_class.get(class_name)
+            if nodes is not None:
+                self._hits["children"] += 1
+                return list(nodes)
+            self._misses["children"] += 1
+            nodes = self.root().children_filtered_by_class(class_name)
+            self._children_by_class[class_name] = list(nodes)
+            return nodes
+
+    def create_child(self, class_name):
+        '''
+        Creates a node at the project root.
+
+        Args:
+            class_name (str): Node class, i.e. "merge_shader"
+
+        Returns:
+            node <obj>: Node id of the new node
+        '''
+        node = tg.create_child(self.root(), class_name)
+        self.note_created(class_name, [node.id])
+        return node
+
+    def add_node(self, path, node_id) -> None:
+        '''
+        Caches the path of a node.
+
+        Args:
+            path (str): Node path
+            node_id (str): Node id
+        '''
+        with self._lock:
+            self._nodes_by_path[path] = tg.Node(node_id)
+            self._paths_by_id[node_id] = path
+
+    def note_created(self, class_name, node_ids) -> None:
+        '''
+        Counts nodes created at the project root by this session and
+        journals them.
+
+        Args:
+            class_name (str): Node class
+            node_ids [str]: Node ids of the new nodes
+        '''
+        with self._lock:
+            self._children_by_class.pop(class_name, None)
+            if self._root_count is not None:
+                self._root_count += len(node_ids)
+            journal = self._journal
+        if journal is not None:
+            journal.add(node_ids)
+
+    def note_paths(self, node_ids, node_paths) -> None:
+        '''
+        Caches the paths of nodes just created and adds them to the journal.
+
+        Args:
+            node_ids [str]: Node ids
+            node_paths [str]: Paths of the nodes
+        '''
+        with self._lock:
+            for node_id, node_path in zip(node_ids, node_paths):
+                self.add_node(node_path, node_id)
+            journal = self._journal
+        if journal is not None:
+            journal.add_paths(node_ids, node_paths)
+
+    def note_deleted(self, paths) -> None:
+        '''
+        Forgets nodes deleted from the project root by this session.
+
+        Args:
+            paths [str]: Paths of the deleted nodes
+        '''
+        with self._lock:
+            for path in paths:
+                node = self._nodes_by_path.pop(path, None)
+                if node is not None:
+                    self._paths_by_id.pop(node.id, None)
+            # deleted nodes may be of any class
+            self._children_by_class.clear()
+            if self._root_count is not None:
+                self._root_count -= len(paths)
+
+    def stats(self):
+        '''
+        Gets the hit and miss counters of the session so far.
+
+        Returns:
+            stats (dict): Hits and misses per kind of lookup, cached paths
+                and number of invalidations
+        '''
+        with self._lock:
+            return {
+                "hits": dict(self._hits),
+                "misses": dict(self._misses),
+                "cached_paths": len(self._nodes_by_path),
+                "invalidations": self._invalidations,
+                }
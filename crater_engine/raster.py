@@ -0,0 +1,295 @@
+'''
+raster.py - Hybrid crater rasterization for tg_splatter_craters.
+Craters smaller than a diameter threshold are drawn into one displacement
+heightmap tile with NumPy instead of becoming Crater shaders, and the
+tile is added to the network by a single Image map shader, so thousands
+of tiny craters cost Terragen one node. The tile covers the X/Z area,
+row 0 at the minimum Z edge and column 0 at the minimum X edge, and
+holds displacement in metres as a 32 bit float TIFF.
+
+The crater profile is an approximation of the Crater shader: a bowl
+"depth" deep whose walls steepen with the rim tightness, a rim "rim
+height" high at the crater edge and a skirt falling off over "rim skirt"
+metres outside it, rounded by the rim softness.
+'''
+
+import hashlib
+import os
+import struct
+import numpy as np
+from crater_engine.plan_file import default_cache_folder
+
+DEFAULT_RASTER_SIZE = 2048
+
+# Skirts are cut off this many diameters beyond the rim, so a tiny crater
+# with a wide skirt doesn't cover a large part of the tile
+MAX_SKIRT_DIAMETERS = 2.0
+
+# Pixels evaluated per vectorized pass
+RASTER_CHUNK_PIXELS = 1 << 22
+
+# Image map shader parameters set by raster_shader_params(), in order
+RASTER_SHADER_PARAMS = [
+    "image_filename",
+    "projection_type",
+    "position",
+    "size",
+    "apply_colour",
+    "apply_displacement",
+    "displacement_multiplier",
+    "displacement_offset",
+    "input_node",
+    ]
+
+def default_raster_folder():
+    '''
+    Gets the folder heightmap tiles are written to, next to the plan cache.
+
+    Returns:
+        folder (str): Tile folder, not created yet
+    '''
+    return os.path.join(os.path.dirname(default_cache_folder()), "rasters")
+
+def split_plan(crater_plan, max_diameter):
+    '''
+    Splits a crater plan into the craters kept as nodes and those rasterized.
+
+    Args:
+        crater_plan (ndarray): Structured array of CRATER_PLAN_DTYPE
+        max_diameter (float): Craters with a smaller diameter are rasterized
+
+    Returns:
+        node_plan (ndarray): Craters added as Crater shaders, in plan order
+        raster_plan (ndarray): Craters drawn into the tile, in plan order
+    '''
+    rasterized = np.abs(crater_plan["diameter"]) < max_diameter
+    return crater_plan[~rasterized], crater_plan[rasterized]
+
+def tile_shape(x_range, z_range, raster_size):
+    '''
+    Gets the pixel grid of a tile covering the area with square pixels.
+
+    Args:
+        x_range (tuple): Min/max x of the area
+        z_range (tuple): Min/max z of the area
+        raster_size (int): Pixels along the longer side
+
+    Returns:
+        height (int): Rows, along z
+        width (int): Columns, along x
+        pixel_size (float): Pixel width in metres
+    '''
+    x_size = x_range[1] - x_range[0]
+    z_size = z_range[1] - z_range[0]
+    pixel_size = max(x_size, z_size, 1e-6) / raster_size
+    return (
+        max(int(round(z_size / pixel_size)), 1),
+        max(int(round(x_size / pixel_size)), 1),
+        pixel_size,
+        )
+
+def crater_profile(distances, raster_plan):
+    '''
+    Evaluates the crater profile, see the module docstring.
+
+    Args:
+        distances (ndarray): Distances from the crater centers in metres,
+            one row per crater
+        raster_plan (ndarray): Craters of the rows, CRATER_PLAN_DTYPE
+
+    Returns:
+        heights (ndarray): Displacement in metres, shaped like distances
+    '''
+    radius = (np.abs(raster_plan["diameter"]) * 0.5)[:, None]
+    depth = raster_plan["depth"][:, None]
+    rim_height = raster_plan["rim_height"][:, None]
+    skirt = np.maximum(skirt_widths(raster_plan), 1e-6)[:, None]
+    softness = np.clip(raster_plan["rim_softness"], 0.0, 1.0)[:, None]
+    tightness = np.maximum(raster_plan["rim_tightness"], 0.0)[:, None]
+
+    r = np.minimum(distances / np.maximum(radius, 1e-6), 1.0)
+    bowl = -depth + (depth + rim_height) * r ** (1.0 + tightness)
+    t = np.clip((distances - radius) / skirt, 0.0, 1.0)
+    # softness blends a sharp rim crest into a smooth step
+    falloff = (1.0 - softness) * (1.0 - t) ** 2 + softness * (1.0 - t * t * (3.0 - 2.0 * t))
+    return np.where(distances < radius, bowl, rim_height * falloff)
+
+def skirt_widths(raster_plan):
+    '''
+    Gets the skirt width of each crater, cut off at MAX_SKIRT_DIAMETERS.
+
+    Args:
+        raster_plan (ndarray): Structured array of CRATER_PLAN_DTYPE
+
+    Returns:
+        widths (ndarray): Skirt widths in metres
+    '''
+    diameter = np.abs(raster_plan["diameter"])
+    return np.minimum(np.maximum(raster_plan["rim_skirt"], 0.0), MAX_SKIRT_DIAMETERS * diameter)
+
+def rasterize_craters(raster_plan, x_range, z_range, raster_size=DEFAULT_RASTER_SIZE):
+    '''
+    Draws craters into a heightmap tile. Craters of the same footprint
+    size are drawn together in vectorized passes and overlapping craters
+    add up, like a chain of Crater shaders.
+
+    Args:
+        raster_plan (ndarray): Structured array of CRATER_PLAN_DTYPE
+        x_range (tuple): Min/max x of the area
+        z_range (tuple): Min/max z of the area
+        raster_size (int): Pixels along the longer side of the tile
+
+    Returns:
+        heights (ndarray): float32 displacement in metres, rows along z
+        pixel_size (float): Pixel width in metres
+    '''
+    height, width, pixel_size = tile_shape(x_range, z_range, raster_size)
+    heights = np.zeros(height * width, dtype=np.float64)
+    if not len(raster_plan):
+        return heights.reshape(height, width).astype(np.float32), pixel_size
+    reach = np.abs(raster_plan["diameter"]) * 0.5 + skirt_widths(raster_plan)
+    half_windows = np.ceil(reach / pixel_size).astype(np.int64)
+    # pixel of each crater center, pixel centers at (index + 0.5) * pixel_size
+    center_columns = np.floor((raster_plan["center"][:, 0] - x_range[0]) / pixel_size).astype(np.int64)
+    center_rows = np.floor((raster_plan["center"][:, 2] - z_range[0]) / pixel_size).astype(np.int64)
+
+    for half_window in np.unique(half_windows).tolist():
+        offsets = np.arange(-half_window, half_window + 1)
+        window = len(offsets) * len(offsets)
+        indices = np.flatnonzero(half_windows == half_window)
+        step = max(RASTER_CHUNK_PIXELS // window, 1)
+        for start in range(0, len(indices), step):
+            chunk = indices[start:start + step]
+            rows = center_rows[chunk, None, None] + offsets[None, :, None]
+            columns = center_columns[chunk, None, None] + offsets[None, None, :]
+            rows, columns = np.broadcast_arrays(rows, columns)
+            delta_x = x_range[0] + (columns + 0.5) * pixel_size - raster_plan["center"][chunk, 0, None, None]
+            delta_z = z_range[0] + (rows + 0.5) * pixel_size - raster_plan["center"][chunk, 2, None, None]
+            distances = np.hypot(delta_x, delta_z).reshape(len(chunk), window)
+            values = crater_profile(distances, raster_plan[chunk]).ravel()
+            rows = rows.ravel()
+            columns = columns.ravel()
+            inside = (rows >= 0) & (rows < height) & (columns >= 0) & (columns < width)
+            heights += np.bincount(
+                rows[inside] * width + columns[inside], weights=values[inside],
+                minlength=height * width)
+    return heights.reshape(height, width).astype(np.float32), pixel_size
+
+def raster_file_name(raster_plan, x_range, z_range, raster_size):
+    '''
+    Names a tile by what is drawn into it, so an unchanged tile is reused
+    and a changed one gets a new file Terragen hasn't cached.
+
+    Args:
+        raster_plan (ndarray): Craters drawn into the tile
+        x_range (tuple): Min/max x of the area
+        z_range (tuple): Min/max z of the area
+        raster_size (int): Pixels along the longer side
+
+    Returns:
+        file_name (str): i.e. "3fa9c1....tif"
+    '''
+    digest = hashlib.sha256(repr((tuple(x_range), tuple(z_range), raster_size)).encode("ascii"))
+    digest.update(np.ascontiguousarray(raster_plan).tobytes())
+    return digest.hexdigest()[:32] + ".tif"
+
+def write_float_tiff(file_path, heights) -> None:
+    '''
+    Writes a grayscale 32 bit float TIFF, uncompressed in one strip. The
+    file is replaced in one step.
+
+    Args:
+        file_path (str): File to write
+        heights (ndarray): 2D array of values
+    '''
+    heights = np.ascontiguousarray(heights, dtype="<f4")
+    height, width = heights.shape
+    # tag, type (3 short, 4 long), value; the strip follows the directory
+    tags = [
+        (256, 4, width),        # ImageWidth
+        (257, 4, height),       # ImageLength
+        (258, 3, 32),           # BitsPerSample
+        (259, 3, 1),            # Compression: none
+        (262, 3, 1),            # PhotometricInterpretation: black is zero
+        (273, 4, 0),            # StripOffsets, set below
+        (277, 3, 1),            # SamplesPerPixel
+        (278, 4, height),       # RowsPerStrip
+        (279, 4, heights.nbytes), # StripByteCounts
+        (284, 3, 1),            # PlanarConfiguration: chunky
+        (339, 3, 3),            # SampleFormat: IEEE float
+        ]
+    strip_offset = 8 + 2 + len(tags) * 12 + 4
+    directory = struct.pack("<H", len(tags))
+    for tag, field_type, value in tags:
+        if tag == 273:
+            value = strip_offset
+        packed = struct.pack("<H", value) + b"\0\0" if field_type == 3 else struct.pack("<I", value)
+        directory += struct.pack("<HHI", tag, field_type, 1) + packed
+    directory += struct.pack("<I", 0)
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(b"II*\0" + struct.pack("<I", 8))
+        file.write(directory)
+        file.write(heights.tobytes())
+    os.replace(temp_path, file_path)
+
+def write_raster(raster_plan, x_range, z_range, raster_size=DEFAULT_RASTER_SIZE, folder=None):
+    '''
+    Rasterizes craters into a tile file, unless the same tile was written
+    before.
+
+    Args:
+        raster_plan (ndarray): Craters to draw
+        x_range (tuple): Min/max x of the area
+        z_range (tuple): Min/max z of the area
+        raster_size (int): Pixels along the longer side of the tile
+        folder (str): Optional folder, see default_raster_folder()
+
+    Returns:
+        raster (dict): Tile file, number of craters drawn, tile size and
+            pixel size in metres, and the smallest crater in pixels
+    '''
+    file_path = os.path.join(
+        folder or default_raster_folder(),
+        raster_file_name(raster_plan, x_range, z_range, raster_size))
+    height, width, pixel_size = tile_shape(x_range, z_range, raster_size)
+    if not os.path.isfile(file_path):
+        heights, pixel_size = rasterize_craters(raster_plan, x_range, z_range, raster_size)
+        write_float_tiff(file_path, heights)
+    smallest = float(np.abs(raster_plan["diameter"]).min()) / pixel_size if len(raster_plan) else 0.0
+    return {
+        "file": file_path,
+        "craters_rasterized": len(raster_plan),
+        "tile_size": [width, height],
+        "pixel_size": round(pixel_size, 4),
+        "smallest_pixels": round(smallest, 2),
+        }
+
+def raster_shader_params(file_path, x_range, z_range, main_input):
+    '''
+    Calculates the parameter values of the Image map shader showing a tile.
+
+    Args:
+        file_path (str): Tile file
+        x_range (tuple): Min/max x of the area
+        z_range (tuple): Min/max z of the area
+        main_input (str): Path of node to assign to Main input
+
+    Returns:
+        params [tuples]: (name, value string) pairs in RASTER_SHADER_PARAMS order
+    '''
+    center_x = (x_range[0] + x_range[1]) * 0.5
+    center_z = (z_range[0] + z_range[1]) * 0.5
+    values = [
+        file_path,
+        "0", # plan Y
+        f"{center_x} 0.0 {center_z}",
+        f"{x_range[1] - x_range[0]} {z_range[1] - z_range[0]}",
+        "0",
+        "1",
+        "1", # the tile holds metres
+        "0",
+        main_input,
+        ]
+    return list(zip(RASTER_SHADER_PARAMS, values))
@@ -0,0 +1,350 @@
+'''
+reapply.py - Incremental re-apply for tg_splatter_craters.
+Updates the craters of the last Apply in place instead of adding new
+ones. The new crater plan is compared with the manifest of the last
+Apply and only parameter values that changed are sent. Crater shaders
+are only created or deleted when the number of craters changes, and
+the Merge tree is only rebuilt when its layout changes.
+'''
+
+import time
+import terragen_rpc as tg
+from crater_engine.culling import cull_craters, read_camera
+from crater_engine.instrument import RpcStats, instrument_rpc, write_report
+from crater_engine.journal import RunJournal, amend_run, clean_up_run
+from crater_engine.manifest import ManifestError, load_manifest, save_manifest
+from crater_engine.merge_tree import build_merge_tree, chain_ends, crater_network_depth
+from crater_engine.pipeline import (
+    get_chain_length,
+    record_craters,
+    rim_shader_params,
+    save_crater_plan,
+    sss_params,
+    warp_scale,
+    )
+from crater_engine.plan import crater_plan_rows, make_crater_plan
+from crater_engine.plan_file import plan_key
+from crater_engine.project_cache import project_cache
+from crater_engine.raster import split_plan, write_raster
+from crater_engine.rpc_batch import (
+    RpcBatchWriter,
+    chain_inputs,
+    crater_param_calls,
+    crater_params,
+    create_craters,
+    param_string,
+    )
+
+# Settings that change which nodes are added, and so need a new Apply
+STRUCTURE_SETTINGS = {
+    "group": "Group",
+    "group_name": "Group name",
+    "on_mountain_or_valley": "On mountain or in valley",
+    "rim_shader_check": "Rim shader",
+    "rim_shader_class": "Rim shader type",
+    "insert_into_flow": "Insertion mode",
+    "append_warp": "Append fractal warp shader",
+    }
+
+def run_reapply(settings, manifest_path, progress=None, report_path=None, plan_cache=None,
+                journal_path=None):
+    '''
+    Updates the craters recorded in a manifest to match new settings and
+    writes the updated manifest back. Every Terragen RPC call is timed
+    per stage, like run_apply().
+
+    Args:
+        settings <obj>: ApplySettings, see ApplySettings.from_values()
+        manifest_path (str): Manifest of the last Apply, see crater_engine.manifest
+        progress <func>: Optional callback taking the number of craters done
+        report_path (str): Optional file the JSON timing report is written to
+        plan_cache <obj>: Optional PlanCache to reuse and keep sampled plans in
+        journal_path (str): Optional journal file, the run of the last Apply in
+            it is updated with the nodes created and deleted
+
+    Returns:
+        apply_result (dict): Like run_apply(), plus the number of parameter
+            values set and of craters created and deleted
+
+    Raises:
+        ManifestError: There is no manifest, its nodes are gone, or settings
+            that need a new Apply were changed
+    '''
+    manifest = load_manifest(manifest_path)
+    check_structure(settings, manifest)
+    stats = RpcStats()
+    journal = RunJournal(manifest.get("run_id"))
+    old_paths = set(manifest["craters"] + manifest["merge_tree"])
+    try:
+        with instrument_rpc(stats):
+            try:
+                with project_cache().journaling(journal):
+                    apply_result, manifest = reapply_stages(
+                        settings, manifest, stats, progress, plan_cache)
+            except Exception:
+                with stats.stage("clean up"):
+                    clean_up_run(journal)
+                raise
+        save_manifest(manifest_path, manifest)
+        if journal_path:
+            new_paths = set(manifest["craters"] + manifest["merge_tree"])
+            amend_run(journal_path, journal.run_id, journal.paths(), old_paths - new_paths)
+    except (ConnectionError, TimeoutError, tg.Error):
+        project_cache().invalidate()
+        raise
+    finally:
+        if report_path:
+            try:
+                write_report(stats.report(), report_path)
+            except OSError:
+                pass # the report is for diagnosis only, never fail the Apply over it
+    apply_result["report"] = stats.report()
+    return apply_result
+
+def check_structure(settings, manifest) -> None:
+    '''
+    Checks that no setting changing which nodes are added differs from
+    the last Apply, and that the last Apply had a single target.
+
+    Args:
+        settings <obj>: ApplySettings
+        manifest (dict): Manifest of the last Apply
+
+    Raises:
+        ManifestError: Lists the changed settings, or the last Apply had
+            several targets
+    '''
+    if manifest.get("other_targets"):
+        raise ManifestError(
+            "The last Apply inserted craters into several Compute terrain nodes, Re-apply" \
+                " only updates one. Apply again.")
+    new_fields = settings.to_dict()
+    changed = [
+        label for name, label in STRUCTURE_SETTINGS.items()
+        if new_fields[name] != manifest["settings"][name]
+        ]
+    if new_fields["targets"] != manifest["settings"].get("targets", "First"):
+        changed.append("Targets")
+    # the raster threshold may change, turning the raster on or off may not
+    if (new_fields["raster_below"] is None) != (manifest["settings"].get("raster_below") is None):
+        changed.append("Raster below")
+    if changed:
+        raise ManifestError(
+            "These settings changed since the last Apply and need a new Apply: "
+            + ", ".join(changed) + ".")
+
+def reapply_stages(settings, manifest, stats, progress=None, plan_cache=None):
+    '''
+    Runs the stages of a re-apply in order, timing each one.
+
+    Args:
+        settings <obj>: ApplySettings
+        manifest (dict): Manifest of the last Apply
+        stats <obj>: RpcStats recording the run
+        progress <func>: Optional callback taking the number of craters done
+        plan_cache <obj>: Optional PlanCache
+
+    Returns:
+        apply_result (dict): See run_reapply(), without the report
+        manifest (dict): Updated manifest
+    '''
+    seed = settings.seed if settings.seed is not None else manifest["seed"]
+    cache = project_cache()
+    with stats.stage("project cache"):
+        cache.validate()
+    with stats.stage("plan"):
+        crater_plan, plan_file = reapply_plan(settings, seed, plan_cache)
+    writer = RpcBatchWriter()
+    culling = None
+    if settings.cull_pixels is not None:
+        with stats.stage("camera"):
+            camera = read_camera(writer)
+        crater_plan, culling = cull_craters(crater_plan, camera, settings.cull_pixels)
+    raster = None
+    if settings.raster_below is not None:
+        with stats.stage("raster"):
+            crater_plan, raster_plan = split_plan(crater_plan, settings.raster_below)
+            raster = write_raster(
+                raster_plan, settings.x_range, settings.z_range, settings.raster_size)
+    nodes = manifest["nodes"]
+    old_paths = manifest["craters"]
+    old_params = manifest["crater_params"]
+    num_craters = len(crater_plan)
+    num_kept = min(num_craters, len(old_paths))
+    chain_length = get_chain_length(settings)
+    old_chain_length = manifest["settings"]["merge_fan_in"] if chain_length else 0
+    rebuild_tree = bool(chain_length) and (
+        num_craters != len(old_paths) or chain_length != old_chain_length)
+
+    with stats.stage("craters"):
+        new_ids, new_paths = create_craters(writer, num_craters - num_kept) \
+            if num_craters > num_kept else ([], [])
+        crater_paths = old_paths[:num_kept] + new_paths
+        rows = crater_plan_rows(crater_plan)
+        input_nodes = chain_inputs(crater_paths, manifest["main_input"], 0, chain_length)
+        changes = {}
+        for index in range(num_kept):
+            params = crater_params(
+                rows[index], nodes["group"], nodes["rim_shader"], input_nodes[index])
+            changed = [
+                (name, value) for name, value in params
+                if value != old_params.get(name, [""] * len(old_paths))[index]
+                ]
+            if changed:
+                changes[crater_paths[index]] = changed
+        deleted_paths = old_paths[num_kept:]
+        if rebuild_tree:
+            deleted_paths = deleted_paths + manifest["merge_tree"]
+        node_changes = node_param_changes(settings, manifest, crater_plan, raster)
+        node_ids = lookup_nodes(writer, list(changes) + deleted_paths + list(node_changes))
+
+        param_calls = []
+        for path, changed in changes.items():
+            param_calls.extend(
+                ("set_param_from_string", [node_ids[path], name, value])
+                for name, value in changed)
+        for index, crater_id in enumerate(new_ids, num_kept):
+            param_calls.extend(crater_param_calls(
+                crater_id, rows[index], nodes["group"], nodes["rim_shader"],
+                input_nodes[index]))
+        for path, changed in node_changes.items():
+            param_calls.extend(
+                ("set_param_from_string", [node_ids[path], name, value])
+                for name, value in changed)
+        writer.call_many(param_calls)
+        if deleted_paths:
+            writer.call("delete", [[node_ids[path] for path in deleted_paths]])
+            cache.note_deleted(deleted_paths)
+        if progress is not None:
+            progress(num_craters)
+
+    output = manifest["output"]
+    merge_paths = manifest["merge_tree"]
+    if rebuild_tree and crater_paths:
+        with stats.stage("merge tree"):
+            output, merge_paths = build_merge_tree(writer, chain_ends(crater_paths, chain_length))
+    elif not chain_length:
+        output = crater_paths[-1] if crater_paths else manifest["main_input"]
+    if output != manifest["output"]:
+        with stats.stage("insertion"):
+            link_ids = lookup_nodes(writer, [path for path, _ in manifest["output_links"]])
+            writer.call_many([
+                ("set_param_from_string", [link_ids[path], name, output])
+                for path, name in manifest["output_links"]
+                ])
+
+    manifest = dict(manifest)
+    manifest.update({
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seed": seed,
+        "settings": settings.to_dict(),
+        "merge_tree": merge_paths,
+        "output": output,
+        "node_params": {
+            path: {**params, **dict(node_changes.get(path, []))}
+            for path, params in manifest["node_params"].items()
+            },
+        })
+    record_craters(
+        manifest, crater_plan, crater_paths, nodes["group"], nodes["rim_shader"],
+        manifest["main_input"], chain_length)
+    num_params = sum(len(changed) for changed in changes.values()) \
+        + sum(len(changed) for changed in node_changes.values())
+    return {
+        "num_craters": settings.quantity,
+        "craters_added": len(new_paths),
+        "craters_deleted": len(old_paths) - num_kept,
+        "params_set": num_params,
+        "round_trips": writer.round_trips,
+        "round_trips_per_crater": writer.round_trips_per_crater(num_craters),
+        "network_depth": crater_network_depth(num_craters, chain_length),
+        "cancelled": False,
+        "seed": seed,
+        "plan_file": plan_file,
+        "culling": culling,
+        "raster": raster,
+        "project_cache": cache.stats(),
+        }, manifest
+
+def reapply_plan(settings, seed, plan_cache=None):
+    '''
+    Gets the crater plan of the new settings, from the plan cache when
+    it was sampled before.
+
+    Args:
+        settings <obj>: ApplySettings
+        seed (int): Seed of the last Apply, or the seed entered
+        plan_cache <obj>: Optional PlanCache
+
+    Returns:
+        crater_plan (ndarray): Structured array of CRATER_PLAN_DTYPE
+        plan_file (str): Plan file reused or written, empty if none
+    '''
+    if plan_cache is not None:
+        crater_plan = plan_cache.load(plan_key(settings, seed))
+        if crater_plan is not None:
+            return crater_plan, plan_cache.path(plan_key(settings, seed))
+    crater_plan = make_crater_plan(settings, settings.quantity, seed, settings.plan_workers)
+    return crater_plan, save_crater_plan(settings, seed, crater_plan, plan_cache)
+
+def node_param_changes(settings, manifest, crater_plan, raster=None):
+    '''
+    Compares the parameters of the rim shader, Simple Shape shader,
+    raster Image map shader and Fractal Warp shader with the values the
+    new settings give them.
+
+    Args:
+        settings <obj>: ApplySettings
+        manifest (dict): Manifest of the last Apply
+        crater_plan (ndarray): New crater plan, without rasterized craters
+        raster (dict): Tile of the rasterized craters, see write_raster()
+
+    Returns:
+        changes (dict): Node path: (name, value string) pairs that changed
+    '''
+    nodes = manifest["nodes"]
+    changes = {}
+    for path, old_params in manifest["node_params"].items():
+        if path == nodes["mountain"]:
+            params = sss_params(settings, old_params.get("input_node", ""))
+        elif path == nodes.get("raster") and raster is not None:
+            params = [("image_filename", raster["file"])]
+        elif path == nodes["warp"]:
+            diameter = float(crater_plan["diameter"][-1]) if len(crater_plan) else 0.0
+            params = [("scale", param_string(warp_scale(diameter)))]
+        else:
+            params = rim_shader_params(settings, settings.rim_shader_class)
+        changed = [(name, value) for name, value in params if old_params.get(name) != value]
+        if changed:
+            changes[path] = changed
+    return changes
+
+def lookup_nodes(writer, paths):
+    '''
+    Gets the node ids of recorded nodes, from the session's project cache
+    when they were looked up or created before.
+
+    Args:
+        writer <obj>: RpcBatchWriter
+        paths [str]: Node paths
+
+    Returns:
+        node_ids (dict): Node path: node id
+
+    Raises:
+        ManifestError: Some of the nodes are no longer in the project
+    '''
+    cache = project_cache()
+    unique_paths = list(dict.fromkeys(paths))
+    node_ids = cache.cached_node_ids(unique_paths)
+    lookup_paths = [path for path in unique_paths if path not in node_ids]
+    found_ids = writer.call_many([("node_by_path", [path]) for path in lookup_paths])
+    missing = [path for path, node_id in zip(lookup_paths, found_ids) if node_id in ("0", "", None)]
+    if missing:
+        raise ManifestError(
+            f"{len(missing)} nodes of the last Apply are no longer in the project, "
+            f"i.e. {missing[0]}. Click Apply to add new craters instead.")
+    for path, node_id in zip(lookup_paths, found_ids):
+        cache.add_node(path, node_id)
+        node_ids[path] = node_id
+    return node_ids
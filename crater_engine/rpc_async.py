@@ -0,0 +1,531 @@
+'''
+rpc_async.py - Pipelined asyncio Terragen RPC client for tg_splatter_craters.
+terragen_rpc sends one call per connection and waits for its reply
+before the next call is sent, so an Apply is bound by round-trip
+latency rather than by how fast Terragen works. AsyncRpcClient speaks
+the same length-prefixed JSON-RPC protocol over asyncio connections and
+keeps up to a window of requests in flight.
+
+Crater and Merge shaders are still created in plan order, one create
+request at a time, so node names match the blocking path. Path lookups
+and parameter sets, whose order doesn't matter, overlap with each other
+and with the next creates; each crater's Main input is set once the
+path of the crater before it is known.
+'''
+
+import asyncio
+import numpy as np
+import terragen_rpc.impl as tg_impl
+import terragen_rpc.jsonrpc as tg_jsonrpc
+from crater_engine.instrument import round_trip
+from crater_engine.merge_tree import merge_param_calls, next_level
+from crater_engine.plan import CRATER_PLAN_DTYPE, crater_plan_rows
+from crater_engine.project_cache import project_cache
+from crater_engine.rpc_batch import (
+    NOT_REPEATABLE,
+    PATH_METHOD,
+    RETRYABLE_ERRORS,
+    batch_reply_values,
+    batch_request,
+    can_retry,
+    chained_param_calls,
+    craters_per_step,
+    raise_first_error,
+    retry_delay,
+    )
+
+DEFAULT_WINDOW = 8
+
+class AsyncRpcClient:
+    '''
+    Sends Terragen RPC calls with up to window requests in flight. Calls
+    and round-trips are counted on the RpcBatchWriter of the run, and
+    batches are used when it found the server accepts them.
+
+    Args:
+        writer <obj>: RpcBatchWriter of the run
+        window (int): Most requests in flight at once
+    '''
+    def __init__(self, writer, window=DEFAULT_WINDOW):
+        self.writer = writer
+        self.window = max(int(window), 1)
+        self.batch = writer.supports_batch()
+        self.address = (tg_impl.TCP_IP, tg_impl.TCP_PORT)
+        self.timeout = tg_impl.SOCKET_TIMEOUT
+        self._slots = asyncio.Semaphore(self.window)
+
+    async def send(self, message):
+        '''
+        Sends one request on its own connection, as Terragen expects, and
+        reads the reply until the server closes the connection.
+
+        Args:
+            message (str): Request JSON
+
+        Returns:
+            reply_bytes (bytes): Reply JSON
+
+        Raises:
+            ConnectionError: The server can't be reached
+            TimeoutError: The server didn't reply in time
+        '''
+        message_bytes = message.encode()
+        async with self._slots:
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(*self.address), self.timeout)
+            except asyncio.TimeoutError as e:
+                raise TimeoutError(e)
+            try:
+                writer.write(len(message_bytes).to_bytes(4, byteorder="little") + message_bytes)
+                await writer.drain()
+                return await asyncio.wait_for(reader.read(), self.timeout)
+            except asyncio.TimeoutError as e:
+                # asyncio.TimeoutError is only an alias of TimeoutError since Python 3.11
+                raise TimeoutError(e)
+            finally:
+                writer.close()
+
+    async def call(self, method, params):
+        '''
+        Sends a single RPC call.
+
+        Args:
+            method (str): RPC method name
+            params []: RPC method parameters
+
+        Returns:
+            value: Result of the call
+        '''
+        async def send():
+            self.writer.count(1, 1)
+            with round_trip([method]):
+                reply_bytes = await self.send(tg_impl.generate_query_string(method, params))
+                return tg_jsonrpc.Reply(reply_bytes, method, params).value
+        return await self.with_retries([method], send)
+
+    async def call_many(self, calls, ordered=False):
+        '''
+        Sends several RPC calls, as batches when the server supports it,
+        all in flight at once unless they must run in order.
+
+        Args:
+            calls [tuples]: (method, params) pairs
+            ordered (bool): Send each request after the one before has been
+                answered, i.e. for creates that name nodes in order
+
+        Returns:
+            values []: Results of the calls, in order
+        '''
+        values, errors = await self.call_many_results(calls, ordered)
+        raise_first_error(errors)
+        return values
+
+    async def call_many_results(self, calls, ordered=False):
+        '''
+        Sends several RPC calls like call_many(), but returns the error of
+        each call that failed instead of raising it, like
+        RpcBatchWriter.call_many_results(). In order, sending stops at the
+        first request that fails and the calls not sent get its error.
+
+        Args:
+            calls [tuples]: (method, params) pairs
+            ordered (bool): Send each request after the one before has been
+                answered, i.e. for creates that name nodes in order
+
+        Returns:
+            values []: Results of the calls, in order, None where a call failed
+            errors [objs]: Exception of each call that failed, None where it succeeded
+        '''
+        if len(calls) > 1 and self.batch:
+            size = self.writer.batch_size
+            requests = [calls[start:start + size] for start in range(0, len(calls), size)]
+            send = self.send_batch
+        else:
+            requests = [[call] for call in calls]
+            send = self.send_single
+
+        async def results(request):
+            try:
+                return await send(request)
+            except Exception as e:
+                return [None] * len(request), [e] * len(request)
+
+        if not ordered:
+            request_results = await asyncio.gather(*map(results, requests))
+        else:
+            request_results = []
+            for request in requests:
+                request_values, request_errors = await results(request)
+                request_results.append((request_values, request_errors))
+                first_error = next((e for e in request_errors if e is not None), None)
+                if first_error is not None:
+                    num_sent = sum(len(values) for values, _ in request_results)
+                    request_results.append(
+                        ([None] * (len(calls) - num_sent), [first_error] * (len(calls) - num_sent)))
+                    break
+        values = [value for request_values, _ in request_results for value in request_values]
+        errors = [error for _, request_errors in request_results for error in request_errors]
+        return values, errors
+
+    async def send_single(self, calls):
+        '''
+        Sends one call on its own, with the results of send_batch().
+
+        Args:
+            calls [tuples]: The (method, params) pair
+
+        Returns:
+            values []: Result of the call
+            errors [objs]: None, the call raises when it fails
+        '''
+        method, params = calls[0]
+        return [await self.call(method, params)], [None]
+
+    async def send_batch(self, calls):
+        '''
+        Sends calls as one JSON-RPC batch request. A batch of calls that
+        can be sent again is retried as a whole when one of its calls
+        fails in a way rpc_batch.can_retry() allows.
+
+        Args:
+            calls [tuples]: (method, params) pairs
+
+        Returns:
+            values []: Results of the calls, in order, None where a call failed
+            errors [objs]: Exception of each call that failed, None where it succeeded
+        '''
+        methods = [method for method, _ in calls]
+        async def send():
+            self.writer.count(len(calls), 1)
+            with round_trip(methods):
+                reply_bytes = await self.send(batch_request(calls))
+                values, errors = batch_reply_values(reply_bytes, calls)
+                if NOT_REPEATABLE.isdisjoint(methods):
+                    raise_first_error(errors, RETRYABLE_ERRORS)
+            return values, errors
+        return await self.with_retries(methods, send)
+
+    async def with_retries(self, methods, send):
+        '''
+        Sends a request, and sends it again after a growing delay when it
+        fails in a way rpc_batch.can_retry() allows, up to the writer's
+        number of retries.
+
+        Args:
+            methods [str]: RPC methods of the request
+            send <func>: Coroutine function sending the request
+
+        Returns:
+            result: Result of send()
+        '''
+        attempt = 0
+        while True:
+            try:
+                return await send()
+            except RETRYABLE_ERRORS as e:
+                if not can_retry(e, methods, attempt, self.writer.retries):
+                    raise
+            self.writer.count(0, 0, retries=1)
+            await asyncio.sleep(retry_delay(attempt))
+            attempt += 1
+
+    async def create_child(self, parent_id, class_name):
+        '''
+        Creates a node.
+
+        Args:
+            parent_id (str): Node id of the parent
+            class_name (str): Node class, i.e. "crater_shader"
+
+        Returns:
+            node_id (str): Node id of the new node
+        '''
+        return await self.call("create_child", [parent_id, class_name])
+
+    async def set_param(self, node_id, param_name, value_string):
+        '''
+        Sets a parameter from its string value.
+
+        Args:
+            node_id (str): Node id
+            param_name (str): Parameter name
+            value_string (str): Parameter value, see rpc_batch.param_string()
+        '''
+        await self.call("set_param_from_string", [node_id, param_name, value_string])
+
+    async def get_param(self, node_id, param_name):
+        '''
+        Gets a parameter as a string.
+
+        Args:
+            node_id (str): Node id
+            param_name (str): Parameter name
+
+        Returns:
+            value_string (str): Parameter value
+        '''
+        return await self.call("get_param_as_string", [node_id, param_name])
+
+    async def path(self, node_id):
+        '''
+        Gets the path of a node.
+
+        Args:
+            node_id (str): Node id
+
+        Returns:
+            path (str): Node path
+        '''
+        return await self.call(PATH_METHOD, [node_id])
+
+    async def children_filtered_by_class(self, node_id, class_name):
+        '''
+        Gets the children of a node that are of a class.
+
+        Args:
+            node_id (str): Node id of the parent
+            class_name (str): Node class
+
+        Returns:
+            node_ids [str]: Node ids of the children
+        '''
+        return await self.call("children_filtered_by_class", [node_id, class_name])
+
+async def create_nodes_async(client, class_name, num_nodes):
+    '''
+    Creates nodes at the project root, in order, and gets their paths,
+    like rpc_batch.create_nodes().
+
+    Args:
+        client <obj>: AsyncRpcClient
+        class_name (str): Node class, i.e. "merge_shader"
+        num_nodes (int): Number of nodes to create
+
+    Returns:
+        node_ids [str]: Node ids of the new nodes
+        node_paths [str]: Paths of the new nodes
+    '''
+    node_ids = await create_in_order(client, class_name, num_nodes)
+    return node_ids, await node_paths_async(client, node_ids)
+
+async def create_in_order(client, class_name, num_nodes):
+    '''
+    Creates nodes at the project root, one request after the other, and
+    adds them to the session's project cache and journal.
+
+    Args:
+        client <obj>: AsyncRpcClient
+        class_name (str): Node class
+        num_nodes (int): Number of nodes to create
+
+    Returns:
+        node_ids [str]: Node ids of the new nodes
+    '''
+    project = client.writer.root()
+    node_ids, errors = await client.call_many_results(
+        [("create_child", [project.id, class_name])] * num_nodes, ordered=True)
+    # journals the nodes created before a create failed, see rpc_batch.create_nodes()
+    project_cache().note_created(
+        class_name, [i for i, error in zip(node_ids, errors) if error is None])
+    raise_first_error(errors)
+    return node_ids
+
+async def node_paths_async(client, node_ids):
+    '''
+    Gets the paths of new nodes and adds them to the project cache.
+
+    Args:
+        client <obj>: AsyncRpcClient
+        node_ids [str]: Node ids
+
+    Returns:
+        node_paths [str]: Paths of the nodes
+    '''
+    node_paths = await client.call_many([(PATH_METHOD, [node_id]) for node_id in node_ids])
+    project_cache().note_paths(node_ids, node_paths)
+    return node_paths
+
+async def write_craters_async(client, plan_chunks, group_name, rim_shader_name, input_node,
+                              progress=None, cancel_event=None, chain_length=0,
+                              first_index=0, commit=None):
+    '''
+    Adds Crater shaders to the project, creating them in plan order while
+    the paths and parameters of earlier craters are still in flight.
+
+    Args:
+        client <obj>: AsyncRpcClient
+        plan_chunks <iter>: Crater plan chunks, see iter_crater_plan()
+        group_name (str): Name of group node or empty string
+        rim_shader_name (str): Name of rim shader or empty string
+        input_node (str): Path of node to assign to the first crater's Main input
+        progress <func>: Optional callback taking the number of craters done
+        cancel_event <obj>: Optional threading.Event, set to stop after the current crater
+        chain_length (int): Craters per chain, 0 chains all craters together
+        first_index (int): Plan index of the first crater, when resuming a run
+        commit <func>: Optional callback taking the paths of craters whose
+            parameters are all set, in plan order, see crater_engine.checkpoint
+
+    Returns:
+        crater_paths [str]: Paths of the new Crater shaders, in plan order
+        crater_plan (ndarray): The part of the plan that was written
+    '''
+    step = craters_per_step(client.writer)
+    batches = []
+    written_chunks = []
+    pending = set()
+    # batches committed so far, always the leading ones
+    num_committed = [0]
+    done_count = [0]
+    # path of the last crater of the batch before, once known
+    previous_path = asyncio.get_running_loop().create_future()
+    previous_path.set_result(input_node)
+
+    async def finish_batch(crater_ids, batch_rows, batch_index, input_path, last_path):
+        batch_paths = await node_paths_async(client, crater_ids)
+        last_path.set_result(batch_paths[-1])
+        await client.call_many(chained_param_calls(
+            crater_ids, batch_rows, batch_paths, group_name, rim_shader_name,
+            await input_path, batch_index, chain_length))
+        done_count[0] += len(batch_rows)
+        if progress is not None:
+            progress(done_count[0])
+        return batch_paths
+
+    def commit_finished():
+        while num_committed[0] < len(batches):
+            batch = batches[num_committed[0]]
+            if not batch.done() or batch.cancelled() or batch.exception() is not None:
+                return
+            num_committed[0] += 1
+            if commit is not None:
+                commit(batch.result())
+
+    try:
+        num_planned = 0
+        for chunk in plan_chunks:
+            crater_rows = crater_plan_rows(chunk)
+            num_written = 0
+            for start in range(0, len(crater_rows), step):
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                batch_rows = crater_rows[start:start + step]
+                crater_ids = await create_in_order(client, "crater_shader", len(batch_rows))
+                last_path = asyncio.get_running_loop().create_future()
+                batch = asyncio.ensure_future(finish_batch(
+                    crater_ids, batch_rows, first_index + num_planned + start, previous_path,
+                    last_path))
+                batches.append(batch)
+                pending.add(batch)
+                previous_path = last_path
+                num_written += len(batch_rows)
+                pending = await wait_for_batches(pending, client.window * 2)
+                commit_finished()
+            written_chunks.append(chunk[:num_written])
+            num_planned += num_written
+            if num_written < len(chunk):
+                break
+        await wait_for_batches(pending, 0)
+    except BaseException:
+        for batch in pending:
+            batch.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        commit_finished()
+        raise
+    commit_finished()
+
+    crater_paths = [path for batch in batches for path in batch.result()]
+    if not written_chunks:
+        return crater_paths, np.zeros(0, dtype=CRATER_PLAN_DTYPE)
+    return crater_paths, np.concatenate(written_chunks)
+
+async def wait_for_batches(pending, max_pending):
+    '''
+    Waits until no more than max_pending batches are outstanding and
+    re-raises the first batch error.
+
+    Args:
+        pending {tasks}: Outstanding batches
+        max_pending (int): Number of batches allowed to remain outstanding
+
+    Returns:
+        pending {tasks}: Batches still outstanding
+    '''
+    while len(pending) > max_pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for batch in done:
+            batch.result()
+    return pending
+
+async def build_merge_tree_async(client, leaf_paths):
+    '''
+    Merges the leaves pairwise, one level of Merge shaders at a time, like
+    merge_tree.build_merge_tree(), with the parameter sets of a level in
+    flight together.
+
+    Args:
+        client <obj>: AsyncRpcClient
+        leaf_paths [str]: Paths of the nodes to merge
+
+    Returns:
+        root_path (str): Path of the root Merge shader, or the only leaf
+        merge_paths [str]: Paths of all Merge shaders added, level by level
+    '''
+    level_paths = list(leaf_paths)
+    all_merge_paths = []
+    while len(level_paths) > 1:
+        merge_ids, merge_paths = await create_nodes_async(
+            client, "merge_shader", len(level_paths) // 2)
+        await client.call_many(merge_param_calls(merge_ids, level_paths))
+        all_merge_paths.extend(merge_paths)
+        level_paths = next_level(merge_paths, level_paths)
+    return level_paths[0], all_merge_paths
+
+def write_craters_pipelined(writer, plan_chunks, group_name, rim_shader_name, input_node,
+                            window=DEFAULT_WINDOW, progress=None, cancel_event=None,
+                            chain_length=0, first_index=0, commit=None):
+    '''
+    Adds Crater shaders to the project with up to window requests in
+    flight. Produces the same network as write_craters() for the same plan.
+
+    Args:
+        writer <obj>: RpcBatchWriter of the run
+        plan_chunks <iter>: Crater plan chunks, see iter_crater_plan()
+        group_name (str): Name of group node or empty string
+        rim_shader_name (str): Name of rim shader or empty string
+        input_node (str): Path of node to assign to the first crater's Main input
+        window (int): Most requests in flight at once
+        progress <func>: Optional callback taking the number of craters done
+        cancel_event <obj>: Optional threading.Event, set to stop after the current crater
+        chain_length (int): Craters per chain, 0 chains all craters together
+        first_index (int): Plan index of the first crater, when resuming a run
+        commit <func>: Optional callback taking the paths of committed craters
+
+    Returns:
+        crater_paths [str]: Paths of the new Crater shaders, in plan order
+        crater_plan (ndarray): The part of the plan that was written
+    '''
+    async def run():
+        client = AsyncRpcClient(writer, window)
+        return await write_craters_async(
+            client, plan_chunks, group_name, rim_shader_name, input_node, progress,
+            cancel_event, chain_length, first_index, commit)
+    return asyncio.run(run())
+
+def build_merge_tree_pipelined(writer, leaf_paths, window=DEFAULT_WINDOW):
+    '''
+    Builds the Merge tree with up to window requests in flight, see
+    build_merge_tree_async().
+
+    Args:
+        writer <obj>: RpcBatchWriter of the run
+        leaf_paths [str]: Paths of the nodes to merge
+        window (int): Most requests in flight at once
+
+    Returns:
+        root_path (str): Path of the root Merge shader, or the only leaf
+        merge_paths [str]: Paths of all Merge shaders added, level by level
+    '''
+    async def run():
+        return await build_merge_tree_async(AsyncRpcClient(writer, window), leaf_paths)
+    return asyncio.run(run())
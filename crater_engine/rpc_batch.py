@@ -0,0 +1,579 @@
+'''
+rpc_batch.py - Batched Terragen RPC writer for tg_splatter_craters.
+Queues node creation and parameter sets and sends them to Terragen in
+as few round-trips as the RPC server allows. When the server accepts
+JSON-RPC 2.0 batch requests, many calls share one round-trip, otherwise
+the calls are sent one by one and only the redundant lookups are saved.
+'''
+
+import json
+import threading
+import time
+import terragen_rpc as tg
+import terragen_rpc.impl as tg_impl
+import terragen_rpc.jsonrpc as tg_jsonrpc
+from crater_engine.instrument import round_trip
+from crater_engine.project_cache import project_cache
+
+DEFAULT_BATCH_SIZE = 64
+
+# Method used by terragen_rpc Node.path()
+PATH_METHOD = "name_and_path"
+
+DEFAULT_RETRIES = 0
+
+# Seconds before the first retry, doubled for each one after it
+RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 8.0
+
+# Methods Terragen may have run before the connection failed, which
+# would run twice if sent again
+NOT_REPEATABLE = {"create_child", "delete"}
+
+# Errors of a request that may be worth sending again, see can_retry().
+# Parse errors and invalid requests are left out: the server rejected
+# the request itself and would reject it again.
+RETRYABLE_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    tg.ReplyError,
+    tg_jsonrpc.LowLevelInternalError,
+    tg_jsonrpc.LowLevelServerError,
+    )
+
+# Batch support of each RPC server, keyed by (host, port)
+_batch_support = {}
+
+def param_string(values):
+    '''
+    Converts a parameter value to the string sent to Terragen, the same
+    way terragen_rpc Node.set_param() does.
+
+    Args:
+        values (str | number | tuple | list): Parameter value
+
+    Returns:
+        value_string (str): Parameter value as string
+    '''
+    if isinstance(values, (tuple, list)):
+        return " ".join(str(i) for i in values)
+    return str(values)
+
+def reset_batch_support():
+    '''
+    Forgets which RPC servers accept batch requests, i.e. after a server
+    was restarted with different settings on the same port.
+    '''
+    _batch_support.clear()
+
+class RpcBatchWriter:
+    '''
+    Sends Terragen RPC calls in batches and counts the round-trips
+    needed to do so. Requests that fail with a connection error, timeout,
+    garbled reply or internal server error are sent again up to retries
+    times, see can_retry(). A writer can be shared by several worker threads.
+    '''
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, retries=DEFAULT_RETRIES):
+        self.batch_size = max(int(batch_size), 1)
+        self.retries = max(int(retries), 0)
+        self.calls = 0
+        self.round_trips = 0
+        self.retried = 0
+        self._root = None
+        self._lock = threading.Lock()
+
+    def count(self, calls, round_trips, retries=0):
+        '''
+        Adds to the call, round-trip and retry counters.
+
+        Args:
+            calls (int): Number of RPC calls
+            round_trips (int): Number of requests sent to the server
+            retries (int): Number of failed requests about to be sent again
+        '''
+        with self._lock:
+            self.calls += calls
+            self.round_trips += round_trips
+            self.retried += retries
+
+    def with_retries(self, methods, send):
+        '''
+        Sends a request, and sends it again after a growing delay when it
+        fails in a way can_retry() allows.
+
+        Args:
+            methods [str]: RPC methods of the request
+            send <func>: Sends the request and returns its result
+
+        Returns:
+            result: Result of send()
+        '''
+        attempt = 0
+        while True:
+            try:
+                return send()
+            except RETRYABLE_ERRORS as e:
+                if not can_retry(e, methods, attempt, self.retries):
+                    raise
+            self.count(0, 0, retries=1)
+            time.sleep(retry_delay(attempt))
+            attempt += 1
+
+    def root(self):
+        '''
+        Gets the project root node from the session's project cache.
+
+        Returns:
+            root <obj>: Project root node id
+        '''
+        if self._root is None:
+            self._root = project_cache().root()
+        return self._root
+
+    def supports_batch(self):
+        '''
+        Checks once per RPC server whether it accepts JSON-RPC batch
+        requests. The probe isn't retried, a server without batch support
+        would only reject it again.
+
+        Returns:
+            supported (bool): True if calls can be sent as a batch
+        '''
+        server = (tg_impl.TCP_IP, tg_impl.TCP_PORT)
+        if server not in _batch_support:
+            try:
+                values, errors = self._send_batch([("root", [])], retry=False)
+                _batch_support[server] = errors[0] is None and values[0] is not None
+            except (tg.Error, ValueError, TypeError, KeyError):
+                _batch_support[server] = False
+        return _batch_support[server]
+
+    def call(self, method, params):
+        '''
+        Sends a single RPC call.
+
+        Args:
+            method (str): RPC method name
+            params []: RPC method parameters
+
+        Returns:
+            value: Result of the call
+        '''
+        def send():
+            self.count(1, 1)
+            return tg_jsonrpc.call(method, params).value
+        return self.with_retries([method], send)
+
+    def call_many(self, calls):
+        '''
+        Sends several RPC calls, as batches when the server supports it.
+
+        Args:
+            calls [tuples]: (method, params) pairs
+
+        Returns:
+            values []: Results of the calls, in order
+        '''
+        values, errors = self.call_many_results(calls)
+        raise_first_error(errors)
+        return values
+
+    def call_many_results(self, calls):
+        '''
+        Sends several RPC calls like call_many(), but returns the error of
+        each call that failed instead of raising it, so the results of the
+        calls that did run aren't lost, i.e. the ids of nodes created
+        before a create failed. Stops sending at the first request that
+        fails, the calls not sent get its error.
+
+        Args:
+            calls [tuples]: (method, params) pairs
+
+        Returns:
+            values []: Results of the calls, in order, None where a call failed
+            errors [objs]: Exception of each call that failed, None where it succeeded
+        '''
+        if len(calls) > 1 and self.supports_batch():
+            requests = [
+                calls[start:start + self.batch_size]
+                for start in range(0, len(calls), self.batch_size)
+                ]
+            send = self._send_batch
+        else:
+            requests = [[call] for call in calls]
+            send = self._send_single
+        values = []
+        errors = []
+        for request in requests:
+            try:
+                request_values, request_errors = send(request)
+            except Exception as e:
+                request_values, request_errors = [None] * len(request), [e] * len(request)
+            values.extend(request_values)
+            errors.extend(request_errors)
+            first_error = next((error for error in request_errors if error is not None), None)
+            if first_error is not None:
+                values.extend([None] * (len(calls) - len(values)))
+                errors.extend([first_error] * (len(calls) - len(errors)))
+                break
+        return values, errors
+
+    def _send_single(self, calls):
+        '''
+        Sends one call on its own, with the results of _send_batch().
+
+        Args:
+            calls [tuples]: The (method, params) pair
+
+        Returns:
+            values []: Result of the call
+            errors [objs]: None, the call raises when it fails
+        '''
+        method, params = calls[0]
+        return [self.call(method, params)], [None]
+
+    def _send_batch(self, calls, retry=True):
+        '''
+        Sends calls as one JSON-RPC batch request. A batch of calls that
+        can be sent again is retried as a whole when one of its calls
+        fails in a way can_retry() allows.
+
+        Args:
+            calls [tuples]: (method, params) pairs
+            retry (bool): Send the request again when it fails, see with_retries()
+
+        Returns:
+            values []: Results of the calls, in order, None where a call failed
+            errors [objs]: Exception of each call that failed, None where it succeeded
+        '''
+        methods = [method for method, _ in calls]
+        def send():
+            self.count(len(calls), 1)
+            with round_trip(methods):
+                reply_bytes = tg_impl.send_string(batch_request(calls))
+                values, errors = batch_reply_values(reply_bytes, calls)
+                if NOT_REPEATABLE.isdisjoint(methods):
+                    raise_first_error(errors, RETRYABLE_ERRORS)
+            return values, errors
+        if not retry:
+            return send()
+        return self.with_retries(methods, send)
+
+    def round_trips_per_crater(self, num_craters):
+        '''
+        Average number of round-trips per crater so far.
+
+        Args:
+            num_craters (int): Number of craters written
+
+        Returns:
+            ratio (float): Round-trips per crater
+        '''
+        if num_craters <= 0:
+            return 0.0
+        return self.round_trips / num_craters
+
+def can_retry(error, methods, attempt, retries):
+    '''
+    Checks whether a failed request may be sent again. A request the
+    server refused never reached Terragen and can always be sent again.
+    After a timeout, a dropped connection, a garbled reply or an internal
+    server error Terragen may already have run it, so only requests
+    without NOT_REPEATABLE methods are, such as parameter sets and gets.
+
+    Args:
+        error <obj>: One of RETRYABLE_ERRORS raised by the request
+        methods [str]: RPC methods of the request
+        attempt (int): Number of retries so far
+        retries (int): Most retries allowed
+
+    Returns:
+        retry (bool): True if the request can be sent again
+    '''
+    if attempt >= retries:
+        return False
+    if isinstance(error, ConnectionRefusedError):
+        return True
+    return NOT_REPEATABLE.isdisjoint(methods)
+
+def retry_delay(attempt):
+    '''
+    Seconds to wait before a retry, doubled for every retry of a request.
+
+    Args:
+        attempt (int): Number of retries so far
+
+    Returns:
+        delay (float): Seconds
+    '''
+    return min(RETRY_DELAY * 2 ** attempt, MAX_RETRY_DELAY)
+
+def batch_request(calls):
+    '''
+    Builds a JSON-RPC batch request, the calls numbered in order.
+
+    Args:
+        calls [tuples]: (method, params) pairs
+
+    Returns:
+        request (str): Request JSON
+    '''
+    return json.dumps([
+        {"jsonrpc": "2.0", "method": method, "params": params, "id": index}
+        for index, (method, params) in enumerate(calls)
+        ])
+
+def batch_reply_values(reply_bytes, calls):
+    '''
+    Gets the result or error of each call of a batch request from the
+    server's reply. Calls of a batch succeed or fail on their own.
+
+    Args:
+        reply_bytes (bytes): Reply JSON
+        calls [tuples]: (method, params) pairs of the request
+
+    Returns:
+        values []: Results of the calls, in order, None where a call failed
+        errors [objs]: terragen_rpc Error of each call that failed, None
+            where it succeeded
+
+    Raises:
+        TypeError: The reply isn't a list of replies
+    '''
+    try:
+        replies = json.loads(reply_bytes)
+    except ValueError:
+        # raises terragen_rpc's ReplyError for a reply that can't be parsed
+        tg_jsonrpc.Reply(reply_bytes, "batch", calls)
+        raise
+    if not isinstance(replies, list):
+        # raises the matching terragen_rpc error for the reply
+        tg_jsonrpc.Reply(reply_bytes, "batch", calls)
+        raise TypeError("Terragen RPC batch reply is not a list")
+    replies_by_id = {reply.get("id"): reply for reply in replies}
+    values = []
+    errors = []
+    for index, (method, params) in enumerate(calls):
+        try:
+            values.append(tg_jsonrpc.Reply(json.dumps(replies_by_id[index]), method, params).value)
+            errors.append(None)
+        except tg.Error as e:
+            values.append(None)
+            errors.append(e)
+    return values, errors
+
+def raise_first_error(errors, error_types=Exception) -> None:
+    '''
+    Raises the first error of a list of per-call results, if any.
+
+    Args:
+        errors [objs]: Exception of each call, None where it succeeded
+        error_types (type | tuple): Only raise the first error if it is one of these
+    '''
+    first_error = next((error for error in errors if error is not None), None)
+    if isinstance(first_error, error_types):
+        raise first_error
+
+# Crater shader parameters set from a crater plan row, in row order
+CRATER_PARAM_NAMES = (
+    "center",
+    "diameter",
+    "depth",
+    "rim_height",
+    "rim_skirt",
+    "rim_softness",
+    "rim_tightness",
+    )
+
+# Crater shader parameters set from the Apply settings and the network
+CRATER_LINK_NAMES = ("gui_group", "rim_shader", "input_node")
+
+def crater_params(crater_row, group_name, rim_shader_name, input_node):
+    '''
+    Builds the parameter values of one Crater shader, as sent to Terragen.
+
+    Args:
+        crater_row (tuple): Crater plan row, see crater_plan_rows()
+        group_name (str): Name of group node or empty string
+        rim_shader_name (str): Name of rim shader or empty string
+        input_node (str): Path of node to assign to Main input or empty string
+
+    Returns:
+        params [tuples]: (name, value string) pairs, CRATER_PARAM_NAMES then
+            CRATER_LINK_NAMES, with empty strings for unset links
+    '''
+    params = [(name, param_string(value)) for name, value in zip(CRATER_PARAM_NAMES, crater_row)]
+    params.extend(zip(CRATER_LINK_NAMES, (group_name, rim_shader_name, input_node)))
+    return params
+
+def crater_param_calls(crater_id, crater_row, group_name, rim_shader_name, input_node):
+    '''
+    Builds the parameter set calls of one Crater shader. Empty group and
+    rim shader values are left at their defaults instead of being sent.
+
+    Args:
+        crater_id (str): Crater shader node id
+        crater_row (tuple): Crater plan row, see crater_plan_rows()
+        group_name (str): Name of group node or empty string
+        rim_shader_name (str): Name of rim shader or empty string
+        input_node (str): Path of node to assign to Main input or empty string
+
+    Returns:
+        calls [tuples]: (method, params) pairs
+    '''
+    return [
+        ("set_param_from_string", [crater_id, name, value])
+        for name, value in crater_params(crater_row, group_name, rim_shader_name, input_node)
+        if value or name not in CRATER_LINK_NAMES
+        ]
+
+def create_nodes(writer, class_name, num_nodes):
+    '''
+    Creates nodes at the project root, in order, and gets their paths.
+    The new nodes are added to the session's project cache and journal.
+
+    Args:
+        writer <obj>: RpcBatchWriter
+        class_name (str): Node class, i.e. "crater_shader"
+        num_nodes (int): Number of nodes to create
+
+    Returns:
+        node_ids [str]: Node ids of the new nodes
+        node_paths [str]: Paths of the new nodes
+    '''
+    project = writer.root()
+    node_ids, errors = writer.call_many_results(
+        [("create_child", [project.id, class_name])] * num_nodes)
+    cache = project_cache()
+    # the nodes created before a create failed are journaled all the same,
+    # so that clean-up, stray deletion and Undo remove them
+    cache.note_created(class_name, [i for i, error in zip(node_ids, errors) if error is None])
+    raise_first_error(errors)
+    node_paths = writer.call_many([(PATH_METHOD, [node_id]) for node_id in node_ids])
+    cache.note_paths(node_ids, node_paths)
+    return node_ids, node_paths
+
+def create_craters(writer, num_craters):
+    '''
+    Creates Crater shaders at the project root, in order, and gets their paths.
+
+    Args:
+        writer <obj>: RpcBatchWriter
+        num_craters (int): Number of Crater shaders to create
+
+    Returns:
+        crater_ids [str]: Node ids of the new Crater shaders
+        crater_paths [str]: Paths of the new Crater shaders
+    '''
+    return create_nodes(writer, "crater_shader", num_craters)
+
+def chain_inputs(crater_paths, input_node, first_index=0, chain_length=0):
+    '''
+    Gets the Main input of consecutive Crater shaders, each one chained
+    to the crater before it.
+
+    Args:
+        crater_paths [str]: Crater shader paths
+        input_node (str): Path of node to assign to the first crater's Main input
+        first_index (int): Plan index of the first crater
+        chain_length (int): Start a new chain, with an empty Main input, every
+            chain_length craters. 0 chains all craters together.
+
+    Returns:
+        input_nodes [str]: Main input of each crater
+    '''
+    input_nodes = []
+    for index, crater_path in enumerate(crater_paths, first_index):
+        if chain_length and index and index % chain_length == 0:
+            input_node = ""
+        input_nodes.append(input_node)
+        input_node = crater_path
+    return input_nodes
+
+def chained_param_calls(crater_ids, crater_rows, crater_paths, group_name, rim_shader_name,
+                        input_node, first_index=0, chain_length=0):
+    '''
+    Builds the parameter set calls of consecutive Crater shaders, chaining
+    each one's Main input to the crater before it.
+
+    Args:
+        crater_ids [str]: Crater shader node ids
+        crater_rows [tuples]: Crater plan rows, see crater_plan_rows()
+        crater_paths [str]: Crater shader paths
+        group_name (str): Name of group node or empty string
+        rim_shader_name (str): Name of rim shader or empty string
+        input_node (str): Path of node to assign to the first crater's Main input
+        first_index (int): Plan index of the first crater
+        chain_length (int): Start a new chain, with an empty Main input, every
+            chain_length craters. 0 chains all craters together.
+
+    Returns:
+        calls [tuples]: (method, params) pairs
+    '''
+    param_calls = []
+    input_nodes = chain_inputs(crater_paths, input_node, first_index, chain_length)
+    for crater_id, crater_row, crater_input in zip(crater_ids, crater_rows, input_nodes):
+        param_calls.extend(
+            crater_param_calls(crater_id, crater_row, group_name, rim_shader_name, crater_input))
+    return param_calls
+
+def write_craters(writer, crater_rows, group_name, rim_shader_name, input_node,
+                  progress=None, cancel_event=None, chain_length=0, first_index=0,
+                  commit=None):
+    '''
+    Adds Crater shaders to the project and chains each one's Main input
+    to the crater before it. When the server accepts batches, craters
+    are written batch_size at a time: one request creates them, one gets
+    their paths and the parameter sets follow in batches. Otherwise
+    they are written one crater at a time.
+
+    Args:
+        writer <obj>: RpcBatchWriter
+        crater_rows [tuples]: Crater plan rows, see crater_plan_rows()
+        group_name (str): Name of group node or empty string
+        rim_shader_name (str): Name of rim shader or empty string
+        input_node (str): Path of node to assign to the first crater's Main input
+        progress <func>: Optional callback taking the number of craters done
+        cancel_event <obj>: Optional threading.Event, set to stop after the current crater
+        chain_length (int): Craters per chain, 0 chains all craters together
+        first_index (int): Plan index of the first crater, when resuming a run
+        commit <func>: Optional callback taking the paths of craters whose
+            parameters are all set, in plan order, see crater_engine.checkpoint
+
+    Returns:
+        crater_paths [str]: Paths of the new Crater shaders, in plan order
+    '''
+    crater_rows = list(crater_rows)
+    crater_paths = []
+    step = craters_per_step(writer)
+    for start in range(0, len(crater_rows), step):
+        if cancel_event is not None and cancel_event.is_set():
+            break
+        batch_rows = crater_rows[start:start + step]
+        crater_ids, batch_paths = create_craters(writer, len(batch_rows))
+        writer.call_many(chained_param_calls(
+            crater_ids, batch_rows, batch_paths, group_name, rim_shader_name, input_node,
+            first_index + start, chain_length))
+        if commit is not None:
+            commit(batch_paths)
+        input_node = batch_paths[-1]
+        crater_paths.extend(batch_paths)
+        if progress is not None:
+            progress(len(crater_paths))
+    return crater_paths
+
+def craters_per_step(writer):
+    '''
+    Number of craters written together. Without batch support writing
+    them together saves nothing, so they are written one at a time and
+    can be cancelled after any crater.
+
+    Args:
+        writer <obj>: RpcBatchWriter
+
+    Returns:
+        step (int): Number of craters
+    '''
+    if writer.supports_batch():
+        return writer.batch_size
+    return 1
@@ -0,0 +1,536 @@
+'''
+settings.py - Validated, read-only Apply settings for tg_splatter_craters.
+The raw UI values are parsed and checked once, when Apply is clicked.
+Every problem is reported together in one SettingsError, and everything
+after that runs from the ApplySettings object, so no string is parsed
+again and no bad value is silently replaced by a default.
+'''
+
+import os.path
+
+INSERT_MODES = ["Don't", "Output > Main input", "Merge shader", "Merge tree"]
+SIZE_DISTRIBUTIONS = ["Uniform", "Power law"]
+PLACEMENTS = ["Uniform", "Spaced"]
+# Compute terrain nodes an Apply inserts into, see crater_engine.targets
+TARGET_MODES = ["First", "All", "Selected"]
+TARGET_PLANS = ["Shared", "Per target"]
+# Density map files, see crater_engine.density
+DENSITY_MAP_SUFFIXES = [".pgm", ".npy", ".png", ".tif", ".tiff", ".bmp"]
+RIM_SHADER_CLASSES = [
+    "alpine_fractal_shader_v2", "displacement_shader", "fake_stones_shader", "image_map_shader",
+    "power_fractal_shader_v3", "strata_and_outcrops_shader_v2", "twist_and_shear_shader"]
+
+# UI values of a freshly opened window, see get_apply_values() in the GUI
+DEFAULT_VALUES = {
+    "quantity": "1",
+    "group": False,
+    "group_name": "Craters",
+    "on_mountain_or_valley": False,
+    "amplitude": "100.0",
+    "x_pos": "0.0",
+    "z_pos": "0.0",
+    "x_area": "1000.0",
+    "y_area": "0.0",
+    "z_area": "1000.0",
+    "dia_min": "500.0",
+    "dia_max": "1500.0",
+    "depth_check": False,
+    "depth_percent": "0.1",
+    "depth_offset": False,
+    "depth_min": "50.0",
+    "depth_max": "150.0",
+    "rim_height": False,
+    "rim_height_percent": "0.1",
+    "rim_height_offset": False,
+    "rim_min": "5.0",
+    "rim_max": "20.0",
+    "rim_skirt": False,
+    "rim_skirt_percent": "0.1",
+    "rim_skirt_offset": False,
+    "skirt_min": "500.0",
+    "skirt_max": "1500.0",
+    "soft_min": "0.0",
+    "soft_max": "1.0",
+    "tight_min": "0.0",
+    "tight_max": "16.0",
+    "rim_shader_check": False,
+    "rim_shader_class": "alpine_fractal_shader_v2",
+    "insert_into_flow": "Output > Main input",
+    "targets": "First",
+    "target_names": "",
+    "target_plan": "Shared",
+    "append_warp": False,
+    "rpc_workers": "1",
+    "plan_workers": "1",
+    "rpc_window": "1",
+    "rpc_retries": "2",
+    "size_distribution": "Uniform",
+    "size_exponent": "2.0",
+    "placement": "Uniform",
+    "spacing": "1.0",
+    "density_map": "",
+    "cull_pixels": "",
+    "raster_below": "",
+    "raster_size": "2048",
+    "merge_fan_in": "8",
+    "seed": "",
+    }
+
+class SettingsError(ValueError):
+    '''
+    Raised when UI values can't be used. Lists every problem found.
+
+    Args:
+        problems [str]: One message per invalid value
+    '''
+    def __init__(self, problems):
+        super().__init__("\n".join(problems))
+        self.problems = list(problems)
+
+class FrozenSettings:
+    '''
+    Base of read-only settings objects. Subclasses list their fields in
+    __slots__, and every field must be given to the constructor.
+    '''
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        missing = [name for name in self.__slots__ if name not in fields]
+        unknown = [name for name in fields if name not in self.__slots__]
+        if missing or unknown:
+            raise TypeError(
+                f"{type(self).__name__}: missing fields {missing}, unknown fields {unknown}")
+        for name in self.__slots__:
+            object.__setattr__(self, name, fields[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in self.__slots__))
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def to_dict(self):
+        '''
+        Converts the settings to plain values, nested settings included.
+
+        Returns:
+            fields (dict): Field values keyed by field name
+        '''
+        fields = {}
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if isinstance(value, FrozenSettings):
+                value = value.to_dict()
+            elif isinstance(value, tuple):
+                value = list(value)
+            fields[name] = value
+        return fields
+
+class PercentSettings(FrozenSettings):
+    '''
+    Settings of a crater parameter that is either a percentage of the
+    diameter, optionally with a random +/- offset, or a value between
+    a minimum and maximum.
+    '''
+    __slots__ = ("use_percent", "percent", "offset", "range")
+
+class ApplySettings(FrozenSettings):
+    '''
+    Everything one Apply needs, parsed and validated. Build it with
+    ApplySettings.from_values().
+    '''
+    __slots__ = (
+        "quantity",
+        "group",
+        "group_name",
+        "on_mountain_or_valley",
+        "amplitude",
+        "x_pos",
+        "z_pos",
+        "x_area",
+        "y_area",
+        "z_area",
+        "x_range",
+        "z_range",
+        "diameter_range",
+        "depth",
+        "rim_height",
+        "rim_skirt",
+        "softness_range",
+        "tightness_range",
+        "rim_shader_check",
+        "rim_shader_class",
+        "insert_into_flow",
+        "targets",
+        "target_names",
+        "target_plan",
+        "append_warp",
+        "rpc_workers",
+        "plan_workers",
+        "rpc_window",
+        "rpc_retries",
+        "size_distribution",
+        "size_exponent",
+        "placement",
+        "spacing",
+        "density_map",
+        "cull_pixels",
+        "raster_below",
+        "raster_size",
+        "merge_fan_in",
+        "seed",
+        )
+
+    # Fields holding a PercentSettings
+    PERCENT_FIELDS = ("depth", "rim_height", "rim_skirt")
+
+    # Values of fields added later, for settings saved before them
+    FIELD_DEFAULTS = {
+        "seed": None, "density_map": "", "cull_pixels": None, "raster_below": None,
+        "raster_size": 2048, "plan_workers": 1,
+        "rpc_window": 1, "rpc_retries": 0,
+        "targets": "First", "target_names": (), "target_plan": "Shared",
+        }
+
+    @classmethod
+    def from_values(cls, values):
+        '''
+        Parses and validates the raw UI values.
+
+        Args:
+            values (dict): Raw UI values keyed by variable name, without "_var"
+
+        Returns:
+            settings <obj>: ApplySettings
+
+        Raises:
+            SettingsError: One or more values are invalid
+        '''
+        parser = ValuesParser(values)
+        insert_into_flow = parser.choice("insert_into_flow", "Insertion mode", INSERT_MODES)
+        size_distribution = parser.choice(
+            "size_distribution", "Size distribution", SIZE_DISTRIBUTIONS)
+        placement = parser.choice("placement", "Placement", PLACEMENTS)
+        targets = parser.choice("targets", "Targets", TARGET_MODES)
+        raster_below = parser.optional_number("raster_below", "Raster below", above=0.0)
+        x_pos = parser.number("x_pos", "Area centre x")
+        z_pos = parser.number("z_pos", "Area centre z")
+        x_area = parser.number("x_area", "Area volume x")
+        z_area = parser.number("z_area", "Area volume z")
+        on_mountain_or_valley = bool(values["on_mountain_or_valley"])
+        rim_shader_check = bool(values["rim_shader_check"])
+        settings = cls(
+            quantity=parser.whole_number("quantity", "Number of craters"),
+            group=bool(values["group"]),
+            group_name=str(values["group_name"]),
+            on_mountain_or_valley=on_mountain_or_valley,
+            amplitude=parser.number("amplitude", "Amplitude", required=on_mountain_or_valley),
+            x_pos=x_pos,
+            z_pos=z_pos,
+            x_area=x_area,
+            y_area=parser.number("y_area", "Area volume y", required=on_mountain_or_valley),
+            z_area=z_area,
+            x_range=area_range(x_pos, x_area),
+            z_range=area_range(z_pos, z_area),
+            diameter_range=parser.value_range("dia_min", "dia_max", "Diameter", above=0.0),
+            depth=parser.percent_settings(
+                "depth_check", "depth_percent", "depth_offset", "depth_min", "depth_max",
+                "Depth"),
+            rim_height=parser.percent_settings(
+                "rim_height", "rim_height_percent", "rim_height_offset", "rim_min", "rim_max",
+                "Rim height"),
+            rim_skirt=parser.percent_settings(
+                "rim_skirt", "rim_skirt_percent", "rim_skirt_offset", "skirt_min", "skirt_max",
+                "Rim skirt"),
+            softness_range=parser.value_range("soft_min", "soft_max", "Rim softness"),
+            tightness_range=parser.value_range("tight_min", "tight_max", "Rim tightness"),
+            rim_shader_check=rim_shader_check,
+            rim_shader_class=parser.choice(
+                "rim_shader_class", "Rim shader", RIM_SHADER_CLASSES, required=rim_shader_check),
+            insert_into_flow=insert_into_flow,
+            targets=targets,
+            target_names=parser.names(
+                "target_names", "Compute terrains", required=targets == "Selected"),
+            target_plan=parser.choice("target_plan", "Target plan", TARGET_PLANS),
+            append_warp=bool(values["append_warp"]),
+            rpc_workers=parser.whole_number("rpc_workers", "RPC workers"),
+            plan_workers=parser.whole_number("plan_workers", "Plan workers"),
+            rpc_window=parser.whole_number("rpc_window", "RPC window"),
+            rpc_retries=parser.whole_number("rpc_retries", "RPC retries", minimum=0),
+            size_distribution=size_distribution,
+            size_exponent=parser.number(
+                "size_exponent", "Size distribution exponent", minimum=0.0,
+                required=size_distribution == "Power law"),
+            placement=placement,
+            spacing=parser.number(
+                "spacing", "Placement spacing", above=0.0, required=placement == "Spaced"),
+            density_map=parser.optional_file("density_map", "Density map", DENSITY_MAP_SUFFIXES),
+            cull_pixels=parser.optional_number("cull_pixels", "Cull below pixels", above=0.0),
+            raster_below=raster_below,
+            raster_size=parser.whole_number(
+                "raster_size", "Raster size", minimum=16, required=raster_below is not None),
+            merge_fan_in=parser.whole_number(
+                "merge_fan_in", "Fan-in", required=insert_into_flow == "Merge tree"),
+            seed=parser.optional_whole_number("seed", "Seed", minimum=0),
+            )
+        if parser.problems:
+            raise SettingsError(parser.problems)
+        return settings
+
+    @classmethod
+    def from_dict(cls, fields):
+        '''
+        Rebuilds settings saved with to_dict(), i.e. from a plan file.
+        The values are not validated again.
+
+        Args:
+            fields (dict): Field values keyed by field name
+
+        Returns:
+            settings <obj>: ApplySettings
+        '''
+        fields = {
+            name: tuple(value) if isinstance(value, list) else value
+            for name, value in {**cls.FIELD_DEFAULTS, **fields}.items()
+            }
+        for name in cls.PERCENT_FIELDS:
+            percent_fields = dict(fields[name])
+            if percent_fields["range"] is not None:
+                percent_fields["range"] = tuple(percent_fields["range"])
+            fields[name] = PercentSettings(**percent_fields)
+        return cls(**fields)
+
+class ValuesParser:
+    '''
+    Parses raw UI values and collects a message for every invalid one.
+    Values that are not required by the other settings are parsed when
+    possible and left as None otherwise, without a message.
+    '''
+    def __init__(self, values):
+        self.values = values
+        self.problems = []
+
+    def number(self, key, label, minimum=None, above=None, required=True):
+        '''
+        Parses a floating point value.
+
+        Args:
+            key (str): Value key
+            label (str): Name of the field as shown in the window
+            minimum (float): Optional smallest allowed value
+            above (float): Optional value the number must be greater than
+            required (bool): Report the value if it is invalid
+
+        Returns:
+            number (float): Parsed value, or None if invalid
+        '''
+        try:
+            number = float(self.values[key])
+        except (TypeError, ValueError):
+            return self.problem(f"{label} must be a number.", required)
+        if number != number or number in (float("inf"), float("-inf")):
+            return self.problem(f"{label} must be a finite number.", required)
+        if minimum is not None and number < minimum:
+            return self.problem(f"{label} must be {minimum} or more.", required)
+        if above is not None and number <= above:
+            return self.problem(f"{label} must be greater than {above}.", required)
+        return number
+
+    def whole_number(self, key, label, minimum=1, required=True):
+        '''
+        Parses an integer value.
+
+        Args:
+            key (str): Value key
+            label (str): Name of the field as shown in the window
+            minimum (int): Smallest allowed value
+            required (bool): Report the value if it is invalid
+
+        Returns:
+            number (int): Parsed value, or None if invalid
+        '''
+        try:
+            number = int(str(self.values[key]).strip())
+        except ValueError:
+            return self.problem(f"{label} must be a whole number.", required)
+        if number < minimum:
+            return self.problem(f"{label} must be {minimum} or more.", required)
+        return number
+
+    def optional_number(self, key, label, above=None):
+        '''
+        Parses a floating point value that may be left empty.
+
+        Args:
+            key (str): Value key
+            label (str): Name of the field as shown in the window
+            above (float): Optional value the number must be greater than
+
+        Returns:
+            number (float): Parsed value, or None if empty or invalid
+        '''
+        if not str(self.values[key]).strip():
+            return None
+        return self.number(key, label, above=above)
+
+    def optional_whole_number(self, key, label, minimum=0):
+        '''
+        Parses an integer value that may be left empty.
+
+        Args:
+            key (str): Value key
+            label (str): Name of the field as shown in the window
+            minimum (int): Smallest allowed value
+
+        Returns:
+            number (int): Parsed value, or None if empty or invalid
+        '''
+        if not str(self.values[key]).strip():
+            return None
+        return self.whole_number(key, label, minimum)
+
+    def optional_file(self, key, label, suffixes):
+        '''
+        Checks a file path that may be left empty.
+
+        Args:
+            key (str): Value key
+            label (str): Name of the field as shown in the window
+            suffixes [str]: Allowed file name endings, lower case
+
+        Returns:
+            file_path (str): The path, empty if empty or invalid
+        '''
+        file_path = str(self.values[key]).strip()
+        if not file_path:
+            return ""
+        if not file_path.lower().endswith(tuple(suffixes)):
+            self.problem(f"{label} must be one of: {', '.join(suffixes)}.", True)
+            return ""
+        if not os.path.isfile(file_path):
+            self.problem(f"{label} {file_path} doesn't exist.", True)
+            return ""
+        return file_path
+
+    def choice(self, key, label, choices, required=True):
+        '''
+        Checks a value picked from a list.
+
+        Args:
+            key (str): Value key
+            label (str): Name of the field as shown in the window
+            choices [str]: Allowed values
+            required (bool): Report the value if it is not allowed
+
+        Returns:
+            choice (str): The value, or None if not allowed
+        '''
+        choice = self.values[key]
+        if choice not in choices:
+            return self.problem(f"{label} must be one of: {', '.join(choices)}.", required)
+        return choice
+
+    def names(self, key, label, required=True):
+        '''
+        Parses a comma separated list of node names or paths.
+
+        Args:
+            key (str): Value key
+            label (str): Name of the field as shown in the window
+            required (bool): Report the value if it is empty
+
+        Returns:
+            names (tuple): Stripped names, in the order given
+        '''
+        names = tuple(name.strip() for name in str(self.values[key]).split(",") if name.strip())
+        if not names:
+            self.problem(f"{label} must name at least one node.", required)
+        return names
+
+    def value_range(self, min_key, max_key, label, above=None, required=True):
+        '''
+        Parses a minimum/maximum pair.
+
+        Args:
+            min_key (str): Key of the minimum value
+            max_key (str): Key of the maximum value
+            label (str): Name of the row as shown in the window
+            above (float): Optional value both numbers must be greater than
+            required (bool): Report the values if they are invalid
+
+        Returns:
+            value_range (tuple): (min, max) floats, or None if invalid
+        '''
+        minimum = self.number(min_key, f"{label} minimum", above=above, required=required)
+        maximum = self.number(max_key, f"{label} maximum", above=above, required=required)
+        if minimum is None or maximum is None:
+            return None
+        # a minimum above the maximum samples the same range, some presets rely on it
+        return minimum, maximum
+
+    def percent_settings(self, use_key, percent_key, offset_key, min_key, max_key, label):
+        '''
+        Parses a crater parameter that can be a percentage of the diameter.
+        Only the percentage or the min/max pair is required, whichever is used.
+
+        Args:
+            use_key (str): Key of the "or % of diameter" check
+            percent_key (str): Key of the percentage
+            offset_key (str): Key of the "+/- Offset" check
+            min_key (str): Key of the minimum value
+            max_key (str): Key of the maximum value
+            label (str): Name of the row as shown in the window
+
+        Returns:
+            column_settings <obj>: PercentSettings
+        '''
+        use_percent = bool(self.values[use_key])
+        return PercentSettings(
+            use_percent=use_percent,
+            percent=self.number(
+                percent_key, f"{label} % of diameter", minimum=0.0, required=use_percent),
+            offset=bool(self.values[offset_key]),
+            range=self.value_range(min_key, max_key, label, required=not use_percent),
+            )
+
+    def problem(self, message, required):
+        '''
+        Records a problem with a required value.
+
+        Args:
+            message (str): What is wrong
+            required (bool): The value is used, so the problem is reported
+
+        Returns:
+            None
+        '''
+        if required:
+            self.problems.append(message)
+        return None
+
+def area_range(center, area):
+    '''
+    Calculates the min/max coordinate of one axis of the area volume.
+
+    Args:
+        center (float): Axis value of the area centre
+        area (float): Axis value of the area volume
+
+    Returns:
+        coordinate_range (tuple): (min, max) rounded to two decimal places,
+            None if either value is invalid
+    '''
+    if center is None or area is None:
+        return None
+    deviation = abs(area * 0.5)
+    return round(center - deviation, 2), round(center + deviation, 2)
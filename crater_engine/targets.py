@@ -0,0 +1,62 @@
+'''
+targets.py - Compute terrain targets of an Apply for tg_splatter_craters.
+By default the craters are inserted into the first Compute terrain node
+of the project. An Apply can also target every Compute terrain node,
+or those named in the settings, in one pass: the project is searched
+once, the group and rim shader are shared, and each target gets its own
+crater network, see pipeline.target_stages(). The targets either share
+one crater plan or each get a plan of their own seed.
+'''
+
+from crater_engine.manifest import root_node_path
+
+class TargetError(ValueError):
+    '''
+    Raised when Compute terrain nodes named in the settings aren't in the project.
+    '''
+
+def select_targets(settings, compute_terrains):
+    '''
+    Picks the Compute terrain nodes an Apply inserts into.
+
+    Args:
+        settings <obj>: ApplySettings
+        compute_terrains [tuples]: Compute terrain path, input_node assignment
+            of every Compute terrain node in the project, in project order
+
+    Returns:
+        targets [tuples]: The selected ones, in project order, empty if
+            the project has none
+
+    Raises:
+        TargetError: A node named in the settings wasn't found
+    '''
+    if settings.targets == "First":
+        return list(compute_terrains[:1])
+    if settings.targets == "All":
+        return list(compute_terrains)
+    wanted = {root_node_path(name) for name in settings.target_names}
+    targets = [target for target in compute_terrains if target[0] in wanted]
+    missing = sorted(wanted - {target[0] for target in targets})
+    if missing:
+        raise TargetError(
+            "These Compute terrain nodes aren't in the project: " + ", ".join(missing) + ".")
+    return targets
+
+def target_seeds(settings, seed, num_targets):
+    '''
+    Gets the seed of each target's crater plan. The first target always
+    uses the seed of the Apply, so its craters are those of a single
+    target Apply with that seed.
+
+    Args:
+        settings <obj>: ApplySettings
+        seed (int): Seed of the Apply
+        num_targets (int): Number of targets
+
+    Returns:
+        seeds [int]: Plan seed of each target, all the same for a shared plan
+    '''
+    if settings.target_plan == "Per target":
+        return [seed + index for index in range(num_targets)]
+    return [seed] * num_targets
@@ -0,0 +1,77 @@
+'''
+conftest.py - Shared helpers for the tests, which run the Apply pipeline
+against the mock Terragen RPC server in crater_engine.mock_server.
+
+Run from the repository folder:
+    python -m pytest tests
+'''
+
+import pytest
+from crater_engine.mock_server import MockRpcError
+from crater_engine.settings import DEFAULT_VALUES, ApplySettings
+
+
+def make_settings(**values):
+    '''
+    Builds ApplySettings from the defaults with some values changed.
+
+    Args:
+        values: Setting values by key, as strings like the GUI gives them
+
+    Returns:
+        settings <obj>: ApplySettings
+    '''
+    settings_values = dict(DEFAULT_VALUES)
+    settings_values.update(values)
+    return ApplySettings.from_values(settings_values)
+
+def snapshot(project):
+    '''
+    Describes every node of a mock project by path, class and parameters,
+    so two networks can be compared whatever ids the server gave them.
+
+    Args:
+        project <obj>: MockProject
+
+    Returns:
+        list: Sorted (path, class name, sorted parameter items) per node
+    '''
+    return sorted(
+        (project.path(node), node.class_name, sorted(node.params.items()))
+        for node in project.nodes.values())
+
+def fail_create(project, class_name, number):
+    '''
+    Makes the mock project reply with an error to one create_child call.
+
+    Args:
+        project <obj>: MockProject
+        class_name (str): Class of the node whose creation fails
+        number (int): Which create_child call of that class fails, from 1
+    '''
+    call = project.call
+    created = [0]
+
+    def failing_call(method, params):
+        if method == "create_child" and params[1] == class_name:
+            created[0] += 1
+            if created[0] == number:
+                raise MockRpcError(-32602, "Invalid params")
+        return call(method, params)
+
+    project.call = failing_call
+
+@pytest.fixture
+def files(tmp_path):
+    '''
+    Gives the report, manifest, journal and checkpoint file paths of a test.
+
+    Returns:
+        dict: File path by run_apply() argument name
+    '''
+    return {
+        "report_path": str(tmp_path / "report.json"),
+        "manifest_path": str(tmp_path / "manifest.json"),
+        "journal_path": str(tmp_path / "journal.json"),
+        "checkpoint_path": str(tmp_path / "checkpoint.jsonl"),
+    }
@@ -0,0 +1,107 @@
+'''
+test_failures.py - Checks that failed, cancelled, resumed and undone
+Applies leave the node network the way they should.
+'''
+
+import os
+import threading
+import pytest
+import terragen_rpc as tg
+from conftest import fail_create, make_settings, snapshot
+from crater_engine.journal import undo_last_run
+from crater_engine.mock_server import mock_terragen
+from crater_engine.pipeline import resume_apply, run_apply
+
+WRITERS = [{}, {"rpc_workers": "4"}, {"rpc_window": "8"}]
+
+
+class Interrupted(ConnectionError):
+    '''
+    Stands in for a lost connection partway through an Apply.
+    '''
+
+def interrupt_at(number):
+    '''
+    Makes a progress callback that fails once enough craters are done.
+
+    Args:
+        number (int): Number of craters done when the Apply fails
+
+    Returns:
+        progress <func>: Progress callback for run_apply()
+    '''
+    def progress(done):
+        if done >= number:
+            raise Interrupted("Connection lost")
+    return progress
+
+@pytest.mark.parametrize("batch", [True, False])
+@pytest.mark.parametrize("writer", WRITERS)
+def test_failed_create_leaves_no_nodes(writer, batch):
+    with mock_terragen(batch=batch) as server:
+        before = snapshot(server.project)
+        fail_create(server.project, "crater_shader", 40)
+        with pytest.raises(tg.Error):
+            run_apply(make_settings(quantity="200", **writer))
+        assert server.project.nodes_of_class("crater_shader") == []
+        assert snapshot(server.project) == before
+
+@pytest.mark.parametrize("writer", WRITERS)
+def test_interrupted_apply_is_cleaned_up(writer):
+    with mock_terragen() as server:
+        before = snapshot(server.project)
+        with pytest.raises(Interrupted):
+            run_apply(make_settings(quantity="300", **writer), progress=interrupt_at(120))
+        assert snapshot(server.project) == before
+
+@pytest.mark.parametrize("writer", [{}, {"rpc_workers": "3"}])
+def test_resume_matches_uninterrupted_apply(writer, files):
+    settings = make_settings(quantity="300", seed="5", **writer)
+    with mock_terragen() as server:
+        run_apply(settings)
+        uninterrupted = snapshot(server.project)
+    with mock_terragen() as server:
+        with pytest.raises(Interrupted):
+            run_apply(settings, progress=interrupt_at(120),
+                      checkpoint_path=files["checkpoint_path"])
+        result = resume_apply(files["checkpoint_path"])
+        assert result["resumed_from"] >= 120
+        assert snapshot(server.project) == uninterrupted
+    assert not os.path.exists(files["checkpoint_path"])
+
+@pytest.mark.parametrize("writer", WRITERS)
+def test_cancel_after_last_crater_connects_network(writer):
+    with mock_terragen() as server:
+        run_apply(make_settings(quantity="200", seed="5", **writer))
+        uncancelled = snapshot(server.project)
+    cancel_event = threading.Event()
+
+    def progress(done):
+        if done == 200:
+            cancel_event.set()
+
+    with mock_terragen() as server:
+        result = run_apply(make_settings(quantity="200", seed="5", **writer),
+                           progress=progress, cancel_event=cancel_event)
+        assert not result["cancelled"]
+        assert snapshot(server.project) == uncancelled
+
+def test_undo_restores_project(files):
+    with mock_terragen() as server:
+        before = snapshot(server.project)
+        run_apply(make_settings(quantity="100", insert_into_flow="Merge tree"),
+                  journal_path=files["journal_path"])
+        undo_last_run(files["journal_path"])
+        assert snapshot(server.project) == before
+
+def test_undo_deletes_checkpoint_of_undone_run(files):
+    with mock_terragen() as server:
+        before = snapshot(server.project)
+        with pytest.raises(Interrupted):
+            run_apply(make_settings(quantity="300", seed="5"), progress=interrupt_at(120),
+                      journal_path=files["journal_path"],
+                      checkpoint_path=files["checkpoint_path"])
+        assert os.path.exists(files["checkpoint_path"])
+        undo_last_run(files["journal_path"], checkpoint_path=files["checkpoint_path"])
+        assert snapshot(server.project) == before
+    assert not os.path.exists(files["checkpoint_path"])
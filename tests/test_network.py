@@ -0,0 +1,50 @@
+'''
+test_network.py - Checks that the parallel and pipelined crater writers
+build the same node network as the serial path.
+'''
+
+import pytest
+from conftest import make_settings, snapshot
+from crater_engine.mock_server import mock_terragen
+from crater_engine.pipeline import run_apply
+
+WRITERS = [
+    {"rpc_workers": "4"},
+    {"rpc_window": "8"},
+    {"rpc_workers": "3", "rpc_window": "4"},
+]
+FLOWS = ["Output > Main input", "Merge shader", "Merge tree"]
+
+
+def apply_snapshot(batch=True, **values):
+    '''
+    Runs Apply on a new mock project.
+
+    Args:
+        batch (bool): Whether the mock server accepts batched calls
+        values: Setting values, see make_settings()
+
+    Returns:
+        list: Snapshot of the project afterwards, see snapshot()
+    '''
+    with mock_terragen(batch=batch) as server:
+        run_apply(make_settings(**values))
+        return snapshot(server.project)
+
+@pytest.mark.parametrize("flow", FLOWS)
+@pytest.mark.parametrize("writer", WRITERS)
+def test_writer_matches_serial(writer, flow):
+    serial = apply_snapshot(quantity="300", seed="5", insert_into_flow=flow)
+    assert apply_snapshot(quantity="300", seed="5", insert_into_flow=flow, **writer) == serial
+
+@pytest.mark.parametrize("writer", [{}] + WRITERS)
+def test_unbatched_matches_batched(writer):
+    batched = apply_snapshot(quantity="200", seed="7", **writer)
+    assert apply_snapshot(batch=False, quantity="200", seed="7", **writer) == batched
+
+def test_serial_network_has_every_crater():
+    with mock_terragen() as server:
+        result = run_apply(make_settings(quantity="300", seed="5"))
+        craters = server.project.nodes_of_class("crater_shader")
+    assert len(craters) == result["craters_added"] == 300
+    assert not result["cancelled"]
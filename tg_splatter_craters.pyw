@@ -1,22 +1,42 @@
 '''
 tg_splatter_craters.py - Randomly splatters the Crater shader throughout
 the active Terragen project. Parameter values of the Crater shader are
-randomly chosen based on min/max values in the UI.
+randomly chosen based on min/max values in the UI. The window is a front
+end over crater_engine, which can also be run without it, see
+crater_engine/cli.py. Importing this module doesn't open a window.
 '''
 
+import json
 import os.path
-import random
+import queue
+import threading
+import time
 import traceback
 import tkinter as tk
 from tkinter import ttk
+from tkinter import filedialog
 from tkinter import messagebox
 from tkinter import TclError
-import terragen_rpc as tg
+from crater_engine.presets import PRESET_LABELS, preset_values
+from crater_engine.settings import (
+    DEFAULT_VALUES, DENSITY_MAP_SUFFIXES, INSERT_MODES, PLACEMENTS, RIM_SHADER_CLASSES,
+    SIZE_DISTRIBUTIONS, TARGET_MODES, TARGET_PLANS, ApplySettings, SettingsError)
+
+APPLY_POLL_MS = 100
+REPORT_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "tg_splatter_craters_report.json")
+MANIFEST_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "tg_splatter_craters_manifest.json")
+JOURNAL_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "tg_splatter_craters_journal.json")
+CHECKPOINT_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "tg_splatter_craters_checkpoint.jsonl")
 
 class ToolTip:
     '''
     Opens a tooltip window to display the description of the parameter
-    the cursor is hovering over.
+    the cursor is hovering over. The window is built the first time it
+    is shown and then hidden and reused, so none are built at startup.
     '''
     def __init__(self, widget, text, control_var):
         self.widget = widget
@@ -36,18 +56,20 @@ class ToolTip:
             x += self.widget.winfo_rootx() + 25
             y += self.widget.winfo_rooty() + 25
 
-            self.tooltip = tk.Toplevel(self.widget)
-            self.tooltip.wm_overrideredirect(True)
+            if self.tooltip is None:
+                self.tooltip = tk.Toplevel(self.widget)
+                self.tooltip.wm_overrideredirect(True)
+                label = tk.Label(self.tooltip,
+                                 text=self.text,
+                                 background="yellow",
+                                 relief="solid",
+                                 borderwidth=1,
+                                 justify="left",
+                                 anchor="w"
+                                 )
+                label.pack()
             self.tooltip.wm_geometry(f"+{x}+{y}")
-            label = tk.Label(self.tooltip,
-                             text=self.text,
-                             background="yellow",
-                             relief="solid",
-                             borderwidth=1,
-                             justify="left",
-                             anchor="w"
-                             )
-            label.pack()
+            self.tooltip.deiconify()
 
     def hide_tooltip(self, _event):
         '''
@@ -55,713 +77,640 @@ class ToolTip:
         The event argument is not used within this function.
         '''
         if self.tooltip:
-            self.tooltip.destroy()
-            self.tooltip = None
-
-gui = tk.Tk()
-gui.geometry("600x580")
-gui.title(os.path.basename(__file__))
-
-frame0 = tk.Frame(gui) # generic
-frame1 = tk.Frame(gui) # position
-frame2 = tk.Frame(gui) # crater params min max
-frame3 = tk.Frame(gui) # other buttons and widgets
-frame0.grid(row=0,column=0,padx=4,pady=4,sticky="WENS")
-frame1.grid(row=1,column=0,padx=4,pady=4,sticky="WENS")
-frame2.grid(row=2,column=0,padx=4,pady=4,sticky="WENS")
-frame3.grid(row=3,column=0,padx=4,pady=4,sticky="WENS")
+            self.tooltip.withdraw()
 
 def on_apply() -> None:
     '''
-    Triggers the creation of all new shaders to the project.
-    Including crater, group, and other shaders assigned to
-    the Crater's Rim shader input.
+    Validates the UI values once and hands the creation of all new
+    shaders to a background worker, so the window stays responsive.
 
     Returns:
         None
     '''
-    final_crater_group_name = get_group_name()
-    final_rim_shader_name = get_rim_shader_name()
-    compute_terrain_tuple = get_main_input_node()
-    add_mountain_or_valley()
-    crater_diameter = make_craters(final_crater_group_name, final_rim_shader_name)
-    add_fractal_warp(crater_diameter)
-    insert_into_network(compute_terrain_tuple)
-
-def insert_into_network(compute_terrain_tuple) -> None:
-    '''
-    Connect last node added to project to the first Compute terrain
-    node in project.
+    try:
+        settings = ApplySettings.from_values(get_apply_values())
+    except SettingsError as e:
+        info_message("error", "Please correct these values:\n\n" + str(e))
+        return
+    start_apply(settings)
 
-    Args:
-        all_compute_terrain_nodes [list]: Node ids of Compute terrain node
+def on_reapply() -> None:
+    '''
+    Validates the UI values and updates the craters of the last Apply to
+    match them, sending only the parameter values that changed.
 
     Returns:
         None
     '''
-    if insert_into_flow.get() == "Output > Main input":
-        set_compute_terrain_node_main_input(compute_terrain_tuple[0])
-    elif insert_into_flow.get() == "Merge shader":
-        merge_shader_path = add_merge_shader(compute_terrain_tuple)
-        main_input_node.set(merge_shader_path)
-        set_compute_terrain_node_main_input(compute_terrain_tuple[0])
-
-def add_fractal_warp(crater_diameter) -> None:
-    '''
-    Triggers a Fractal Warp shader to be added after all crater shaders
-    are added. Scale is based on crater diameter.
-
-    Args:
-        crater_diameter (float): Crater diameter
-    '''
-    if append_warp_var.get() is True:
-        fractal_warp_path = add_warp_shader(crater_diameter)
-        main_input_node.set(fractal_warp_path)
+    try:
+        settings = ApplySettings.from_values(get_apply_values())
+    except SettingsError as e:
+        info_message("error", "Please correct these values:\n\n" + str(e))
+        return
+    start_apply(settings, reapply=True)
 
-def make_craters(final_crater_group_name, final_rim_shader_name):
+def on_undo() -> None:
     '''
-    Triggers calculation of crater parameters and creation of crater nodes.
-
-    Args:
-        final_crater_group_name (str): Crater name as determined by Terragen
-        final_rim_shader_name (str): Path of shader assigned to rim shader
+    Asks for confirmation, then deletes every node the last Apply added
+    and restores the Compute terrain's Main input on a background worker.
 
     Returns:
-        crater_diameter (float): Diameter of last crater shader
-    '''
-    num_craters = int(quantity_var.get())
-    for _ in range(num_craters):
-        position_string = calc_position()
-        crater_diameter = get_random_float(dia_min_var.get(), dia_max_var.get())
-        depth = calc_depth(crater_diameter)
-        height = calc_rim_height(crater_diameter)
-        skirt = calc_rim_skirt(crater_diameter)
-        soft = get_random_float(soft_min_var.get(), soft_max_var.get())
-        tight = get_random_float(tight_min_var.get(), tight_max_var.get())
-        crater_params = [
-            position_string,
-            crater_diameter,
-            depth, height,
-            skirt,
-            soft,
-            tight,
-            final_crater_group_name,
-            final_rim_shader_name
-            ]
-        crater_path = add_crater(crater_params)
-        main_input_node.set(crater_path)
-    return crater_diameter
-
-def calc_position():
+        None
     '''
-    Calculate the position values
+    if not messagebox.askyesno(
+            "Undo last run",
+            "Delete every node the last Apply added and restore the Compute terrain's" \
+                " Main input?"):
+        return
+    set_run_buttons("disabled")
+    status_var.set("Undoing the last run...")
+    apply_state["start_time"] = time.perf_counter()
+    worker = threading.Thread(target=undo_worker, daemon=True)
+    worker.start()
+    gui.after(APPLY_POLL_MS, poll_apply_queue)
 
-    Returns:
-        (str) Calculated xyz coordinate position, i.e. "0.0 1.1 2.2"
+def undo_worker() -> None:
     '''
-    x_deviation = get_deviation(x_area_var.get())
-    z_deviation = get_deviation(z_area_var.get())
-    x_min = get_min_coordinate(x_deviation, x_pos_var.get())
-    x_max = get_max_coordinate(x_deviation, x_pos_var.get())
-    z_min = get_min_coordinate(z_deviation, z_pos_var.get())
-    z_max = get_max_coordinate(z_deviation, z_pos_var.get())
-    x_coord = get_random_float(x_min, x_max)
-    z_coord = get_random_float(z_min, z_max)
-    return str(x_coord) + " 0.0 " + str(z_coord)
-
-def calc_depth(crater_diameter):
-    '''
-    Calculate the depth of the crater, based on the crater's diameter
-
-    Args:
-        crater_diamter (float): Crater diameter
+    Undoes the last journaled run on the background worker thread and
+    reports the result or errors to the GUI through apply_queue.
 
     Returns:
-        depth (float): Crater depth
+        None
     '''
-    if depth_check_var.get():
-        depth = get_percentage_of_diameter(crater_diameter, depth_percent_var.get())
-        if depth_offset_var.get() is True:
-            offset_delta = depth * float(depth_percent_var.get())
-            depth = get_random_float(depth - offset_delta, depth + offset_delta)
-    else:
-        depth = get_random_float(depth_min_var.get(), depth_max_var.get())
-    return depth
+    try:
+        import terragen_rpc as tg
+        from crater_engine.journal import JournalError, undo_last_run
+    except ImportError as e:
+        apply_queue.put(("error", "Can't load the Apply pipeline: " + str(e)))
+        return
+    try:
+        undo_result = undo_last_run(
+            JOURNAL_FILE, MANIFEST_FILE, report_path=REPORT_FILE, checkpoint_path=CHECKPOINT_FILE)
+        apply_queue.put(("undone", undo_result))
+    except (JournalError, OSError) as e:
+        apply_queue.put(("error", str(e)))
+    except ConnectionError as e:
+        apply_queue.put(("error", "Terragen RPC connection error" + str(e)))
+    except TimeoutError as e:
+        apply_queue.put(("error", "Terragen RPC timeout error" + str(e)))
+    except tg.ReplyError as e:
+        apply_queue.put(("error", "Terragen RPC reply error" + str(e)))
+    except tg.ApiError:
+        apply_queue.put(("error", "Terragen RPC API error" + str(traceback.format_exc())))
+    except tg.Error as e:
+        apply_queue.put(("error", "Terragen RPC error" + str(e)))
+    except Exception as e: # always post a message, or the buttons stay disabled
+        apply_queue.put(("error", str(e)))
 
-def calc_rim_height(crater_diameter):
+def on_resume() -> None:
     '''
-    Calculate the rim height of the crater, based on the crater's diameter
-
-    Args:
-        crater_diameter (float): Crater diameter
+    Continues the last Apply that failed or was cancelled halfway, from
+    the crater after the last one it finished, with the same plan and
+    settings.
 
     Returns:
-        height (float): Crater height
-    '''
-    if rim_height_var.get():
-        height = get_percentage_of_diameter(crater_diameter, rim_height_percent_var.get())
-        if rim_height_offset_var.get() is True:
-            offset_delta = height * float(rim_height_percent_var.get())
-            height = get_random_float(height - offset_delta, height + offset_delta)
-    else:
-        height = get_random_float(rim_height_min.get(), rim_height_max.get())
-    return height
-
-def calc_rim_skirt(crater_diameter):
+        None
     '''
-    Calculate the rim skirt of the crater, based on the crater's diameter.
-
-    Args:
-        crater_diameter (float): Crater diameter
+    from crater_engine.checkpoint import CheckpointError, load_checkpoint, load_checkpoint_plan
+    from crater_engine.plan_file import PlanFileError
 
-    Returns:
-        skirt (float): Crater rim skirt
-    '''
-    if rim_skirt_var.get():
-        skirt = get_percentage_of_diameter(crater_diameter, rim_skirt_percent_var.get())
-        if rim_skirt_offset_var.get() is True:
-            rim_skirt_percent_float = float(rim_skirt_percent_var.get())
-            if rim_skirt_percent_float > 1.0:
-                rim_skirt_percent_float = 1 / rim_skirt_percent_float # here
-            offset_delta = skirt * rim_skirt_percent_float
-            skirt = get_random_float(skirt - offset_delta, skirt + offset_delta)
-    else:
-        skirt = get_random_float(skirt_min_var.get(), skirt_max_var.get())
-    return skirt
+    try:
+        crater_plan, settings = load_checkpoint_plan(load_checkpoint(CHECKPOINT_FILE))
+    except (CheckpointError, PlanFileError) as e:
+        info_message("error", str(e))
+        return
+    start_apply(settings, crater_plan, resume=True)
 
-def add_mountain_or_valley() -> None:
+def on_replay() -> None:
     '''
-    Triggers functions to add a Simple Shape shader to the project and
-    updates shader path to assign to Main input.
+    Asks for a crater plan file and adds its craters to the project with
+    the settings it was saved with, without sampling them again.
 
     Returns:
         None
     '''
-    if on_mountain_or_valley_var.get():
-        sss_node_id, sss_node_name = add_simple_shape_shader()
-        calc_sss_params(sss_node_id)
-        main_input_node.set(sss_node_name)
+    from crater_engine.plan_file import PlanFileError, default_cache_folder, load_replay
+
+    file_path = filedialog.askopenfilename(
+        title="Replay crater plan",
+        initialdir=default_cache_folder(),
+        filetypes=[("Crater plans", "*.npz"), ("All files", "*.*")]
+        )
+    if not file_path:
+        return
+    try:
+        crater_plan, settings = load_replay(file_path)
+    except PlanFileError as e:
+        info_message("error", str(e))
+        return
+    start_apply(settings, crater_plan)
 
-def get_group_name():
+def on_export() -> None:
     '''
-    Triggers creation of group node.
+    Validates the UI values, asks for a clip file and writes the crater
+    network to it on a background worker, without Terragen.
 
     Returns:
-        crater_group_name (str): Final group node name or empty string
+        None
     '''
-    if group_var.get():
-        final_crater_group_name = add_group(group_name_var.get())
-    else:
-        final_crater_group_name = ""
-    return final_crater_group_name
+    try:
+        settings = ApplySettings.from_values(get_apply_values())
+    except SettingsError as e:
+        info_message("error", "Please correct these values:\n\n" + str(e))
+        return
+    file_path = filedialog.asksaveasfilename(
+        title="Export clip file",
+        defaultextension=".tgc",
+        filetypes=[("Terragen clip files", "*.tgc"), ("All files", "*.*")]
+        )
+    if not file_path:
+        return
+    start_apply(settings, export_path=file_path)
 
-def get_rim_shader_name():
+def on_density_map() -> None:
     '''
-    Triggers creation of rim shader. Determines type of shader to be
-    assigned to rim shader, calls func to add shader to project.
+    Asks for a grayscale image to place the craters by.
 
     Returns:
-        rim_shader_name (str): Final name of shader assigned to rim shader parameter.
+        None
     '''
-    if rim_shader_check_var.get():
-        selected_rim_shader = rim_shader_classes[rim_shader.current()]
-        rim_shader_id, rim_shader_name = add_rim_shader(selected_rim_shader)
-        set_rim_shader_params(rim_shader_id,selected_rim_shader)
-    else:
-        rim_shader_name = ""
-    return rim_shader_name
+    patterns = " ".join("*" + suffix for suffix in DENSITY_MAP_SUFFIXES)
+    file_path = filedialog.askopenfilename(
+        title="Density map",
+        filetypes=[("Density maps", patterns), ("All files", "*.*")]
+        )
+    if file_path:
+        density_map_var.set(file_path)
 
-def add_rim_shader(shader_class):
+def start_apply(settings, crater_plan=None, reapply=False, export_path="",
+                resume=False) -> None:
     '''
-    Adds a shader to the project to be assigned to the crater's
-    rim shader input.
+    Starts the Apply worker and polls it for progress.
 
     Args:
-        shader_class (str): Type of shader to add
+        settings <obj>: ApplySettings
+        crater_plan (ndarray): Optional plan to add instead of sampling one
+        reapply (bool): Update the craters of the last Apply instead of adding new ones
+        export_path (str): Write the craters to this clip file instead of adding them
+        resume (bool): Continue the checkpointed Apply of crater_plan
 
     Returns:
-        node_id <obj>: Shader node id
-        node_name (str): Shader's name as determined by Terragen
-    '''
-    project = tg.root()
-    node_id = tg.create_child(project,shader_class)
-    node_name = node_id.name()
-    return node_id, node_name
-
-def set_rim_shader_params(rim_shader_id, selected_rim_shader) -> None:
+        None
     '''
-    Sets certain parameters for various Shader types assigned
-    to the crater's Rim shader input.
+    num_craters = len(crater_plan) if resume else settings.quantity
+    cancel_event.clear()
+    set_run_buttons("disabled")
+    cancel.config(state="normal")
+    progress_bar.config(maximum=max(num_craters, 1), value=0)
+    status_var.set("")
+    apply_state["num_craters"] = num_craters
+    apply_state["start_time"] = time.perf_counter()
+    worker = threading.Thread(
+        target=apply_worker, args=(settings, crater_plan, reapply, export_path, resume),
+        daemon=True)
+    worker.start()
+    gui.after(APPLY_POLL_MS, poll_apply_queue)
+
+def apply_worker(settings, crater_plan=None, reapply=False, export_path="",
+                 resume=False) -> None:
+    '''
+    Runs the Apply pipeline on the background worker thread and reports
+    progress, the result or errors to the GUI through apply_queue.
+    Sampled plans are kept in the plan cache so they can be replayed,
+    the manifest of every finished Apply is kept for Re-apply, every
+    run is journaled for Undo and checkpointed for Resume.
 
     Args:
-        rim_shader_id <obj>: Crater shader node id
-        selected_rim_shader (str): Class of assigned shader
+        settings <obj>: ApplySettings validated by on_apply()
+        crater_plan (ndarray): Optional plan to add instead of sampling one
+        reapply (bool): Update the craters of the last Apply instead of adding new ones
+        export_path (str): Write the craters to this clip file instead of adding them
+        resume (bool): Continue the checkpointed Apply instead of starting one
 
     Returns:
         None
     '''
+    # terragen_rpc, numpy and the pipeline are loaded on the first Apply,
+    # not at startup, so the window opens faster
     try:
-        if selected_rim_shader == "fake_stones_shader":
-            max_diameter = dia_max_var.get()
-            stone_scale = get_percentage_of_diameter(max_diameter, "0.01")
-            rim_shader_id.set_param("stone_scale",stone_scale)
+        import terragen_rpc as tg
+        from crater_engine.checkpoint import CheckpointError
+        from crater_engine.clip_export import export_clip
+        from crater_engine.culling import CameraError
+        from crater_engine.density import DensityMapError
+        from crater_engine.manifest import ManifestError
+        from crater_engine.pipeline import resume_apply, run_apply
+        from crater_engine.plan_file import PlanCache, PlanFileError
+        from crater_engine.reapply import run_reapply
+        from crater_engine.targets import TargetError
+    except ImportError as e:
+        apply_queue.put(("error", "Can't load the Apply pipeline: " + str(e)))
+        return
+    progress = lambda craters_done: apply_queue.put(("progress", craters_done))
+    try:
+        if export_path:
+            apply_queue.put(("exported", export_clip(
+                settings, export_path, progress=progress, cancel_event=cancel_event)))
+            return
+        if resume:
+            apply_result = resume_apply(
+                CHECKPOINT_FILE,
+                progress=progress,
+                cancel_event=cancel_event,
+                report_path=REPORT_FILE,
+                manifest_path=MANIFEST_FILE,
+                journal_path=JOURNAL_FILE
+                )
+        elif reapply:
+            apply_result = run_reapply(
+                settings,
+                MANIFEST_FILE,
+                progress=progress,
+                report_path=REPORT_FILE,
+                plan_cache=PlanCache(),
+                journal_path=JOURNAL_FILE
+                )
+        else:
+            apply_result = run_apply(
+                settings,
+                progress=progress,
+                cancel_event=cancel_event,
+                report_path=REPORT_FILE,
+                crater_plan=crater_plan,
+                plan_cache=PlanCache(),
+                manifest_path=MANIFEST_FILE,
+                journal_path=JOURNAL_FILE,
+                checkpoint_path=CHECKPOINT_FILE
+                )
+        apply_queue.put(("done", apply_result))
+    except (ManifestError, DensityMapError, CameraError, CheckpointError, PlanFileError,
+                TargetError) as e:
+        apply_queue.put(("error", str(e)))
     except ConnectionError as e:
-        info_message("error", "Terragen RPC connection error" + str(e))
+        apply_queue.put(("error", "Terragen RPC connection error" + str(e) + resume_hint()))
     except TimeoutError as e:
-        info_message("error", "Terragen RPC timeout error" + str(e))
+        apply_queue.put(("error", "Terragen RPC timeout error" + str(e) + resume_hint()))
     except tg.ReplyError as e:
-        info_message("error", "Terragen RPC reply error" + str(e))
+        apply_queue.put(("error", "Terragen RPC reply error" + str(e)))
     except tg.ApiError:
-        info_message("error", "Terragen RPC API error" + str(traceback.format_exc()))
+        apply_queue.put(("error", "Terragen RPC API error" + str(traceback.format_exc())))
+    except tg.Error as e:
+        apply_queue.put(("error", "Terragen RPC error" + str(e) + resume_hint()))
+    except OSError as e:
+        apply_queue.put(("error", "Can't write the file: " + str(e)))
+    except Exception as e: # always post a message, or the buttons stay disabled
+        apply_queue.put(("error", str(e)))
 
-def get_main_input_node():
+def resume_hint():
     '''
-    Get the first Compute terrain node in the project and whatever is
-    assigned to its Main input.
+    Tells how to continue after an Apply failed with a checkpoint.
 
     Returns:
-        all_compute_terrain_nodes []: Compute terrain node ids
-    '''
-    main_input_node.set("")
-    compute_terrain_tuple = ()
-    insert_mode = insert_into_flow.get()
-    if insert_mode == "Don't":
-        main_input_node.set("") # could break here instead
-    else:
-        compute_terrain_tuple = get_compute_terrain_nodes()
-        if compute_terrain_tuple:
-            if insert_mode == "Output > Main input":
-                main_input_node.set(compute_terrain_tuple[1])
-            else:
-                main_input_node.set("")
-    return compute_terrain_tuple
-
-def add_merge_shader(compute_terrain_tuple):
+        hint (str): Text to add to the error message, empty without a checkpoint
     '''
-    Add Merge shader to project, set params, and connect new crater
-    network to existing node network.
+    if not os.path.exists(CHECKPOINT_FILE):
+        return ""
+    return "\n\nThe craters added so far are kept, click Resume to continue."
 
-    Args:
-        all_compute_terrain_nodes [list]: Compute terrain node ids
-        main_input_node (str): Path of node to assign to Main input
-
-    Returns:
-        node_name (str): Name of Merge shader added to project
-    '''
-    compute_terrain_main_input = compute_terrain_tuple[1]
-    try:
-        project = tg.root()
-        node_id = tg.create_child(project,'merge_shader')
-        node_id.set_param('input_node',compute_terrain_main_input)
-        node_id.set_param('shader_A',main_input_node.get())
-        node_id.set_param('mix_to_A',"1")
-        node_id.set_param('merge_colour',"1")
-        node_id.set_param('colour_merge_mode',"1")
-        node_id.set_param('merge_displacement',"1")
-        node_id.set_param('displace_merge_mode',"1")
-        node_name = node_id.name()
-    except ConnectionError as e:
-        info_message("error", "Terragen RPC connection error" + str(e))
-    except TimeoutError as e:
-        info_message("error", "Terragen RPC timeout error" + str(e))
-    except tg.ReplyError as e:
-        info_message("error", "Terragen RPC reply error" + str(e))
-    except tg.ApiError:
-        info_message("error", "Terragen RPC API error" + str(traceback.format_exc()))
-    return node_name
-
-def info_message(message_title, message_description) -> None:
+def set_run_buttons(state) -> None:
     '''
-    Opens window to display an info message.
+    Enables or disables the buttons that start a run.
 
     Args:
-        message_title (str): Name of program
-        message_description (str): Information message
-
-    Returns: None
-    '''
-    messagebox.showinfo(title = message_title, message = message_description)
-
-def add_simple_shape_shader():
-    '''
-    Adds a Simple Shape shader to the project.
+        state (str): "normal" or "disabled"
 
     Returns:
-        node_id <obj>: Simple Shape shader's node id
-        node_name (str): Simple Shape shader's name
+        None
     '''
-    try:
-        project = tg.root()
-        node_id = tg.create_child(project,'simple_shape_shader')
-        node_name = node_id.name()
-    except ConnectionError as e:
-        info_message("error", "Terragen RPC connection error" + str(e))
-    except TimeoutError as e:
-        info_message("error", "Terragen RPC timeout error" + str(e))
-    except tg.ReplyError as e:
-        info_message("error", "Terragen RPC reply error" + str(e))
-    except tg.ApiError:
-        info_message("error", "Terragen RPC API error" + str(traceback.format_exc()))
-    return node_id, node_name
+    for button in (apply, replay, reapply_button, undo, export, resume):
+        button.config(state=state)
 
-def calc_sss_params(node_id) -> None:
+def poll_apply_queue() -> None:
     '''
-    Calculates the parameter values for a Simple Shape shader and calls
-    func to update sss node.
+    Handles the messages posted by the Apply and Undo workers. Reschedules
+    itself until the worker has finished.
 
     Returns:
         None
     '''
-    position = str(x_pos_var.get()) + " 0.0 " + str(z_pos_var.get())
-    shape = "1" # circle / elipse
-    size = mountain_valley_size()
-    displacement_amp = str(amplitude_var.get())
-    displacement_edge_profile = "1" # smooth step
-    displacement_edge_width = "100" # max smoothing
-    displacement_edge_units = "1" # percent ?
-    apply_displacement = "1"
-    sss_param_values = [
-        position,
-        shape,
-        size,
-        displacement_amp,
-        displacement_edge_profile,
-        displacement_edge_width,
-        displacement_edge_units,
-        main_input_node.get(),
-        apply_displacement
-        ]
-    set_sss_params(node_id, sss_param_values)
-
-def set_sss_params(node_id, sss_param_values) -> None:
+    finished = False
+    while True:
+        try:
+            message = apply_queue.get_nowait()
+        except queue.Empty:
+            break
+        if message[0] == "progress":
+            show_progress(message[1])
+        elif message[0] == "done":
+            show_apply_result(message[1])
+            finished = True
+        elif message[0] == "undone":
+            show_undo_result(message[1])
+            finished = True
+        elif message[0] == "exported":
+            show_export_result(message[1])
+            finished = True
+        else:
+            status_var.set("Apply failed")
+            info_message("error", message[1])
+            finished = True
+    if finished:
+        set_run_buttons("normal")
+        cancel.config(state="disabled")
+    else:
+        gui.after(APPLY_POLL_MS, poll_apply_queue)
+
+def show_progress(craters_done) -> None:
     '''
-    Sets a Simple Shape shader's parameters in the project.
+    Updates the progress bar, throughput and estimated time remaining.
 
     Args:
-        node_id <obj>: Simple Shape shader's node id.
-        sss_params [list]: Parameter values as strings.
+        craters_done (int): Number of craters added so far
 
     Returns:
         None
     '''
-    sss_params = [
-        "position",
-        "type_of_shape",
-        "size",
-        "displacement_amplitude",
-        "displacement_edge_profile",
-        "displacement_edge_width",
-        "displacement_edge_units",
-        "input_node",
-        "apply_displacement"
-    ]
-    for index, value in enumerate(sss_params):
-        try:
-            node_id.set_param(value, sss_param_values[index])
-        except ConnectionError as e:
-            info_message("error", "Terragen RPC connection error" + str(e))
-        except TimeoutError as e:
-            info_message("error", "Terragen RPC timeout error" + str(e))
-        except tg.ReplyError as e:
-            info_message("error", "Terragen RPC reply error" + str(e))
-        except tg.ApiError:
-            info_message("error", "Terragen RPC API error" + str(traceback.format_exc()))
-
-def mountain_valley_size():
-    '''
-    Calculates the size needed for the Simple Shape shader
-    acting as the mountain or valley node.
+    num_craters = apply_state["num_craters"]
+    elapsed = time.perf_counter() - apply_state["start_time"]
+    progress_bar.config(value=craters_done)
+    craters_per_second = craters_done / elapsed if elapsed > 0 else 0.0
+    if craters_per_second > 0:
+        eta = (num_craters - craters_done) / craters_per_second
+        status_var.set(
+            f"{craters_done}/{num_craters} craters, "
+            f"{craters_per_second:.1f}/s, ETA {eta:.0f}s"
+            )
+    else:
+        status_var.set(f"{craters_done}/{num_craters} craters")
 
-    Returns:
-        size_str (str): XY size values
+def show_apply_result(apply_result) -> None:
     '''
-    max_area = max(float(x_area_var.get()), float(y_area_var.get()))
-    size = max_area + float(dia_max_var.get())
-    size_str = f"{size} {size}"
-    return size_str
+    Displays the number of craters added and round-trips used.
 
-def add_group(group_name):
+    Args:
+        apply_result (dict): Result returned by run_apply() or run_reapply()
+
+    Returns:
+        None
     '''
-    Adds a group node to the project.
+    craters_added = apply_result["craters_added"]
+    progress_bar.config(maximum=max(craters_added, 1), value=craters_added)
+    elapsed = time.perf_counter() - apply_state["start_time"]
+    summary = (
+        f"{craters_added} craters in {elapsed:.1f}s, {apply_result['round_trips']} round-trips "
+        f"({apply_result['round_trips_per_crater']:.2f} per crater), "
+        f"depth {apply_result['network_depth']}, seed {apply_result['seed']}"
+        )
+    if "params_set" in apply_result:
+        summary = (
+            f"Re-applied {apply_result['num_craters']} craters in {elapsed:.1f}s: "
+            f"{apply_result['params_set']} values set, {apply_result['craters_added']} added, "
+            f"{apply_result['craters_deleted']} deleted, {apply_result['round_trips']} round-trips, "
+            f"seed {apply_result['seed']}"
+            )
+    culling = apply_result.get("culling")
+    if culling:
+        summary += (
+            f", {culling['craters_culled']} culled "
+            f"({culling['evaluation_saved']:.0%} fewer crater evaluations)"
+            )
+    raster = apply_result.get("raster")
+    if raster:
+        summary += f", {raster['craters_rasterized']} rasterized"
+    if apply_result.get("targets"):
+        summary += f", into {len(apply_result['targets'])} Compute terrain nodes"
+    if apply_result.get("resumed_from"):
+        summary = f"Resumed from crater {apply_result['resumed_from']}: " + summary
+    if apply_result["cancelled"]:
+        summary = "Cancelled after " + summary
+        if not apply_result.get("targets"):
+            summary += ", Resume continues"
+    status_var.set(summary)
+
+def show_undo_result(undo_result) -> None:
+    '''
+    Displays the number of nodes the undo deleted.
 
     Args:
-        group_name (str): Name suggested for group by user.
+        undo_result (dict): Result returned by undo_last_run()
 
     Returns:
-        crater_name (str): Final name as determined by Terragen.
+        None
     '''
-    try:
-        project = tg.root()
-        crater_group_id = tg.create_child(project,'group')
-        crater_group_id.set_param('name', group_name)
-        crater_name = crater_group_id.get_param('name')
-    except ConnectionError as e:
-        info_message("error", "Terragen RPC connection error" + str(e))
-    except TimeoutError as e:
-        info_message("error", "Terragen RPC timeout error" + str(e))
-    except tg.ReplyError as e:
-        info_message("error", "Terragen RPC reply error" + str(e))
-    except tg.ApiError:
-        info_message("error", "Terragen RPC API error" + str(traceback.format_exc()))
-    return crater_name
+    elapsed = time.perf_counter() - apply_state["start_time"]
+    summary = (
+        f"Undid run {undo_result['run_id']}: {undo_result['nodes_deleted']} nodes deleted in "
+        f"{elapsed:.1f}s, {undo_result['round_trips']} round-trips"
+        )
+    if undo_result["nodes_missing"]:
+        summary += f", {undo_result['nodes_missing']} were already gone"
+    progress_bar.config(value=0)
+    status_var.set(summary)
 
-def add_warp_shader(crater_diameter):
+def show_export_result(export_result) -> None:
     '''
-    Adds a warp shader to the project. Sets its parameters based on the crater diameter.
+    Displays the clip file written and the node to connect it by.
 
     Args:
-        crater_diameter (float): Diameter of last crater added
+        export_result (dict): Result returned by export_clip()
 
     Returns:
-        fractal_warp_path (str): Path of Warp shader added to project.
+        None
     '''
-    try:
-        project = tg.root()
-        fractal_warp_node = tg.create_child(project, 'fractal_warp_shader')
-        fractal_warp_node.set_param('input_node', main_input_node.get())
-        scale = crater_diameter * .25
-        fractal_warp_node.set_param('scale',scale)
-        fractal_warp_path = fractal_warp_node.path()
-    except ConnectionError as e:
-        info_message("error", "Terragen RPC connection error" + str(e))
-    except TimeoutError as e:
-        info_message("error", "Terragen RPC timeout error" + str(e))
-    except tg.ReplyError as e:
-        info_message("error", "Terragen RPC reply error" + str(e))
-    except tg.ApiError:
-        info_message("error", "Terragen RPC API error" + str(traceback.format_exc()))
-    return fractal_warp_path
+    craters_written = export_result["craters_written"]
+    progress_bar.config(maximum=max(craters_written, 1), value=craters_written)
+    if export_result["cancelled"]:
+        status_var.set(f"Export cancelled after {craters_written} craters, no file written")
+        return
+    status_var.set(
+        f"Exported {craters_written} craters in {export_result['elapsed']:.1f}s, "
+        f"{export_result['megabytes_per_second']:.1f} MB/s, seed {export_result['seed']}"
+        )
+    if export_result["output"]:
+        info_message(
+            "Export",
+            f"Wrote {export_result['nodes_written']} nodes to {export_result['file']}." \
+                f"\n\nAfter importing it, connect {export_result['output']} to the" \
+                    " Compute terrain's Main input.")
 
-def set_compute_terrain_node_main_input(compute_terrain) -> None:
-    '''
-    Sets the Main input the Compute terrain node after all craters and
-    shaders are added to the project.
-    
-    Args:
-        compute_terrain <obj>: Compute terrain node id
+def on_report() -> None:
     '''
-    try:
-        compute_terrain_node = tg.node_by_path(compute_terrain)
-        compute_terrain_node.set_param('input_node',main_input_node.get())
-    except ConnectionError as e:
-        info_message("error", "Terragen RPC connection error" + str(e))
-    except TimeoutError as e:
-        info_message("error", "Terragen RPC timeout error" + str(e))
-    except tg.ReplyError as e:
-        info_message("error", "Terragen RPC reply error" + str(e))
-    except tg.ApiError:
-        info_message("error", "Terragen RPC API error" + str(traceback.format_exc()))
-
-def get_compute_terrain_nodes():
-    '''    
-    Gets first compute terrain node and returns its id and path of shader assigned to its main input
+    Displays the timing report of the last Apply, including failed ones.
 
-    Example:
-        ('/Compute Terrain', 'Fractal warp shader 01')
-
-    Return:
-        compute_terrain_list (tuple): Compute terrain path, input_node assingment
+    Returns:
+        None
     '''
-    try:
-        project = tg.root()
-        compute_terrain_node_ids = project.children_filtered_by_class('compute_terrain')
-        if compute_terrain_node_ids:
-            for node in compute_terrain_node_ids:
-                node_path = node.path()
-                node_input = node.get_param('input_node')
-                compute_terrain_tuple = (node_path, node_input)
-                break # quit after first
-    except ConnectionError as e:
-        info_message("error", "Terragen RPC connection error" + str(e))
-    except TimeoutError as e:
-        info_message("error", "Terragen RPC timeout error" + str(e))
-    except tg.ReplyError as e:
-        info_message("error", "Terragen RPC reply error" + str(e))
-    except tg.ApiError:
-        info_message("error", "Terragen RPC API error" + str(traceback.format_exc()))
-    return compute_terrain_tuple
-
-def get_compute_terrain_nodes_old1():
-    '''    
-    Gets all compute terrain nodes in project at root level and
-    returns their node path and main input parameter assignment
+    from crater_engine.instrument import report_summary
 
-    Example:
-        [('/Compute Terrain', 'Fractal warp shader 01'), ('Compute terrain 01', 'Heightfield 01')]
-
-    Return:
-        compute_terrain_list [tuples]: Compute terrain path, input_node assingment
-    '''
-    compute_terrain_list = []
     try:
-        project = tg.root()
-        compute_terrain_node_ids = project.children_filtered_by_class('compute_terrain')
-        if compute_terrain_node_ids:
-            for node in compute_terrain_node_ids:
-                node_path = node.path()
-                node_input = node.get_param('input_node')
-                compute_terrain_tuple = (node_path, node_input)
-                compute_terrain_list.append(compute_terrain_tuple)
-    except ConnectionError as e:
-        info_message("error", "Terragen RPC connection error" + str(e))
-    except TimeoutError as e:
-        info_message("error", "Terragen RPC timeout error" + str(e))
-    except tg.ReplyError as e:
-        info_message("error", "Terragen RPC reply error" + str(e))
-    except tg.ApiError:
-        info_message("error", "Terragen RPC API error" + str(traceback.format_exc()))
-    return compute_terrain_list
+        with open(REPORT_FILE, encoding="utf-8") as file:
+            report = json.load(file)
+    except (OSError, ValueError):
+        info_message("Report", "No Apply report yet. Click Apply first.")
+        return
+    info_message("Report", report_summary(report) + "\n\nFull report: " + REPORT_FILE)
 
-def add_crater(crater_params):
+def on_preview() -> None:
     '''
-    Add a Crater shader to the project.
-
-    Args:
-        crater_params []: Values to assign to new Crater shader parameters
-        main_input_node (str): Path of node to assign as Main input
+    Draws the craters of the current values as a shaded height image in
+    the preview window, without Terragen.
 
     Returns:
-        crater_id <obj>: Crater shader node id
-        crater_path (str): Path of Crater shader
+        None
     '''
     try:
-        project = tg.root()
-        crater_id = tg.create_child(project, 'crater_shader')
-        crater_path = crater_id.path()
-        set_crater_params(crater_id, crater_params) # HERE 5
-    except ConnectionError as e:
-        info_message("error", "Terragen RPC connection error" + str(e))
-    except TimeoutError as e:
-        info_message("error", "Terragen RPC timeout error" + str(e))
-    except tg.ReplyError as e:
-        info_message("error", "Terragen RPC reply error" + str(e))
-    except tg.ApiError:
-        info_message("error", "Terragen RPC API error" + str(traceback.format_exc()))
-    return crater_path
+        settings = ApplySettings.from_values(get_apply_values())
+    except SettingsError as e:
+        info_message("error", "Please correct these values:\n\n" + str(e))
+        return
+    from crater_engine.density import DensityMapError
+    from crater_engine.preview import render_preview
 
-def set_crater_params(crater_id, crater_params) -> None:
-    '''
-    Set the parameter values for the current Crater shader.
+    try:
+        preview = render_preview(settings)
+    except DensityMapError as e:
+        info_message("error", str(e))
+        return
+    show_preview(preview)
 
-    Args:
-        crater_id <obj>: Crater node id
-        crater_params []: Parameter values to assign to Crater shader.
-        main_input_node (st): Path of node to assing to Main input
-    
-    Returns:
-        None
+def show_preview(preview) -> None:
     '''
-    crater_param_names = [
-        "center",
-        "diameter",
-        "depth",
-        "rim_height",
-        "rim_skirt",
-        "rim_softness",
-        "rim_tightness",
-        "gui_group",
-        "rim_shader"
-        ]
-    for i, value in enumerate(crater_param_names):
-        crater_id.set_param(value,crater_params[i])
-    if main_input_node.get():
-        crater_id.set_param('input_node',main_input_node.get())
-
-def get_min_coordinate(deviation, center):
-    '''
-    Subtract the deviation from the coordiate value to determine the minimum axis value
+    Shows a preview image, opening the preview window if it isn't open.
 
     Args:
-        deviation (float): Absolute maximum value to deviate
-        center (string): Axis value
+        preview (dict): Result returned by render_preview()
 
     Returns:
-        round_value (float): Minimum coordinate value rounded to two decimal places.
+        None
     '''
-    try:
-        minimum_value = float(center) - deviation
-    except ValueError:
-        minimum_value = -deviation
-    rounded_value = round(minimum_value, 2)
-    return rounded_value
+    window = preview_state["window"]
+    if window is None or not window.winfo_exists():
+        window = tk.Toplevel(gui)
+        window.title("Preview")
+        canvas = tk.Canvas(window,highlightthickness=0)
+        canvas.grid(row=0,column=0,columnspan=3,padx=4,pady=4)
+        tk.Button(window,text="Refresh",command=on_preview).grid(
+            row=1,column=0,padx=4,pady=4,sticky="w")
+        use_seed = tk.Button(window,text="Use seed",command=on_use_preview_seed)
+        use_seed.grid(row=1,column=1,padx=4,pady=4,sticky="w")
+        ToolTip(
+            use_seed,
+            text="Enters the seed of this preview, so Apply adds these craters.",
+            control_var=show_tooltips_var
+            )
+        tk.Label(window,textvariable=preview_status_var,justify="left").grid(
+            row=2,column=0,columnspan=3,padx=4,pady=4,sticky="w")
+        preview_state.update(window=window, canvas=canvas)
+    # keep a reference, Tk drops images Python no longer holds
+    preview_state["image"] = tk.PhotoImage(data=preview["image"], format="PPM")
+    preview_state["seed"] = preview["seed"]
+    canvas = preview_state["canvas"]
+    canvas.config(width=preview["width"], height=preview["height"])
+    canvas.delete("all")
+    canvas.create_image(0, 0, anchor="nw", image=preview_state["image"])
+    low, high = preview["height_range"]
+    preview_status_var.set(
+        f"{preview['num_craters']} craters, {preview['num_marked']} marked as Crater shaders, " \
+        f"seed {preview['seed']}\nDisplacement {low:.1f} to {high:.1f}, top edge at minimum z, " \
+        f"drawn in {preview['elapsed']:.2f}s"
+        )
+    window.lift()
 
-def get_max_coordinate(deviation, center):
+def on_use_preview_seed() -> None:
     '''
-    Adds the deviation from the coordiate value to determine the minimum axis value
-
-    Args:
-        deviation (float): Absolute maximum value to deviate
-        center (string): Axis value
+    Enters the seed of the preview shown, so Apply adds the same craters.
 
     Returns:
-        rounded_value (float): Max value rounded to two decimal places.
+        None
     '''
-    try:
-        maximum_value = float(center) + deviation
-    except ValueError:
-        maximum_value = deviation
-    rounded_value = round(maximum_value, 2)
-    return rounded_value
+    if preview_state["seed"] is not None:
+        seed_var.set(str(preview_state["seed"]))
 
-def get_deviation(tolerance):
+def on_cancel() -> None:
     '''
-    Calculates half of the value given it.
+    Asks the Apply worker to stop after the current crater.
 
-    Args:
-        tolerance (float): The X or Z area value
-    
     Returns:
-        half_tolerance (float): Half of the area value
+        None
     '''
-    try:
-        half_tolerance = abs(float(tolerance) * 0.5)
-    except ValueError:
-        half_tolerance = 0.0
-    return half_tolerance
+    cancel_event.set()
+    cancel.config(state="disabled")
 
-def get_random_float(minimum, maximum):
+def get_apply_values():
     '''
-    Converts non-floating values to float and generates a random
-    floating value between the min and max arguements.
-
-    Args:
-        minimum (str): minimum value
-        maximum (str): maximum value
+    Snapshots the raw UI values used by the Apply pipeline, to be
+    validated by ApplySettings.from_values(). The worker thread never
+    reads Tk variables.
 
     Returns:
-        random_float (float): A randomized float value.
-    '''
-    try:
-        min_value = float(minimum)
-        max_value = float(maximum)
-    except ValueError:
-        min_value = 0.0
-        max_value = 1.0
-    random_float = random.uniform(min_value, max_value)
-    rounded_random_float = round(random_float, 2)
-    return rounded_random_float
-
-def get_percentage_of_diameter(diameter_value, percent):
+        values (dict): Raw UI values keyed by variable name, without "_var"
+    '''
+    return {
+        "quantity": quantity_var.get(),
+        "group": group_var.get(),
+        "group_name": group_name_var.get(),
+        "on_mountain_or_valley": on_mountain_or_valley_var.get(),
+        "amplitude": amplitude_var.get(),
+        "x_pos": x_pos_var.get(),
+        "z_pos": z_pos_var.get(),
+        "x_area": x_area_var.get(),
+        "y_area": y_area_var.get(),
+        "z_area": z_area_var.get(),
+        "dia_min": dia_min_var.get(),
+        "dia_max": dia_max_var.get(),
+        "depth_check": depth_check_var.get(),
+        "depth_percent": depth_percent_var.get(),
+        "depth_offset": depth_offset_var.get(),
+        "depth_min": depth_min_var.get(),
+        "depth_max": depth_max_var.get(),
+        "rim_height": rim_height_var.get(),
+        "rim_height_percent": rim_height_percent_var.get(),
+        "rim_height_offset": rim_height_offset_var.get(),
+        "rim_min": rim_min_var.get(),
+        "rim_max": rim_max_var.get(),
+        "rim_skirt": rim_skirt_var.get(),
+        "rim_skirt_percent": rim_skirt_percent_var.get(),
+        "rim_skirt_offset": rim_skirt_offset_var.get(),
+        "skirt_min": skirt_min_var.get(),
+        "skirt_max": skirt_max_var.get(),
+        "soft_min": soft_min_var.get(),
+        "soft_max": soft_max_var.get(),
+        "tight_min": tight_min_var.get(),
+        "tight_max": tight_max_var.get(),
+        "rim_shader_check": rim_shader_check_var.get(),
+        "rim_shader_class": RIM_SHADER_CLASSES[rim_shader.current()],
+        "insert_into_flow": insert_into_flow.get(),
+        "targets": targets.get(),
+        "target_names": target_names_var.get(),
+        "target_plan": target_plan.get(),
+        "append_warp": append_warp_var.get(),
+        "rpc_workers": rpc_workers_var.get(),
+        "plan_workers": plan_workers_var.get(),
+        "rpc_window": rpc_window_var.get(),
+        "rpc_retries": rpc_retries_var.get(),
+        "size_distribution": size_distribution.get(),
+        "size_exponent": size_exponent_var.get(),
+        "placement": placement.get(),
+        "spacing": spacing_var.get(),
+        "density_map": density_map_var.get(),
+        "cull_pixels": cull_pixels_var.get(),
+        "raster_below": raster_below_var.get(),
+        "raster_size": raster_size_var.get(),
+        "merge_fan_in": merge_fan_in_var.get(),
+        "seed": seed_var.get(),
+        }
+
+def info_message(message_title, message_description) -> None:
     '''
-    Calculates a rounded off portion of a percent of the 
-    value passed to it.  Typically a diameter and a percentage.
+    Opens window to display an info message.
 
     Args:
-        diameter_value (float): Typically a diameter value
-        percent (float): Percentage of diameter_value needed
+        message_title (str): Name of program
+        message_description (str): Information message
 
-    Returns:
-        rounded_percentage_of_diameter (float): A percentge of the diameter_value
+    Returns: None
     '''
-    try:
-        diameter_float = float(diameter_value)
-        percent_of_diameter_float = float(percent)
-    except ValueError:
-        diameter_float = 1.0
-        percent_of_diameter_float = 0.1
-    percent_of_diameter = diameter_float * percent_of_diameter_float
-    rounded_percent_of_diameter = round(percent_of_diameter, 2)
-    return rounded_percent_of_diameter
+    messagebox.showinfo(title = message_title, message = message_description)
 
 def on_clip() -> None:
     ''''
@@ -796,423 +745,703 @@ def on_reset() -> None:
 
 def apply_preset(preset) -> None:
     '''
-    Applies values from the preset crater dictionary to the script variables.
+    Applies values from a crater_engine preset to the script variables.
 
     Args:
-        preset (str) Name of preset and preset dictionary key
+        preset (str) Name of preset and CRATER_PRESETS key
 
     Returns:
         None
     '''
-    param_values = crater_dict[preset]
-    dia_min_var.set(param_values[0])
-    dia_max_var.set(param_values[1])
-    depth_min_var.set(param_values[2])
-    depth_max_var.set(param_values[3])
-    depth_percent_var.set(param_values[4])
-    rim_min_var.set(param_values[5])
-    rim_max_var.set(param_values[6])
-    rim_height_percent_var.set(param_values[7])
-    skirt_min_var.set(param_values[8])
-    skirt_max_var.set(param_values[9])
-    rim_skirt_percent_var.set(param_values[10])
-    soft_min_var.set(param_values[11])
-    soft_max_var.set(param_values[12])
-    tight_min_var.set(param_values[13])
-    tight_max_var.set(param_values[14])
-
-# dia min, dia max, depth min, depth max, depth percent
-# rim min, rim max, rim height percent,
-# skirt min, skirt max, rim skirt percent,
-# soft min, soft max, tight min, tight max
-crater_dict = {
-    "Very_tiny_craters": (
-        "1", "10", "0.005", "0.25", "0.25",
-        "0.05", "0.2", "0.1",
-        "1", "20", "2",
-        "0.15", "1", "2", "8"),
-    "Tiny_craters": (
-        "30", "100", "3", "12", "0.12",
-        "5", "30", "0.1",
-        "50", "150", "10",
-        "0.6", "1", "3", "5"),
-    "ALC_young": (
-        "1000", "10000", "100", "1000", "0.2",
-        "100", "200", "0.2",
-        "500", "4000", "0.4",
-        "0.2", "0.4", "10", "16"),
-    "Mid_50k-200k": (
-        "50000", "250000", "1000", "2000", "0.02",
-        "100", "1000", "0.01",
-        "1000", "10000", "0.1",
-        "0.01", "0.45", "3", "4"),
-    "Basins": (
-        "250000", "500000", "5000", "12000", "0.06",
-        "5000", "25000", "0.1",
-        "100000", "300000", "0.05",
-        "0.12", "0.05", "0.5", "6"),
-    "Sci-fi_basins": (
-        "250000", "500000", "5000", "12000", "0.06",
-        "10000", "150000", "0.4",
-        "100000", "300000", "0.05",
-        "0.12", "0.05", "0.5", "6")
-}
-
-# var
-show_tooltips_var = tk.BooleanVar()
-append_warp_var = tk.BooleanVar()
-quantity_var = tk.StringVar()
-quantity_var.set("1")
-group_var = tk.BooleanVar()
-group_name_var = tk.StringVar()
-group_name_var.set("Craters")
-on_mountain_or_valley_var = tk.BooleanVar()
-amplitude_var = tk.StringVar()
-amplitude_var.set('100.0')
-x_pos_var = tk.StringVar()
-x_pos_var.set("0.0")
-y_pos_var = tk.StringVar()
-y_pos_var.set("0.0")
-z_pos_var = tk.StringVar()
-z_pos_var.set("0.0")
-x_area_var = tk.StringVar()
-x_area_var.set("1000.0")
-y_area_var = tk.StringVar()
-y_area_var.set("0.0")
-z_area_var = tk.StringVar()
-z_area_var.set("1000.0")
-dia_min_var = tk.StringVar()
-dia_min_var.set("500.0")
-dia_max_var = tk.StringVar()
-dia_max_var.set("1500.0")
-depth_min_var = tk.StringVar()
-depth_min_var.set("50.0")
-depth_max_var = tk.StringVar()
-depth_max_var.set("150.0")
-depth_check_var = tk.BooleanVar()
-depth_percent_var = tk.StringVar()
-depth_percent_var.set("0.1")
-depth_offset_var = tk.BooleanVar()
-rim_min_var = tk.StringVar()
-rim_min_var.set("5.0")
-rim_max_var = tk.StringVar()
-rim_max_var.set("20.0")
-rim_height_var = tk.BooleanVar()
-rim_height_percent_var = tk.StringVar()
-rim_height_percent_var.set("0.1")
-rim_height_offset_var = tk.BooleanVar()
-skirt_min_var = tk.StringVar()
-skirt_min_var.set("500.0")
-skirt_max_var = tk.StringVar()
-skirt_max_var.set("1500.0")
-rim_skirt_var = tk.BooleanVar()
-rim_skirt_percent_var = tk.StringVar()
-rim_skirt_percent_var.set("0.1")
-rim_skirt_offset_var = tk.BooleanVar()
-rim_shader_check_var = tk.BooleanVar()
-soft_min_var = tk.StringVar()
-soft_min_var.set("0.0")
-soft_max_var = tk.StringVar()
-soft_max_var.set("1.0")
-tight_min_var = tk.StringVar()
-tight_min_var.set("0.0")
-tight_max_var = tk.StringVar()
-tight_max_var.set("16.0")
-rim_shader_classes = [
-    "alpine_fractal_shader_v2", "displacement_shader", "fake_stones_shader", "image_map_shader",
-    "power_fractal_shader_v3", "strata_and_outcrops_shader_v2", "twist_and_shear_shader"]
-main_input_node = tk.StringVar() # a node path i.e. "/Null 01"
-main_input_node.set("")
-
-# menu bar
-menubar = tk.Menu(gui)
-preset_menu = tk.Menu(menubar,tearoff=0)
-preset_menu.add_command(
-    label="Very tiny craters 1m-10m",
-    command=lambda: apply_preset("Very_tiny_craters")
-    )
-preset_menu.add_command(label="Tiny craters 30m-100m",command=lambda: apply_preset("Tiny_craters"))
-preset_menu.add_command(label="ALC young 1k-10k",command=lambda: apply_preset("ALC_young"))
-preset_menu.add_command(label="Mid 50k-200k",command=lambda: apply_preset("Mid_50k-200k"))
-preset_menu.add_command(label="Basins 250k-500k",command=lambda: apply_preset("Basins"))
-preset_menu.add_command(
-    label="Sci-Fi Basins 250k-500k",
-    command=lambda: apply_preset("Sci-fi_basins")
-    )
-menubar.add_cascade(label="Presets",menu=preset_menu)
-
-# frame0 - generic widgets
-show_tooltips = tk.Checkbutton(frame0,text="Show tooltips",variable=show_tooltips_var)
-show_tooltips.grid(row=0,column=0,padx=4,pady=4,sticky="w")
-
-crater_number = tk.Label(frame0,text="Number of craters:")
-crater_number.grid(row=1,column=0,padx=4,pady=4,sticky="w")
-crater_number_tooltip = ToolTip(
-    crater_number,
-    text="Add this amount of craters to the project.",
-    control_var=show_tooltips_var
-    )
-quantity = tk.Entry(frame0,textvariable=quantity_var)
-quantity.grid(row=1,column=1,padx=4,pady=4,sticky="w")
-
-crater_group = tk.Checkbutton(frame0,text="Group",variable=group_var)
-crater_group.grid(row=2, column=0,padx=4,pady=4,sticky="w")
-crater_group_tooltip = ToolTip(
-    crater_group,
-    text="When checked, the craters added to the project are \ngrouped" \
-         " together under this group name.",
-    control_var=show_tooltips_var
-    )
-crater_group_name = tk.Entry(frame0,textvariable=group_name_var)
-crater_group_name.grid(row=2, column=1, padx=4, pady=4, sticky="w")
-
-on_mountain_in_valley = tk.Checkbutton(
-    frame0,
-    text="On mountain or in valley?",
-    variable=on_mountain_or_valley_var
-    )
-on_mountain_in_valley.grid(row=3, column=0, padx=4, pady=4, sticky="w")
-on_mountain_in_valley_tooltip = ToolTip(
-    on_mountain_in_valley,
-    text="When checked, a Simple shape shader is first added to the" \
-         " \nproject which the craters rest on. Positive values create " \
-            "a \nhill and negative values create a valley. Can provide a" \
-                " subtle \nslope for downstream erosion nodes to work on.",
-            control_var=show_tooltips_var
+    param_values = preset_values(preset)
+    dia_min_var.set(param_values["dia_min"])
+    dia_max_var.set(param_values["dia_max"])
+    depth_min_var.set(param_values["depth_min"])
+    depth_max_var.set(param_values["depth_max"])
+    depth_percent_var.set(param_values["depth_percent"])
+    rim_min_var.set(param_values["rim_min"])
+    rim_max_var.set(param_values["rim_max"])
+    rim_height_percent_var.set(param_values["rim_height_percent"])
+    skirt_min_var.set(param_values["skirt_min"])
+    skirt_max_var.set(param_values["skirt_max"])
+    rim_skirt_percent_var.set(param_values["rim_skirt_percent"])
+    soft_min_var.set(param_values["soft_min"])
+    soft_max_var.set(param_values["soft_max"])
+    tight_min_var.set(param_values["tight_min"])
+    tight_max_var.set(param_values["tight_max"])
+    size_distribution.set(param_values["size_distribution"])
+    if "size_exponent" in param_values:
+        size_exponent_var.set(param_values["size_exponent"])
+
+if __name__ == "__main__":
+    gui = tk.Tk()
+    gui.geometry("600x900")
+    gui.title(os.path.basename(__file__))
+
+    frame0 = tk.Frame(gui) # generic
+    frame1 = tk.Frame(gui) # position
+    frame2 = tk.Frame(gui) # crater params min max
+    frame3 = tk.Frame(gui) # other buttons and widgets
+    frame0.grid(row=0,column=0,padx=4,pady=4,sticky="WENS")
+    frame1.grid(row=1,column=0,padx=4,pady=4,sticky="WENS")
+    frame2.grid(row=2,column=0,padx=4,pady=4,sticky="WENS")
+    frame3.grid(row=3,column=0,padx=4,pady=4,sticky="WENS")
+
+    # var
+    show_tooltips_var = tk.BooleanVar()
+    append_warp_var = tk.BooleanVar()
+    quantity_var = tk.StringVar()
+    quantity_var.set(DEFAULT_VALUES["quantity"])
+    group_var = tk.BooleanVar()
+    group_name_var = tk.StringVar()
+    group_name_var.set(DEFAULT_VALUES["group_name"])
+    on_mountain_or_valley_var = tk.BooleanVar()
+    amplitude_var = tk.StringVar()
+    amplitude_var.set(DEFAULT_VALUES["amplitude"])
+    x_pos_var = tk.StringVar()
+    x_pos_var.set(DEFAULT_VALUES["x_pos"])
+    y_pos_var = tk.StringVar()
+    y_pos_var.set("0.0")
+    z_pos_var = tk.StringVar()
+    z_pos_var.set(DEFAULT_VALUES["z_pos"])
+    x_area_var = tk.StringVar()
+    x_area_var.set(DEFAULT_VALUES["x_area"])
+    y_area_var = tk.StringVar()
+    y_area_var.set(DEFAULT_VALUES["y_area"])
+    z_area_var = tk.StringVar()
+    z_area_var.set(DEFAULT_VALUES["z_area"])
+    dia_min_var = tk.StringVar()
+    dia_min_var.set(DEFAULT_VALUES["dia_min"])
+    dia_max_var = tk.StringVar()
+    dia_max_var.set(DEFAULT_VALUES["dia_max"])
+    depth_min_var = tk.StringVar()
+    depth_min_var.set(DEFAULT_VALUES["depth_min"])
+    depth_max_var = tk.StringVar()
+    depth_max_var.set(DEFAULT_VALUES["depth_max"])
+    depth_check_var = tk.BooleanVar()
+    depth_percent_var = tk.StringVar()
+    depth_percent_var.set(DEFAULT_VALUES["depth_percent"])
+    depth_offset_var = tk.BooleanVar()
+    rim_min_var = tk.StringVar()
+    rim_min_var.set(DEFAULT_VALUES["rim_min"])
+    rim_max_var = tk.StringVar()
+    rim_max_var.set(DEFAULT_VALUES["rim_max"])
+    rim_height_var = tk.BooleanVar()
+    rim_height_percent_var = tk.StringVar()
+    rim_height_percent_var.set(DEFAULT_VALUES["rim_height_percent"])
+    rim_height_offset_var = tk.BooleanVar()
+    skirt_min_var = tk.StringVar()
+    skirt_min_var.set(DEFAULT_VALUES["skirt_min"])
+    skirt_max_var = tk.StringVar()
+    skirt_max_var.set(DEFAULT_VALUES["skirt_max"])
+    rim_skirt_var = tk.BooleanVar()
+    rim_skirt_percent_var = tk.StringVar()
+    rim_skirt_percent_var.set(DEFAULT_VALUES["rim_skirt_percent"])
+    rim_skirt_offset_var = tk.BooleanVar()
+    rim_shader_check_var = tk.BooleanVar()
+    soft_min_var = tk.StringVar()
+    soft_min_var.set(DEFAULT_VALUES["soft_min"])
+    soft_max_var = tk.StringVar()
+    soft_max_var.set(DEFAULT_VALUES["soft_max"])
+    tight_min_var = tk.StringVar()
+    tight_min_var.set(DEFAULT_VALUES["tight_min"])
+    tight_max_var = tk.StringVar()
+    tight_max_var.set(DEFAULT_VALUES["tight_max"])
+    status_var = tk.StringVar()
+    rpc_workers_var = tk.StringVar()
+    rpc_workers_var.set(DEFAULT_VALUES["rpc_workers"])
+    plan_workers_var = tk.StringVar()
+    plan_workers_var.set(DEFAULT_VALUES["plan_workers"])
+    rpc_window_var = tk.StringVar()
+    rpc_window_var.set(DEFAULT_VALUES["rpc_window"])
+    rpc_retries_var = tk.StringVar()
+    rpc_retries_var.set(DEFAULT_VALUES["rpc_retries"])
+    target_names_var = tk.StringVar()
+    target_names_var.set(DEFAULT_VALUES["target_names"])
+    size_exponent_var = tk.StringVar()
+    size_exponent_var.set(DEFAULT_VALUES["size_exponent"])
+    spacing_var = tk.StringVar()
+    spacing_var.set(DEFAULT_VALUES["spacing"])
+    density_map_var = tk.StringVar()
+    density_map_var.set(DEFAULT_VALUES["density_map"])
+    cull_pixels_var = tk.StringVar()
+    cull_pixels_var.set(DEFAULT_VALUES["cull_pixels"])
+    raster_below_var = tk.StringVar()
+    raster_below_var.set(DEFAULT_VALUES["raster_below"])
+    raster_size_var = tk.StringVar()
+    raster_size_var.set(DEFAULT_VALUES["raster_size"])
+    merge_fan_in_var = tk.StringVar()
+    merge_fan_in_var.set(DEFAULT_VALUES["merge_fan_in"])
+    seed_var = tk.StringVar()
+    seed_var.set(DEFAULT_VALUES["seed"])
+    apply_queue = queue.Queue() # messages from the Apply worker
+    cancel_event = threading.Event()
+    apply_state = {"num_craters": 0, "start_time": 0.0}
+    preview_state = {"window": None, "canvas": None, "image": None, "seed": None}
+    preview_status_var = tk.StringVar()
+
+    # menu bar
+    menubar = tk.Menu(gui)
+    preset_menu = tk.Menu(menubar,tearoff=0)
+    for preset_name, preset_label in PRESET_LABELS.items():
+        preset_menu.add_command(
+            label=preset_label,
+            command=lambda preset_name=preset_name: apply_preset(preset_name)
             )
-amplitude = tk.Entry(frame0, textvariable=amplitude_var)
-amplitude.grid(row=3, column=1, padx=4, pady=4, sticky="w")
-
-# frame 1 - position widgets
-area_center = tk.Label(frame1,text="Area centre x,y,z: ")
-area_center.grid(row=0,column=0,padx=4,pady=4,sticky="w")
-area_center_tooltip = ToolTip(
-    area_center,
-    text="Center position coordinates of the area volume.",
-    control_var=show_tooltips_var
-    )
-x_position = tk.Entry(frame1,textvariable=x_pos_var,width=10)
-x_position.grid(row=0,column=1,padx=4,pady=4,sticky="w")
-y_position = tk.Entry(frame1,textvariable=y_pos_var,width=10)
-y_position.grid(row=0,column=2,padx=4,pady=4,sticky="w")
-z_position = tk.Entry(frame1,textvariable=z_pos_var,width=10)
-z_position.grid(row=0,column=3,padx=4,pady=4,sticky="w")
-
-clip = tk.Button(frame1,text="Clip",command=on_clip)
-clip.grid(row=0,column=4,padx=4,pady=4,sticky="w")
-clip_tooltip = ToolTip(clip, text="Get coordinates from clipboard.", control_var=show_tooltips_var)
-
-reset = tk.Button(frame1,text="Reset",command=on_reset)
-reset.grid(row=0,column=5,padx=4,pady=4,sticky="w")
-reset_tooltip = ToolTip(reset, text="Reset coordinates to origin", control_var=show_tooltips_var)
-
-area_volume = tk.Label(frame1,text="Area volume x,y,z:")
-area_volume.grid(row=1,column=0,padx=4,pady=4,sticky="w")
-area_volume_tooltip = ToolTip(
-    area_volume,
-    control_var=show_tooltips_var,
-    text="The center of each crater is randomly generated within this" \
-         " \narea, around the area centre coordinates."
-         )
-x_area = tk.Entry(frame1,textvariable=x_area_var,width=10)
-x_area.grid(row=1,column=1,padx=4,pady=4,sticky="w")
-y_area = tk.Entry(frame1,textvariable=y_area_var,width=10)
-y_area.grid(row=1,column=2,padx=4,pady=4,sticky="w")
-y_area.config(state="readonly")
-z_area = tk.Entry(frame1,textvariable=z_area_var,width=10)
-z_area.grid(row=1,column=3,padx=4,pady=4,sticky="w")
-
-# frame 2 - crater params
-tk.Label(frame2,text="Minimum").grid(row=0,column=1,padx=4,pady=4,sticky="w")
-tk.Label(frame2,text="Maximum").grid(row=0,column=2,padx=4,pady=4,sticky="w")
-tk.Label(frame2,text="or % of diameter").grid(row=0,column=4,padx=4,pady=4,sticky="w")
-
-diameter = tk.Label(frame2,text="Diameter:")
-diameter.grid(row=1,column=0,padx=4,pady=4,sticky="w")
-diameter_tooltip = ToolTip(
-    diameter,
-    control_var=show_tooltips_var,
-    text="The diameter of each crater is randomly generated within" \
-         " \nthe min/max values. Terragen default = 1000 metres."
-         )
-diameter_min = tk.Entry(frame2,textvariable=dia_min_var,width=10)
-diameter_min.grid(row=1,column=1,padx=4,pady=4,sticky="w")
-diameter_max = tk.Entry(frame2,textvariable=dia_max_var,width=10)
-diameter_max.grid(row=1,column=2,padx=4,pady=4,sticky="w")
-
-depth_l = tk.Label(frame2,text="Depth:")
-depth_l.grid(row=2,column=0,padx=4,pady=4,sticky="w")
-depth_l_tooltip = ToolTip(
-    depth_l,
-    control_var=show_tooltips_var,
-    text="The depth value of each crater is randomly generated within" \
-         " \nthe min/max values. Terragen default = 100 metres."
-         )
-depth_min = tk.Entry(frame2,textvariable=depth_min_var,width=10)
-depth_min.grid(row=2,column=1,padx=4,pady=4,sticky="w")
-depth_max = tk.Entry(frame2,textvariable=depth_max_var,width=10)
-depth_max.grid(row=2,column=2,padx=4,pady=4,sticky="w")
-depth_check = tk.Checkbutton(frame2, variable=depth_check_var)
-depth_check.grid(row=2,column=3,padx=4,pady=4,sticky="w")
-depth_check_tooltip = ToolTip(
-    depth_check,
-    control_var=show_tooltips_var,
-    text="When checked, the percentage \nof diameter value is used" \
-      "\ninstead of the min/max values."
-      )
-depth_percent = tk.Entry(frame2,textvariable=depth_percent_var,width=10)
-depth_percent.grid(row=2,column=4,padx=4,pady=4,sticky="w")
-depth_offset = tk.Checkbutton(frame2,text="\u00B1 Offset",variable=depth_offset_var)
-depth_offset.grid(row=2,column=5,padx=4,pady=4,sticky="w")
-depth_offset_tooltip = ToolTip(
-    depth_offset,
-    control_var=show_tooltips_var,
-    text="When checked, and the crater depth is based on a % \nof the" \
-         " diameter, a random offset is applied to depth."
-         )
-
-rim_height = tk.Label(frame2,text="Rim height:")
-rim_height.grid(row=3,column=0,padx=4,pady=4,sticky="w")
-rim_height_tooltip = ToolTip(
-    rim_height,
-    control_var=show_tooltips_var,
-    text="The rim height value of each crater is randomly generated" \
-         " \nwithin the min/max values. Terragen default = 10 metres."
-         )
-
-rim_height_min = tk.Entry(frame2,textvariable=rim_min_var,width=10)
-rim_height_min.grid(row=3,column=1,padx=4,pady=4,sticky="w")
-rim_height_max = tk.Entry(frame2,textvariable=rim_max_var,width=10)
-rim_height_max.grid(row=3,column=2,padx=4,pady=4,sticky="w")
-
-rim_height_check = tk.Checkbutton(frame2,variable=rim_height_var)
-rim_height_check.grid(row=3,column=3,padx=4,pady=4,sticky="w")
-rim_height_check_tooltip = ToolTip(
-    rim_height_check,
-    control_var=show_tooltips_var,
-    text="When checked, the percentage \nof diameter value is used" \
-         " \ninstead of the min/max values."
-         )
-rim_height_percent = tk.Entry(frame2,textvariable=rim_height_percent_var,width=10)
-rim_height_percent.grid(row=3,column=4,padx=4,pady=4,sticky="w")
-rim_height_offset = tk.Checkbutton(frame2,text="\u00B1 Offset",variable=rim_height_offset_var)
-rim_height_offset.grid(row=3,column=5,padx=4,pady=4,sticky="w")
-rim_height_offset_tooltip = ToolTip(
-    rim_height_offset,
-    control_var=show_tooltips_var,
-    text="When checked, and the rim height is based on a % \nof the" \
-         " diameter, a random offset is applied to rim height."
-         )
-
-rim_skirt = tk.Label(frame2,text="Rim skirt:")
-rim_skirt.grid(row=4,column=0,padx=4,pady=4,sticky="w")
-rim_skirt_tooltip = ToolTip(
-    rim_skirt,
-    control_var=show_tooltips_var,
-    text="The rim skirt value of each crater is randomly generated" \
-         " \nwithin the min/max values. Terragen default = 1000 metres."
-         )
-
-rim_skirt_min = tk.Entry(frame2,textvariable=skirt_min_var,width=10)
-rim_skirt_min.grid(row=4,column=1,padx=4,pady=4,sticky="w")
-rim_skirt_max = tk.Entry(frame2,textvariable=skirt_max_var,width=10)
-rim_skirt_max.grid(row=4,column=2,padx=4,pady=4,sticky="w")
-
-rim_skirt_check = tk.Checkbutton(frame2,variable=rim_skirt_var)
-rim_skirt_check.grid(row=4,column=3,padx=4,pady=4,sticky="w")
-rim_skirt_check_tooltip = ToolTip(
-    rim_skirt_check,
-    control_var=show_tooltips_var,
-    text="When checked, the percentage \nof diameter value is used" \
-         " \ninstead of the min/max values"
-         )
-rim_skirt_percent = tk.Entry(frame2,textvariable=rim_skirt_percent_var,width=10)
-rim_skirt_percent.grid(row=4,column=4,padx=4,pady=4,sticky="w")
-rim_skirt_offset = tk.Checkbutton(frame2,text="\u00B1 offset",variable=rim_skirt_offset_var)
-rim_skirt_offset.grid(row=4,column=5,padx=4,pady=4,sticky="w")
-rim_skirt_offset_tooltip = ToolTip(
-    rim_skirt_offset,
-    control_var=show_tooltips_var,
-    text="When checked, and the rim skirt is based on a % \nof the" \
-         " diameter, a random offset is applied to rim skirt."
-         )
-
-rim_softness = tk.Label(frame2,text="Rim softness:")
-rim_softness.grid(row=5,column=0,padx=4,pady=4,sticky="w")
-rim_softness_tooltip = ToolTip(
-    rim_softness,
-    control_var=show_tooltips_var,
-    text="The rim softness value of each crater is randomly generated" \
-         " \nwithin the min/max values. Terragen default value is 0.125"
-         )
-rim_soft_min = tk.Entry(frame2,textvariable=soft_min_var,width=10)
-rim_soft_min.grid(row=5,column=1,padx=4,pady=4,sticky="w")
-rim_soft_max = tk.Entry(frame2,textvariable=soft_max_var,width=10)
-rim_soft_max.grid(row=5,column=2,padx=4,pady=4,sticky="w")
-
-rim_tightness = tk.Label(frame2,text="Rim tightness:")
-rim_tightness.grid(row=6,column=0,padx=4,pady=4,sticky="w")
-rim_tightness_tooltip = ToolTip(
-    rim_tightness,
-    control_var=show_tooltips_var,
-    text="The rim tightness value of each crater is randomly generated" \
-         " \nwithin the min/max values. Terragen default value is 4."
-         )
-rim_tight_min = tk.Entry(frame2,textvariable=tight_min_var,width=10)
-rim_tight_min.grid(row=6,column=1,padx=4,pady=4,sticky="w")
-rim_tight_max = tk.Entry(frame2,textvariable=tight_max_var,width=10)
-rim_tight_max.grid(row=6,column=2,padx=4,pady=4,sticky="w")
-
-rim_shader_check = tk.Checkbutton(frame2,text="Rim shader",variable=rim_shader_check_var)
-rim_shader_check.grid(row=7, column=0, padx=4, pady=4, sticky="w")
-rim_shader_check_tooltip = ToolTip(
-    rim_shader_check,
-    control_var=show_tooltips_var,
-    text="When checked, a new shader of the selected \ntype is assigned" \
-         " to all the craters in this group."
-         )
-rim_shader = ttk.Combobox(
-    frame2,
-    values=[
-        "Alpine","Displacement","Fake stones","Image map",
-        "Power fractal shader_v3","Strata_and_outcrops","Twist_and_shear"
-        ]
+    menubar.add_cascade(label="Presets",menu=preset_menu)
+
+    # frame0 - generic widgets
+    show_tooltips = tk.Checkbutton(frame0,text="Show tooltips",variable=show_tooltips_var)
+    show_tooltips.grid(row=0,column=0,padx=4,pady=4,sticky="w")
+
+    crater_number = tk.Label(frame0,text="Number of craters:")
+    crater_number.grid(row=1,column=0,padx=4,pady=4,sticky="w")
+    crater_number_tooltip = ToolTip(
+        crater_number,
+        text="Add this amount of craters to the project.",
+        control_var=show_tooltips_var
         )
-rim_shader.grid(row=7, column=1, padx=4, pady=4, sticky="w")
-rim_shader.current(0)
-
-# frame 3 - other widgets and buttons
-insert = tk.Label(frame3,text="Insertion mode:")
-insert.grid(row=0,column=0,padx=4,pady=4,sticky="w")
-insert_tooltip = ToolTip(
-    insert,
-    control_var=show_tooltips_var,
-    text="Don't - will not insert craters into the workflow. \nOutput" \
-         " > Main input inserts crater into the workflow \nMerge " \
-            "shader inserts craters via merge."
-            )
+    quantity = tk.Entry(frame0,textvariable=quantity_var)
+    quantity.grid(row=1,column=1,padx=4,pady=4,sticky="w")
+
+    crater_group = tk.Checkbutton(frame0,text="Group",variable=group_var)
+    crater_group.grid(row=2, column=0,padx=4,pady=4,sticky="w")
+    crater_group_tooltip = ToolTip(
+        crater_group,
+        text="When checked, the craters added to the project are \ngrouped" \
+             " together under this group name.",
+        control_var=show_tooltips_var
+        )
+    crater_group_name = tk.Entry(frame0,textvariable=group_name_var)
+    crater_group_name.grid(row=2, column=1, padx=4, pady=4, sticky="w")
+
+    on_mountain_in_valley = tk.Checkbutton(
+        frame0,
+        text="On mountain or in valley?",
+        variable=on_mountain_or_valley_var
+        )
+    on_mountain_in_valley.grid(row=3, column=0, padx=4, pady=4, sticky="w")
+    on_mountain_in_valley_tooltip = ToolTip(
+        on_mountain_in_valley,
+        text="When checked, a Simple shape shader is first added to the" \
+             " \nproject which the craters rest on. Positive values create " \
+                "a \nhill and negative values create a valley. Can provide a" \
+                    " subtle \nslope for downstream erosion nodes to work on.",
+                control_var=show_tooltips_var
+                )
+    amplitude = tk.Entry(frame0, textvariable=amplitude_var)
+    amplitude.grid(row=3, column=1, padx=4, pady=4, sticky="w")
+
+    seed_l = tk.Label(frame0,text="Seed:")
+    seed_l.grid(row=4,column=0,padx=4,pady=4,sticky="w")
+    seed_l_tooltip = ToolTip(
+        seed_l,
+        text="Leave empty for new random craters on every Apply. The seed" \
+             " \nof the last Apply is shown below the progress bar, enter" \
+                 " \nit here to add the same craters again.",
+        control_var=show_tooltips_var
+        )
+    seed = tk.Entry(frame0,textvariable=seed_var)
+    seed.grid(row=4,column=1,padx=4,pady=4,sticky="w")
+
+    # frame 1 - position widgets
+    area_center = tk.Label(frame1,text="Area centre x,y,z: ")
+    area_center.grid(row=0,column=0,padx=4,pady=4,sticky="w")
+    area_center_tooltip = ToolTip(
+        area_center,
+        text="Center position coordinates of the area volume.",
+        control_var=show_tooltips_var
+        )
+    x_position = tk.Entry(frame1,textvariable=x_pos_var,width=10)
+    x_position.grid(row=0,column=1,padx=4,pady=4,sticky="w")
+    y_position = tk.Entry(frame1,textvariable=y_pos_var,width=10)
+    y_position.grid(row=0,column=2,padx=4,pady=4,sticky="w")
+    z_position = tk.Entry(frame1,textvariable=z_pos_var,width=10)
+    z_position.grid(row=0,column=3,padx=4,pady=4,sticky="w")
+
+    clip = tk.Button(frame1,text="Clip",command=on_clip)
+    clip.grid(row=0,column=4,padx=4,pady=4,sticky="w")
+    clip_tooltip = ToolTip(clip, text="Get coordinates from clipboard.", control_var=show_tooltips_var)
+
+    reset = tk.Button(frame1,text="Reset",command=on_reset)
+    reset.grid(row=0,column=5,padx=4,pady=4,sticky="w")
+    reset_tooltip = ToolTip(reset, text="Reset coordinates to origin", control_var=show_tooltips_var)
+
+    area_volume = tk.Label(frame1,text="Area volume x,y,z:")
+    area_volume.grid(row=1,column=0,padx=4,pady=4,sticky="w")
+    area_volume_tooltip = ToolTip(
+        area_volume,
+        control_var=show_tooltips_var,
+        text="The center of each crater is randomly generated within this" \
+             " \narea, around the area centre coordinates."
+             )
+    x_area = tk.Entry(frame1,textvariable=x_area_var,width=10)
+    x_area.grid(row=1,column=1,padx=4,pady=4,sticky="w")
+    y_area = tk.Entry(frame1,textvariable=y_area_var,width=10)
+    y_area.grid(row=1,column=2,padx=4,pady=4,sticky="w")
+    y_area.config(state="readonly")
+    z_area = tk.Entry(frame1,textvariable=z_area_var,width=10)
+    z_area.grid(row=1,column=3,padx=4,pady=4,sticky="w")
+
+    placement_l = tk.Label(frame1,text="Placement:")
+    placement_l.grid(row=2,column=0,padx=4,pady=4,sticky="w")
+    placement_l_tooltip = ToolTip(
+        placement_l,
+        control_var=show_tooltips_var,
+        text="Uniform places each crater anywhere in the area volume. \nSpaced" \
+             " keeps craters apart by the spacing times their \naverage" \
+                 " diameter. Craters without room are left out."
+                 )
+    placement = ttk.Combobox(frame1,values=PLACEMENTS,width=10)
+    placement.grid(row=2,column=1,padx=4,pady=4,sticky="w")
+    placement.current(0)
+    spacing = tk.Entry(frame1,textvariable=spacing_var,width=10)
+    spacing.grid(row=2,column=2,padx=4,pady=4,sticky="w")
+    spacing_tooltip = ToolTip(
+        spacing,
+        control_var=show_tooltips_var,
+        text="Spacing. 1.0 lets crater rims touch, smaller values allow" \
+             " \nsome overlap and larger values leave gaps."
+             )
+
+    density_map_l = tk.Label(frame1,text="Density map:")
+    density_map_l.grid(row=3,column=0,padx=4,pady=4,sticky="w")
+    density_map_l_tooltip = ToolTip(
+        density_map_l,
+        control_var=show_tooltips_var,
+        text="Optional grayscale image stretched over the area, top row at" \
+             " \nminimum z. Brighter pixels get more craters, black none." \
+             " \n.pgm and .npy always work, .png, .tif and .bmp need Pillow."
+             )
+    density_map = tk.Entry(frame1,textvariable=density_map_var,width=32)
+    density_map.grid(row=3,column=1,columnspan=3,padx=4,pady=4,sticky="w")
+    density_map_browse = tk.Button(frame1,text="Browse...",command=on_density_map)
+    density_map_browse.grid(row=3,column=4,padx=4,pady=4,sticky="w")
+
+    cull_pixels_l = tk.Label(frame1,text="Cull below px:")
+    cull_pixels_l.grid(row=4,column=0,padx=4,pady=4,sticky="w")
+    cull_pixels_l_tooltip = ToolTip(
+        cull_pixels_l,
+        control_var=show_tooltips_var,
+        text="Optional. Leaves out craters narrower than this many pixels" \
+             " \nas seen from the render camera, so Terragen doesn't evaluate" \
+             " \ncraters too small or too far away to show. Empty keeps all."
+             )
+    cull_pixels = tk.Entry(frame1,textvariable=cull_pixels_var,width=10)
+    cull_pixels.grid(row=4,column=1,padx=4,pady=4,sticky="w")
+
+    raster_below_l = tk.Label(frame1,text="Raster below:")
+    raster_below_l.grid(row=5,column=0,padx=4,pady=4,sticky="w")
+    raster_below_l_tooltip = ToolTip(
+        raster_below_l,
+        control_var=show_tooltips_var,
+        text="Optional. Craters with a smaller diameter are drawn into one" \
+             " \nheightmap image shown by a single Image map shader instead" \
+             " \nof a Crater shader each. Empty adds every crater as a node."
+             )
+    raster_below = tk.Entry(frame1,textvariable=raster_below_var,width=10)
+    raster_below.grid(row=5,column=1,padx=4,pady=4,sticky="w")
+    raster_size = tk.Entry(frame1,textvariable=raster_size_var,width=10)
+    raster_size.grid(row=5,column=2,padx=4,pady=4,sticky="w")
+    raster_size_tooltip = ToolTip(
+        raster_size,
+        control_var=show_tooltips_var,
+        text="Heightmap size in pixels along the longer side of the area." \
+             " \nCraters only a few pixels wide lose their shape."
+             )
+
+    # frame 2 - crater params
+    tk.Label(frame2,text="Minimum").grid(row=0,column=1,padx=4,pady=4,sticky="w")
+    tk.Label(frame2,text="Maximum").grid(row=0,column=2,padx=4,pady=4,sticky="w")
+    tk.Label(frame2,text="or % of diameter").grid(row=0,column=4,padx=4,pady=4,sticky="w")
+
+    diameter = tk.Label(frame2,text="Diameter:")
+    diameter.grid(row=1,column=0,padx=4,pady=4,sticky="w")
+    diameter_tooltip = ToolTip(
+        diameter,
+        control_var=show_tooltips_var,
+        text="The diameter of each crater is randomly generated within" \
+             " \nthe min/max values. Terragen default = 1000 metres."
+             )
+    diameter_min = tk.Entry(frame2,textvariable=dia_min_var,width=10)
+    diameter_min.grid(row=1,column=1,padx=4,pady=4,sticky="w")
+    diameter_max = tk.Entry(frame2,textvariable=dia_max_var,width=10)
+    diameter_max.grid(row=1,column=2,padx=4,pady=4,sticky="w")
+
+    depth_l = tk.Label(frame2,text="Depth:")
+    depth_l.grid(row=2,column=0,padx=4,pady=4,sticky="w")
+    depth_l_tooltip = ToolTip(
+        depth_l,
+        control_var=show_tooltips_var,
+        text="The depth value of each crater is randomly generated within" \
+             " \nthe min/max values. Terragen default = 100 metres."
+             )
+    depth_min = tk.Entry(frame2,textvariable=depth_min_var,width=10)
+    depth_min.grid(row=2,column=1,padx=4,pady=4,sticky="w")
+    depth_max = tk.Entry(frame2,textvariable=depth_max_var,width=10)
+    depth_max.grid(row=2,column=2,padx=4,pady=4,sticky="w")
+    depth_check = tk.Checkbutton(frame2, variable=depth_check_var)
+    depth_check.grid(row=2,column=3,padx=4,pady=4,sticky="w")
+    depth_check_tooltip = ToolTip(
+        depth_check,
+        control_var=show_tooltips_var,
+        text="When checked, the percentage \nof diameter value is used" \
+          "\ninstead of the min/max values."
+          )
+    depth_percent = tk.Entry(frame2,textvariable=depth_percent_var,width=10)
+    depth_percent.grid(row=2,column=4,padx=4,pady=4,sticky="w")
+    depth_offset = tk.Checkbutton(frame2,text="\u00B1 Offset",variable=depth_offset_var)
+    depth_offset.grid(row=2,column=5,padx=4,pady=4,sticky="w")
+    depth_offset_tooltip = ToolTip(
+        depth_offset,
+        control_var=show_tooltips_var,
+        text="When checked, and the crater depth is based on a % \nof the" \
+             " diameter, a random offset is applied to depth."
+             )
 
-insert_into_flow = ttk.Combobox(frame3,values=["Don't","Output > Main input","Merge shader"])
-insert_into_flow.grid(row=0,column=1,padx=4,pady=4,sticky="w")
-insert_into_flow.current(1)
-
-append_warp = tk.Checkbutton(frame3,text="Append fractal warp shader?",variable=append_warp_var)
-append_warp.grid(row=1,column=0,padx=4,pady=4,sticky="w")
-append_warp_tooltip = ToolTip(
-    append_warp,
-    control_var=show_tooltips_var,
-    text="When checked, a Fractal warp shader is added to the \nproject" \
-         " after the last crater.  Its Scale value is approximately" \
-             " \n1/4 of the maximum Diameter parameter value."
+    rim_height = tk.Label(frame2,text="Rim height:")
+    rim_height.grid(row=3,column=0,padx=4,pady=4,sticky="w")
+    rim_height_tooltip = ToolTip(
+        rim_height,
+        control_var=show_tooltips_var,
+        text="The rim height value of each crater is randomly generated" \
+             " \nwithin the min/max values. Terragen default = 10 metres."
              )
 
-apply = tk.Button(frame3,text="Apply",command=on_apply)
-apply.grid(row=2,column=0,padx=4,pady=4,sticky="w")
-apply_tooltip = ToolTip(
-    apply,
-    text="Clicking this button will add the craters to the project.",
-    control_var=show_tooltips_var
-    )
+    rim_height_min = tk.Entry(frame2,textvariable=rim_min_var,width=10)
+    rim_height_min.grid(row=3,column=1,padx=4,pady=4,sticky="w")
+    rim_height_max = tk.Entry(frame2,textvariable=rim_max_var,width=10)
+    rim_height_max.grid(row=3,column=2,padx=4,pady=4,sticky="w")
+
+    rim_height_check = tk.Checkbutton(frame2,variable=rim_height_var)
+    rim_height_check.grid(row=3,column=3,padx=4,pady=4,sticky="w")
+    rim_height_check_tooltip = ToolTip(
+        rim_height_check,
+        control_var=show_tooltips_var,
+        text="When checked, the percentage \nof diameter value is used" \
+             " \ninstead of the min/max values."
+             )
+    rim_height_percent = tk.Entry(frame2,textvariable=rim_height_percent_var,width=10)
+    rim_height_percent.grid(row=3,column=4,padx=4,pady=4,sticky="w")
+    rim_height_offset = tk.Checkbutton(frame2,text="\u00B1 Offset",variable=rim_height_offset_var)
+    rim_height_offset.grid(row=3,column=5,padx=4,pady=4,sticky="w")
+    rim_height_offset_tooltip = ToolTip(
+        rim_height_offset,
+        control_var=show_tooltips_var,
+        text="When checked, and the rim height is based on a % \nof the" \
+             " diameter, a random offset is applied to rim height."
+             )
+
+    rim_skirt = tk.Label(frame2,text="Rim skirt:")
+    rim_skirt.grid(row=4,column=0,padx=4,pady=4,sticky="w")
+    rim_skirt_tooltip = ToolTip(
+        rim_skirt,
+        control_var=show_tooltips_var,
+        text="The rim skirt value of each crater is randomly generated" \
+             " \nwithin the min/max values. Terragen default = 1000 metres."
+             )
+
+    rim_skirt_min = tk.Entry(frame2,textvariable=skirt_min_var,width=10)
+    rim_skirt_min.grid(row=4,column=1,padx=4,pady=4,sticky="w")
+    rim_skirt_max = tk.Entry(frame2,textvariable=skirt_max_var,width=10)
+    rim_skirt_max.grid(row=4,column=2,padx=4,pady=4,sticky="w")
+
+    rim_skirt_check = tk.Checkbutton(frame2,variable=rim_skirt_var)
+    rim_skirt_check.grid(row=4,column=3,padx=4,pady=4,sticky="w")
+    rim_skirt_check_tooltip = ToolTip(
+        rim_skirt_check,
+        control_var=show_tooltips_var,
+        text="When checked, the percentage \nof diameter value is used" \
+             " \ninstead of the min/max values"
+             )
+    rim_skirt_percent = tk.Entry(frame2,textvariable=rim_skirt_percent_var,width=10)
+    rim_skirt_percent.grid(row=4,column=4,padx=4,pady=4,sticky="w")
+    rim_skirt_offset = tk.Checkbutton(frame2,text="\u00B1 offset",variable=rim_skirt_offset_var)
+    rim_skirt_offset.grid(row=4,column=5,padx=4,pady=4,sticky="w")
+    rim_skirt_offset_tooltip = ToolTip(
+        rim_skirt_offset,
+        control_var=show_tooltips_var,
+        text="When checked, and the rim skirt is based on a % \nof the" \
+             " diameter, a random offset is applied to rim skirt."
+             )
+
+    rim_softness = tk.Label(frame2,text="Rim softness:")
+    rim_softness.grid(row=5,column=0,padx=4,pady=4,sticky="w")
+    rim_softness_tooltip = ToolTip(
+        rim_softness,
+        control_var=show_tooltips_var,
+        text="The rim softness value of each crater is randomly generated" \
+             " \nwithin the min/max values. Terragen default value is 0.125"
+             )
+    rim_soft_min = tk.Entry(frame2,textvariable=soft_min_var,width=10)
+    rim_soft_min.grid(row=5,column=1,padx=4,pady=4,sticky="w")
+    rim_soft_max = tk.Entry(frame2,textvariable=soft_max_var,width=10)
+    rim_soft_max.grid(row=5,column=2,padx=4,pady=4,sticky="w")
+
+    rim_tightness = tk.Label(frame2,text="Rim tightness:")
+    rim_tightness.grid(row=6,column=0,padx=4,pady=4,sticky="w")
+    rim_tightness_tooltip = ToolTip(
+        rim_tightness,
+        control_var=show_tooltips_var,
+        text="The rim tightness value of each crater is randomly generated" \
+             " \nwithin the min/max values. Terragen default value is 4."
+             )
+    rim_tight_min = tk.Entry(frame2,textvariable=tight_min_var,width=10)
+    rim_tight_min.grid(row=6,column=1,padx=4,pady=4,sticky="w")
+    rim_tight_max = tk.Entry(frame2,textvariable=tight_max_var,width=10)
+    rim_tight_max.grid(row=6,column=2,padx=4,pady=4,sticky="w")
+
+    rim_shader_check = tk.Checkbutton(frame2,text="Rim shader",variable=rim_shader_check_var)
+    rim_shader_check.grid(row=7, column=0, padx=4, pady=4, sticky="w")
+    rim_shader_check_tooltip = ToolTip(
+        rim_shader_check,
+        control_var=show_tooltips_var,
+        text="When checked, a new shader of the selected \ntype is assigned" \
+             " to all the craters in this group."
+             )
+    rim_shader = ttk.Combobox(
+        frame2,
+        values=[
+            "Alpine","Displacement","Fake stones","Image map",
+            "Power fractal shader_v3","Strata_and_outcrops","Twist_and_shear"
+            ]
+            )
+    rim_shader.grid(row=7, column=1, padx=4, pady=4, sticky="w")
+    rim_shader.current(0)
+
+    size_distribution_l = tk.Label(frame2,text="Size distribution:")
+    size_distribution_l.grid(row=8, column=0, padx=4, pady=4, sticky="w")
+    size_distribution_l_tooltip = ToolTip(
+        size_distribution_l,
+        control_var=show_tooltips_var,
+        text="Uniform picks every diameter between min and max equally." \
+             " \nPower law makes many small craters and few large ones." \
+                 " \nThe larger the exponent, the more small craters."
+                 )
+    size_distribution = ttk.Combobox(frame2,values=SIZE_DISTRIBUTIONS)
+    size_distribution.grid(row=8, column=1, padx=4, pady=4, sticky="w")
+    size_distribution.current(0)
+    size_exponent = tk.Entry(frame2,textvariable=size_exponent_var,width=10)
+    size_exponent.grid(row=8, column=2, padx=4, pady=4, sticky="w")
+    size_exponent_tooltip = ToolTip(
+        size_exponent,
+        control_var=show_tooltips_var,
+        text="Exponent of the power law. Around 2 matches small" \
+             " \ncraters on the Moon."
+             )
+
+    # frame 3 - other widgets and buttons
+    insert = tk.Label(frame3,text="Insertion mode:")
+    insert.grid(row=0,column=0,padx=4,pady=4,sticky="w")
+    insert_tooltip = ToolTip(
+        insert,
+        control_var=show_tooltips_var,
+        text="Don't - will not insert craters into the workflow. \nOutput" \
+             " > Main input inserts crater into the workflow \nMerge " \
+                "shader inserts craters via merge. \nMerge tree inserts" \
+                    " craters via a balanced tree of merges."
+                )
+
+    insert_into_flow = ttk.Combobox(frame3,values=INSERT_MODES)
+    insert_into_flow.grid(row=0,column=1,padx=4,pady=4,sticky="w")
+    insert_into_flow.current(1)
+
+    merge_fan_in_l = tk.Label(frame3,text="Fan-in:")
+    merge_fan_in_l.grid(row=0,column=2,padx=4,pady=4,sticky="w")
+    merge_fan_in_l_tooltip = ToolTip(
+        merge_fan_in_l,
+        control_var=show_tooltips_var,
+        text="Merge tree only. Number of craters chained under each \nleaf" \
+             " of the tree before the chains are merged in pairs."
+             )
+    merge_fan_in = tk.Entry(frame3,textvariable=merge_fan_in_var,width=10)
+    merge_fan_in.grid(row=0,column=3,padx=4,pady=4,sticky="w")
+
+    append_warp = tk.Checkbutton(frame3,text="Append fractal warp shader?",variable=append_warp_var)
+    append_warp.grid(row=1,column=0,padx=4,pady=4,sticky="w")
+    append_warp_tooltip = ToolTip(
+        append_warp,
+        control_var=show_tooltips_var,
+        text="When checked, a Fractal warp shader is added to the \nproject" \
+             " after the last crater.  Its Scale value is approximately" \
+                 " \n1/4 of the maximum Diameter parameter value."
+                 )
+
+    rpc_retries_l = tk.Label(frame3,text="RPC retries:")
+    rpc_retries_l.grid(row=1,column=2,padx=4,pady=4,sticky="w")
+    rpc_retries_l_tooltip = ToolTip(
+        rpc_retries_l,
+        control_var=show_tooltips_var,
+        text="Times an RPC request that timed out or lost its connection is" \
+             " sent again, \nwaiting twice as long before each retry. Creating" \
+                 " a node is only \nsent again when Terragen refused the connection."
+                 )
+    rpc_retries = tk.Entry(frame3,textvariable=rpc_retries_var,width=10)
+    rpc_retries.grid(row=1,column=3,padx=4,pady=4,sticky="w")
+
+    rpc_workers_l = tk.Label(frame3,text="RPC workers:")
+    rpc_workers_l.grid(row=2,column=0,padx=4,pady=4,sticky="w")
+    rpc_workers_l_tooltip = ToolTip(
+        rpc_workers_l,
+        control_var=show_tooltips_var,
+        text="Number of connections used to add the craters at the same" \
+             " time. \n1 adds them one after another. The resulting node" \
+                 " network is the same."
+                 )
+    rpc_workers = tk.Entry(frame3,textvariable=rpc_workers_var,width=10)
+    rpc_workers.grid(row=2,column=1,padx=4,pady=4,sticky="w")
+
+    plan_workers_l = tk.Label(frame3,text="Plan workers:")
+    plan_workers_l.grid(row=2,column=2,padx=4,pady=4,sticky="w")
+    plan_workers_l_tooltip = ToolTip(
+        plan_workers_l,
+        control_var=show_tooltips_var,
+        text="Number of processes sampling large crater plans at the" \
+             " same time. \nThe craters of a seed are the same whatever" \
+                 " the number."
+                 )
+    plan_workers = tk.Entry(frame3,textvariable=plan_workers_var,width=10)
+    plan_workers.grid(row=2,column=3,padx=4,pady=4,sticky="w")
+
+    rpc_window_l = tk.Label(frame3,text="RPC window:")
+    rpc_window_l.grid(row=2,column=4,padx=4,pady=4,sticky="w")
+    rpc_window_l_tooltip = ToolTip(
+        rpc_window_l,
+        control_var=show_tooltips_var,
+        text="Number of RPC requests in flight at once. Above 1 the" \
+             " craters' paths and \nparameters are sent while the next" \
+                 " craters are created."
+                 )
+    rpc_window = tk.Entry(frame3,textvariable=rpc_window_var,width=10)
+    rpc_window.grid(row=2,column=5,padx=4,pady=4,sticky="w")
+
+    targets_l = tk.Label(frame3,text="Targets:")
+    targets_l.grid(row=3,column=0,padx=4,pady=4,sticky="w")
+    targets_l_tooltip = ToolTip(
+        targets_l,
+        control_var=show_tooltips_var,
+        text="First inserts the craters into the first Compute terrain node." \
+             " \nAll inserts them into every Compute terrain node, Selected into" \
+                 " \nthose named under Compute terrains, in one Apply."
+                 )
+    targets = ttk.Combobox(frame3,values=TARGET_MODES,width=10)
+    targets.grid(row=3,column=1,padx=4,pady=4,sticky="w")
+    targets.current(0)
+
+    target_names_l = tk.Label(frame3,text="Compute terrains:")
+    target_names_l.grid(row=3,column=2,padx=4,pady=4,sticky="w")
+    target_names_l_tooltip = ToolTip(
+        target_names_l,
+        control_var=show_tooltips_var,
+        text="Selected only. Names of the Compute terrain nodes to insert" \
+             " \nthe craters into, separated by commas."
+             )
+    target_names = tk.Entry(frame3,textvariable=target_names_var,width=10)
+    target_names.grid(row=3,column=3,padx=4,pady=4,sticky="w")
+
+    target_plan_l = tk.Label(frame3,text="Target plan:")
+    target_plan_l.grid(row=3,column=4,padx=4,pady=4,sticky="w")
+    target_plan_l_tooltip = ToolTip(
+        target_plan_l,
+        control_var=show_tooltips_var,
+        text="Shared gives every target the same craters. Per target samples" \
+             " \neach target's craters from a seed of its own, the seed plus" \
+                 " \nthe target's number, so the first target keeps the seed's craters."
+                 )
+    target_plan = ttk.Combobox(frame3,values=TARGET_PLANS,width=10)
+    target_plan.grid(row=3,column=5,padx=4,pady=4,sticky="w")
+    target_plan.current(0)
+
+    apply = tk.Button(frame3,text="Apply",command=on_apply)
+    apply.grid(row=4,column=0,padx=4,pady=4,sticky="w")
+    apply_tooltip = ToolTip(
+        apply,
+        text="Clicking this button will add the craters to the project.",
+        control_var=show_tooltips_var
+        )
+    cancel = tk.Button(frame3,text="Cancel",command=on_cancel,state="disabled")
+    cancel.grid(row=4,column=1,padx=4,pady=4,sticky="w")
+    cancel_tooltip = ToolTip(
+        cancel,
+        text="Stops adding craters after the current crater.",
+        control_var=show_tooltips_var
+        )
+    report = tk.Button(frame3,text="Report",command=on_report)
+    report.grid(row=4,column=2,padx=4,pady=4,sticky="w")
+    report_tooltip = ToolTip(
+        report,
+        text="Shows where the time of the last Apply went: waiting on \nTerragen" \
+             " or in Python, per stage and per RPC method. \nThe full report" \
+                 " is saved as tg_splatter_craters_report.json.",
+        control_var=show_tooltips_var
+        )
+    replay = tk.Button(frame3,text="Replay plan...",command=on_replay)
+    replay.grid(row=4,column=3,padx=4,pady=4,sticky="w")
+    replay_tooltip = ToolTip(
+        replay,
+        text="Adds the craters of a saved plan again, with the settings" \
+             " \nthey were made with. Every Apply saves its plan in the" \
+                 " \nplan cache folder this opens.",
+        control_var=show_tooltips_var
+        )
+    reapply_button = tk.Button(frame3,text="Re-apply",command=on_reapply)
+    reapply_button.grid(row=4,column=4,padx=4,pady=4,sticky="w")
+    reapply_tooltip = ToolTip(
+        reapply_button,
+        text="Updates the craters of the last Apply to the current settings" \
+             " \ninstead of adding new ones. Only values that changed are" \
+                 " sent. \nThe seed of the last Apply is kept unless one is entered." \
+                     " \nGroup, rim shader, mountain/valley, insertion and warp" \
+                         " \nchanges need a new Apply.",
+        control_var=show_tooltips_var
+        )
+    undo = tk.Button(frame3,text="Undo last run",command=on_undo)
+    undo.grid(row=4,column=5,padx=4,pady=4,sticky="w")
+    undo_tooltip = ToolTip(
+        undo,
+        text="Deletes every node the last Apply added, with one RPC call," \
+             " \nand restores the Compute terrain's Main input. Click again" \
+                 " \nto undo the run before it.",
+        control_var=show_tooltips_var
+        )
+    progress_bar = ttk.Progressbar(frame3,orient="horizontal",length=300,mode="determinate")
+    progress_bar.grid(row=5,column=0,columnspan=2,padx=4,pady=4,sticky="w")
+    preview = tk.Button(frame3,text="Preview",command=on_preview)
+    preview.grid(row=5,column=2,padx=4,pady=4,sticky="w")
+    preview_tooltip = ToolTip(
+        preview,
+        text="Draws the craters of the current values as a top-down height" \
+             " \nimage, without Terragen. Marked craters become Crater shaders," \
+                 " \nthe others are rasterized. Culling isn't shown.",
+        control_var=show_tooltips_var
+        )
+    export = tk.Button(frame3,text="Export clip...",command=on_export)
+    export.grid(row=5,column=3,padx=4,pady=4,sticky="w")
+    export_tooltip = ToolTip(
+        export,
+        text="Writes the crater network to a Terragen clip file instead of" \
+             " \nadding it over RPC, to import in one step. Terragen isn't" \
+                 " needed. \nCull below px is ignored and the network isn't" \
+                     " connected \nto the Compute terrain.",
+        control_var=show_tooltips_var
+        )
+    resume = tk.Button(frame3,text="Resume",command=on_resume)
+    resume.grid(row=5,column=4,padx=4,pady=4,sticky="w")
+    resume_tooltip = ToolTip(
+        resume,
+        text="Continues the last Apply that failed or was cancelled halfway," \
+             " \nfrom the crater after the last one it finished, with the" \
+                 " same \ncraters and settings. The finished craters are kept.",
+        control_var=show_tooltips_var
+        )
+    status = tk.Label(frame3,textvariable=status_var)
+    status.grid(row=6,column=0,columnspan=2,padx=4,pady=4,sticky="w")
+    status_tooltip = ToolTip(
+        status,
+        text="Progress, craters per second and estimated time remaining. \nAfter" \
+             " Apply, the Terragen RPC round-trips used.",
+        control_var=show_tooltips_var
+        )
 
-gui.config(menu=menubar)
-gui.mainloop()
+    gui.config(menu=menubar)
+    gui.mainloop()